@@ -0,0 +1,6 @@
+"""Runtime extensions of the ansible-chatbot-stack image.
+
+The image runs the upstream lightspeed-stack server with llama-stack as a library
+client. This package is added to the image next to it, and is loaded by
+``python -m ansible_chatbot_stack.launch`` (see entrypoint.sh).
+"""
@@ -0,0 +1,140 @@
+"""Admin HTTP server, next to the lightspeed-stack service.
+
+lightspeed-stack owns the service port and its FastAPI application, so the
+image's own operational endpoints are served by a small threaded HTTP server
+on a separate port, enabled by setting $ANSIBLE_CHATBOT_ADMIN_PORT:
+
+    GET  /startup             startup phase timings, slowest first
+    GET  /readiness           readiness checks; 200 when ready, 503 otherwise
+    GET  /embedding_cache     query embedding cache size and hit rates
+    GET  /embedding_batcher   query embedding batch size, queue wait and encoding time histograms
+    GET  /embedding_executor  embedding process pool tasks and restarts
+    GET  /answer_cache        semantic answer cache size and hit rates
+    POST /answer_cache/clear  empty the semantic answer cache
+    GET  /stores              vector stores loaded, and the last reload
+    POST /stores/reload       reload the vector stores whose store DB changed, e.g. a new snapshot
+    GET  /store_search        search latency histograms, timeouts and score multipliers per vector store
+    GET  /store_router        vector stores searched and skipped by the query routing
+    GET  /rag_context         knowledge_search results kept and dropped, and the context tokens saved
+    GET  /reranker            knowledge_search results reranked, fallbacks and the reranking latency histogram
+
+The GET routes only read, and answer every client: the kubelet probes them.
+The POST routes change the service, so they answer only the clients sending
+$ANSIBLE_CHATBOT_ADMIN_TOKEN as a bearer token, or, when no token is set, the
+clients on the loopback interface, e.g. a `kubectl exec` into the container.
+A route that raises answers 500 with the error, and the server keeps serving.
+
+Environment:
+    ANSIBLE_CHATBOT_ADMIN_PORT   port of the admin server (default: none, disabled)
+    ANSIBLE_CHATBOT_ADMIN_HOST   interface the admin server listens on (default: 0.0.0.0)
+    ANSIBLE_CHATBOT_ADMIN_TOKEN  bearer token of the POST routes (default: none, loopback clients only)
+"""
+
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ansible_chatbot_stack import (
+    answer_cache,
+    embedding_batcher,
+    embedding_cache,
+    embedding_executor,
+    rag_context,
+    reranker,
+    snapshots,
+    store_router,
+    store_search,
+)
+from ansible_chatbot_stack.readiness import READINESS
+from ansible_chatbot_stack.startup import TIMINGS
+
+logger = logging.getLogger(__name__)
+
+ADMIN_PORT_ENV = "ANSIBLE_CHATBOT_ADMIN_PORT"
+ADMIN_HOST_ENV = "ANSIBLE_CHATBOT_ADMIN_HOST"
+ADMIN_TOKEN_ENV = "ANSIBLE_CHATBOT_ADMIN_TOKEN"
+
+# GET routes: path -> callable returning (HTTP status, JSON serializable body).
+ROUTES = {
+    "/startup": lambda: (200, TIMINGS.summary()),
+    "/readiness": lambda: (200 if READINESS.ready() else 503, READINESS.report()),
+    "/embedding_cache": lambda: (200, embedding_cache.stats()),
+    "/embedding_batcher": lambda: (200, embedding_batcher.stats()),
+    "/embedding_executor": lambda: (200, embedding_executor.stats()),
+    "/answer_cache": lambda: (200, answer_cache.stats()),
+    "/stores": lambda: (200, snapshots.stats()),
+    "/store_search": lambda: (200, store_search.stats()),
+    "/store_router": lambda: (200, store_router.stats()),
+    "/rag_context": lambda: (200, rag_context.stats()),
+    "/reranker": lambda: (200, reranker.stats()),
+}
+
+# POST routes, same as ROUTES, for authorized clients only (see AdminHandler.authorized).
+POST_ROUTES = {
+    "/answer_cache/clear": lambda: (200, answer_cache.clear()),
+    "/stores/reload": snapshots.request_reload,
+}
+
+
+class AdminHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def do_GET(self):
+        self._route(ROUTES)
+
+    def do_POST(self):
+        if self.path.split("?", 1)[0] in POST_ROUTES and not self.authorized():
+            self._send_json(403, {"detail": f"Forbidden: {self.path}"})
+            return
+        self._route(POST_ROUTES)
+
+    def authorized(self) -> bool:
+        """Whether the client may change the service: it sends the admin token, or is local when none is set."""
+        token = os.environ.get(ADMIN_TOKEN_ENV)
+        if token:
+            return hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {token}")
+        try:
+            return ipaddress.ip_address(self.client_address[0]).is_loopback
+        except ValueError:
+            return False
+
+    def _route(self, routes: dict):
+        route = routes.get(self.path.split("?", 1)[0])
+        if route is None:
+            self._send_json(404, {"detail": f"Not found: {self.path}"})
+            return
+        try:
+            status, body = route()
+        except Exception as e:
+            logger.exception("Admin route %s failed", self.path)
+            status, body = 500, {"detail": f"{type(e).__name__}: {e}"}
+        self._send_json(status, body)
+
+    def _send_json(self, status: int, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_admin_server(port: int | None = None, host: str | None = None) -> ThreadingHTTPServer | None:
+    """Start the admin server in a daemon thread; returns None when no port is configured."""
+    if port is None:
+        port = int(os.environ.get(ADMIN_PORT_ENV) or 0) or None
+    if port is None:
+        return None
+    # Probed by the kubelet, so it listens on all interfaces by default, like the service itself:
+    # the POST routes check their clients.
+    host = host or os.environ.get(ADMIN_HOST_ENV, "0.0.0.0")
+    server = ThreadingHTTPServer((host, port), AdminHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="admin-server", daemon=True).start()
+    logger.info("Admin server listening on %s:%s", host, server.server_address[1])
+    return server
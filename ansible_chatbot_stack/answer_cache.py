@@ -0,0 +1,399 @@
+"""Semantic cache of the answers of first-turn questions.
+
+Most questions are paraphrases of a few hundred frequent ones, and each of them
+costs a full agent turn against the LLM. When enabled, the answer of a
+first-turn question is cached, and returned for the later questions that are
+close enough to it, without calling the LLM.
+
+An answer is reused only when all of these match:
+  - the model, the system prompt and the tools of the request
+  - the content version of the request's vector stores (see
+    faiss_index.store_version), so that a new snapshot, an update of the store
+    DB or chunks inserted at runtime invalidate it
+  - the cosine similarity of the question embeddings, at least
+    $ANSWER_CACHE_SIMILARITY
+
+The questions are not searched to key the answers: a cached answer is grounded
+on the file_search queries of the model, not on the question itself. The
+stores served by other providers than inline::faiss have no content version,
+and their answers expire with the TTL only.
+
+The cache is checked in the Responses API orchestrator of the agent turn, so
+the conversation and the response are stored as for any other turn, and
+cached answers are streamed as the usual text delta events, word by word.
+Only answers made of text and file search results are cached: turns with
+MCP or function tool calls, guardrails, or a previous conversation turn are
+always run. Entries expire after $ANSWER_CACHE_TTL seconds, and the admin
+server serves statistics on GET /answer_cache and empties the cache on POST
+/answer_cache/clear, for local or token-bearing clients only (see admin).
+
+Environment:
+    ANSWER_CACHE              "true" to enable the cache (default: false)
+    ANSWER_CACHE_SIZE         answers kept, least recently used evicted first (default: 1000)
+    ANSWER_CACHE_TTL          seconds after which an answer expires, 0 for never (default: 3600)
+    ANSWER_CACHE_SIMILARITY   minimum cosine similarity of the questions (default: 0.95)
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from ansible_chatbot_stack import faiss_index
+from ansible_chatbot_stack.runtime import RUNTIME
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENV = "ANSWER_CACHE"
+CACHE_SIZE_ENV = "ANSWER_CACHE_SIZE"
+CACHE_TTL_ENV = "ANSWER_CACHE_TTL"
+SIMILARITY_ENV = "ANSWER_CACHE_SIMILARITY"
+DEFAULT_SIZE = 1000
+DEFAULT_TTL = 3600.0
+DEFAULT_SIMILARITY = 0.95
+# Output items an answer may contain to be cached; mcp_list_tools items are not replayed.
+CACHEABLE_OUTPUTS = {"message", "file_search_call", "mcp_list_tools"}
+TOKEN_PATTERN = re.compile(r"\s*\S+|\s+")
+
+
+@dataclass
+class CachedAnswer:
+    embedding: array
+    text: str
+    # file_search_call output items, as dictionaries.
+    file_searches: list[dict] = field(default_factory=list)
+    created_at: float = field(default_factory=lambda: time.monotonic())
+
+
+def unit_vector(embedding) -> array:
+    norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+    return array("f", (x / norm for x in embedding))
+
+
+def similarity(a: array, b: array) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_SIZE,
+        ttl: float = DEFAULT_TTL,
+        min_similarity: float = DEFAULT_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_similarity = min_similarity
+        # (context key, entry ID) -> answer, least recently used first.
+        self._entries: OrderedDict[tuple[str, int], CachedAnswer] = OrderedDict()
+        # context key -> entry IDs, so that only the answers of the same context are compared.
+        self._contexts: dict[str, set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.skipped = self.stored = self.evictions = 0
+
+    def get(self, context: str, embedding: array) -> CachedAnswer | None:
+        with self._lock:
+            best, best_similarity = None, self.min_similarity
+            for entry_id in list(self._contexts.get(context, ())):
+                answer = self._entries[(context, entry_id)]
+                if self.ttl and time.monotonic() - answer.created_at > self.ttl:
+                    self._remove((context, entry_id))
+                    continue
+                score = similarity(embedding, answer.embedding)
+                if score >= best_similarity:
+                    best, best_similarity = (context, entry_id), score
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best)
+            return self._entries[best]
+
+    def put(self, context: str, answer: CachedAnswer):
+        with self._lock:
+            key = (context, self._next_id)
+            self._next_id += 1
+            self._entries[key] = answer
+            self._contexts.setdefault(context, set()).add(key[1])
+            self.stored += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple[str, int]):
+        del self._entries[key]
+        ids = self._contexts[key[0]]
+        ids.discard(key[1])
+        if not ids:
+            del self._contexts[key[0]]
+
+    def skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._contexts.clear()
+        logger.info("Answer cache cleared, %d answers removed", count)
+        return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "contexts": len(self._contexts),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "min_similarity": self.min_similarity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "skipped": self.skipped,
+                "stored": self.stored,
+                "evictions": self.evictions,
+            }
+
+
+ANSWER_CACHE: AnswerCache | None = None
+
+
+def from_env() -> AnswerCache | None:
+    if os.environ.get(CACHE_ENV, "false").lower() != "true":
+        return None
+    return AnswerCache(
+        int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_SIZE)),
+        float(os.environ.get(CACHE_TTL_ENV, DEFAULT_TTL)),
+        float(os.environ.get(SIMILARITY_ENV, DEFAULT_SIMILARITY)),
+    )
+
+
+def stats() -> dict:
+    return ANSWER_CACHE.stats() if ANSWER_CACHE else {"enabled": False}
+
+
+def clear() -> dict:
+    return {"cleared": ANSWER_CACHE.clear() if ANSWER_CACHE else 0}
+
+
+def _as_dict(item) -> dict:
+    return item if isinstance(item, dict) else item.model_dump()
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(_as_dict(part).get("text", "") for part in content or [])
+
+
+def _question(orchestrator) -> str | None:
+    """The question of a cacheable turn: a single user message after the system prompt, and no guardrail."""
+    if orchestrator.guardrail_ids:
+        return None
+    turn = [m for m in orchestrator.ctx.messages if m.role != "system"]
+    if len(turn) != 1 or turn[0].role != "user":
+        return None
+    return _text(turn[0].content).strip() or None
+
+
+def _vector_store_ids(tools) -> list[str]:
+    return sorted(
+        store_id
+        for tool in map(_as_dict, tools or [])
+        if tool.get("type") == "file_search"
+        for store_id in tool.get("vector_store_ids") or []
+    )
+
+
+async def _embedding_model(vector_store_ids: list[str]) -> str | None:
+    """The embedding model of the request's vector stores, or the first registered one."""
+    vector_stores = RUNTIME.api("vector_stores")
+    if vector_stores is not None:
+        for vector_store in await vector_stores.list_vector_stores():
+            if not vector_store_ids or vector_store.identifier in vector_store_ids:
+                return vector_store.embedding_model
+    return None
+
+
+def _context(orchestrator) -> str:
+    """Key of everything, but the question itself, that an answer depends on."""
+    ctx = orchestrator.ctx
+    system_prompt = "\n".join(_text(m.content) for m in ctx.messages if m.role == "system")
+    tools = [
+        {k: v for k, v in _as_dict(tool).items() if k in ("type", "server_label", "vector_store_ids", "name")}
+        for tool in ctx.response_tools or []
+    ]
+    context = {
+        "model": ctx.model,
+        "system_prompt": hashlib.sha256(system_prompt.encode()).hexdigest(),
+        "tools": tools,
+        "stores": {
+            store_id: faiss_index.store_version(store_id) for store_id in _vector_store_ids(ctx.response_tools)
+        },
+    }
+    return hashlib.sha256(json.dumps(context, sort_keys=True).encode()).hexdigest()
+
+
+async def _embed(orchestrator, question: str, model: str, api) -> array:
+    request = api.OpenAIEmbeddingsRequestWithExtraBody(model=model, input=[question])
+    response = await orchestrator.inference_api.openai_embeddings(request)
+    return unit_vector(response.data[0].embedding)
+
+
+def _cacheable_answer(response) -> tuple[str, list[dict]] | None:
+    """The text and file searches of a completed response made only of cacheable outputs."""
+    if response.status != "completed":
+        return None
+    outputs = [_as_dict(item) for item in response.output]
+    if any(item.get("type") not in CACHEABLE_OUTPUTS for item in outputs):
+        return None
+    messages = [item for item in outputs if item.get("type") == "message"]
+    if len(messages) != 1 or messages[0].get("role") != "assistant":
+        return None
+    content = messages[0].get("content") or []
+    if any(part.get("type") != "output_text" for part in content):
+        return None
+    text = _text(content)
+    if not text.strip():
+        return None
+    return text, [item for item in outputs if item.get("type") == "file_search_call"]
+
+
+async def _replay(orchestrator, answer: CachedAnswer, api):
+    """The stream events of a turn answering ``answer``, as the orchestrator emits them."""
+    outputs = []
+
+    def next_sequence_number():
+        orchestrator.sequence_number += 1
+        return orchestrator.sequence_number
+
+    yield api.OpenAIResponseObjectStreamResponseCreated(
+        response=orchestrator._snapshot_response("in_progress", outputs)
+    )
+    yield api.OpenAIResponseObjectStreamResponseInProgress(
+        response=orchestrator._snapshot_response("in_progress", outputs), sequence_number=next_sequence_number()
+    )
+
+    for file_search in answer.file_searches:
+        item = api.OpenAIResponseOutputMessageFileSearchToolCall(**{**file_search, "id": f"fs_{uuid.uuid4()}"})
+        for event_type in (
+            api.OpenAIResponseObjectStreamResponseOutputItemAdded,
+            api.OpenAIResponseObjectStreamResponseOutputItemDone,
+        ):
+            yield event_type(
+                response_id=orchestrator.response_id,
+                item=item,
+                output_index=len(outputs),
+                sequence_number=next_sequence_number(),
+            )
+        outputs.append(item)
+
+    message_id = f"msg_{uuid.uuid4()}"
+    message_index = len(outputs)
+    yield api.OpenAIResponseObjectStreamResponseOutputItemAdded(
+        response_id=orchestrator.response_id,
+        item=api.OpenAIResponseMessage(id=message_id, content=[], role="assistant", status="in_progress"),
+        output_index=message_index,
+        sequence_number=next_sequence_number(),
+    )
+    part = {
+        "content_index": 0,
+        "response_id": orchestrator.response_id,
+        "item_id": message_id,
+        "output_index": message_index,
+    }
+    yield api.OpenAIResponseObjectStreamResponseContentPartAdded(
+        **part, part=api.OpenAIResponseContentPartOutputText(text=""), sequence_number=next_sequence_number()
+    )
+    for token in TOKEN_PATTERN.findall(answer.text):
+        yield api.OpenAIResponseObjectStreamResponseOutputTextDelta(
+            content_index=0,
+            delta=token,
+            item_id=message_id,
+            output_index=message_index,
+            sequence_number=next_sequence_number(),
+        )
+    yield api.OpenAIResponseObjectStreamResponseContentPartDone(
+        **part, part=api.OpenAIResponseContentPartOutputText(text=answer.text), sequence_number=next_sequence_number()
+    )
+    message = api.OpenAIResponseMessage(
+        id=message_id,
+        content=[api.OpenAIResponseOutputMessageContentOutputText(text=answer.text, annotations=[])],
+        role="assistant",
+        status="completed",
+    )
+    yield api.OpenAIResponseObjectStreamResponseOutputItemDone(
+        response_id=orchestrator.response_id,
+        item=message,
+        output_index=message_index,
+        sequence_number=next_sequence_number(),
+    )
+    outputs.append(message)
+
+    # Stored with the response and the conversation, as the context of the next turns.
+    orchestrator.final_messages = [*orchestrator.ctx.messages, api.OpenAIAssistantMessageParam(content=answer.text)]
+    yield api.OpenAIResponseObjectStreamResponseCompleted(
+        response=orchestrator._snapshot_response("completed", outputs)
+    )
+
+
+def install_hooks():
+    """Answer cacheable turns of the Responses API orchestrator from the cache."""
+    global ANSWER_CACHE
+    ANSWER_CACHE = from_env()
+    if ANSWER_CACHE is None:
+        return
+    try:
+        from llama_stack.providers.inline.agents.meta_reference.responses import streaming
+        import llama_stack_api
+    except ImportError:
+        logger.warning("llama-stack not found, answers are not cached")
+        return
+
+    create_response = streaming.StreamingResponseOrchestrator.create_response
+
+    @functools.wraps(create_response)
+    async def cached_create_response(self):
+        cache = ANSWER_CACHE
+        question = _question(self)
+        lookup = None
+        if question is not None:
+            try:
+                model = await _embedding_model(_vector_store_ids(self.ctx.response_tools))
+                if model is not None:
+                    context = _context(self)
+                    lookup = (context, await _embed(self, question, model, llama_stack_api))
+            except Exception as e:
+                logger.warning("Answer cache lookup failed, running the turn: %s", e)
+        if lookup is None:
+            cache.skip()
+            async for event in create_response(self):
+                yield event
+            return
+
+        answer = cache.get(*lookup)
+        if answer is not None:
+            async for event in _replay(self, answer, streaming):
+                yield event
+            return
+
+        async for event in create_response(self):
+            if event.type == "response.completed":
+                cacheable = _cacheable_answer(event.response)
+                if cacheable is not None:
+                    cache.put(lookup[0], CachedAnswer(lookup[1], *cacheable))
+            yield event
+
+    streaming.StreamingResponseOrchestrator.create_response = cached_create_response
@@ -0,0 +1,136 @@
+"""BM25 inverted index of the chunks of a vector store.
+
+Ansible questions name exact identifiers (ansible.builtin.copy, error strings,
+setting names) that dense embeddings often rank below paraphrases. The chunks
+of a store are also indexed lexically, with BM25 over their words: the
+lowercased runs of letters, digits and underscores, kept whole when joined by
+".", "-", "/" or ":" (ansible.builtin.copy), and also split into their parts
+(copy). The index is a compressed sparse layout of numpy arrays: the sorted
+vocabulary, and for each term the positions of the chunks holding it (their
+index in chunk_by_index) and its frequency in each. faiss_index stores it in
+the kvstore next to the FAISS index, and searches it for the provider's
+keyword and hybrid queries.
+"""
+
+import io
+import re
+
+import numpy as np
+
+# Okapi BM25 parameters: term frequency saturation, and document length normalization.
+K1 = 1.2
+B = 0.75
+WORD = re.compile(r"[a-z0-9_]+(?:[./:\-][a-z0-9_]+)*")
+SEPARATOR = re.compile(r"[./:\-]")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it of on or that the this to was what when "
+    "where which with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for word in WORD.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        tokens.append(word)
+        if SEPARATOR.search(word):
+            tokens.extend(part for part in SEPARATOR.split(word) if part and part not in STOPWORDS)
+    return tokens
+
+
+def chunk_text(chunk: dict) -> str:
+    """The text of a stored chunk, whose content is a string or a list of content items."""
+    content = chunk.get("content")
+    if isinstance(content, list):
+        return " ".join(item.get("text", "") for item in content if isinstance(item, dict))
+    return content if isinstance(content, str) else ""
+
+
+class BM25Index:
+    def __init__(
+        self,
+        vocabulary: list[str],
+        offsets: np.ndarray,
+        positions: np.ndarray,
+        frequencies: np.ndarray,
+        lengths: np.ndarray,
+    ):
+        self.vocabulary = vocabulary
+        self.terms = {term: row for row, term in enumerate(vocabulary)}
+        self.offsets = offsets
+        self.positions = positions
+        self.frequencies = frequencies
+        self.lengths = lengths
+        documents = len(lengths)
+        counts = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((documents - counts + 0.5) / (counts + 0.5)).astype(np.float32)
+        # Per chunk: the length normalization of its term frequencies.
+        average = float(lengths.mean()) if documents and lengths.any() else 1.0
+        self.norms = (K1 * (1 - B + B * lengths / average)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @classmethod
+    def build(cls, texts: list[str]) -> "BM25Index":
+        postings: dict[str, dict[int, int]] = {}
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[position] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[position] = counts.get(position, 0) + 1
+        vocabulary = sorted(postings)
+        sizes = np.array([len(postings[term]) for term in vocabulary], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        positions = np.fromiter(
+            (position for term in vocabulary for position in postings[term]), dtype=np.int32, count=int(offsets[-1])
+        )
+        frequencies = np.fromiter(
+            (count for term in vocabulary for count in postings[term].values()),
+            dtype=np.float32,
+            count=int(offsets[-1]),
+        )
+        return cls(vocabulary, offsets, positions, frequencies, lengths)
+
+    def search(self, query: str, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """The positions of the ``k`` chunks that score highest for ``query``, best first, and their scores."""
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        for token in set(tokenize(query)):
+            row = self.terms.get(token)
+            if row is None:
+                continue
+            start, end = self.offsets[row], self.offsets[row + 1]
+            positions, frequencies = self.positions[start:end], self.frequencies[start:end]
+            scores[positions] += self.idf[row] * frequencies * (K1 + 1) / (frequencies + self.norms[positions])
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return matched, scores[matched]
+
+    def serialize(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            vocabulary=np.frombuffer("\n".join(self.vocabulary).encode(), dtype=np.uint8),
+            offsets=self.offsets,
+            positions=self.positions,
+            frequencies=self.frequencies,
+            lengths=self.lengths,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def deserialize(cls, data: bytes) -> "BM25Index":
+        with np.load(io.BytesIO(data)) as arrays:
+            words = arrays["vocabulary"].tobytes().decode()
+            return cls(
+                words.split("\n") if words else [],
+                arrays["offsets"],
+                arrays["positions"],
+                arrays["frequencies"],
+                arrays["lengths"],
+            )
@@ -0,0 +1,178 @@
+"""Readiness checks of the service's dependencies.
+
+Once the HTTP server is started, these checks run in its event loop every
+$READINESS_REFRESH_INTERVAL seconds (default: 30), and each one is reported
+separately on the admin server's GET /readiness:
+
+    inference        every inference provider of a registered LLM answers its model list
+    embedding_model  every registered embedding model is loaded in memory
+    vector_stores    every registered vector store (AAP and BYOK) is loaded, with its chunk count
+    mcp_servers      the tools of every registered MCP server can be listed
+
+Which checks keep the service unready while they are not "ok" is set by
+$READINESS_BLOCKING_CHECKS, by default "embedding_model,vector_stores". The
+inference and MCP checks are only reported by default: they depend on services
+shared by every replica, and an outage there would otherwise take all replicas
+out of rotation at once.
+"""
+
+import asyncio
+import logging
+import os
+
+from ansible_chatbot_stack.readiness import FAILED, OK, PENDING, READINESS, SKIPPED
+from ansible_chatbot_stack.runtime import RUNTIME, Runtime
+
+logger = logging.getLogger(__name__)
+
+BLOCKING_CHECKS_ENV = "READINESS_BLOCKING_CHECKS"
+REFRESH_INTERVAL_ENV = "READINESS_REFRESH_INTERVAL"
+CHECK_TIMEOUT_ENV = "READINESS_CHECK_TIMEOUT"
+DEFAULT_BLOCKING_CHECKS = "embedding_model,vector_stores"
+DEFAULT_REFRESH_INTERVAL = 30.0
+DEFAULT_CHECK_TIMEOUT = 10.0
+
+
+async def _models(runtime: Runtime, model_type: str) -> list:
+    models = await runtime.api("models").list_models()
+    return [m for m in models.data if str(getattr(m, "model_type", "llm")) == model_type]
+
+
+async def check_inference(runtime: Runtime) -> tuple[str, dict]:
+    providers = {}
+    for model in await _models(runtime, "llm"):
+        providers.setdefault(model.provider_id, []).append(model.identifier)
+    if not providers:
+        return SKIPPED, {"reason": "no LLM registered"}
+
+    routing_table = runtime.api("models")
+    results = {}
+    for provider_id, models in providers.items():
+        provider = routing_table.impls_by_provider_id.get(provider_id)
+        try:
+            available = await provider.list_provider_model_ids()
+            results[provider_id] = {"reachable": True, "models": models, "provider_models": len(list(available))}
+        except Exception as e:
+            results[provider_id] = {"reachable": False, "models": models, "error": f"{type(e).__name__}: {e}"}
+    status = OK if all(r["reachable"] for r in results.values()) else FAILED
+    return status, {"providers": results}
+
+
+def _loaded_embedding_models() -> set[str]:
+    from llama_stack.providers.utils.inference.embedding_mixin import EMBEDDING_MODELS
+
+    return set(EMBEDDING_MODELS)
+
+
+async def check_embedding_model(runtime: Runtime) -> tuple[str, dict]:
+    models = await _models(runtime, "embedding")
+    if not models:
+        return SKIPPED, {"reason": "no embedding model registered"}
+    loaded = _loaded_embedding_models()
+    # sentence-transformers loads models by their provider resource ID (a local path here).
+    results = {m.identifier: (m.provider_resource_id or m.identifier) in loaded for m in models}
+    if all(results.values()):
+        return OK, {"models": results}
+    warmup = READINESS.status("warmup")
+    if warmup == SKIPPED:
+        return SKIPPED, {"models": results, "reason": "loaded on first use, the startup warm-up is disabled"}
+    return (PENDING if warmup in (None, PENDING) else FAILED), {"models": results}
+
+
+async def check_vector_stores(runtime: Runtime) -> tuple[str, dict]:
+    routing_table = runtime.api("vector_stores")
+    vector_stores = await routing_table.list_vector_stores()
+    if not vector_stores:
+        return SKIPPED, {"reason": "no vector store registered"}
+
+    results = {}
+    for vector_store in vector_stores:
+        provider = routing_table.impls_by_provider_id.get(vector_store.provider_id)
+        cache = getattr(provider, "cache", None)
+        if cache is None:
+            # Not an index-caching provider: registered is all that can be said.
+            results[vector_store.identifier] = {"provider_id": vector_store.provider_id, "loaded": True}
+            continue
+        entry = cache.get(vector_store.identifier) or cache.get(vector_store.provider_resource_id)
+        index = getattr(entry, "index", None)
+        chunks = getattr(index, "chunk_by_index", None)
+        results[vector_store.identifier] = {
+            "provider_id": vector_store.provider_id,
+            "loaded": entry is not None,
+            "chunks": len(chunks) if chunks is not None else None,
+        }
+    status = OK if all(r["loaded"] for r in results.values()) else FAILED
+    return status, {"vector_stores": results}
+
+
+async def check_mcp_servers(runtime: Runtime) -> tuple[str, dict]:
+    tool_groups = runtime.api("tool_groups")
+    if tool_groups is None:
+        return SKIPPED, {"reason": "no tool runtime"}
+    servers = [g for g in (await tool_groups.list_tool_groups()).data if getattr(g, "mcp_endpoint", None)]
+    if not servers:
+        return SKIPPED, {"reason": "no MCP server registered"}
+
+    results = {}
+    for server in servers:
+        try:
+            tools = (await tool_groups.list_tools(toolgroup_id=server.identifier)).data
+            # Servers that cannot be reached are logged and skipped by llama-stack, leaving no tools.
+            results[server.identifier] = {"listed": bool(tools), "tools": len(tools)}
+        except Exception as e:
+            results[server.identifier] = {"listed": False, "error": f"{type(e).__name__}: {e}"}
+    status = OK if all(r["listed"] for r in results.values()) else FAILED
+    return status, {"servers": results}
+
+
+CHECKS = {
+    "inference": check_inference,
+    "embedding_model": check_embedding_model,
+    "vector_stores": check_vector_stores,
+    "mcp_servers": check_mcp_servers,
+}
+
+
+def blocking_checks() -> set[str]:
+    return {c.strip() for c in os.environ.get(BLOCKING_CHECKS_ENV, DEFAULT_BLOCKING_CHECKS).split(",") if c.strip()}
+
+
+def mark_pending():
+    """Register the checks before the first refresh, so that readiness waits for it."""
+    blocking = blocking_checks()
+    for name in CHECKS:
+        READINESS.set(name, PENDING, blocking=name in blocking)
+
+
+async def refresh(runtime: Runtime):
+    blocking = blocking_checks()
+    timeout = float(os.environ.get(CHECK_TIMEOUT_ENV, DEFAULT_CHECK_TIMEOUT))
+    for name, check in CHECKS.items():
+        try:
+            status, details = await asyncio.wait_for(check(runtime), timeout)
+        except Exception as e:
+            logger.warning("Readiness check %s failed: %s", name, e)
+            status, details = FAILED, {"error": f"{type(e).__name__}: {e}"}
+        READINESS.set(name, status, blocking=name in blocking, **details)
+
+
+async def refresh_forever(runtime: Runtime):
+    interval = float(os.environ.get(REFRESH_INTERVAL_ENV, DEFAULT_REFRESH_INTERVAL))
+    while True:
+        await refresh(runtime)
+        await asyncio.sleep(interval)
+
+
+async def start_refresh(runtime: Runtime):
+    if runtime.impls is None:
+        logger.warning("llama-stack was not initialized in this process, dependency checks are disabled")
+        for name in CHECKS:
+            READINESS.set(name, SKIPPED, blocking=False, reason="llama-stack not initialized in this process")
+        return
+    # Keep a reference, the event loop only holds weak ones to its tasks.
+    runtime.background_tasks.add(asyncio.create_task(refresh_forever(runtime)))
+
+
+def install():
+    mark_pending()
+    RUNTIME.after_startup(start_refresh)
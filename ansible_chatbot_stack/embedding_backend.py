@@ -0,0 +1,308 @@
+"""ONNX and OpenVINO backends of the sentence-transformers embedding model.
+
+sentence-transformers runs a model with torch by default, and can also run an
+ONNX Runtime or OpenVINO export of it, whose int8 quantized variants encode
+queries on the CPU in a fraction of the time. The inline::sentence-transformers
+provider entry of the run configuration selects the backend of its models:
+
+    providers:
+      inference:
+      - provider_id: sentence-transformers
+        provider_type: inline::sentence-transformers
+        config:
+          backend: openvino      # torch (default), onnx or openvino
+          quantization: int8     # openvino: int8 or none (default)
+                                 # onnx: avx2 (default), avx512, avx512_vnni, arm64 or none
+
+The exports are files next to the model, in its onnx/ or openvino/ directory,
+named as sentence-transformers names them, e.g.
+openvino/openvino_model_qint8_quantized.xml. They are written by this module's
+command line, which entrypoint.sh runs at container start for the
+EMBEDDINGS_BACKEND and EMBEDDINGS_QUANTIZATION of the run configuration, since
+the model comes from the data volume:
+
+    python -m ansible_chatbot_stack.embedding_backend /.llama/data/embeddings_model --backend openvino \
+        --quantization int8 --calibration-db /.llama/data/distributions/ansible-chatbot/aap_faiss_store.db
+
+The int8 OpenVINO export is quantized statically, as sentence-transformers'
+export_static_quantized_openvino_model does: its activation ranges are
+calibrated on a seeded sample of the chunk texts of the --calibration-db store
+DBs, the texts the model embeds in production, fed to optimum-intel's
+quantizer as an NNCF dataset rather than a Hugging Face Hub dataset. The ONNX
+int8 exports are quantized dynamically.
+
+A model whose export is missing is loaded with torch, with a warning, so that
+a failed export never leaves the stores without an embedding model. The ONNX
+backend needs sentence-transformers[onnx] (optimum and onnxruntime), the
+OpenVINO backend sentence-transformers[openvino] (optimum-intel, OpenVINO and
+NNCF). The image installs the latter only: the optimum-onnx of the former
+requires transformers<4.58.
+scripts/embedding_backend_benchmark.py compares the latency and retrieval of
+an export with the fp32 torch model.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import random
+import shutil
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "openvino")
+# Dynamic int8 quantization configurations of sentence-transformers' export_dynamic_quantized_onnx_model.
+ONNX_QUANTIZATIONS = ("avx2", "avx512", "avx512_vnni", "arm64")
+DEFAULT_ONNX_QUANTIZATION = "avx2"
+# Static int8 quantization of the OpenVINO export, calibrated on chunk texts.
+OPENVINO_QUANTIZATIONS = ("int8",)
+DEFAULT_CALIBRATION_SAMPLES = 300
+
+
+@dataclass(frozen=True)
+class Backend:
+    name: str = "torch"
+    quantization: str | None = None
+
+    @classmethod
+    def from_config(cls, config) -> "Backend":
+        """The backend of a provider config: the run configuration dict, or llama-stack's config object."""
+        if config is None:
+            return cls()
+        if not isinstance(config, dict):
+            config = {**(getattr(config, "model_extra", None) or {}), **vars(config)}
+        return cls.parse(config.get("backend"), config.get("quantization"))
+
+    @classmethod
+    def parse(cls, name: str | None, quantization: str | None = None) -> "Backend":
+        name = (name or "torch").lower()
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {name}, expected one of {', '.join(BACKENDS)}")
+        quantization = (quantization or "").lower() or None
+        if name == "onnx":
+            quantization = quantization or DEFAULT_ONNX_QUANTIZATION
+            if quantization not in (*ONNX_QUANTIZATIONS, "none"):
+                raise ValueError(
+                    f"Unknown ONNX quantization {quantization}, expected one of {', '.join(ONNX_QUANTIZATIONS)} or none"
+                )
+        elif name == "openvino":
+            if quantization not in (None, *OPENVINO_QUANTIZATIONS, "none"):
+                raise ValueError(
+                    f"Unknown OpenVINO quantization {quantization}, expected one of {', '.join(OPENVINO_QUANTIZATIONS)}"
+                    " or none"
+                )
+        elif quantization not in (None, "none"):
+            raise ValueError(f"The {name} backend is not quantized, got quantization {quantization}")
+        return cls(name, None if quantization == "none" else quantization)
+
+    @property
+    def model_file(self) -> str | None:
+        """The export, relative to the model directory, as sentence-transformers names it."""
+        if self.name == "onnx":
+            return f"onnx/model_qint8_{self.quantization}.onnx" if self.quantization else "onnx/model.onnx"
+        if self.name == "openvino":
+            return "openvino/openvino_model_qint8_quantized.xml" if self.quantization else "openvino/openvino_model.xml"
+        return None
+
+    def load_kwargs(self) -> dict:
+        if self.name == "torch":
+            return {}
+        return {"backend": self.name, "model_kwargs": {"file_name": self.model_file}}
+
+    def __str__(self):
+        return f"{self.name}:{self.quantization}" if self.quantization else self.name
+
+
+def available(model_path: str, backend: Backend) -> bool:
+    """Whether the export of a local model exists; models that are not a directory are left to sentence-transformers."""
+    path = Path(model_path)
+    return backend.name == "torch" or not path.is_dir() or (path / backend.model_file).is_file()
+
+
+def load_model(model_path: str, backend: Backend):
+    """The SentenceTransformer of ``model_path`` with ``backend``, or with torch when its export is missing."""
+    from sentence_transformers import SentenceTransformer
+
+    if not available(model_path, backend):
+        logger.warning(
+            "%s not found in %s, loading the embedding model with torch; export it with python -m %s",
+            backend.model_file,
+            model_path,
+            __spec__.name,
+        )
+        backend = Backend()
+    # Same arguments as llama-stack's _load_sentence_transformer_model, plus the backend.
+    return SentenceTransformer(model_path, trust_remote_code=True, **backend.load_kwargs())
+
+
+def backend_of(provider) -> Backend:
+    """The backend of an inline::sentence-transformers provider instance."""
+    try:
+        return Backend.from_config(getattr(provider, "config", None))
+    except ValueError as e:
+        logger.warning("%s, loading the embedding model with torch", e)
+        return Backend()
+
+
+def calibration_texts(db_paths: list[Path], samples: int = DEFAULT_CALIBRATION_SAMPLES, seed: int = 0) -> list[str]:
+    """A seeded sample of the chunk texts of store DBs, to calibrate a static quantization on."""
+    from ansible_chatbot_stack.bm25 import chunk_text
+    from ansible_chatbot_stack.faiss_index import load_stores
+
+    texts = [
+        " ".join(chunk_text(json.loads(chunk)).split())
+        for db_path in db_paths
+        for record in load_stores(db_path).values()
+        for chunk in record["chunk_by_index"].values()
+    ]
+    texts = [text for text in texts if text]
+    return random.Random(seed).sample(texts, min(samples, len(texts)))
+
+
+def export_static_quantized_openvino(model, texts: list[str], target: Path):
+    """Write the int8 OpenVINO export of a SentenceTransformer loaded with the openvino backend to ``target``,
+    calibrated on ``texts``."""
+    import nncf
+    from optimum.intel.openvino import OVConfig, OVQuantizationConfig, OVQuantizer
+
+    ov_model = model[0].auto_model
+    inputs = set(ov_model.input_names)
+    samples = [
+        {
+            name: value
+            for name, value in model.tokenizer(
+                text, truncation=True, max_length=model.max_seq_length, return_tensors="np"
+            ).items()
+            if name in inputs
+        }
+        for text in texts
+    ]
+    quantizer = OVQuantizer.from_pretrained(ov_model)
+    config = OVConfig(quantization_config=OVQuantizationConfig(num_samples=len(samples)))
+    with tempfile.TemporaryDirectory() as save_dir:
+        quantizer.quantize(nncf.Dataset(samples), save_directory=save_dir, ov_config=config)
+        quantized = next(Path(save_dir).rglob("openvino_model.xml"))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(quantized.with_suffix(".bin"), target.with_suffix(".bin"))
+        shutil.move(quantized, target)
+
+
+def export(model_path: str, backend: Backend, calibration: list[str] | None = None) -> Path:
+    """Write the export of a local model for ``backend``; returns its path. The int8 OpenVINO export is calibrated
+    on the ``calibration`` texts."""
+    path = Path(model_path)
+    target = path / backend.model_file
+    if backend.name == "openvino" and backend.quantization and not calibration:
+        raise ValueError("The int8 OpenVINO export needs calibration texts, e.g. from the chunks of a store DB")
+    from sentence_transformers import SentenceTransformer
+
+    # Loading a model with a backend it has no file for exports it, in memory.
+    model = SentenceTransformer(model_path, trust_remote_code=True, backend=backend.name)
+    if backend.name == "openvino" and backend.quantization:
+        export_static_quantized_openvino(model, calibration, target)
+    elif backend.quantization:
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        export_dynamic_quantized_onnx_model(model, backend.quantization, model_path)
+    else:
+        model[0].auto_model.save_pretrained(target.parent)
+    if not target.is_file():
+        raise RuntimeError(f"{target} not written by the {backend} export")
+    return target
+
+
+def install_hooks():
+    """Load the models of the sentence-transformers providers with the backend of their provider config."""
+    try:
+        from llama_stack.providers.inline.inference.sentence_transformers.config import (
+            SentenceTransformersInferenceConfig,
+        )
+        from llama_stack.providers.utils.inference import embedding_mixin
+    except ImportError:
+        logger.warning("llama-stack not found, the embedding models are loaded with torch")
+        return
+
+    # The provider config has no fields, and drops unknown ones: keep the backend settings on it.
+    SentenceTransformersInferenceConfig.model_config["extra"] = "allow"
+    SentenceTransformersInferenceConfig.model_rebuild(force=True)
+
+    load_sentence_transformer_model = embedding_mixin.SentenceTransformerEmbeddingMixin._load_sentence_transformer_model
+
+    @functools.wraps(load_sentence_transformer_model)
+    async def load_with_backend(self, model: str):
+        backend = backend_of(self)
+        if backend.name == "torch" or model in embedding_mixin.EMBEDDING_MODELS:
+            return await load_sentence_transformer_model(self, model)
+        async with embedding_mixin.EMBEDDING_MODELS_LOCK:
+            loaded_model = embedding_mixin.EMBEDDING_MODELS.get(model)
+            if loaded_model is None:
+                logger.info("Loading sentence transformer for %s with the %s backend", model, backend)
+                loaded_model = await asyncio.to_thread(load_model, model, backend)
+                embedding_mixin.EMBEDDING_MODELS[model] = loaded_model
+            return loaded_model
+
+    embedding_mixin.SentenceTransformerEmbeddingMixin._load_sentence_transformer_model = load_with_backend
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="directory of the sentence-transformers model")
+    parser.add_argument("--backend", choices=BACKENDS[1:], default="onnx", help="backend to export (default: onnx)")
+    parser.add_argument(
+        "--quantization",
+        help=f"int8 quantization, or none (default: {DEFAULT_ONNX_QUANTIZATION} for onnx, none for openvino)",
+    )
+    parser.add_argument(
+        "--calibration-db",
+        dest="calibration_dbs",
+        action="append",
+        type=Path,
+        default=[],
+        help="store DB whose chunk texts calibrate the int8 OpenVINO export, repeatable",
+    )
+    parser.add_argument(
+        "--calibration-samples",
+        type=int,
+        default=DEFAULT_CALIBRATION_SAMPLES,
+        help=f"chunk texts sampled to calibrate on (default: {DEFAULT_CALIBRATION_SAMPLES})",
+    )
+    parser.add_argument("--force", action="store_true", help="export again when the export already exists")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    args = parse_args(argv)
+    try:
+        backend = Backend.parse(args.backend, args.quantization)
+    except ValueError as e:
+        print(e)
+        return 1
+    if not Path(args.model).is_dir():
+        print(f"Model directory not found: {args.model}")
+        return 1
+    target = Path(args.model) / backend.model_file
+    if target.is_file() and not args.force:
+        print(f"{target} already exists")
+        return 0
+    calibration = None
+    if backend.name == "openvino" and backend.quantization:
+        calibration = calibration_texts([db for db in args.calibration_dbs if db.is_file()], args.calibration_samples)
+        if not calibration:
+            print("No chunk texts to calibrate the int8 OpenVINO export on, pass a store DB with --calibration-db")
+            return 1
+    try:
+        print(f"Exported {export(args.model, backend, calibration)}")
+    except ImportError as e:
+        print(f"The {backend.name} backend is not installed ({e}), install sentence-transformers[{backend.name}]")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
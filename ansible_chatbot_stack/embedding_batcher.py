@@ -0,0 +1,176 @@
+"""Micro-batching of query embeddings.
+
+Every knowledge_search call encodes its single query with the
+sentence-transformers model, on the CPU, and concurrent calls each run their
+own forward pass of one text. Single-text requests are queued per model
+instead: a worker task takes the queued texts, up to the maximum batch size,
+once the first one has waited the maximum wait (immediately when the batch is
+full), encodes them in one call in a thread, and resolves the future of each
+caller. While a batch is being encoded, the next one collects the queries
+arriving meanwhile. The hook sits at the provider, so the queries to the AAP
+store and to the BYOK stores embedded with the same model are batched
+together; the query embedding cache (see embedding_cache) answers the repeated
+queries before they are queued. Multi-text requests (document ingestion) are
+already batches, and are encoded as before.
+
+Batch sizes, the wait of each query in the queue and the encoding time of each
+batch are served as histograms by the admin server on GET /embedding_batcher.
+
+Environment:
+    EMBEDDING_BATCH               "false" to encode every query on its own (default: true)
+    EMBEDDING_BATCH_MAX_SIZE      queries encoded in one forward pass at most (default: 32)
+    EMBEDDING_BATCH_MAX_WAIT_MS   milliseconds the first query of a batch waits for more (default: 5)
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+import weakref
+from dataclasses import dataclass, field
+
+from ansible_chatbot_stack.embedding_cache import single_text
+from ansible_chatbot_stack.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENV = "EMBEDDING_BATCH"
+MAX_SIZE_ENV = "EMBEDDING_BATCH_MAX_SIZE"
+MAX_WAIT_ENV = "EMBEDDING_BATCH_MAX_WAIT_MS"
+DEFAULT_MAX_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+MILLISECOND_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+
+@dataclass
+class _Query:
+    text: str
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class EmbeddingBatcher:
+    def __init__(self, max_batch_size: int = DEFAULT_MAX_SIZE, max_wait: float = DEFAULT_MAX_WAIT_MS / 1000):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        # Event loop -> model ID -> queue; the queues and worker tasks belong to the loop of their callers.
+        self._queues: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._workers: set[asyncio.Task] = set()
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(MILLISECOND_BUCKETS)
+        self.encode_ms = Histogram(MILLISECOND_BUCKETS)
+        self.errors = 0
+
+    async def embed(self, model_id: str, model, text: str):
+        """Embedding of ``text`` by ``model`` (a SentenceTransformer), encoded in a batch of concurrent queries."""
+        loop = asyncio.get_running_loop()
+        queues = self._queues.setdefault(loop, {})
+        queue = queues.get(model_id)
+        if queue is None:
+            queue = queues[model_id] = asyncio.Queue()
+            worker = loop.create_task(self._run(model, queue), name=f"embedding-batcher-{model_id}")
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+        query = _Query(text, loop.create_future())
+        queue.put_nowait(query)
+        return await query.future
+
+    async def _run(self, model, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            deadline = batch[0].queued_at + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except TimeoutError:
+                    break
+            await self._encode(model, batch)
+
+    async def _encode(self, model, batch: list[_Query]):
+        batch = [query for query in batch if not query.future.done()]  # callers cancelled meanwhile
+        if not batch:
+            return
+        start = time.monotonic()
+        for query in batch:
+            self.queue_wait_ms.observe((start - query.queued_at) * 1000)
+        self.batch_size.observe(len(batch))
+        try:
+            # Same call as llama-stack's SentenceTransformerEmbeddingMixin, with the texts of the whole batch.
+            embeddings = await asyncio.to_thread(model.encode, [query.text for query in batch], show_progress_bar=False)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Encoding a batch of %d queries failed: %s", len(batch), e)
+            for query in batch:
+                if not query.future.done():
+                    query.future.set_exception(e)
+            return
+        self.encode_ms.observe((time.monotonic() - start) * 1000)
+        for query, embedding in zip(batch, embeddings):
+            if not query.future.done():
+                query.future.set_result(embedding)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batch_size.count,
+            "queries": self.queue_wait_ms.count,
+            "errors": self.errors,
+            "batch_size": self.batch_size.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "encode_ms": self.encode_ms.snapshot(),
+        }
+
+
+EMBEDDING_BATCHER: EmbeddingBatcher | None = None
+
+
+def from_env() -> EmbeddingBatcher | None:
+    if os.environ.get(BATCH_ENV, "true").lower() != "true":
+        return None
+    return EmbeddingBatcher(
+        int(os.environ.get(MAX_SIZE_ENV, DEFAULT_MAX_SIZE)),
+        float(os.environ.get(MAX_WAIT_ENV, DEFAULT_MAX_WAIT_MS)) / 1000,
+    )
+
+
+def stats() -> dict:
+    return EMBEDDING_BATCHER.stats() if EMBEDDING_BATCHER else {"enabled": False}
+
+
+def install_hooks():
+    """Batch the single-text requests of the sentence-transformers embedding providers."""
+    global EMBEDDING_BATCHER
+    EMBEDDING_BATCHER = from_env()
+    if EMBEDDING_BATCHER is None:
+        return
+    try:
+        from llama_stack.providers.utils.inference import embedding_mixin
+    except ImportError:
+        logger.warning("llama-stack not found, query embeddings are not batched")
+        return
+
+    openai_embeddings = embedding_mixin.SentenceTransformerEmbeddingMixin.openai_embeddings
+
+    @functools.wraps(openai_embeddings)
+    async def batched_openai_embeddings(self, params):
+        text = single_text(params)
+        if text is None:
+            return await openai_embeddings(self, params)
+        model = await self._load_sentence_transformer_model(params.model)
+        embedding = await EMBEDDING_BATCHER.embed(params.model, model, text)
+        return embedding_mixin.OpenAIEmbeddingsResponse(
+            data=[embedding_mixin.OpenAIEmbeddingData(embedding=embedding.tolist(), index=0)],
+            model=params.model,
+            usage=embedding_mixin.OpenAIEmbeddingUsage(prompt_tokens=-1, total_tokens=-1),
+        )
+
+    embedding_mixin.SentenceTransformerEmbeddingMixin.openai_embeddings = batched_openai_embeddings
@@ -0,0 +1,317 @@
+"""Cache of query embeddings.
+
+Every knowledge_search call encodes its query with the sentence-transformers
+model before searching a vector store, on the CPU. The questions asked to the
+chatbot are very repetitive, so the embeddings of single-text requests are
+cached, keyed on the normalized text (Unicode NFKC, whitespace collapsed,
+case-folded) and the model. The cache sits in front of the provider, so the
+AAP store and the BYOK stores embedded with the same model share it.
+Multi-text requests (document ingestion) are not cached.
+
+Entries are evicted least recently used first, and expire after a TTL. An
+optional SQLite tier keeps them across restarts, typically on the data volume;
+its entries are bound to a fingerprint of the model files and of the backend
+the model runs with (see embedding_backend.py), so that a new model or an int8
+export does not reuse the embeddings of the previous one. The fingerprint of a
+model is computed in a thread at its first request. The disk tier is read and
+written in a thread of its own, never on the event loop: the hook awaits its
+reads, and its writes are queued behind the response. Hit rates are served by
+the admin server on GET /embedding_cache.
+
+Environment:
+    EMBEDDING_CACHE             "false" to disable the cache (default: true)
+    EMBEDDING_CACHE_SIZE        entries kept in memory (default: 10000)
+    EMBEDDING_CACHE_TTL         seconds after which an entry expires, 0 for never (default: 86400)
+    EMBEDDING_CACHE_DISK_PATH   SQLite file of the disk tier, e.g. /.llama/data/embedding_cache.db (default: none)
+    EMBEDDING_CACHE_DISK_SIZE   entries kept on disk (default: 100000)
+"""
+
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from ansible_chatbot_stack.embedding_backend import Backend, available, backend_of
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENV = "EMBEDDING_CACHE"
+CACHE_SIZE_ENV = "EMBEDDING_CACHE_SIZE"
+CACHE_TTL_ENV = "EMBEDDING_CACHE_TTL"
+DISK_PATH_ENV = "EMBEDDING_CACHE_DISK_PATH"
+DISK_SIZE_ENV = "EMBEDDING_CACHE_DISK_SIZE"
+DEFAULT_SIZE = 10000
+DEFAULT_TTL = 86400.0
+DEFAULT_DISK_SIZE = 100000
+# Files read whole into the model fingerprint; the weights are only fingerprinted by size.
+FINGERPRINT_MAX_FILE_SIZE = 1024 * 1024
+
+
+def normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split()).casefold()
+
+
+def model_fingerprint(model: str, backend: str = "torch") -> str:
+    """Model ID and backend, plus the configuration and file sizes when the model is a local directory.
+
+    Reads the model files: call it off the event loop.
+    """
+    digest = hashlib.sha256(f"{model}\0{backend}".encode())
+    path = Path(model)
+    if path.is_dir():
+        for file in sorted(p for p in path.rglob("*") if p.is_file()):
+            size = file.stat().st_size
+            digest.update(f"{file.relative_to(path)}:{size}".encode())
+            if size <= FINGERPRINT_MAX_FILE_SIZE:
+                digest.update(file.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+class DiskTier:
+    """Embeddings in a SQLite file, oldest entries pruned beyond ``max_entries``.
+
+    get(), put() and prune() block on the file: the cache runs them in the thread of submit().
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._puts = 0
+        self._pid = None
+        self._inherited = []
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+
+    def submit(self, fn, *args) -> Future:
+        """Run ``fn(*args)`` in the thread of the disk tier in this process, after the calls submitted before."""
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache-disk")
+                self._executor_pid = os.getpid()
+            return self._executor.submit(fn, *args)
+
+    def flush(self):
+        """Wait for the calls submitted so far."""
+        self.submit(lambda: None).result()
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """The connection of this process: a SQLite connection must not be used across fork()."""
+        if self._pid != os.getpid():
+            if self._pid is not None:
+                # Left open: closing it in a forked worker could checkpoint the WAL under the parent.
+                self._inherited.append(self._connection)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key: str) -> array | None:
+        row = self._db.execute("SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return array("f", row[0])
+
+    def put(self, key: str, vector: array):
+        self._db.execute(
+            "INSERT OR REPLACE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)",
+            (key, vector.tobytes(), time.time()),
+        )
+        self._puts += 1
+        if self._puts % 100 == 0:
+            self.prune()
+
+    def prune(self):
+        if self.ttl:
+            self._db.execute("DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl,))
+        # Both steps walk the created_at index: the oldest entry kept, then the entries before it.
+        self._db.execute(
+            "DELETE FROM embeddings WHERE created_at < "
+            "(SELECT created_at FROM embeddings ORDER BY created_at DESC LIMIT 1 OFFSET ?)",
+            (max(0, self.max_entries - 1),),
+        )
+
+    def __len__(self) -> int:
+        return self.submit(lambda: self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]).result()
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int = DEFAULT_SIZE, ttl: float = DEFAULT_TTL, disk: DiskTier | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = disk
+        # key -> (monotonic time of insertion, embedding), least recently used first.
+        self._entries: OrderedDict[str, tuple[float, array]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = self.evictions = self.expirations = 0
+
+    @staticmethod
+    def key(fingerprint: str, text: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\0{normalize(text)}".encode()).hexdigest()
+
+    def get(self, fingerprint: str, text: str) -> array | None:
+        """Blocking on the disk tier: async callers await get_async() instead."""
+        key = self.key(fingerprint, text)
+        vector = self._get_memory(key)
+        if vector is not None:
+            return vector
+        return self._disk_result(key, self.disk.submit(self.disk.get, key).result() if self.disk is not None else None)
+
+    async def get_async(self, fingerprint: str, text: str) -> array | None:
+        key = self.key(fingerprint, text)
+        vector = self._get_memory(key)
+        if vector is not None:
+            return vector
+        if self.disk is None:
+            return self._disk_result(key, None)
+        return self._disk_result(key, await asyncio.wrap_future(self.disk.submit(self.disk.get, key)))
+
+    def put(self, fingerprint: str, text: str, embedding) -> array:
+        """Cache an embedding in memory, and queue its write to the disk tier."""
+        key = self.key(fingerprint, text)
+        vector = array("f", embedding)
+        with self._lock:
+            self._insert(key, vector)
+        if self.disk is not None:
+            self.disk.submit(self.disk.put, key, vector)
+        return vector
+
+    def _get_memory(self, key: str) -> array | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _disk_result(self, key: str, vector: array | None) -> array | None:
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, vector)
+            return vector
+
+    def _insert(self, key: str, vector: array):
+        self._entries[key] = (time.monotonic(), vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "disk": {"path": self.disk.path, "entries": len(self.disk)} if self.disk is not None else None,
+            }
+
+
+EMBEDDING_CACHE: EmbeddingCache | None = None
+
+
+def from_env() -> EmbeddingCache | None:
+    if os.environ.get(CACHE_ENV, "true").lower() != "true":
+        return None
+    ttl = float(os.environ.get(CACHE_TTL_ENV, DEFAULT_TTL))
+    disk = None
+    disk_path = os.environ.get(DISK_PATH_ENV)
+    if disk_path:
+        try:
+            disk = DiskTier(disk_path, int(os.environ.get(DISK_SIZE_ENV, DEFAULT_DISK_SIZE)), ttl)
+        except sqlite3.Error as e:
+            logger.warning("Embedding cache disk tier %s not available, caching in memory only: %s", disk_path, e)
+    return EmbeddingCache(int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_SIZE)), ttl, disk)
+
+
+def stats() -> dict:
+    return EMBEDDING_CACHE.stats() if EMBEDDING_CACHE else {"enabled": False}
+
+
+def single_text(params) -> str | None:
+    """The text of a request that can be answered from the cache, None otherwise."""
+    if params.encoding_format not in (None, "float") or params.dimensions is not None:
+        return None
+    if isinstance(params.input, str):
+        return params.input
+    if isinstance(params.input, list) and len(params.input) == 1 and isinstance(params.input[0], str):
+        return params.input[0]
+    return None
+
+
+def install_hooks():
+    """Cache the single-text requests of the sentence-transformers embedding providers."""
+    global EMBEDDING_CACHE
+    EMBEDDING_CACHE = from_env()
+    if EMBEDDING_CACHE is None:
+        return
+    try:
+        from llama_stack.providers.utils.inference import embedding_mixin
+    except ImportError:
+        logger.warning("llama-stack not found, query embeddings are not cached")
+        return
+
+    openai_embeddings = embedding_mixin.SentenceTransformerEmbeddingMixin.openai_embeddings
+    # (model, backend of its provider) -> fingerprint.
+    fingerprints: dict[tuple[str, Backend], str] = {}
+
+    def fingerprint_of(model: str, backend: Backend) -> str:
+        # A model whose export is missing runs with torch.
+        return model_fingerprint(model, str(backend if available(model, backend) else Backend()))
+
+    @functools.wraps(openai_embeddings)
+    async def cached_openai_embeddings(self, params):
+        text = single_text(params)
+        if text is None:
+            return await openai_embeddings(self, params)
+        # At the provider, params.model is the provider resource ID: the model path for sentence-transformers.
+        model = (params.model, backend_of(self))
+        fingerprint = fingerprints.get(model)
+        if fingerprint is None:
+            fingerprint = fingerprints[model] = await asyncio.to_thread(fingerprint_of, *model)
+        vector = await EMBEDDING_CACHE.get_async(fingerprint, text)
+        if vector is not None:
+            return embedding_mixin.OpenAIEmbeddingsResponse(
+                data=[embedding_mixin.OpenAIEmbeddingData(embedding=vector.tolist(), index=0)],
+                model=params.model,
+                usage=embedding_mixin.OpenAIEmbeddingUsage(prompt_tokens=-1, total_tokens=-1),
+            )
+        response = await openai_embeddings(self, params)
+        EMBEDDING_CACHE.put(fingerprint, text, response.data[0].embedding)
+        return response
+
+    embedding_mixin.SentenceTransformerEmbeddingMixin.openai_embeddings = cached_openai_embeddings
@@ -0,0 +1,337 @@
+"""Embedding models run in a process pool.
+
+llama-stack encodes with the sentence-transformers model in a thread of the
+server process (and so does the embedding batcher): the forward pass releases
+the GIL, but tokenization and the Python parts of sentence-transformers hold
+it, so a slow encode still delays the event loop that streams the responses
+of every other request. With EMBEDDING_EXECUTOR=process, the models are loaded
+and run in a pool of separate processes instead, started with the "spawn"
+method, since torch is not fork-safe once used. The server process never
+loads them: llama-stack's model cache holds a stand-in whose encode() submits
+the texts to the pool and waits, in the thread llama-stack or the batcher
+calls it in. Each pool process loads a model on its first request for it,
+with the backend of its provider (see embedding_backend).
+
+The embeddings come back through shared memory rather than the result pipe.
+Each pool process allocates a ring of EMBEDDING_PROCESS_SHARED_MEMORY_MB when
+it starts, writes the embeddings of each request after those of the previous
+one, and only returns where they are; the server process attaches the ring on
+its first result and copies them out. Creating a shared memory block per
+request cost 150 us for one query and 1 ms for 256 chunks, more than pickling
+them; copying out of the ring costs 2 to 80 us. Embeddings that the ring wraps
+over before they are read, when a reader falls a whole ring behind, are
+encoded again and come back through the pipe, as do those larger than the
+ring. A pool process that dies is replaced, and the request it was encoding
+fails.
+
+Environment:
+    EMBEDDING_EXECUTOR                   "process" to run the models in a process pool (default: "thread")
+    EMBEDDING_PROCESSES                  processes of the pool (default: 1)
+    EMBEDDING_PROCESS_TORCH_THREADS      torch threads per process (default: the torch default)
+    EMBEDDING_PROCESS_SHARED_MEMORY_MB   size of the shared memory ring of each process (default: 16)
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import util
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from ansible_chatbot_stack.embedding_backend import Backend, backend_of, load_model
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_ENV = "EMBEDDING_EXECUTOR"
+PROCESSES_ENV = "EMBEDDING_PROCESSES"
+TORCH_THREADS_ENV = "EMBEDDING_PROCESS_TORCH_THREADS"
+SHARED_MEMORY_ENV = "EMBEDDING_PROCESS_SHARED_MEMORY_MB"
+DEFAULT_SHARED_MEMORY_MB = 16
+
+# Models loaded in a pool process, by model path and backend.
+_MODELS: dict[tuple[str, Backend], object] = {}
+
+
+class SharedRing:
+    """A shared memory block written in turn by the encodes of a pool process, and read by the server process.
+
+    The first 8 bytes count the bytes written so far. The embeddings follow, each array contiguous, after the previous
+    one or from the start again when it does not fit before the end. A reader checks, once it has copied an array,
+    that the writer has not come around the ring to it in the meantime.
+    """
+
+    HEADER = 8
+
+    def __init__(self, shm: SharedMemory):
+        self.shm = shm
+        self.capacity = (shm.size - self.HEADER) // 4 * 4
+        self._written = np.ndarray((1,), np.int64, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, size: int) -> "SharedRing":
+        return cls(SharedMemory(create=True, size=cls.HEADER + size))
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedRing":
+        return cls(SharedMemory(name=name))
+
+    def write(self, array: np.ndarray) -> int | None:
+        """Write a float32 ``array``, and return where it starts; None when it is larger than the ring."""
+        if array.nbytes > self.capacity:
+            return None
+        start = int(self._written[0])
+        offset = start % self.capacity
+        if offset + array.nbytes > self.capacity:
+            start += self.capacity - offset
+            offset = 0
+        # Counted before it is written, so that a reader of the bytes it overwrites discards them.
+        self._written[0] = start + array.nbytes
+        self._view(offset, array.shape)[...] = array
+        return start
+
+    def read(self, start: int, shape: tuple[int, ...]) -> np.ndarray | None:
+        """A copy of the array written at ``start``, or None if it has been overwritten."""
+        array = self._view(start % self.capacity, shape).copy()
+        return array if int(self._written[0]) <= start + self.capacity else None
+
+    def _view(self, offset: int, shape: tuple[int, ...]) -> np.ndarray:
+        return np.ndarray(shape, np.float32, buffer=self.shm.buf, offset=self.HEADER + offset)
+
+    def close(self, unlink: bool = False):
+        self._written = None
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# The shared memory ring of a pool process.
+_RING: SharedRing | None = None
+
+
+def _initialize(torch_threads: int | None, shared_memory: int = 0):
+    global _RING
+    if torch_threads:
+        import torch
+
+        torch.set_num_threads(torch_threads)
+    if shared_memory:
+        _RING = SharedRing.create(shared_memory)
+        # Unlinked when the process exits; the server process unlinks the rings of those that die.
+        util.Finalize(None, _RING.shm.unlink, exitpriority=0)
+
+
+def _model(model_path: str, backend: Backend):
+    model = _MODELS.get((model_path, backend))
+    if model is None:
+        model = _MODELS[model_path, backend] = load_model(model_path, backend)
+    return model
+
+
+def _load(model_path: str, backend: Backend):
+    _model(model_path, backend)
+
+
+def _encode(
+    model_path: str, backend: Backend, texts: list[str], shared: bool = True
+) -> tuple[str, int, tuple[int, ...]] | np.ndarray:
+    """Run in a pool process: encode ``texts``, and return where the embeddings are in the ring of the process, or
+    the embeddings themselves when they are not ``shared`` or do not fit in it."""
+    model = _model(model_path, backend)
+    embeddings = np.ascontiguousarray(model.encode(texts, show_progress_bar=False), dtype=np.float32)
+    start = _RING.write(embeddings) if shared and _RING is not None else None
+    if start is None:
+        return embeddings
+    return _RING.shm.name, start, embeddings.shape
+
+
+class EmbeddingExecutor:
+    def __init__(
+        self,
+        processes: int = 1,
+        torch_threads: int | None = None,
+        shared_memory: int = DEFAULT_SHARED_MEMORY_MB * 1024 * 1024,
+    ):
+        self.processes = max(1, processes)
+        self.torch_threads = torch_threads
+        self.shared_memory = shared_memory
+        self._pool: ProcessPoolExecutor | None = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Rings of the pool processes, attached by name on their first result.
+        self._rings: dict[str, SharedRing] = {}
+        self.tasks = self.errors = self.restarts = self.overwritten = 0
+
+    def pool(self) -> ProcessPoolExecutor:
+        """The pool of this process, started on first use: pre-forked workers each start their own."""
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                if self._pid != os.getpid():
+                    # Inherited from the parent process, whose pool owns them.
+                    self._rings = {}
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_initialize,
+                    initargs=(self.torch_threads, self.shared_memory),
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def submit(self, fn, *args) -> Future:
+        self.tasks += 1
+        try:
+            return self.pool().submit(fn, *args)
+        except BrokenProcessPool:
+            self._replace_broken_pool()
+            return self.pool().submit(fn, *args)
+
+    def result(self, future: Future):
+        try:
+            return future.result()
+        except Exception as e:
+            self.errors += 1
+            if isinstance(e, BrokenProcessPool):
+                self._replace_broken_pool()
+            raise
+
+    def _replace_broken_pool(self):
+        with self._lock:
+            # ProcessPoolExecutor flags itself broken when one of its processes dies.
+            if self._pool is None or not getattr(self._pool, "_broken", False):
+                return
+            logger.warning("A process of the embedding process pool died, starting a new pool")
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._close_rings()
+            self.restarts += 1
+
+    def _close_rings(self):
+        """Unlink the rings of the pool, whether its processes exited or died."""
+        for ring in self._rings.values():
+            ring.close(unlink=True)
+        self._rings = {}
+
+    def submit_encode(self, model_path: str, backend: Backend, texts: list[str]) -> Future:
+        """Encode ``texts`` in the pool; the embeddings are read with read()."""
+        future = self.submit(_encode, model_path, backend, texts)
+        future.encode_args = (model_path, backend, texts)
+        return future
+
+    def read(self, future: Future) -> np.ndarray:
+        """Blocking: the embeddings of a submit_encode() future, encoded again if the ring wrapped over them."""
+        result = self.result(future)
+        if isinstance(result, np.ndarray):
+            return result
+        name, start, shape = result
+        with self._lock:
+            ring = self._rings.get(name)
+            if ring is None:
+                ring = self._rings[name] = SharedRing.attach(name)
+        embeddings = ring.read(start, shape)
+        if embeddings is None:
+            with self._lock:
+                self.overwritten += 1
+            embeddings = self.result(self.submit(_encode, *future.encode_args, False))
+        return embeddings
+
+    def encode(self, model_path: str, backend: Backend, texts: list[str]) -> np.ndarray:
+        """Blocking: to be called in a thread, as llama-stack calls SentenceTransformer.encode."""
+        return self.read(self.submit_encode(model_path, backend, texts))
+
+    def stats(self) -> dict:
+        return {
+            "processes": self.processes,
+            "torch_threads": self.torch_threads,
+            "started": self._pool is not None and self._pid == os.getpid(),
+            "shared_memory": self.shared_memory,
+            "tasks": self.tasks,
+            "errors": self.errors,
+            "restarts": self.restarts,
+            "overwritten": self.overwritten,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._close_rings()
+            self._pool = None
+
+
+class PooledModel:
+    """Stand-in of a SentenceTransformer in llama-stack's model cache, encoding in the process pool."""
+
+    def __init__(self, executor: EmbeddingExecutor, model_path: str, backend: Backend = Backend()):
+        self.executor = executor
+        self.model_path = model_path
+        self.backend = backend
+
+    def encode(self, sentences, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        texts = [sentences] if isinstance(sentences, str) else list(sentences)
+        embeddings = self.executor.encode(self.model_path, self.backend, texts)
+        return embeddings[0] if isinstance(sentences, str) else embeddings
+
+
+EMBEDDING_EXECUTOR: EmbeddingExecutor | None = None
+
+
+def enabled() -> bool:
+    return os.environ.get(EXECUTOR_ENV, "thread").lower() == "process"
+
+
+def from_env() -> EmbeddingExecutor | None:
+    if not enabled():
+        return None
+    torch_threads = os.environ.get(TORCH_THREADS_ENV)
+    return EmbeddingExecutor(
+        int(os.environ.get(PROCESSES_ENV, 1)),
+        int(torch_threads) if torch_threads else None,
+        int(float(os.environ.get(SHARED_MEMORY_ENV, DEFAULT_SHARED_MEMORY_MB)) * 1024 * 1024),
+    )
+
+
+def stats() -> dict:
+    return EMBEDDING_EXECUTOR.stats() if EMBEDDING_EXECUTOR else {"enabled": False}
+
+
+def install_hooks():
+    """Load the sentence-transformers embedding models in the process pool instead of the server process."""
+    global EMBEDDING_EXECUTOR
+    EMBEDDING_EXECUTOR = from_env()
+    if EMBEDDING_EXECUTOR is None:
+        return
+    try:
+        from llama_stack.providers.utils.inference import embedding_mixin
+    except ImportError:
+        logger.warning("llama-stack not found, the embedding models run in the server process")
+        return
+
+    load_model = embedding_mixin.SentenceTransformerEmbeddingMixin._load_sentence_transformer_model
+
+    @functools.wraps(load_model)
+    async def load_pooled_model(self, model: str):
+        loaded_model = embedding_mixin.EMBEDDING_MODELS.get(model)
+        if loaded_model is not None:
+            return loaded_model
+        async with embedding_mixin.EMBEDDING_MODELS_LOCK:
+            loaded_model = embedding_mixin.EMBEDDING_MODELS.get(model)
+            if loaded_model is not None:
+                return loaded_model
+            backend = backend_of(self)
+            logger.info("Loading sentence transformer %s (%s) in the embedding process pool", model, backend)
+            # Loaded by one pool process, so that load errors surface here; the others load it on first use.
+            future = EMBEDDING_EXECUTOR.submit(_load, model, backend)
+            await asyncio.to_thread(EMBEDDING_EXECUTOR.result, future)
+            loaded_model = embedding_mixin.EMBEDDING_MODELS[model] = PooledModel(EMBEDDING_EXECUTOR, model, backend)
+            return loaded_model
+
+    embedding_mixin.SentenceTransformerEmbeddingMixin._load_sentence_transformer_model = load_pooled_model
@@ -0,0 +1,1043 @@
+"""Approximate FAISS indexes for the inline::faiss vector stores.
+
+llama-stack's inline::faiss provider searches every vector store with an exact
+IndexFlatL2, whose cost grows linearly with the number of chunks. It
+deserializes whatever index type it finds in its kvstore though, so this module
+rewrites the index of an existing store DB (aap_faiss_store.db, or a BYOK
+faiss_store.db) with an approximate one, built offline from the chunk
+embeddings stored next to it:
+
+    python -m ansible_chatbot_stack.faiss_index /.llama/data/distributions/ansible-chatbot/aap_faiss_store.db \\
+        --index hnsw:m=32,ef_search=64
+
+Index specs are ``<type>[:<param>=<value>,...]``:
+
+    flat      exact search, as built by llama-stack
+    ivf_flat  nlist (default: 4 * sqrt(chunks)), nprobe (default: 16)
+    hnsw      m (default: 32), ef_construction (default: 200), ef_search (default: 64)
+    ivf_pq    nlist, nprobe, pq_m sub-quantizers (default: dimension / 8), pq_nbits (default: 8)
+
+The search parameters (nprobe, ef_search) are serialized with the index. The
+metric stays L2, which the provider turns into 1 / distance scores. Chunks
+inserted at runtime are added to the trained index as they are to a flat one,
+but deleting chunks is only supported by flat storage: HNSW cannot remove
+vectors, and IVF keeps the IDs the provider renumbers, so install_hooks()
+makes the provider refuse to delete chunks from other indexes. Update such
+stores offline instead (ingest --update, then --compact).
+scripts/faiss_index_benchmark.py measures the recall and latency of index specs
+against the exact index.
+
+Memory and search time also scale with the dimension of the vectors and with
+their float32 storage. With --transform, the rewritten index reduces and/or
+quantizes the vectors it stores:
+
+    python -m ansible_chatbot_stack.faiss_index <store DB> --index hnsw --transform pca:256,int8
+
+Transforms are comma-separated steps, at most one of each kind:
+
+    pca:<dimension>       PCA projection, trained on the stored embeddings
+    truncate:<dimension>  leading dimensions, normalized again (Matryoshka truncation, for models trained for it)
+    int8                  8-bit scalar quantization of each dimension (flat, ivf_flat and hnsw indexes)
+
+The projection is part of the index (an IndexPreTransform), which the provider
+serializes with the store, so the embedding of every query, and of every chunk
+inserted at runtime, is projected the same way as the stored ones; the record
+also keeps the transform under "vector_transform". It is trained from the
+chunk embeddings stored next to the index, which must all be present. The
+benchmark reports the size and recall of each --transform too.
+
+Chunks deleted or replaced offline (see ansible_chatbot_stack.ingest --update)
+become tombstones: the chunk keeps its place in chunk_by_index, as the provider
+numbers the chunks it adds after the existing ones, with no content and a
+"tombstone" flag in its metadata, and its vector stays in the index.
+install_hooks() makes the provider's searches skip the tombstoned vectors with
+a FAISS ID selector. --compact drops them, renumbering the remaining chunks:
+
+    python -m ansible_chatbot_stack.faiss_index <store DB> --compact
+
+Flat indexes, reduced or int8 ones included, drop the vectors in place; the
+others are rebuilt with their recorded index spec and transform. --index
+rewrites compact the stores too.
+
+Every process deserializes the indexes from the kvstore into its own memory.
+With --export, the index of each store is also written to a standalone file next
+to the DB, named after a digest of the stored index:
+
+    python -m ansible_chatbot_stack.faiss_index <store DB> --export
+
+and with FAISS_INDEX_MMAP=true, install_hooks() makes the provider load these
+files memory-mapped read-only (IO_FLAG_MMAP_IFC, which maps the vectors of flat
+and HNSW indexes and the inverted lists of IVF ones), so that the workers and
+the pods of a node share them in the page cache, and startup skips decoding and
+deserializing them. An index whose file is missing, or whose stored index
+changed since the export, is deserialized as usual. The pre-forked workers of
+ansible_chatbot_stack.prefork also share the indexes that preload() loads before
+forking them. Shared stores are read-only: inserting or deleting chunks fails.
+
+reload() loads again, in the background, the indexes whose store DB changed
+since loaded, such as a new snapshot (see ansible_chatbot_stack.snapshots), and
+swaps them in: the searches in flight finish on the index they started with.
+store_version() tells the content of a loaded store apart from the previous
+ones: its store DB version and the chunk changes made at runtime since loaded.
+
+Dense retrieval misses the exact identifiers of many questions (module names,
+error strings). --bm25 builds a BM25 inverted index of the chunks of each store
+(see ansible_chatbot_stack.bm25), stored in the kvstore next to its index, and
+kept up to date by --index rewrites, --compact and the BYOK ingestion:
+
+    python -m ansible_chatbot_stack.faiss_index <store DB> --bm25
+
+With HYBRID_SEARCH=true, install_hooks() loads them with the indexes, answers
+the provider's keyword queries from them, and its hybrid queries by fusing, in
+one call, the BM25 and vector rankings of the HYBRID_SEARCH_CANDIDATES best
+chunks of each with llama-stack's reranker (RRF by default). The fusion only
+orders the chunks: they are scored with their vector scores, sorted, so that
+the results of hybrid and vector-only stores are ranked on one scale when
+merged (see store_search) and trimmed (see rag_context). A chunk found by BM25
+only is scored as the last vector candidate. The vector queries of the stores
+that have a BM25 index, such as those of knowledge_search, become hybrid ones. The BM25 index records a digest of the IDs of the chunks it
+was built for, in their order, and is not used for other chunks. Inserting or
+deleting chunks at runtime renumbers them, so it drops the BM25 index of the
+store, loaded and stored: the store is then searched by vector only, until
+--bm25 builds it again.
+
+Environment:
+    FAISS_INDEX_MMAP          "true" to load the exported index files memory-mapped (default: false)
+    HYBRID_SEARCH             "true" to fuse the BM25 and vector rankings of the stores with a BM25 index
+                              (default: false)
+    HYBRID_SEARCH_CANDIDATES  chunks ranked by each of BM25 and vector search before fusing them (default: 20)
+"""
+
+import argparse
+import asyncio
+import base64
+import functools
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import sqlite3
+import sys
+import time
+import weakref
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from ansible_chatbot_stack.bm25 import BM25Index, chunk_text
+
+logger = logging.getLogger(__name__)
+
+# Key layout of llama-stack's inline::faiss provider (providers/inline/vector_io/faiss/faiss.py).
+KVSTORE_TABLE = "kvstore"
+VECTOR_STORES_PREFIX = "vector_stores:v3::"
+FAISS_INDEX_PREFIX = "faiss_index:v3::"
+# The BM25 index of a vector store's chunks, see bm25.
+BM25_PREFIX = "bm25_index:v1::"
+
+MMAP_ENV = "FAISS_INDEX_MMAP"
+HYBRID_ENV = "HYBRID_SEARCH"
+HYBRID_CANDIDATES_ENV = "HYBRID_SEARCH_CANDIDATES"
+DEFAULT_HYBRID_CANDIDATES = 20
+INDEX_FILE_SUFFIX = ".faiss"
+
+INDEX_PARAMS = {
+    "flat": {},
+    "ivf_flat": {"nlist": None, "nprobe": 16},
+    "hnsw": {"m": 32, "ef_construction": 200, "ef_search": 64},
+    "ivf_pq": {"nlist": None, "nprobe": 16, "pq_m": None, "pq_nbits": 8},
+}
+TOMBSTONE_KEY = "tombstone"
+REDUCTIONS = ("pca", "truncate")
+QUANTIZATIONS = ("int8",)
+
+
+@dataclass
+class IndexSpec:
+    kind: str
+    params: dict = field(default_factory=dict)
+
+    @classmethod
+    def parse(cls, text: str) -> "IndexSpec":
+        """``hnsw:m=32,ef_search=64`` -> IndexSpec("hnsw", {"m": 32, "ef_search": 64})."""
+        kind, _, params_text = text.strip().partition(":")
+        if kind not in INDEX_PARAMS:
+            raise ValueError(f"Unknown index type {kind!r}, expected one of {', '.join(INDEX_PARAMS)}")
+        params = {}
+        for item in filter(None, (p.strip() for p in params_text.split(","))):
+            name, _, value = item.partition("=")
+            if name not in INDEX_PARAMS[kind]:
+                raise ValueError(f"Unknown {kind} parameter {name!r}, expected one of {', '.join(INDEX_PARAMS[kind])}")
+            try:
+                params[name] = int(value)
+            except ValueError:
+                raise ValueError(f"{kind} parameter {name} must be an integer, got {value!r}") from None
+        return cls(kind, params)
+
+    def resolve(self, count: int, dimension: int) -> dict:
+        """The parameters of the index of ``count`` vectors of ``dimension``, defaults included."""
+        params = {**INDEX_PARAMS[self.kind], **self.params}
+        if "nlist" in params and params["nlist"] is None:
+            params["nlist"] = max(1, min(count, round(4 * math.sqrt(count))))
+        if "pq_m" in params and params["pq_m"] is None:
+            params["pq_m"] = dimension // 8
+        return params
+
+    def __str__(self):
+        return ":".join([self.kind, ",".join(f"{k}={v}" for k, v in self.params.items())]).rstrip(":")
+
+
+@dataclass(frozen=True)
+class VectorTransform:
+    reduction: str | None = None
+    dimension: int | None = None
+    quantization: str | None = None
+
+    @classmethod
+    def parse(cls, text: str) -> "VectorTransform":
+        """``pca:256,int8`` -> VectorTransform("pca", 256, "int8")."""
+        reduction = dimension = quantization = None
+        for step in filter(None, (s.strip() for s in text.split(","))):
+            name, _, value = step.partition(":")
+            if name in REDUCTIONS:
+                if reduction:
+                    raise ValueError(f"Only one dimensionality reduction per transform, got {reduction} and {name}")
+                try:
+                    reduction, dimension = name, int(value)
+                except ValueError:
+                    raise ValueError(f"{name} needs a dimension, e.g. {name}:256, got {step!r}") from None
+                if dimension < 1:
+                    raise ValueError(f"{name} dimension must be positive, got {dimension}")
+            elif name in QUANTIZATIONS and not value:
+                quantization = name
+            else:
+                raise ValueError(
+                    f"Unknown transform step {step!r}, expected {' or '.join(f'{r}:<dimension>' for r in REDUCTIONS)}"
+                    f" or {', '.join(QUANTIZATIONS)}"
+                )
+        if reduction is None and quantization is None:
+            raise ValueError("Empty transform")
+        return cls(reduction, dimension, quantization)
+
+    def output_dimension(self, dimension: int) -> int:
+        """The dimension of the stored vectors, for embeddings of ``dimension``."""
+        if self.reduction is None:
+            return dimension
+        if self.dimension >= dimension:
+            raise ValueError(f"{self.reduction}:{self.dimension} does not reduce embeddings of dimension {dimension}")
+        return self.dimension
+
+    def __str__(self):
+        steps = [f"{self.reduction}:{self.dimension}" if self.reduction else None, self.quantization]
+        return ",".join(filter(None, steps))
+
+
+def _reduced(index, transform: VectorTransform, dimension: int):
+    """``index`` of reduced vectors, behind the projection of the embeddings of ``dimension``."""
+    import faiss
+
+    if transform.reduction == "pca":
+        return faiss.IndexPreTransform(faiss.PCAMatrix(dimension, transform.dimension), index)
+    # Matryoshka: the leading dimensions, normalized again like the embeddings of the model.
+    reduced = faiss.IndexPreTransform(faiss.NormalizationTransform(transform.dimension, 2.0), index)
+    reduced.prepend_transform(faiss.RemapDimensionsTransform(dimension, transform.dimension, False))
+    return reduced
+
+
+def build_index(vectors: np.ndarray, spec: IndexSpec, transform: VectorTransform | None = None):
+    """A FAISS index of ``spec`` over ``vectors``, which get IDs 0..n-1 like in the flat index."""
+    import faiss
+
+    transform = transform or VectorTransform()
+    count, embedding_dimension = vectors.shape
+    dimension = transform.output_dimension(embedding_dimension)
+    int8 = transform.quantization == "int8"
+    params = spec.resolve(count, dimension)
+    if spec.kind == "flat":
+        if int8:
+            index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+        else:
+            index = faiss.IndexFlatL2(dimension)
+    elif spec.kind == "hnsw":
+        if int8:
+            index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, params["m"])
+        else:
+            index = faiss.IndexHNSWFlat(dimension, params["m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+    else:
+        if count < params["nlist"]:
+            raise ValueError(f"{spec.kind} needs at least nlist={params['nlist']} chunks to train, got {count}")
+        quantizer = faiss.IndexFlatL2(dimension)
+        if spec.kind == "ivf_flat" and int8:
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dimension, params["nlist"], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2
+            )
+        elif spec.kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, params["nlist"])
+        else:
+            if int8:
+                raise ValueError("ivf_pq already quantizes the vectors, int8 applies to flat, ivf_flat and hnsw")
+            if not params["pq_m"] or dimension % params["pq_m"]:
+                raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {dimension}")
+            if count < 2 ** params["pq_nbits"]:
+                raise ValueError(
+                    f"ivf_pq with pq_nbits={params['pq_nbits']} needs at least {2 ** params['pq_nbits']} chunks to train,"
+                    f" got {count}; use a smaller pq_nbits, or hnsw"
+                )
+            index = faiss.IndexIVFPQ(quantizer, dimension, params["nlist"], params["pq_m"], params["pq_nbits"])
+        index.nprobe = min(params["nprobe"], params["nlist"])
+    if transform.reduction:
+        index = _reduced(index, transform, embedding_dimension)
+    if not index.is_trained:
+        # Trains the projection first, then the index on the projected vectors.
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def serialize_index(index) -> str:
+    """The index as llama-stack stores it: np.save of faiss.serialize_index, base64 encoded."""
+    import faiss
+
+    buffer = io.BytesIO()
+    np.save(buffer, faiss.serialize_index(index), allow_pickle=False)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def deserialize_index(data: str):
+    import faiss
+
+    return faiss.deserialize_index(np.load(io.BytesIO(base64.b64decode(data)), allow_pickle=False))
+
+
+def load_stores(db_path: Path) -> dict[str, dict]:
+    """Vector store ID -> stored index record ({"chunk_by_index": ..., "faiss_index": ...}) of a store DB."""
+    with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as db:
+        rows = db.execute(
+            f"SELECT key, value FROM {KVSTORE_TABLE} WHERE key >= ? AND key <= ?",
+            (FAISS_INDEX_PREFIX, f"{FAISS_INDEX_PREFIX}\xff"),
+        ).fetchall()
+    return {key.removeprefix(FAISS_INDEX_PREFIX): json.loads(value) for key, value in rows}
+
+
+def store_vectors(record: dict) -> np.ndarray:
+    """The chunk embeddings of a stored index record, in index order."""
+    chunks = sorted((int(i), json.loads(chunk)) for i, chunk in record["chunk_by_index"].items())
+    if [i for i, _ in chunks] != list(range(len(chunks))):
+        raise ValueError("chunk_by_index keys are not contiguous from 0")
+    if chunks and all(chunk.get("embedding") for _, chunk in chunks):
+        return np.array([chunk["embedding"] for _, chunk in chunks], dtype=np.float32)
+    # Chunks stored without their embedding: read the vectors back from the index, when it keeps them.
+    if record.get("vector_transform"):
+        raise ValueError(f"Chunks stored without their embedding, and a {record['vector_transform']} index")
+    index = deserialize_index(record["faiss_index"])
+    if index.ntotal != len(chunks):
+        raise ValueError(f"Index has {index.ntotal} vectors for {len(chunks)} chunks")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def chunk_document_id(chunk: dict) -> str | None:
+    """The document_id of a stored chunk, from its metadata first, as llama-stack's Chunk.document_id."""
+    return (chunk.get("metadata") or {}).get("document_id") or (chunk.get("chunk_metadata") or {}).get("document_id")
+
+
+def is_tombstone(chunk) -> bool:
+    """If a chunk, as stored or as the provider loads it, is a tombstone."""
+    return bool(_chunk_metadata(chunk).get(TOMBSTONE_KEY))
+
+
+def tombstone(chunk: dict) -> dict:
+    """A stored chunk deleted offline: it keeps its place, and its vector in the index, until compacted."""
+    document_id = chunk_document_id(chunk)
+    return {
+        "content": "",
+        "chunk_id": chunk["chunk_id"],
+        "metadata": {"document_id": document_id, TOMBSTONE_KEY: True},
+        "chunk_metadata": {"chunk_id": chunk["chunk_id"], "document_id": document_id},
+        "embedding": [],
+        "embedding_model": chunk.get("embedding_model", ""),
+        "embedding_dimension": chunk.get("embedding_dimension", 0),
+    }
+
+
+def compact_record(record: dict) -> int:
+    """Drop the tombstoned chunks of a stored index record and their vectors; returns how many."""
+    import faiss
+
+    chunks = sorted((int(i), chunk) for i, chunk in record["chunk_by_index"].items())
+    parsed = [(i, chunk, json.loads(chunk)) for i, chunk in chunks]
+    dead = [i for i, _, chunk in parsed if is_tombstone(chunk)]
+    if not dead:
+        return 0
+    live = [(chunk, data) for _, chunk, data in parsed if not is_tombstone(data)]
+    index = deserialize_index(record["faiss_index"])
+    storage = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexPreTransform) else index
+    if not live:
+        index.reset()
+    elif isinstance(storage, faiss.IndexFlatCodes):
+        # Flat storage shifts the following vectors down, keeping them in the order of the chunks.
+        index.remove_ids(np.array(dead, dtype=np.int64))
+    else:
+        if not all(data.get("embedding") for _, data in live):
+            raise ValueError("Chunks stored without their embedding, the index cannot be rebuilt without tombstones")
+        vectors = np.array([data["embedding"] for _, data in live], dtype=np.float32)
+        spec = IndexSpec.parse(record.get("index_spec") or "flat")
+        transform = VectorTransform.parse(record["vector_transform"]) if record.get("vector_transform") else None
+        index = build_index(vectors, spec, transform)
+    record["chunk_by_index"] = {str(n): chunk for n, (chunk, _) in enumerate(live)}
+    record["faiss_index"] = serialize_index(index)
+    record.pop("index_file", None)
+    return len(dead)
+
+
+def _selected_stores(db_path: Path, store_ids: list[str] | None) -> dict[str, dict]:
+    stores = load_stores(db_path)
+    missing = set(store_ids or ()) - set(stores)
+    if missing:
+        raise ValueError(f"Vector stores not found in {db_path}: {', '.join(sorted(missing))}")
+    return {store_id: stores[store_id] for store_id in store_ids or sorted(stores)}
+
+
+def _save_record(db: sqlite3.Connection, store_id: str, record: dict):
+    db.execute(
+        f"UPDATE {KVSTORE_TABLE} SET value = ? WHERE key = ?", (json.dumps(record), f"{FAISS_INDEX_PREFIX}{store_id}")
+    )
+
+
+def rewrite(
+    db_path: Path, spec: IndexSpec, store_ids: list[str] | None = None, transform: VectorTransform | None = None
+) -> dict[str, dict]:
+    """Replace the index of the vector stores of a store DB (all of them by default) by one of ``spec``."""
+    results = {}
+    with closing(sqlite3.connect(db_path)) as db, db:
+        for store_id, record in _selected_stores(db_path, store_ids).items():
+            compact_record(record)
+            vectors = store_vectors(record)
+            start = time.perf_counter()
+            index = build_index(vectors, spec, transform)
+            build_time = time.perf_counter() - start
+            dimension = (transform or VectorTransform()).output_dimension(vectors.shape[1])
+            params = spec.resolve(len(vectors), dimension)
+            previous_size = len(record["faiss_index"])
+            record["faiss_index"] = serialize_index(index)
+            # Informational only: the provider reads the index type, and the projection, from the index itself.
+            record["index_spec"] = str(IndexSpec(spec.kind, params))
+            if transform:
+                record["vector_transform"] = str(transform)
+            else:
+                record.pop("vector_transform", None)
+            record.pop("index_file", None)
+            _save_record(db, store_id, record)
+            _refresh_bm25(db, store_id, record)
+            results[store_id] = {
+                "chunks": len(vectors),
+                "dimension": vectors.shape[1],
+                "index": spec.kind,
+                "params": params,
+                "vector_transform": str(transform) if transform else None,
+                "stored_dimension": dimension,
+                "build_time": round(build_time, 3),
+                "size": len(record["faiss_index"]),
+                "previous_size": previous_size,
+            }
+    return results
+
+
+def compact(db_path: Path, store_ids: list[str] | None = None) -> dict[str, int]:
+    """Drop the tombstoned chunks of the vector stores of a store DB (all of them by default); returns how many."""
+    compacted = {}
+    with closing(sqlite3.connect(db_path)) as db, db:
+        for store_id, record in _selected_stores(db_path, store_ids).items():
+            compacted[store_id] = compact_record(record)
+            if compacted[store_id]:
+                _save_record(db, store_id, record)
+                _refresh_bm25(db, store_id, record)
+    return compacted
+
+
+def _index_digest(record: dict) -> str:
+    return hashlib.sha256(record["faiss_index"].encode()).hexdigest()[:16]
+
+
+def _chunk_id(chunk) -> str | None:
+    """The ID of a chunk as the provider loads it (an EmbeddedChunk), or as stored."""
+    return chunk.get("chunk_id") if isinstance(chunk, dict) else getattr(chunk, "chunk_id", None)
+
+
+def chunk_ids_digest(chunk_by_index: dict) -> str:
+    """A digest of the IDs of the chunks of a store, in the order of their positions."""
+    ids = (_chunk_id(chunk_by_index[i]) or "" for i in sorted(chunk_by_index))
+    return hashlib.sha256("\n".join(ids).encode()).hexdigest()[:16]
+
+
+def bm25_record(record: dict) -> dict:
+    """The stored BM25 index of the chunks of a stored index record, by their position in chunk_by_index."""
+    chunks = {int(i): json.loads(chunk) for i, chunk in record["chunk_by_index"].items()}
+    index = BM25Index.build([chunk_text(chunks[i]) for i in range(len(chunks))])
+    return {
+        "chunks": len(chunks),
+        "chunk_ids": chunk_ids_digest(chunks),
+        "digest": _index_digest(record),
+        "index": base64.b64encode(index.serialize()).decode(),
+    }
+
+
+def save_bm25(db: sqlite3.Connection, store_id: str, record: dict):
+    db.execute(
+        f"INSERT OR REPLACE INTO {KVSTORE_TABLE} VALUES (?, ?, NULL)",
+        (f"{BM25_PREFIX}{store_id}", json.dumps(bm25_record(record))),
+    )
+
+
+def _refresh_bm25(db: sqlite3.Connection, store_id: str, record: dict):
+    """Build again the BM25 index of a store that has one: it refers to the chunks by position."""
+    if db.execute(f"SELECT 1 FROM {KVSTORE_TABLE} WHERE key = ?", (f"{BM25_PREFIX}{store_id}",)).fetchone():
+        save_bm25(db, store_id, record)
+
+
+def build_bm25(db_path: Path, store_ids: list[str] | None = None) -> dict[str, str]:
+    """Build the BM25 index of the vector stores of a store DB (all of them by default) that have none up to date."""
+    results = {}
+    with closing(sqlite3.connect(db_path)) as db, db:
+        for store_id, record in _selected_stores(db_path, store_ids).items():
+            key = f"{BM25_PREFIX}{store_id}"
+            row = db.execute(f"SELECT value FROM {KVSTORE_TABLE} WHERE key = ?", (key,)).fetchone()
+            stored = json.loads(row[0]) if row else {}
+            chunks = {int(i): json.loads(chunk) for i, chunk in record["chunk_by_index"].items()}
+            if stored.get("chunk_ids") == chunk_ids_digest(chunks) and stored.get("digest") == _index_digest(record):
+                results[store_id] = "up to date"
+                continue
+            save_bm25(db, store_id, record)
+            results[store_id] = "built"
+    return results
+
+
+def index_file_name(db_path: Path, store_id: str, record: dict) -> str:
+    """Name of the exported index file of a stored index record, which changes with the stored index."""
+    return f"{db_path.stem}.{store_id}.{_index_digest(record)}{INDEX_FILE_SUFFIX}"
+
+
+def export(db_path: Path, store_ids: list[str] | None = None) -> dict[str, Path]:
+    """Write the index of the vector stores of a store DB to files next to it, and record their names."""
+    import faiss
+
+    exported = {}
+    with closing(sqlite3.connect(db_path)) as db, db:
+        for store_id, record in _selected_stores(db_path, store_ids).items():
+            path = db_path.with_name(index_file_name(db_path, store_id, record))
+            if not path.is_file():
+                # Written aside and renamed, so that running processes keep mapping the previous file.
+                partial = path.with_name(f".{path.name}.partial")
+                faiss.write_index(deserialize_index(record["faiss_index"]), str(partial))
+                os.replace(partial, path)
+            for stale in db_path.parent.glob(f"{db_path.stem}.{store_id}.*{INDEX_FILE_SUFFIX}"):
+                if stale != path:
+                    stale.unlink()
+            if record.get("index_file") != path.name:
+                record["index_file"] = path.name
+                _save_record(db, store_id, record)
+            exported[store_id] = path
+    return exported
+
+
+def backup(db_path: Path) -> Path:
+    """Copy the store DB next to itself with sqlite's online backup."""
+    target = db_path.with_name(f"{db_path.name}.bak")
+    with closing(sqlite3.connect(db_path)) as source, closing(sqlite3.connect(target)) as copy:
+        source.backup(copy)
+    return target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", type=Path, help="store DB of an inline::faiss provider")
+    parser.add_argument("--index", type=IndexSpec.parse, help="index spec to rewrite with, e.g. ivf_flat:nprobe=16")
+    parser.add_argument(
+        "--transform", type=VectorTransform.parse, help="reduce and/or quantize the indexed vectors, e.g. pca:256,int8"
+    )
+    parser.add_argument("--compact", action="store_true", help="drop the tombstoned chunks and their vectors")
+    parser.add_argument("--bm25", action="store_true", help="build the BM25 indexes of the chunks, for hybrid search")
+    parser.add_argument("--export", action="store_true", help="write the indexes to files next to the DB, for mmap")
+    parser.add_argument("--store", action="append", help="vector store ID to modify or export (default: all)")
+    parser.add_argument("--no-backup", action="store_true", help="do not copy the DB to <db>.bak before modifying it")
+    args = parser.parse_args(argv)
+    if args.index is None and not args.compact and not args.bm25 and not args.export:
+        parser.error("one of --index, --compact, --bm25 or --export is required")
+    if args.transform is not None and args.index is None:
+        parser.error("--transform requires --index")
+
+    if not args.db.is_file():
+        print(f"Store DB not found: {args.db}")
+        return 1
+    if (args.index is not None or args.compact) and not args.no_backup:
+        print(f"Backup written to: {backup(args.db)}")
+    if args.index is not None:
+        try:
+            results = rewrite(args.db, args.index, args.store, args.transform)
+        except ValueError as e:
+            print(f"Index not rewritten: {e}")
+            return 1
+        for store_id, result in results.items():
+            print(f"Vector store {store_id}: {json.dumps(result)}")
+    elif args.compact:
+        try:
+            compacted = compact(args.db, args.store)
+        except ValueError as e:
+            print(f"Index not compacted: {e}")
+            return 1
+        for store_id, count in compacted.items():
+            print(f"Vector store {store_id}: {count} tombstoned chunks dropped")
+    if args.bm25:
+        try:
+            built = build_bm25(args.db, args.store)
+        except (ValueError, KeyError) as e:
+            print(f"BM25 index not built: {e}")
+            return 1
+        for store_id, outcome in built.items():
+            print(f"Vector store {store_id}: BM25 index {outcome}")
+    if args.export:
+        try:
+            exported = export(args.db, args.store)
+        except (ValueError, OSError, sqlite3.Error) as e:
+            print(f"Index not exported: {e}")
+            return 1
+        for store_id, path in exported.items():
+            print(f"Vector store {store_id}: exported to {path}")
+    return 0
+
+
+@dataclass
+class SharedIndex:
+    """An index and its chunks loaded outside the provider, which the provider's FaissIndex adopts read-only."""
+
+    name: str  # index_file_name() of the stored record it was loaded from
+    index: Any
+    chunk_by_index: dict
+    source: str  # the memory-mapped index file, or the store DB it was deserialized from
+
+
+# (store DB path, vector store ID) -> index loaded before forking the workers, see prefork.
+PRELOADED: dict[tuple[str, str], SharedIndex] = {}
+# The provider FaissIndex instances of this process, see reload().
+LOADED: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _mmap_enabled() -> bool:
+    return os.environ.get(MMAP_ENV, "false").lower() == "true"
+
+
+def _hybrid_enabled() -> bool:
+    return os.environ.get(HYBRID_ENV, "false").lower() == "true"
+
+
+def _hybrid_candidates() -> int:
+    return int(os.environ.get(HYBRID_CANDIDATES_ENV, DEFAULT_HYBRID_CANDIDATES))
+
+
+def _load_shared(db_path: Path, store_id: str, record: dict, provider, deserialize: bool) -> SharedIndex | None:
+    """The index of a stored record, memory-mapped when exported, else deserialized if ``deserialize``."""
+    name = index_file_name(db_path, store_id, record)
+    path = db_path.with_name(name)
+    if _mmap_enabled() and record.get("index_file") == name and path.is_file():
+        index = provider.faiss.read_index(str(path), provider.faiss.IO_FLAG_MMAP_IFC | provider.faiss.IO_FLAG_READ_ONLY)
+        source = str(path)
+    elif deserialize:
+        index = deserialize_index(record["faiss_index"])
+        source = str(db_path)
+    else:
+        return None
+    chunk_by_index = {
+        int(k): provider.load_embedded_chunk_with_backward_compat(json.loads(v))
+        for k, v in record["chunk_by_index"].items()
+    }
+    if index.ntotal != len(chunk_by_index):
+        logger.warning("Index of %s from %s has %d vectors for %d chunks", store_id, source, index.ntotal, len(chunk_by_index))
+        return None
+    return SharedIndex(name, index, chunk_by_index, source)
+
+
+def preload(db_path: Path) -> list[str]:
+    """Load the indexes of the vector stores of a store DB into PRELOADED; returns their IDs."""
+    try:
+        from llama_stack.providers.inline.vector_io.faiss import faiss as provider
+    except ImportError:
+        logger.warning("llama-stack not found, FAISS indexes are not preloaded")
+        return []
+    preloaded = []
+    for store_id, record in load_stores(db_path).items():
+        shared = _load_shared(db_path, store_id, record, provider, deserialize=True)
+        if shared is not None:
+            PRELOADED[(str(db_path), store_id)] = shared
+            preloaded.append(store_id)
+    return preloaded
+
+
+async def _adopt_shared(index, provider) -> bool:
+    """Initialize a provider FaissIndex with a preloaded or memory-mapped index, if there is an up-to-date one."""
+    db_path = getattr(index.kvstore, "db_path", None)
+    if not db_path or not index.bank_id:
+        return False
+    stored = await index.kvstore.get(f"{FAISS_INDEX_PREFIX}{index.bank_id}")
+    if not stored:
+        return False
+    record = json.loads(stored)
+    db_path = Path(db_path)
+    shared = PRELOADED.get((str(db_path), index.bank_id))
+    if shared is None or shared.name != index_file_name(db_path, index.bank_id, record):
+        shared = _load_shared(db_path, index.bank_id, record, provider, deserialize=False)
+    if shared is None:
+        logger.info("No up-to-date index file for vector store %s, deserializing its index", index.bank_id)
+        return False
+    index.index = shared.index
+    index.chunk_by_index = shared.chunk_by_index
+    index.chunk_ids = [chunk.chunk_id for chunk in shared.chunk_by_index.values()]
+    index.shared_index_source = shared.source
+    logger.info("Vector store %s: %d vectors shared read-only from %s", index.bank_id, index.index.ntotal, shared.source)
+    return True
+
+
+def _read_only(method):
+    """Refuse to modify a shared index: FAISS aborts the process when resizing mapped storage."""
+
+    @functools.wraps(method)
+    async def guarded(self, *args, **kwargs):
+        source = getattr(self, "shared_index_source", None)
+        if source:
+            raise ValueError(f"Vector store {self.bank_id} is read-only, its index is shared from {source}")
+        return await method(self, *args, **kwargs)
+
+    return guarded
+
+
+def _flat_deletes(method, faiss):
+    """Refuse to delete chunks from an index that cannot remove vectors in place: the provider removes the vector
+    at the position of a chunk, then renumbers the following chunks down."""
+
+    @functools.wraps(method)
+    async def guarded(self, *args, **kwargs):
+        storage = self.index
+        if isinstance(storage, faiss.IndexPreTransform):
+            storage = faiss.downcast_index(storage.index)
+        if not isinstance(storage, faiss.IndexFlatCodes):
+            raise ValueError(
+                f"Vector store {self.bank_id} has a {type(storage).__name__} index, whose chunks cannot be deleted: "
+                "update it with ansible_chatbot_stack.ingest --update and compact it instead"
+            )
+        return await method(self, *args, **kwargs)
+
+    return guarded
+
+
+def _search_parameters(faiss, index, selector):
+    """Search parameters of ``index`` restricted to ``selector``, keeping the index's own nprobe or efSearch."""
+    if isinstance(index, faiss.IndexPreTransform):
+        return faiss.SearchParametersPreTransform(
+            index_params=_search_parameters(faiss, faiss.downcast_index(index.index), selector)
+        )
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _chunk_metadata(chunk) -> dict:
+    """The metadata of a chunk as the provider loads it (an EmbeddedChunk), or as stored."""
+    return (chunk.get("metadata") if isinstance(chunk, dict) else getattr(chunk, "metadata", None)) or {}
+
+
+def _live_selector(index, chunk_by_index: dict, faiss):
+    """An ID selector excluding the tombstones of a provider FaissIndex, or None; cached until its chunks change."""
+    cached = getattr(index, "_live_selector", None)
+    if cached and cached[0] is chunk_by_index and cached[1] == len(chunk_by_index):
+        return cached[2]
+    dead = [i for i, chunk in chunk_by_index.items() if _chunk_metadata(chunk).get(TOMBSTONE_KEY)]
+    selector = None
+    if dead:
+        batch = faiss.IDSelectorBatch(np.array(dead, dtype=np.int64))
+        # The batch selector is kept along, since the negation does not own it.
+        selector = (faiss.IDSelectorNot(batch), batch)
+    index._live_selector = (chunk_by_index, len(chunk_by_index), selector)
+    return selector
+
+
+def _db_version(db_path: str) -> tuple:
+    """The file a store DB path resolves to, its inode and modification time: changed by a snapshot or an update."""
+    path = os.path.realpath(db_path)
+    stat = os.stat(path)
+    return path, stat.st_ino, stat.st_mtime_ns
+
+
+def _read_value(db_path: Path, key: str) -> str | None:
+    with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as db:
+        row = db.execute(f"SELECT value FROM {KVSTORE_TABLE} WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _load_record(db_path: Path, store_id: str) -> dict:
+    stored = _read_value(db_path, f"{FAISS_INDEX_PREFIX}{store_id}")
+    if stored is None:
+        raise ValueError(f"Vector store {store_id} not found in {db_path}")
+    return json.loads(stored)
+
+
+def _bm25_index(stored: str | None, store_id: str, chunk_by_index: dict) -> BM25Index | None:
+    """The BM25 index of a stored value, unless there is none or it was built for other chunks than
+    ``chunk_by_index``."""
+    if not stored:
+        return None
+    stored = json.loads(stored)
+    if stored.get("chunk_ids") != chunk_ids_digest(chunk_by_index):
+        logger.warning("BM25 index of vector store %s is out of date, rebuild it with --bm25", store_id)
+        return None
+    return BM25Index.deserialize(base64.b64decode(stored["index"]))
+
+
+async def _load_bm25(index) -> BM25Index | None:
+    """The BM25 index of a provider FaissIndex, from its kvstore."""
+    try:
+        stored = await index.kvstore.get(f"{BM25_PREFIX}{index.bank_id}")
+        return await asyncio.to_thread(_bm25_index, stored, index.bank_id, index.chunk_by_index)
+    except Exception as e:
+        logger.warning("BM25 index of vector store %s not loaded, hybrid search disabled: %s", index.bank_id, e)
+        return None
+
+
+def _current_bm25(index, chunk_by_index: dict) -> BM25Index | None:
+    """The BM25 index of a provider FaissIndex, if it indexes its chunks: inserting or deleting chunks drops it."""
+    bm25 = getattr(index, "bm25", None)
+    return bm25 if bm25 is not None and len(bm25) == len(chunk_by_index) else None
+
+
+def _counts_changes(method):
+    """Count the chunk changes of a provider FaissIndex, for store_version()."""
+
+    @functools.wraps(method)
+    async def counted(self, *args, **kwargs):
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            self.chunk_changes = getattr(self, "chunk_changes", 0) + 1
+
+    return counted
+
+
+def store_version(store_id: str) -> list | None:
+    """The version of the content of a vector store loaded in this process, or None: the path, inode and
+    modification time of the store DB it was loaded from, and the chunk changes made since."""
+    for index in list(LOADED):
+        if index.bank_id == store_id:
+            return [*(getattr(index, "db_version", None) or ()), getattr(index, "chunk_changes", 0)]
+    return None
+
+
+def _drops_bm25(method):
+    """Drop the BM25 index of the store, loaded and stored, before changing its chunks: the provider appends the
+    chunks it inserts, and renumbers down the chunks after those it deletes, which the BM25 index refers to by
+    position."""
+
+    @functools.wraps(method)
+    async def unindexed(self, *args, **kwargs):
+        key = f"{BM25_PREFIX}{self.bank_id}"
+        self.bm25 = None
+        if await self.kvstore.get(key) is not None:
+            await self.kvstore.delete(key)
+            logger.warning("Chunks of vector store %s change, BM25 index dropped: rebuild it with --bm25", self.bank_id)
+        return await method(self, *args, **kwargs)
+
+    return unindexed
+
+
+def _vector_hits(faiss, index, selector, embedding, k: int) -> list[tuple[int, float]]:
+    """The positions and 1 / distance scores of the ``k`` nearest chunks, without the tombstones of ``selector``."""
+    search = functools.partial(index.search, embedding.reshape(1, -1).astype(np.float32), k)
+    if selector is not None:
+        search = functools.partial(search, params=_search_parameters(faiss, index, selector[0]))
+    distances, indices = search()
+    return [(int(i), 1.0 / float(d) if d != 0 else float("inf")) for d, i in zip(distances[0], indices[0]) if i >= 0]
+
+
+def _keyword_hits(bm25: BM25Index, chunk_by_index: dict, query: str, k: int) -> list[tuple[int, float]]:
+    """The positions and BM25 scores of the ``k`` best matching chunks, without the tombstones."""
+    positions, scores = bm25.search(query, k)
+    return [
+        (int(position), float(score))
+        for position, score in zip(positions, scores)
+        if not _chunk_metadata(chunk_by_index[int(position)]).get(TOMBSTONE_KEY)
+    ]
+
+
+async def reload_index(index, provider) -> bool:
+    """Swap in the index and chunks of a provider FaissIndex whose store DB changed; returns whether it did.
+
+    The new index is loaded in a thread, memory-mapped if exported, then swapped in in one step of the event loop:
+    the searches in flight finish on the index they started with.
+    """
+    db_path = getattr(index.kvstore, "db_path", None)
+    if not db_path or not index.bank_id:
+        return False
+    version = _db_version(db_path)
+    if version == getattr(index, "db_version", None):
+        return False
+    path = Path(version[0])
+    record = await asyncio.to_thread(_load_record, path, index.bank_id)
+    shared = await asyncio.to_thread(_load_shared, path, index.bank_id, record, provider, True)
+    if shared is None:
+        raise ValueError(f"Index of vector store {index.bank_id} in {path} does not match its chunks")
+    bm25 = None
+    if _hybrid_enabled():
+        stored = await asyncio.to_thread(_read_value, path, f"{BM25_PREFIX}{index.bank_id}")
+        bm25 = await asyncio.to_thread(_bm25_index, stored, index.bank_id, shared.chunk_by_index)
+    index.index, index.chunk_by_index, index.bm25 = shared.index, shared.chunk_by_index, bm25
+    index.chunk_ids = [chunk.chunk_id for chunk in shared.chunk_by_index.values()]
+    index.shared_index_source = shared.source if shared.source != str(path) else None
+    index.db_version = version
+    index.chunk_changes = 0
+    logger.info("Vector store %s: %d vectors reloaded from %s", index.bank_id, index.index.ntotal, shared.source)
+    return True
+
+
+async def reload() -> dict[str, str]:
+    """Reload the provider indexes of this process whose store DB changed; returns the outcome by vector store ID."""
+    try:
+        from llama_stack.providers.inline.vector_io.faiss import faiss as provider
+    except ImportError:
+        return {}
+    results = {}
+    for index in list(LOADED):
+        try:
+            results[index.bank_id] = "reloaded" if await reload_index(index, provider) else "unchanged"
+        except Exception as e:
+            logger.warning("Vector store %s not reloaded, it keeps its index: %s", index.bank_id, e)
+            results[index.bank_id] = f"failed: {type(e).__name__}: {e}"
+    return results
+
+
+def install_hooks():
+    """Make the inline::faiss provider adopt the preloaded indexes, or the exported ones with FAISS_INDEX_MMAP=true,
+    and search the BM25 indexes with HYBRID_SEARCH=true."""
+    try:
+        from llama_stack.providers.inline.vector_io.faiss import faiss as provider
+    except ImportError:
+        logger.warning("llama-stack not found, FAISS indexes are not shared")
+        return
+
+    initialize = provider.FaissIndex.initialize
+
+    @functools.wraps(initialize)
+    async def shared_initialize(self):
+        db_path = getattr(self.kvstore, "db_path", None)
+        if db_path and os.path.exists(db_path):
+            # Taken first, so that a change while loading is reloaded by the next reload().
+            self.db_version = _db_version(db_path)
+        LOADED.add(self)
+        adopted = False
+        if PRELOADED or _mmap_enabled():
+            try:
+                adopted = await _adopt_shared(self, provider)
+            except Exception as e:
+                logger.warning("Shared index of vector store %s not loaded, deserializing it: %s", self.bank_id, e)
+        if not adopted:
+            await initialize(self)
+        self.bm25 = await _load_bm25(self) if _hybrid_enabled() else None
+
+    def response(chunk_by_index: dict, hits: list[tuple[int, float]], score_threshold: float):
+        hits = [(i, score) for i, score in hits if score >= score_threshold]
+        return provider.QueryChunksResponse(chunks=[chunk_by_index[i] for i, _ in hits], scores=[s for _, s in hits])
+
+    query_vector = provider.FaissIndex.query_vector
+
+    @functools.wraps(query_vector)
+    async def live_query_vector(self, embedding, k: int, score_threshold: float):
+        # As the provider's query_vector, skipping the tombstones, on the index and chunks of the call's start,
+        # which reload() may swap while it searches.
+        index, chunk_by_index = self.index, self.chunk_by_index
+        selector = _live_selector(self, chunk_by_index, provider.faiss)
+        hits = await asyncio.to_thread(_vector_hits, provider.faiss, index, selector, embedding, k)
+        return response(chunk_by_index, hits, score_threshold)
+
+    provider.FaissIndex.initialize = shared_initialize
+    provider.FaissIndex.query_vector = live_query_vector
+    provider.FaissIndex.add_chunks = _read_only(_counts_changes(_drops_bm25(provider.FaissIndex.add_chunks)))
+    provider.FaissIndex.delete_chunks = _read_only(
+        _flat_deletes(_counts_changes(_drops_bm25(provider.FaissIndex.delete_chunks)), provider.faiss)
+    )
+
+    try:
+        from llama_stack.providers.utils.memory.vector_store import VectorStoreWithIndex
+        from llama_stack.providers.utils.vector_io import WeightedInMemoryAggregator
+    except ImportError as e:
+        logger.warning("llama-stack's hybrid search not found, BM25 indexes are not searched: %s", e)
+        return
+
+    query_keyword = provider.FaissIndex.query_keyword
+
+    @functools.wraps(query_keyword)
+    async def bm25_query_keyword(self, query_string: str, k: int, score_threshold: float):
+        chunk_by_index = self.chunk_by_index
+        bm25 = _current_bm25(self, chunk_by_index)
+        if bm25 is None:
+            return await query_keyword(self, query_string, k, score_threshold)
+        hits = await asyncio.to_thread(_keyword_hits, bm25, chunk_by_index, query_string, k)
+        return response(chunk_by_index, hits, score_threshold)
+
+    query_hybrid = provider.FaissIndex.query_hybrid
+
+    @functools.wraps(query_hybrid)
+    async def fused_query_hybrid(
+        self,
+        embedding,
+        query_string: str,
+        k: int,
+        score_threshold: float,
+        reranker_type: str = "rrf",
+        reranker_params: dict[str, float] | None = None,
+    ):
+        index, chunk_by_index = self.index, self.chunk_by_index
+        bm25 = _current_bm25(self, chunk_by_index)
+        if bm25 is None:
+            return await query_hybrid(self, embedding, query_string, k, score_threshold, reranker_type, reranker_params)
+        # Both rankings go deeper than k: RRF favours the chunks ranked well by both.
+        depth = max(k, _hybrid_candidates())
+        selector = _live_selector(self, chunk_by_index, provider.faiss)
+        vector_hits, keyword_hits = await asyncio.gather(
+            asyncio.to_thread(_vector_hits, provider.faiss, index, selector, embedding, depth),
+            asyncio.to_thread(_keyword_hits, bm25, chunk_by_index, query_string, depth),
+        )
+        vector_scores = dict(vector_hits)
+        fused = WeightedInMemoryAggregator.combine_search_results(
+            vector_scores, dict(keyword_hits), reranker_type, reranker_params
+        )
+        positions = sorted(fused, key=fused.get, reverse=True)[:k]
+        # The fused ranks are not comparable with the 1 / distance scores of the vector-only stores: the fused
+        # order is scored with the vector scores of its chunks.
+        floor = min(vector_scores.values(), default=0.0)
+        scores = sorted((vector_scores.get(i, floor) for i in positions), reverse=True)
+        return response(chunk_by_index, list(zip(positions, scores)), score_threshold)
+
+    query_chunks = VectorStoreWithIndex.query_chunks
+
+    @functools.wraps(query_chunks)
+    async def hybrid_query_chunks(self, query, params=None):
+        params = params or {}
+        if (
+            _hybrid_enabled()
+            and params.get("mode") in (None, "vector")
+            and _current_bm25(self.index, getattr(self.index, "chunk_by_index", {})) is not None
+        ):
+            params = {**params, "mode": "hybrid"}
+        return await query_chunks(self, query, params)
+
+    provider.FaissIndex.query_keyword = bm25_query_keyword
+    provider.FaissIndex.query_hybrid = fused_query_hybrid
+    VectorStoreWithIndex.query_chunks = hybrid_query_chunks
+
+
+if __name__ == "__main__":
+    sys.exit(main())
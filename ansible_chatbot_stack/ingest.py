@@ -0,0 +1,553 @@
+"""Resumable ingestion of a directory of documents into a BYOK vector store.
+
+Builds the store DB of an inline::faiss provider (faiss_store.db) and its
+provider_vector_db_id.ind, as the byok_rag entries of lightspeed-stack expect
+them:
+
+    python -m ansible_chatbot_stack.ingest docs/ byok_vector_db/ --model embeddings_model \\
+        --vector-store-id byok-docs-0001 --processes 4
+
+The documents are the files under the directory with one of the --suffix
+extensions, read one at a time in path order, and identified by their path
+relative to it (their document_id). Each is cut into paragraph-aligned chunks
+of at most --chunk-words words, each chunk starting with the last
+--overlap-words words of the previous one. The chunks are embedded in batches
+of --batch-size texts by a pool of --processes processes (see
+embedding_executor), two batches per process in flight, and staged in the store
+DB with one transaction per --commit-documents documents, along with the
+SHA-256 of each document. An interrupted ingestion resumes where it stopped
+when run again with the same settings: the documents already staged are
+skipped, unless their content changed since.
+
+Once every document is staged, the chunks are indexed (with a flat index, as
+llama-stack builds it, or with --index and --transform, see faiss_index), the
+vector store and its index are written to the kvstore as the provider writes
+them, along with the BM25 index of the chunks for HYBRID_SEARCH (see
+faiss_index), and the staged chunks are dropped. The document hashes stay in the
+ingest_documents table. Progress, in documents and chunks per second, is
+printed every --progress-interval seconds.
+
+With --update, an ingested store is brought up to date with the directory
+instead, at a cost proportional to the change: only the documents added or
+changed since are embedded. Their previous chunks, and those of the documents
+removed from the directory, become tombstones (see faiss_index), and their new
+chunks are added to the existing index. Once the tombstones exceed
+--compact-ratio of the chunks, the index is compacted. --update also applies to
+a store DB not built by this command, such as aap_faiss_store.db (see
+--db-name), given the directory of its documents: its first update embeds
+every document, replacing the chunks it holds.
+
+The embedding model recorded with the store, --embedding-model, must be the
+embedding_model of the byok_rag entry: sentence-transformers/<model path in the
+container>.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from ansible_chatbot_stack.embedding_backend import BACKENDS, Backend
+from ansible_chatbot_stack.embedding_executor import EmbeddingExecutor
+from ansible_chatbot_stack.faiss_index import (
+    FAISS_INDEX_PREFIX,
+    KVSTORE_TABLE,
+    VECTOR_STORES_PREFIX,
+    IndexSpec,
+    VectorTransform,
+    build_index,
+    chunk_document_id,
+    compact_record,
+    deserialize_index,
+    is_tombstone,
+    save_bm25,
+    serialize_index,
+    tombstone,
+)
+
+DB_NAME = "faiss_store.db"
+ID_FILE_NAME = "provider_vector_db_id.ind"
+DEFAULT_SUFFIXES = (".md", ".txt", ".rst", ".adoc")
+DEFAULT_PROVIDER_ID = "byok-docs"
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers//.llama/data/embeddings_model"
+DEFAULT_CHUNK_WORDS = 180
+DEFAULT_OVERLAP_WORDS = 20
+DEFAULT_COMPACT_RATIO = 0.2
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {KVSTORE_TABLE} (key TEXT PRIMARY KEY, value TEXT, expiration TIMESTAMP);
+CREATE TABLE IF NOT EXISTS ingest_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS ingest_documents (
+    document_id TEXT PRIMARY KEY, sha256 TEXT NOT NULL, chunks INTEGER NOT NULL, status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingest_chunks (
+    id INTEGER PRIMARY KEY, document_id TEXT NOT NULL, chunk TEXT NOT NULL, embedding BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ingest_chunks_document ON ingest_chunks (document_id);
+"""
+
+_HEADING = re.compile(r"^\s*(?:#{1,6}|={1,6})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
+
+def chunk_text(text: str, chunk_words: int, overlap_words: int) -> list[str]:
+    """Paragraph-aligned chunks of at most ``chunk_words`` words, overlapping by ``overlap_words``."""
+    pieces = []  # paragraphs, the longer ones cut in chunk_words windows
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        pieces += [words[i : i + chunk_words] for i in range(0, len(words), chunk_words)]
+    chunks, current, count = [], [], 0
+    for piece in pieces:
+        if current and count + len(piece) > chunk_words:
+            chunks.append(current)
+            tail = [word for words in current for word in words][-overlap_words:] if overlap_words else []
+            current, count = ([tail], len(tail)) if tail and len(tail) + len(piece) <= chunk_words else ([], 0)
+        current.append(piece)
+        count += len(piece)
+    if current:
+        chunks.append(current)
+    return ["\n\n".join(" ".join(words) for words in chunk) for chunk in chunks]
+
+
+def document_title(text: str, path: Path) -> str:
+    """The first Markdown or AsciiDoc heading of a document, else its file name."""
+    match = _HEADING.search(text)
+    return match.group(1) if match else path.stem
+
+
+def document_paths(root: Path, suffixes: tuple[str, ...]) -> list[Path]:
+    return sorted(p for p in root.rglob("*") if p.is_file() and p.suffix.lower() in suffixes)
+
+
+@dataclass
+class Document:
+    document_id: str
+    sha256: str
+    title: str
+    chunks: list[str]
+    embeddings: list = field(init=False)  # of each chunk, as its batch comes back
+    pending: int = field(init=False)  # chunks not embedded yet
+
+    def __post_init__(self):
+        self.embeddings = [None] * len(self.chunks)
+        self.pending = len(self.chunks)
+
+    def chunk_json(self, number: int) -> str:
+        """The chunk as llama-stack's EmbeddedChunk, without its embedding, added when the store is indexed."""
+        chunk_id = f"{self.document_id}#{number}"
+        return json.dumps(
+            {
+                "content": self.chunks[number],
+                "chunk_id": chunk_id,
+                "metadata": {"document_id": self.document_id, "source": self.document_id, "title": self.title},
+                "chunk_metadata": {"chunk_id": chunk_id, "document_id": self.document_id, "source": self.document_id},
+            }
+        )
+
+
+def open_store(db_path: Path, settings: dict, force: bool = False, update: bool = False) -> sqlite3.Connection:
+    """The store DB, its staging tables created; raises ValueError if it holds another ingestion or store."""
+    if force:
+        for path in (db_path, db_path.with_name(f"{db_path.name}-journal")):
+            path.unlink(missing_ok=True)
+    db = sqlite3.connect(db_path)
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    foreign = KVSTORE_TABLE in tables and "ingest_state" not in tables
+    if foreign and not update:
+        db.close()
+        raise ValueError(
+            f"{db_path} holds vector stores not ingested by this command, "
+            "use --update to update it or --force to replace it"
+        )
+    key = f"{FAISS_INDEX_PREFIX}{settings['vector_store_id']}"
+    if foreign and db.execute(f"SELECT 1 FROM {KVSTORE_TABLE} WHERE key = ?", (key,)).fetchone() is None:
+        db.close()
+        raise ValueError(f"{db_path} has no vector store {settings['vector_store_id']}")
+    with db:
+        db.executescript(SCHEMA)
+        stored = db.execute("SELECT value FROM ingest_state WHERE key = 'settings'").fetchone()
+        if stored is None:
+            db.execute("INSERT INTO ingest_state VALUES ('settings', ?)", (json.dumps(settings),))
+            # A store built elsewhere is updated as if ingested, with none of its documents known.
+            db.execute("INSERT INTO ingest_state VALUES ('status', ?)", ("indexed" if foreign else "staging",))
+    if stored is not None and json.loads(stored[0]) != settings:
+        db.close()
+        raise ValueError(f"{db_path} was started with other settings ({stored[0]}), use --force to start over")
+    if state(db, "status") == "indexed" and not update:
+        db.close()
+        raise ValueError(f"{db_path} is already ingested, use --update to apply changes or --force to ingest again")
+    return db
+
+
+def state(db: sqlite3.Connection, key: str) -> str | None:
+    row = db.execute("SELECT value FROM ingest_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+class Ingestion:
+    """Documents staged in the store DB, their chunks embedded by the process pool as they are read."""
+
+    def __init__(
+        self,
+        db: sqlite3.Connection,
+        executor: EmbeddingExecutor,
+        model_path: str,
+        backend: Backend = Backend(),
+        batch_size: int = 64,
+        commit_documents: int = 100,
+        progress_interval: float = 10.0,
+        out=print,
+    ):
+        self.db = db
+        self.executor = executor
+        self.model_path = model_path
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.commit_documents = max(1, commit_documents)
+        self.progress_interval = progress_interval
+        self.out = out
+        self.max_in_flight = 2 * executor.processes
+        self._batch: list[tuple[Document, int]] = []
+        self._in_flight: deque[tuple[Future, list[tuple[Document, int]]]] = deque()
+        self._ready: list[Document] = []
+        self.total = self.skipped = self.deleted = self.documents = self.chunks = 0
+        self._started = self._reported = time.monotonic()
+
+    def run(self, root: Path, paths: list[Path], chunk_words: int, overlap_words: int) -> dict:
+        self.total = len(paths)
+        staged = dict(self.db.execute("SELECT document_id, sha256 FROM ingest_documents"))
+        document_ids = {path.relative_to(root).as_posix() for path in paths}
+        with self.db:
+            # Removed from the directory since staged: their chunks, when indexed, are deleted by apply_update().
+            for document_id in set(staged) - document_ids:
+                self.db.execute("DELETE FROM ingest_chunks WHERE document_id = ?", (document_id,))
+                self.db.execute("DELETE FROM ingest_documents WHERE document_id = ?", (document_id,))
+                self.deleted += 1
+        for path in paths:
+            text = path.read_text(encoding="utf-8", errors="replace")
+            sha256 = hashlib.sha256(text.encode()).hexdigest()
+            document_id = path.relative_to(root).as_posix()
+            if staged.get(document_id) == sha256:
+                self.skipped += 1
+                continue
+            chunks = chunk_text(text, chunk_words, overlap_words)
+            document = Document(document_id, sha256, document_title(text, path), chunks)
+            if not document.chunks:
+                self._ready.append(document)
+            for number in range(len(document.chunks)):
+                self._batch.append((document, number))
+                if len(self._batch) >= self.batch_size:
+                    self._submit()
+        if self._batch:
+            self._submit()
+        while self._in_flight:
+            self._collect()
+        self._write()
+        return self.stats()
+
+    def _submit(self):
+        texts = [document.chunks[number] for document, number in self._batch]
+        self._in_flight.append((self.executor.submit_encode(self.model_path, self.backend, texts), self._batch))
+        self._batch = []
+        if len(self._in_flight) >= self.max_in_flight:
+            self._collect()
+
+    def _collect(self):
+        future, batch = self._in_flight.popleft()
+        embeddings = self.executor.read(future)
+        for (document, number), embedding in zip(batch, embeddings):
+            document.embeddings[number] = embedding
+            document.pending -= 1
+            if not document.pending:
+                self._ready.append(document)
+        if len(self._ready) >= self.commit_documents:
+            self._write()
+
+    def _write(self):
+        """Stage the fully embedded documents, in one transaction."""
+        with self.db:
+            for document in self._ready:
+                self.db.execute("DELETE FROM ingest_chunks WHERE document_id = ?", (document.document_id,))
+                self.db.executemany(
+                    "INSERT INTO ingest_chunks (document_id, chunk, embedding) VALUES (?, ?, ?)",
+                    [
+                        (document.document_id, document.chunk_json(n), np.asarray(e, dtype=np.float32).tobytes())
+                        for n, e in enumerate(document.embeddings)
+                    ],
+                )
+                self.db.execute(
+                    "INSERT OR REPLACE INTO ingest_documents VALUES (?, ?, ?, 'staged')",
+                    (document.document_id, document.sha256, len(document.chunks)),
+                )
+        self.documents += len(self._ready)
+        self.chunks += sum(len(document.chunks) for document in self._ready)
+        self._ready = []
+        if time.monotonic() - self._reported >= self.progress_interval:
+            self._reported = time.monotonic()
+            self.out(self.progress())
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "documents": self.total,
+            "skipped": self.skipped,
+            "deleted": self.deleted,
+            "ingested": self.documents,
+            "chunks": self.chunks,
+            "seconds": round(elapsed, 3),
+            "documents_per_second": round(self.documents / elapsed, 2),
+            "chunks_per_second": round(self.chunks / elapsed, 2),
+        }
+
+    def progress(self) -> str:
+        stats = self.stats()
+        return (
+            f"{self.skipped + self.documents}/{self.total} documents ({self.skipped} unchanged),"
+            f" {self.chunks} chunks, {stats['documents_per_second']} documents/s, {stats['chunks_per_second']} chunks/s"
+        )
+
+    def close(self):
+        """Drop the batches still in the pool."""
+        for future, _ in self._in_flight:
+            future.cancel()
+        self.executor.shutdown()
+        self._in_flight.clear()
+
+
+def staged_chunks(db: sqlite3.Connection, settings: dict):
+    """The staged chunks, as the provider stores them, and their embeddings."""
+    for chunk, embedding in db.execute("SELECT chunk, embedding FROM ingest_chunks ORDER BY id"):
+        vector = np.frombuffer(embedding, dtype=np.float32)
+        chunk = json.loads(chunk)
+        chunk.update(
+            embedding=vector.tolist(), embedding_model=settings["embedding_model"], embedding_dimension=len(vector)
+        )
+        yield json.dumps(chunk), vector
+
+
+def finalize(
+    db: sqlite3.Connection, settings: dict, spec: IndexSpec | None = None, transform: VectorTransform | None = None
+) -> dict:
+    """Index the staged chunks, write the vector store and its index to the kvstore, and drop the staged chunks."""
+    chunk_by_index, vectors = {}, []
+    for i, (chunk, vector) in enumerate(staged_chunks(db, settings)):
+        chunk_by_index[str(i)] = chunk
+        vectors.append(vector)
+    if not vectors:
+        raise ValueError("No chunks to index: no document has any text")
+    vectors = np.vstack(vectors)
+    index = build_index(vectors, spec or IndexSpec("flat"), transform)
+    record = {"chunk_by_index": chunk_by_index, "faiss_index": serialize_index(index)}
+    if spec is not None:
+        dimension = (transform or VectorTransform()).output_dimension(vectors.shape[1])
+        record["index_spec"] = str(IndexSpec(spec.kind, spec.resolve(len(vectors), dimension)))
+    if transform is not None:
+        record["vector_transform"] = str(transform)
+    vector_store_id = settings["vector_store_id"]
+    # llama-stack's VectorStore resource, as the provider registers it.
+    vector_store = {
+        "identifier": vector_store_id,
+        "provider_resource_id": vector_store_id,
+        "provider_id": settings["provider_id"],
+        "type": "vector_store",
+        "embedding_model": settings["embedding_model"],
+        "embedding_dimension": vectors.shape[1],
+        "vector_store_name": None,
+    }
+    with db:
+        db.execute(
+            f"INSERT OR REPLACE INTO {KVSTORE_TABLE} VALUES (?, ?, NULL)",
+            (f"{VECTOR_STORES_PREFIX}{vector_store_id}", json.dumps(vector_store)),
+        )
+        db.execute(
+            f"INSERT OR REPLACE INTO {KVSTORE_TABLE} VALUES (?, ?, NULL)",
+            (f"{FAISS_INDEX_PREFIX}{vector_store_id}", json.dumps(record)),
+        )
+        save_bm25(db, vector_store_id, record)
+        db.execute("DELETE FROM ingest_chunks")
+        db.execute("UPDATE ingest_documents SET status = 'indexed'")
+        db.execute("UPDATE ingest_state SET value = 'indexed' WHERE key = 'status'")
+    db.execute("VACUUM")
+    return {"chunks": len(vectors), "dimension": vectors.shape[1], "size": len(record["faiss_index"])}
+
+
+def apply_update(db: sqlite3.Connection, settings: dict, compact_ratio: float = DEFAULT_COMPACT_RATIO) -> dict:
+    """Apply the staged documents to the indexed vector store, and drop the staged chunks.
+
+    The chunks of every document that is not indexed and unchanged, that is of the documents changed or removed
+    since, or never ingested by this command, become tombstones; the staged chunks are added to the index.
+    """
+    key = f"{FAISS_INDEX_PREFIX}{settings['vector_store_id']}"
+    row = db.execute(f"SELECT value FROM {KVSTORE_TABLE} WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        raise ValueError(f"Vector store {settings['vector_store_id']} not found in the store DB")
+    record = json.loads(row[0])
+    chunk_by_index = record["chunk_by_index"]
+    indexed = {row[0] for row in db.execute("SELECT document_id FROM ingest_documents WHERE status = 'indexed'")}
+    tombstones = tombstoned = 0
+    for i, chunk in chunk_by_index.items():
+        chunk = json.loads(chunk)
+        if is_tombstone(chunk):
+            tombstones += 1
+        elif chunk_document_id(chunk) not in indexed:
+            chunk_by_index[i] = json.dumps(tombstone(chunk))
+            tombstoned += 1
+    staged = list(staged_chunks(db, settings))
+    if staged:
+        index = deserialize_index(record["faiss_index"])
+        vectors = np.vstack([vector for _, vector in staged])
+        if vectors.shape[1] != index.d:
+            raise ValueError(f"The embeddings have {vectors.shape[1]} dimensions, the index of the store {index.d}")
+        if index.ntotal != len(chunk_by_index):
+            raise ValueError(f"The index holds {index.ntotal} vectors for {len(chunk_by_index)} chunks")
+        # Numbered as the provider's add_chunks numbers them, after the tombstones, which keep their slot.
+        for n, (chunk, _) in enumerate(staged):
+            chunk_by_index[str(index.ntotal + n)] = chunk
+        index.add(vectors)
+        record["faiss_index"] = serialize_index(index)
+    compacted = 0
+    if tombstones + tombstoned > compact_ratio * len(chunk_by_index):
+        compacted = compact_record(record)
+    if staged or tombstoned or compacted:
+        # Its index was changed: the provider loads it from the record.
+        record.pop("index_file", None)
+    with db:
+        db.execute(f"UPDATE {KVSTORE_TABLE} SET value = ? WHERE key = ?", (json.dumps(record), key))
+        save_bm25(db, settings["vector_store_id"], record)
+        db.execute("DELETE FROM ingest_chunks")
+        db.execute("UPDATE ingest_documents SET status = 'indexed'")
+    return {
+        "added_chunks": len(staged),
+        "tombstoned_chunks": tombstoned,
+        "compacted_chunks": compacted,
+        "chunks": len(record["chunk_by_index"]),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("documents", type=Path, help="directory of the documents to ingest")
+    parser.add_argument("output", type=Path, help=f"directory of the store DB and {ID_FILE_NAME} to write")
+    parser.add_argument("--db-name", default=DB_NAME, help=f"file name of the store DB (default: {DB_NAME})")
+    parser.add_argument("--vector-store-id", required=True, help="ID of the vector store, the byok_rag vector_db_id")
+    parser.add_argument(
+        "--provider-id", default=DEFAULT_PROVIDER_ID, help=f"byok_rag rag_id (default: {DEFAULT_PROVIDER_ID})"
+    )
+    parser.add_argument("--model", required=True, help="local directory of the sentence-transformers model")
+    parser.add_argument(
+        "--embedding-model",
+        default=DEFAULT_EMBEDDING_MODEL,
+        help=f"embedding model ID recorded with the store (default: {DEFAULT_EMBEDDING_MODEL})",
+    )
+    parser.add_argument("--backend", choices=BACKENDS, default="torch", help="embedding backend (default: torch)")
+    parser.add_argument("--quantization", help="ONNX quantization of the backend, see embedding_backend")
+    parser.add_argument(
+        "--suffix",
+        dest="suffixes",
+        action="append",
+        help=f"extension of the files to ingest, repeatable (default: {' '.join(DEFAULT_SUFFIXES)})",
+    )
+    parser.add_argument("--chunk-words", type=int, default=DEFAULT_CHUNK_WORDS, help="words per chunk at most")
+    parser.add_argument("--overlap-words", type=int, default=DEFAULT_OVERLAP_WORDS, help="words shared by chunks")
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks embedded per batch (default: 64)")
+    parser.add_argument("--processes", type=int, default=1, help="embedding processes (default: 1)")
+    parser.add_argument(
+        "--threads", type=int, help="torch threads per process (default: CPUs / processes, with several processes)"
+    )
+    parser.add_argument("--commit-documents", type=int, default=100, help="documents staged per transaction")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="seconds between progress reports")
+    parser.add_argument(
+        "--index", type=IndexSpec.parse, help="index spec of a new store, see faiss_index (default: flat)"
+    )
+    parser.add_argument("--transform", type=VectorTransform.parse, help="vector transform of a new store")
+    parser.add_argument("--update", action="store_true", help="update the ingested store with the changed documents")
+    parser.add_argument(
+        "--compact-ratio",
+        type=float,
+        default=DEFAULT_COMPACT_RATIO,
+        help=f"share of tombstoned chunks compacted by an update (default: {DEFAULT_COMPACT_RATIO})",
+    )
+    parser.add_argument("--force", action="store_true", help="discard the store DB and start over")
+    args = parser.parse_args(argv)
+    if not 0 <= args.overlap_words < args.chunk_words:
+        parser.error("--overlap-words must be smaller than --chunk-words")
+    args.suffixes = tuple(f".{s.lower().lstrip('.')}" for s in args.suffixes or DEFAULT_SUFFIXES)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        backend = Backend.parse(args.backend, args.quantization)
+    except ValueError as e:
+        print(e)
+        return 1
+    if not args.documents.is_dir():
+        print(f"Documents directory not found: {args.documents}")
+        return 1
+    paths = document_paths(args.documents, args.suffixes)
+    if not paths:
+        print(f"No {'/'.join(args.suffixes)} files in {args.documents}")
+        return 1
+    settings = {
+        "vector_store_id": args.vector_store_id,
+        "provider_id": args.provider_id,
+        "embedding_model": args.embedding_model,
+        "chunk_words": args.chunk_words,
+        "overlap_words": args.overlap_words,
+    }
+    args.output.mkdir(parents=True, exist_ok=True)
+    db_path = args.output / args.db_name
+    try:
+        db = open_store(db_path, settings, args.force, args.update)
+    except ValueError as e:
+        print(e)
+        return 1
+    updating = state(db, "status") == "indexed"
+    threads = args.threads
+    if threads is None and args.processes > 1:
+        # Each process would otherwise run as many torch threads as there are CPUs.
+        threads = max(1, (os.cpu_count() or 1) // args.processes)
+    executor = EmbeddingExecutor(args.processes, threads)
+    ingestion = Ingestion(
+        db, executor, args.model, backend, args.batch_size, args.commit_documents, args.progress_interval
+    )
+    with closing(db):
+        try:
+            stats = ingestion.run(args.documents, paths, args.chunk_words, args.overlap_words)
+        except KeyboardInterrupt:
+            print(f"Interrupted: {ingestion.progress()}. Run the same command to resume.")
+            return 130
+        except BrokenProcessPool:
+            print(f"An embedding process died: {ingestion.progress()}. Run the same command to resume.")
+            return 1
+        finally:
+            ingestion.close()
+        print(f"Staged: {json.dumps(stats)}")
+        try:
+            if updating:
+                indexed = apply_update(db, settings, args.compact_ratio)
+            else:
+                indexed = finalize(db, settings, args.index, args.transform)
+        except ValueError as e:
+            print(f"Vector store not indexed: {e}")
+            return 1
+    (args.output / ID_FILE_NAME).write_text(args.vector_store_id)
+    print(f"Vector store {args.vector_store_id}: {json.dumps(indexed)}")
+    print(f"Written: {db_path}, {args.output / ID_FILE_NAME}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
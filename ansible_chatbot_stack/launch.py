@@ -0,0 +1,92 @@
+"""Launch lightspeed-stack with the ansible-chatbot-stack runtime extensions.
+
+    python -m ansible_chatbot_stack.launch /app-root/src/lightspeed_stack.py --config <lightspeed-stack.yaml>
+
+Installs the startup timing hooks, the runtime extensions (embedding model
+backends and process pool, query embedding batching, query embedding and
+answer caches, shared FAISS indexes, bounded and routed vector store
+searches, reranked and adaptive knowledge_search contexts, warm-up,
+dependency readiness checks, store snapshot reloads, pre-forked workers) and
+the admin server, then runs the given script as ``__main__``, exactly as
+``python <script> <args>`` would.
+"""
+
+import os
+import runpy
+import sys
+
+from ansible_chatbot_stack import (
+    answer_cache,
+    dependencies,
+    embedding_backend,
+    embedding_batcher,
+    embedding_cache,
+    embedding_executor,
+    faiss_index,
+    prefork,
+    rag_context,
+    reranker,
+    runtime,
+    snapshots,
+    store_router,
+    store_search,
+    warmup,
+)
+from ansible_chatbot_stack.admin import start_admin_server
+from ansible_chatbot_stack.readiness import PENDING, READINESS
+from ansible_chatbot_stack.startup import (
+    STARTUP_EVENTS_FILE_ENV,
+    TIMINGS,
+    install_hooks,
+    monotonic,
+    process_start_time,
+)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        sys.exit(f"usage: python -m {__spec__.name} <script> [args...]")
+    script = argv[0]
+
+    events_file = os.environ.get(STARTUP_EVENTS_FILE_ENV)
+    if events_file:
+        TIMINGS.load_events_file(events_file)
+    started = process_start_time()
+    if started is not None:
+        # Interpreter start-up and the imports of this package.
+        TIMINGS.record("python_launch", started, monotonic())
+
+    READINESS.set("startup", PENDING)
+    install_hooks()
+    # Installed after the timing hooks, so that the runtime callbacks are not timed as llama_stack_init.
+    runtime.install_hooks()
+    # The process pool replaces the model loader of the backend hook, and loads the models with their backend itself.
+    embedding_backend.install_hooks()
+    embedding_executor.install_hooks()
+    # The cache wraps the batcher: repeated queries are answered before they are queued.
+    embedding_batcher.install_hooks()
+    embedding_cache.install_hooks()
+    faiss_index.install_hooks()
+    store_search.install_hooks(prefork.lightspeed_config(argv))
+    # The reranking and the trimming filter the merged results of store_search; the routing wraps them all: only the
+    # stores routed to are searched.
+    reranker.install()
+    rag_context.install_hooks()
+    store_router.install_hooks()
+    answer_cache.install_hooks()
+    warmup.install()
+    dependencies.install()
+    snapshots.install()
+    if not prefork.install():
+        # Pre-forked workers run the admin server in the first worker.
+        start_admin_server()
+
+    # What `python <script>` would set up: the script's directory first on sys.path, and its argv.
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    sys.argv = argv
+    runpy.run_path(script, run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Histograms of the runtime extensions, served as JSON by the admin server."""
+
+import bisect
+import threading
+
+
+class Histogram:
+    """Counts of observed values per bucket, each bucket bounded by its upper bound (inclusive)."""
+
+    def __init__(self, bounds: list[float]):
+        self.bounds = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        count = sum(counts)
+        labels = [f"<={bound:g}" for bound in self.bounds] + ["+Inf"]
+        return {
+            "count": count,
+            "sum": round(total, 3),
+            "mean": round(total / count, 3) if count else None,
+            "buckets": dict(zip(labels, counts)),
+        }
@@ -0,0 +1,255 @@
+"""Pre-fork multi-worker serving.
+
+lightspeed-stack runs uvicorn with ``service.workers`` processes, which uvicorn
+spawns: every worker imports everything again, loads its own copy of the
+embedding model and of the FAISS indexes, and none of the hooks of this package.
+With PREFORK_WORKERS set, uvicorn.run is replaced by a pre-fork server. The
+parent process loads the read-only state once:
+
+  - the heavy modules: torch, sentence-transformers, FAISS, llama-stack, and
+    the lightspeed-stack application
+  - the sentence-transformers embedding models registered in the run
+    configuration, into llama-stack's model cache (unless they run in the
+    embedding process pool, see embedding_executor)
+  - the chunks and indexes of the inline::faiss vector stores (memory-mapped
+    with FAISS_INDEX_MMAP=true, see faiss_index)
+
+then freezes the garbage collector, so that collections do not write to these
+objects, binds the service socket, and forks the workers. They inherit the
+state copy-on-write, and accept connections on the same socket. Each worker
+still initializes its own llama-stack library client (database connections,
+event loop) in the application lifespan, exactly as a single worker does, and
+shares the FAISS stores read-only. The admin server runs in the first worker.
+The parent restarts the workers that exit, stops them on SIGTERM or SIGINT, and
+forwards them SIGHUP, which reloads their vector stores (see snapshots).
+
+Environment:
+    PREFORK_WORKERS         number of workers, "auto" for one per CPU (default: none, uvicorn runs the service)
+    PREFORK_TORCH_THREADS   torch threads per worker (default: CPUs / workers, at least 1)
+"""
+
+import functools
+import gc
+import logging
+import os
+import random
+import signal
+import sys
+import time
+from pathlib import Path
+
+from ansible_chatbot_stack import embedding_executor, faiss_index, snapshots
+from ansible_chatbot_stack.admin import start_admin_server
+from ansible_chatbot_stack.embedding_backend import Backend, load_model
+from ansible_chatbot_stack.runtime import RUNTIME
+from ansible_chatbot_stack.startup import TIMINGS
+from ansible_chatbot_stack.warm_state import load_run_config
+
+logger = logging.getLogger(__name__)
+
+WORKERS_ENV = "PREFORK_WORKERS"
+TORCH_THREADS_ENV = "PREFORK_TORCH_THREADS"
+# Exit code of a uvicorn server whose application failed to start: restarting it would fail again.
+STARTUP_FAILURE = 3
+RESTART_DELAY = 1.0
+
+
+def cpu_count() -> int:
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def workers() -> int:
+    """Number of pre-forked workers; 0 when the pre-fork mode is disabled."""
+    value = os.environ.get(WORKERS_ENV, "").strip().lower()
+    if not value:
+        return 0
+    return cpu_count() if value == "auto" else max(0, int(value))
+
+
+def torch_threads(worker_count: int) -> int:
+    return int(os.environ.get(TORCH_THREADS_ENV) or max(1, cpu_count() // worker_count))
+
+
+def lightspeed_config(argv: list[str]) -> str | None:
+    """The --config/-c argument of the lightspeed-stack command line."""
+    for i, arg in enumerate(argv):
+        if arg in ("--config", "-c") and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith("--config="):
+            return arg.split("=", 1)[1]
+    return None
+
+
+def embedding_models(run_config: dict) -> dict[str, Backend]:
+    """Model paths of the embedding models served by the inline sentence-transformers providers, and their backend."""
+    providers = {
+        p.get("provider_id"): p.get("config")
+        for p in (run_config.get("providers") or {}).get("inference") or []
+        if p.get("provider_type") == "inline::sentence-transformers"
+    }
+    return {
+        model.get("provider_model_id") or model["model_id"]: Backend.from_config(providers[model["provider_id"]])
+        for model in (run_config.get("registered_resources") or {}).get("models") or []
+        if model.get("model_type") == "embedding" and model.get("provider_id") in providers
+    }
+
+
+def faiss_store_dbs(run_config: dict) -> list[Path]:
+    """SQLite kvstore files of the inline::faiss providers."""
+    backends = (run_config.get("storage") or {}).get("backends") or {}
+    dbs = []
+    for provider in (run_config.get("providers") or {}).get("vector_io") or []:
+        if provider.get("provider_type") != "inline::faiss":
+            continue
+        backend = backends.get(((provider.get("config") or {}).get("persistence") or {}).get("backend"), {})
+        if str(backend.get("type", "")).endswith("sqlite") and backend.get("db_path"):
+            dbs.append(Path(backend["db_path"]))
+    return dbs
+
+
+def preload(run_config: dict | None) -> dict:
+    """Load the state the workers share; returns what was loaded."""
+    loaded = {"embedding_models": [], "faiss_stores": []}
+    try:
+        from llama_stack.providers.utils.inference import embedding_mixin
+    except ImportError:
+        logger.warning("llama-stack not found, the embedding models are not preloaded")
+        embedding_mixin = None
+    if run_config is None:
+        return loaded
+
+    # With the embedding process pool, the models are loaded by the pool of each worker instead.
+    if embedding_mixin is not None and not embedding_executor.enabled():
+        for model, backend in embedding_models(run_config).items():
+            # llama-stack's _load_sentence_transformer_model finds it in its cache.
+            with TIMINGS.phase("prefork_embedding_model", model=model, backend=str(backend)):
+                embedding_mixin.EMBEDDING_MODELS[model] = load_model(model, backend)
+            loaded["embedding_models"].append(model)
+
+    for db_path in faiss_store_dbs(run_config):
+        if db_path.is_file():
+            with TIMINGS.phase("prefork_faiss_stores", db=str(db_path)):
+                loaded["faiss_stores"] += faiss_index.preload(db_path)
+    return loaded
+
+
+class Supervisor:
+    """Forks the uvicorn workers of a loaded config and listening socket, and keeps them running."""
+
+    def __init__(self, config, sock, worker_count: int):
+        self.config = config
+        self.sock = sock
+        self.worker_count = worker_count
+        self.children: dict[int, int] = {}  # pid -> worker number
+        self.stopping = False
+
+    def run(self) -> int:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._stop)
+        signal.signal(signal.SIGHUP, self._signal_workers)
+        for number in range(self.worker_count):
+            self._fork(number)
+        exit_code = 0
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            number = self.children.pop(pid, None)
+            if number is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                continue
+            if code == STARTUP_FAILURE:
+                logger.error("Worker %d failed to start, stopping the service", number)
+                exit_code = code
+                self._stop(signal.SIGTERM, None)
+                continue
+            logger.warning("Worker %d (pid %d) exited with %d, restarting it", number, pid, code)
+            time.sleep(RESTART_DELAY)
+            self._fork(number)
+        return exit_code
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        self._signal_workers(signum, frame)
+
+    def _signal_workers(self, signum, frame):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _fork(self, number: int):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = number
+            return
+        code = 1
+        try:
+            self._serve(number)
+            code = 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            logger.exception("Worker %d failed", number)
+        finally:
+            os._exit(code)
+
+    def _serve(self, number: int):
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, signal.SIG_DFL)
+        # Until the worker's event loop handles it, see snapshots.
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        snapshots.SUPERVISOR_PID = os.getppid()
+        random.seed()
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            torch.set_num_threads(torch_threads(self.worker_count))
+        if number == 0:
+            start_admin_server()
+        import uvicorn
+
+        server = uvicorn.Server(self.config)
+        server.run(sockets=[self.sock])
+        if not server.started:
+            sys.exit(STARTUP_FAILURE)
+
+
+def install() -> bool:
+    """Replace uvicorn.run by the pre-fork server when PREFORK_WORKERS is set; returns whether it was."""
+    worker_count = workers()
+    if not worker_count:
+        return False
+    try:
+        import uvicorn
+    except ImportError:
+        logger.warning("uvicorn not found, the service is not pre-forked")
+        return False
+
+    uvicorn_run = uvicorn.run
+
+    @functools.wraps(uvicorn_run)
+    def prefork_run(app, **kwargs):
+        if RUNTIME.impls is not None:
+            # The library client is already initialized: its connections and threads cannot be forked.
+            logger.warning("llama-stack initialized before serving, running a single uvicorn worker")
+            start_admin_server()
+            return uvicorn_run(app, **{**kwargs, "workers": 1})
+
+        config = uvicorn.Config(app, **{**kwargs, "workers": 1, "reload": False})
+        with TIMINGS.phase("prefork_preload", workers=worker_count):
+            config.load()
+            config_path = lightspeed_config(sys.argv)
+            run_config = load_run_config(config_path, None) if config_path else None
+            loaded = preload(run_config)
+        logger.info("Preloaded %s, forking %d workers", loaded, worker_count)
+        sock = config.bind_socket()
+        # Objects allocated so far are never collected, so the workers do not write to their pages.
+        gc.freeze()
+        sys.exit(Supervisor(config, sock, worker_count).run())
+
+    uvicorn.run = prefork_run
+    return True
@@ -0,0 +1,156 @@
+"""Adaptive number of chunks in the knowledge_search context.
+
+The file_search (knowledge_search) tool of the Responses API puts every
+result of every vector store in the context of the model, max_num_results per
+store, however relevant: each low-value chunk adds prompt tokens, and time to
+the first token. The results of the stores are merged and ranked together by
+score by store_search. With RAG_ADAPTIVE=true, install_hooks() adds a filter
+to those results, which keeps, best first, at least RAG_MIN_CHUNKS results,
+then the next ones until one:
+
+- scores under RAG_MIN_SCORE,
+- scores more than RAG_SCORE_GAP (a fraction) under the result before it,
+- or would take the context over RAG_TOKEN_BUDGET tokens, estimated from the
+  length of the chunk text (CHARS_PER_TOKEN characters per token).
+
+llama-stack then formats the context from the results kept, in that order. The
+estimated tokens saved are logged for each search, and totalled with the
+results kept and dropped by the admin server on GET /rag_context. The scores
+are those of the provider: 1 / L2 distance, for hybrid searches too (see
+faiss_index), so RAG_MIN_SCORE depends on the embedding model, while the gap
+and the budget do not. With RERANK=true, the results are
+reranked by a cross-encoder before they are trimmed, and their scores are its
+relevance probabilities (see reranker); the filter is added for either.
+
+Environment:
+    RAG_ADAPTIVE       "true" to drop the low-value chunks from the knowledge_search context (default: false)
+    RAG_MIN_CHUNKS     results always kept (default: 1)
+    RAG_MIN_SCORE      score under which results are dropped (default: 0, none)
+    RAG_SCORE_GAP      relative score drop from one result to the next that drops the rest (default: 0.3)
+    RAG_TOKEN_BUDGET   estimated tokens of chunk text in the context at most, 0 for no budget (default: 1500)
+"""
+
+import logging
+import os
+import threading
+
+from ansible_chatbot_stack import reranker, store_search
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_ENV = "RAG_ADAPTIVE"
+MIN_CHUNKS_ENV = "RAG_MIN_CHUNKS"
+MIN_SCORE_ENV = "RAG_MIN_SCORE"
+SCORE_GAP_ENV = "RAG_SCORE_GAP"
+TOKEN_BUDGET_ENV = "RAG_TOKEN_BUDGET"
+DEFAULT_MIN_CHUNKS = 1
+DEFAULT_MIN_SCORE = 0.0
+DEFAULT_SCORE_GAP = 0.3
+DEFAULT_TOKEN_BUDGET = 1500
+# Characters per token of English text and YAML, for the common tokenizers.
+CHARS_PER_TOKEN = 4
+
+
+def result_text(result) -> str:
+    return result.content[0].text if result.content else ""
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+class RagContext:
+    def __init__(
+        self,
+        min_chunks: int = DEFAULT_MIN_CHUNKS,
+        min_score: float = DEFAULT_MIN_SCORE,
+        score_gap: float = DEFAULT_SCORE_GAP,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+    ):
+        self.min_chunks = max(0, min_chunks)
+        self.min_score = min_score
+        self.score_gap = score_gap
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.kept = 0
+        self.dropped = 0
+        self.tokens_kept = 0
+        self.tokens_saved = 0
+
+    def select(self, results: list) -> tuple[list, int]:
+        """The search results to put in the context, best first, and the estimated tokens of those dropped."""
+        ranked = sorted(results, key=lambda result: result.score, reverse=True)
+        kept, tokens = [], 0
+        for result in ranked:
+            result_tokens = estimate_tokens(result_text(result))
+            if len(kept) >= self.min_chunks and (
+                result.score < self.min_score
+                or (kept and self.score_gap and result.score < kept[-1].score * (1 - self.score_gap))
+                or (self.token_budget and tokens + result_tokens > self.token_budget)
+            ):
+                break
+            kept.append(result)
+            tokens += result_tokens
+        saved = sum(estimate_tokens(result_text(result)) for result in ranked[len(kept) :])
+        with self._lock:
+            self.searches += 1
+            self.kept += len(kept)
+            self.dropped += len(ranked) - len(kept)
+            self.tokens_kept += tokens
+            self.tokens_saved += saved
+        return kept, saved
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "min_chunks": self.min_chunks,
+                "min_score": self.min_score,
+                "score_gap": self.score_gap,
+                "token_budget": self.token_budget,
+                "searches": self.searches,
+                "kept": self.kept,
+                "dropped": self.dropped,
+                "tokens_kept": self.tokens_kept,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+RAG_CONTEXT: RagContext | None = None
+
+
+def from_env() -> RagContext | None:
+    if os.environ.get(ADAPTIVE_ENV, "false").lower() != "true":
+        return None
+    return RagContext(
+        int(os.environ.get(MIN_CHUNKS_ENV, DEFAULT_MIN_CHUNKS)),
+        float(os.environ.get(MIN_SCORE_ENV, DEFAULT_MIN_SCORE)),
+        float(os.environ.get(SCORE_GAP_ENV, DEFAULT_SCORE_GAP)),
+        int(os.environ.get(TOKEN_BUDGET_ENV, DEFAULT_TOKEN_BUDGET)),
+    )
+
+
+def stats() -> dict:
+    return RAG_CONTEXT.stats() if RAG_CONTEXT else {"enabled": False}
+
+
+async def select_context(query: str, results: list) -> list:
+    """The results of a file search to put in the context, reranked and trimmed: a filter of store_search."""
+    kept = results
+    if reranker.RERANKER:
+        kept = await reranker.RERANKER.rerank(query, kept, result_text)
+    if RAG_CONTEXT:
+        kept, _ = RAG_CONTEXT.select(kept)
+    saved = sum(map(estimate_tokens, map(result_text, results))) - sum(map(estimate_tokens, map(result_text, kept)))
+    logger.info("knowledge_search context: %d of %d chunks kept, ~%d tokens saved", len(kept), len(results), saved)
+    return kept
+
+
+def install_hooks():
+    """Keep only the relevant results of the file searches of the Responses API in the context of the model."""
+    global RAG_CONTEXT
+    RAG_CONTEXT = from_env()
+    if RAG_CONTEXT is None and reranker.RERANKER is None:
+        store_search.CONTEXT_FILTERS.pop(__name__, None)
+        return
+    store_search.CONTEXT_FILTERS[__name__] = select_context
@@ -0,0 +1,43 @@
+"""Readiness of the service, as a set of named checks.
+
+Each check is in one of the states ``pending``, ``ok``, ``failed`` or ``skipped``,
+with optional details. A blocking check keeps the service unready until it is
+``ok`` or ``skipped``; a non-blocking one is only reported. The admin server
+answers GET /readiness with 200 when the service is ready and 503 otherwise,
+so that it can be used as the Kubernetes readiness probe.
+"""
+
+import threading
+import time
+
+PENDING = "pending"
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Readiness:
+    def __init__(self):
+        self.checks: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def set(self, name: str, status: str, blocking: bool = True, **details):
+        with self._lock:
+            self.checks[name] = {"status": status, "blocking": blocking, "updated_at": time.time(), **details}
+
+    def status(self, name: str) -> str | None:
+        with self._lock:
+            check = self.checks.get(name)
+        return check["status"] if check else None
+
+    def ready(self) -> bool:
+        with self._lock:
+            return all(c["status"] in (OK, SKIPPED) for c in self.checks.values() if c["blocking"])
+
+    def report(self) -> dict:
+        with self._lock:
+            checks = {name: dict(check) for name, check in self.checks.items()}
+        return {"ready": self.ready(), "checks": checks}
+
+
+READINESS = Readiness()
@@ -0,0 +1,224 @@
+"""Cross-encoder reranking of the knowledge_search results.
+
+The vector stores rank the chunks by the distance between the query and chunk
+embeddings, computed apart from each other: the retrieval is tuned for recall,
+and the knowledge_search context makes up for its precision with many chunks.
+A cross-encoder reads the query and a chunk together, and scores their
+relevance far better, at the cost of a forward pass per chunk. With
+RERANK=true, the RERANK_CANDIDATES best results of the stores of a
+knowledge_search, ranked together by score (see store_search), are scored by
+the cross-encoder RERANK_MODEL on the CPU, RERANK_BATCH_SIZE at a time, and
+only the RERANK_TOP_K best of them are put in the context of the model, with
+the cross-encoder scores: probabilities between 0 and 1, which RAG_ADAPTIVE
+then trims further.
+
+The reranking has a hard budget, RERANK_BUDGET_MS. The batches run one at a
+time in a thread of their own, and when the budget runs out before every
+candidate is scored, the search answers with the RERANK_TOP_K best candidates
+in their retrieval order, so that a slow CPU or a burst of queries never
+delays the answer by more than the budget. The model is loaded in that thread
+by the startup warm-up, before the service is ready (see warmup); without the
+warm-up, by the first knowledge_search of the process, which keeps the
+retrieval order. The reranked searches, the fallbacks to the retrieval order
+and the latency histogram are served as JSON by the admin server on GET
+/reranker.
+
+The model is read from the data volume by default, so that no download from
+the Hugging Face Hub happens at runtime; it is saved there with:
+
+    python -m ansible_chatbot_stack.reranker /.llama/data/rerank_model
+
+Environment:
+    RERANK             "true" to rerank the knowledge_search results with a cross-encoder (default: false)
+    RERANK_MODEL       path, or Hugging Face Hub name, of the sentence-transformers cross-encoder
+                       (default: /.llama/data/rerank_model)
+    RERANK_CANDIDATES  best results of the retrieval scored by the cross-encoder (default: 20)
+    RERANK_TOP_K       best results of the reranking put in the context (default: 5)
+    RERANK_BATCH_SIZE  candidates scored per forward pass (default: 8)
+    RERANK_BUDGET_MS   milliseconds the reranking of a search may take (default: 300)
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ansible_chatbot_stack.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENV = "RERANK"
+MODEL_ENV = "RERANK_MODEL"
+CANDIDATES_ENV = "RERANK_CANDIDATES"
+TOP_K_ENV = "RERANK_TOP_K"
+BATCH_SIZE_ENV = "RERANK_BATCH_SIZE"
+BUDGET_ENV = "RERANK_BUDGET_MS"
+DEFAULT_MODEL = "/.llama/data/rerank_model"
+# The cross-encoder saved to DEFAULT_MODEL by main().
+HUB_MODEL = "cross-encoder/ms-marco-MiniLM-L6-v2"
+DEFAULT_CANDIDATES = 20
+DEFAULT_TOP_K = 5
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_BUDGET_MS = 300.0
+MILLISECOND_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500]
+
+
+def load_cross_encoder(model: str):
+    """The sentence-transformers cross-encoder ``model``, on the CPU, scoring relevance as a probability."""
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model, device="cpu", activation_fn=torch.nn.Sigmoid())
+
+
+class Reranker:
+    def __init__(
+        self,
+        model: str = DEFAULT_MODEL,
+        candidates: int = DEFAULT_CANDIDATES,
+        top_k: int = DEFAULT_TOP_K,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        budget: float = DEFAULT_BUDGET_MS / 1000,
+        load_model=load_cross_encoder,
+    ):
+        self.model = model
+        self.candidates = max(1, candidates)
+        self.top_k = max(1, top_k)
+        self.batch_size = max(1, batch_size)
+        self.budget = budget
+        self.load_model = load_model
+        self._cross_encoder = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.latency_ms = Histogram(MILLISECOND_BUCKETS)
+        self.reranked = self.fallbacks = self.errors = 0
+
+    def executor(self) -> ThreadPoolExecutor:
+        """The reranking thread of this process, started on first use: pre-forked workers each start their own."""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+                self._pid = os.getpid()
+            return self._executor
+
+    def score(self, query: str, texts: list[str], deadline: float) -> list[float] | None:
+        """Blocking, in the reranking thread: the relevance of each text to ``query``, or None past ``deadline``."""
+        if self._cross_encoder is None:
+            self._cross_encoder = self.load_model(self.model)
+            logger.info("Cross-encoder %s loaded for the knowledge_search reranking", self.model)
+        scores = []
+        for start in range(0, len(texts), self.batch_size):
+            if time.monotonic() >= deadline:
+                return None
+            pairs = [(query, text) for text in texts[start : start + self.batch_size]]
+            scores.extend(
+                float(score)
+                for score in self._cross_encoder.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+            )
+        return scores
+
+    async def warm_up(self):
+        """Load the cross-encoder in the reranking thread, and score a first pair with it."""
+        await asyncio.wrap_future(self.executor().submit(self.score, "warm-up", ["warm-up"], math.inf))
+
+    async def rerank(self, query: str, results: list, text) -> list:
+        """The best results for ``query``, best first, scored by the cross-encoder on ``text(result)``, or in
+        their retrieval order if the budget runs out."""
+        candidates = sorted(results, key=lambda result: result.score, reverse=True)[: self.candidates]
+        if len(candidates) < 2:
+            return candidates
+        started = time.monotonic()
+        texts = [text(result) for result in candidates]
+        future = self.executor().submit(self.score, query, texts, started + self.budget)
+        try:
+            scores = await asyncio.wait_for(asyncio.wrap_future(future), self.budget)
+        except TimeoutError:
+            scores = None
+        except Exception as e:
+            logger.warning("knowledge_search results not reranked: %s", e)
+            with self._lock:
+                self.errors += 1
+            scores = None
+        finally:
+            self.latency_ms.observe((time.monotonic() - started) * 1000)
+        with self._lock:
+            if scores is None:
+                self.fallbacks += 1
+            else:
+                self.reranked += 1
+        if scores is None:
+            return candidates[: self.top_k]
+        for result, score in zip(candidates, scores):
+            result.score = score
+        return sorted(candidates, key=lambda result: result.score, reverse=True)[: self.top_k]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model,
+                "loaded": self._cross_encoder is not None,
+                "candidates": self.candidates,
+                "top_k": self.top_k,
+                "batch_size": self.batch_size,
+                "budget_ms": self.budget * 1000,
+                "reranked": self.reranked,
+                "fallbacks": self.fallbacks,
+                "errors": self.errors,
+                "latency_ms": self.latency_ms.snapshot(),
+            }
+
+
+RERANKER: Reranker | None = None
+
+
+def from_env() -> Reranker | None:
+    if os.environ.get(RERANK_ENV, "false").lower() != "true":
+        return None
+    return Reranker(
+        os.environ.get(MODEL_ENV, DEFAULT_MODEL),
+        int(os.environ.get(CANDIDATES_ENV, DEFAULT_CANDIDATES)),
+        int(os.environ.get(TOP_K_ENV, DEFAULT_TOP_K)),
+        int(os.environ.get(BATCH_SIZE_ENV, DEFAULT_BATCH_SIZE)),
+        float(os.environ.get(BUDGET_ENV, DEFAULT_BUDGET_MS)) / 1000,
+    )
+
+
+def stats() -> dict:
+    return RERANKER.stats() if RERANKER else {"enabled": False}
+
+
+def install():
+    """Enable the reranking, which the context filter of rag_context runs: install before it."""
+    global RERANKER
+    RERANKER = from_env()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help=f"directory to save the cross-encoder to, e.g. {DEFAULT_MODEL}")
+    parser.add_argument(
+        "--model", default=HUB_MODEL, help=f"Hugging Face Hub name of the cross-encoder (default: {HUB_MODEL})"
+    )
+    parser.add_argument("--force", action="store_true", help="save the model again when the directory already has one")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    args = parse_args(argv)
+    if os.path.isfile(os.path.join(args.directory, "config.json")) and not args.force:
+        print(f"{args.directory} already has a model")
+        return 0
+    load_cross_encoder(args.model).save(args.directory)
+    print(f"Saved {args.model} to {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Handle on the llama-stack running in this process.
+
+lightspeed-stack creates the llama-stack library client itself, so the API
+implementations are captured when Stack.initialize returns. Callbacks
+registered with ``RUNTIME.after_initialize`` then run in the same event loop,
+before lightspeed-stack gets the client back and starts serving. Callbacks
+registered with ``RUNTIME.after_startup`` run once uvicorn's server is started,
+in the event loop that serves the requests, where background tasks can live.
+"""
+
+import asyncio
+import functools
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+class Runtime:
+    def __init__(self):
+        # API implementations by API name, e.g. "inference", "vector_io", "vector_stores".
+        self.impls: dict[str, Any] | None = None
+        self.run_config: Any = None
+        self.background_tasks: set[asyncio.Task] = set()
+        self._callbacks: list[Callable[["Runtime"], Awaitable[None]]] = []
+        self._startup_callbacks: list[Callable[["Runtime"], Awaitable[None]]] = []
+        self._started = False
+
+    def after_initialize(self, callback: Callable[["Runtime"], Awaitable[None]]):
+        self._callbacks.append(callback)
+
+    def after_startup(self, callback: Callable[["Runtime"], Awaitable[None]]):
+        self._startup_callbacks.append(callback)
+
+    def api(self, name: str) -> Any:
+        return (self.impls or {}).get(name)
+
+    async def initialized(self, impls: dict, run_config: Any):
+        self.impls = {getattr(api, "value", api): impl for api, impl in impls.items()}
+        self.run_config = run_config
+        for callback in self._callbacks:
+            await callback(self)
+
+    async def started(self):
+        if self._started:
+            return
+        self._started = True
+        for callback in self._startup_callbacks:
+            await callback(self)
+
+
+RUNTIME = Runtime()
+
+
+def install_hooks():
+    try:
+        from llama_stack.core import stack
+    except ImportError:
+        logger.warning("llama-stack not found, runtime extensions are disabled")
+    else:
+        initialize = stack.Stack.initialize
+
+        @functools.wraps(initialize)
+        async def initialize_and_notify(self, *args, **kwargs):
+            result = await initialize(self, *args, **kwargs)
+            await RUNTIME.initialized(self.impls or {}, self.run_config)
+            return result
+
+        stack.Stack.initialize = initialize_and_notify
+
+    try:
+        from uvicorn.server import Server
+    except ImportError:
+        logger.warning("uvicorn not found, runtime background tasks are disabled")
+        return
+
+    startup = Server.startup
+
+    @functools.wraps(startup)
+    async def startup_and_notify(self, *args, **kwargs):
+        result = await startup(self, *args, **kwargs)
+        await RUNTIME.started()
+        return result
+
+    Server.startup = startup_and_notify
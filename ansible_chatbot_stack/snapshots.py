@@ -0,0 +1,281 @@
+"""Versioned snapshots of the store DBs, swapped in without a restart.
+
+A store directory keeps each version of its store DBs in a directory of its
+own, and a "current" symbolic link to the version served:
+
+    <store dir>/snapshots/20260101T120000Z/aap_faiss_store.db
+    <store dir>/snapshots/20260101T120000Z/snapshot.json
+    <store dir>/current -> snapshots/20260101T120000Z
+
+The kvstore of the inline::faiss provider is pointed at the link, e.g.
+VECTOR_DB_DIR=<store dir>/current for the AAP store of the run
+configuration, or the db_path of a byok_rag entry for a BYOK store. The
+provider opens the DB again for every operation, so it reads the version the
+link points to at that time. New content is published as a new version:
+
+    python -m ansible_chatbot_stack.snapshots publish /.llama/data/distributions/ansible-chatbot new/aap_faiss_store.db
+
+copies the DB (or the .db and .ind files of a directory) into a new version,
+with --export writes its memory-mapped index files (see faiss_index), then
+switches the link atomically, and removes the versions older than the --keep
+latest. A version holding the same files as the current one is not
+published again. The vector stores of the current version must all be in the
+new one, since the served stores are registered at startup: changing them
+takes a restart. "activate" switches the link back to an older version.
+
+The server then reloads the stores on SIGHUP, or on POST /stores/reload of the
+admin server. The indexes whose store DB changed are loaded in the
+background, and swapped in while the searches in flight finish on the
+previous ones (see faiss_index.reload). The answer cache is then emptied, its
+answers being grounded in the previous content. The pre-fork supervisor
+forwards SIGHUP to its workers, and the admin server of the first worker
+signals the supervisor, so that every worker reloads. The previous index
+stays in memory until its last search ends.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from ansible_chatbot_stack import answer_cache, faiss_index
+from ansible_chatbot_stack.runtime import RUNTIME, Runtime
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_LINK = "current"
+MANIFEST = "snapshot.json"
+SNAPSHOT_SUFFIXES = (".db", ".ind")
+DEFAULT_KEEP = 3
+# Seconds the admin server waits for a reload before answering that it is still running.
+RELOAD_WAIT = 120.0
+
+# The event loop serving the requests, where the reloads run.
+LOOP: asyncio.AbstractEventLoop | None = None
+# Set in the pre-forked workers: a reload is signalled to the supervisor, which signals every worker.
+SUPERVISOR_PID: int | None = None
+LAST_RELOAD: dict | None = None
+_RELOAD_LOCK = asyncio.Lock()
+
+
+def versions(store_dir: Path) -> list[str]:
+    """The published versions of a store directory, oldest first."""
+    root = store_dir / SNAPSHOTS_DIR
+    if not root.is_dir():
+        return []
+    return sorted(path.name for path in root.iterdir() if path.is_dir() and not path.name.startswith("."))
+
+
+def current_version(store_dir: Path) -> str | None:
+    link = store_dir / CURRENT_LINK
+    return Path(os.readlink(link)).name if link.is_symlink() else None
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_files(source: Path) -> list[Path]:
+    """The files a snapshot of ``source`` holds: the store DB, and the .ind file next to it, or those of a directory."""
+    if source.is_dir():
+        return sorted(path for path in source.iterdir() if path.is_file() and path.suffix in SNAPSHOT_SUFFIXES)
+    return [source, *(path for path in source.parent.glob("*.ind") if path.is_file())]
+
+
+def manifest(store_dir: Path, version: str) -> dict:
+    path = store_dir / SNAPSHOTS_DIR / version / MANIFEST
+    return json.loads(path.read_text()) if path.is_file() else {}
+
+
+def switch(store_dir: Path, version: str):
+    """Point the current link of a store directory at ``version``, atomically."""
+    if version not in versions(store_dir):
+        raise ValueError(f"No snapshot {version} in {store_dir / SNAPSHOTS_DIR}")
+    link = store_dir / CURRENT_LINK
+    if link.exists() and not link.is_symlink():
+        raise ValueError(f"{link} is not a symbolic link")
+    staged = store_dir / f".{CURRENT_LINK}.tmp"
+    staged.unlink(missing_ok=True)
+    staged.symlink_to(Path(SNAPSHOTS_DIR) / version)
+    os.replace(staged, link)
+
+
+def prune(store_dir: Path, keep: int) -> list[str]:
+    """Remove the versions older than the ``keep`` latest, except the current one; returns them."""
+    current = current_version(store_dir)
+    removed = [version for version in versions(store_dir)[:-keep] if version != current]
+    for version in removed:
+        shutil.rmtree(store_dir / SNAPSHOTS_DIR / version)
+    return removed
+
+
+def _check_stores(current_dir: Path, snapshot_dir: Path):
+    """Refuse a snapshot missing vector stores of the current version: they are served until a restart."""
+    for db_path in current_dir.glob("*.db"):
+        published = snapshot_dir / db_path.name
+        missing = set(faiss_index.load_stores(db_path)) - set(
+            faiss_index.load_stores(published) if published.is_file() else ()
+        )
+        if missing:
+            raise ValueError(
+                f"{db_path.name} of the snapshot has no vector store {', '.join(sorted(missing))}: "
+                "changing the served vector stores takes a restart"
+            )
+
+
+def publish(
+    store_dir: Path, source: Path, version: str | None = None, export: bool = False, keep: int = DEFAULT_KEEP
+) -> tuple[str, bool]:
+    """Publish the store DB files of ``source`` as a new version and make it current; returns it, and if it is new."""
+    files = snapshot_files(source)
+    if not any(path.suffix == ".db" for path in files):
+        raise ValueError(f"No store DB in {source}")
+    digests = {path.name: file_digest(path) for path in files}
+    current = current_version(store_dir)
+    if current is not None and manifest(store_dir, current).get("files") == digests:
+        return current, False
+    version = version or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    target = store_dir / SNAPSHOTS_DIR / version
+    if target.exists():
+        raise ValueError(f"Snapshot {version} already exists")
+    staged = target.with_name(f".{version}.tmp")
+    shutil.rmtree(staged, ignore_errors=True)
+    staged.mkdir(parents=True)
+    try:
+        for path in files:
+            shutil.copy2(path, staged / path.name)
+        if current is not None:
+            _check_stores(store_dir / SNAPSHOTS_DIR / current, staged)
+        if export:
+            for db_path in staged.glob("*.db"):
+                faiss_index.export(db_path)
+        published_at = datetime.now(timezone.utc).isoformat()
+        (staged / MANIFEST).write_text(json.dumps({"version": version, "published_at": published_at, "files": digests}))
+        staged.rename(target)
+    except BaseException:
+        shutil.rmtree(staged, ignore_errors=True)
+        raise
+    switch(store_dir, version)
+    prune(store_dir, keep)
+    return version, True
+
+
+async def reload() -> dict:
+    """Reload the vector stores whose store DB changed, and empty the answer cache if any did."""
+    global LAST_RELOAD
+    async with _RELOAD_LOCK:
+        started = time.perf_counter()
+        stores = await faiss_index.reload()
+        result = {"stores": stores, "duration": time.perf_counter() - started}
+        if "reloaded" in stores.values():
+            # Its answers are grounded in the previous content.
+            result["answer_cache"] = answer_cache.clear()
+        logger.info("Vector stores reloaded in %.2fs: %s", result["duration"], stores)
+        LAST_RELOAD = {**result, "finished_at": datetime.now(timezone.utc).isoformat()}
+        return result
+
+
+def _schedule_reload():
+    task = asyncio.get_running_loop().create_task(reload())
+    RUNTIME.background_tasks.add(task)
+    task.add_done_callback(RUNTIME.background_tasks.discard)
+
+
+def request_reload() -> tuple[int, dict]:
+    """Reload the vector stores from the admin server's thread: (HTTP status, body)."""
+    if SUPERVISOR_PID is not None:
+        os.kill(SUPERVISOR_PID, signal.SIGHUP)
+        return 202, {"detail": "Reload signalled to every worker"}
+    if LOOP is None:
+        return 503, {"detail": "The service is not started"}
+    future = asyncio.run_coroutine_threadsafe(reload(), LOOP)
+    try:
+        return 200, future.result(timeout=RELOAD_WAIT)
+    except TimeoutError:
+        return 202, {"detail": "Reload still running"}
+
+
+def stats() -> dict:
+    loaded = {
+        index.bank_id: {
+            "vectors": index.index.ntotal if getattr(index, "index", None) is not None else 0,
+            "db": (getattr(index, "db_version", None) or (None,))[0],
+            "shared_from": getattr(index, "shared_index_source", None),
+        }
+        for index in list(faiss_index.LOADED)
+    }
+    return {"stores": loaded, "last_reload": LAST_RELOAD}
+
+
+async def start(runtime: Runtime):
+    global LOOP
+    LOOP = asyncio.get_running_loop()
+    try:
+        LOOP.add_signal_handler(signal.SIGHUP, _schedule_reload)
+    except (NotImplementedError, RuntimeError) as e:
+        logger.warning("Vector stores are not reloaded on SIGHUP: %s", e)
+
+
+def install():
+    RUNTIME.after_startup(start)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish_parser = commands.add_parser("publish", help="publish a new version and make it current")
+    publish_parser.add_argument("store_dir", type=Path, help="store directory")
+    publish_parser.add_argument("source", type=Path, help="store DB, or directory of the .db and .ind files")
+    publish_parser.add_argument("--version", help="name of the version (default: the UTC time)")
+    publish_parser.add_argument("--export", action="store_true", help="export the index files, for FAISS_INDEX_MMAP")
+    publish_parser.add_argument(
+        "--keep", type=int, default=DEFAULT_KEEP, help=f"versions kept, current included (default: {DEFAULT_KEEP})"
+    )
+    activate_parser = commands.add_parser("activate", help="make a published version current")
+    activate_parser.add_argument("store_dir", type=Path, help="store directory")
+    activate_parser.add_argument("version", help="version to serve")
+    list_parser = commands.add_parser("list", help="list the published versions")
+    list_parser.add_argument("store_dir", type=Path, help="store directory")
+    args = parser.parse_args(argv)
+    if args.command == "publish" and args.keep < 1:
+        parser.error("--keep must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        if args.command == "publish":
+            version, published = publish(args.store_dir, args.source, args.version, args.export, args.keep)
+            print(f"Published snapshot {version}" if published else f"Snapshot {version} is current and identical")
+        elif args.command == "activate":
+            switch(args.store_dir, args.version)
+            print(f"Snapshot {args.version} is current")
+        else:
+            current = current_version(args.store_dir)
+            for version in versions(args.store_dir):
+                published_at = manifest(args.store_dir, version).get("published_at", "")
+                print(f"{'*' if version == current else ' '} {version}  {published_at}")
+    except (OSError, ValueError) as e:
+        print(e)
+        return 1
+    if args.command != "list":
+        print("Reload the vector stores of the service with SIGHUP or POST /stores/reload on its admin server")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""Startup phase timings.
+
+Every phase is emitted as a JSON line on stdout as soon as it ends:
+
+    {"event": "startup_phase", "source": "python", "phase": "provider_init",
+     "start": 81234.512, "end": 81236.901, "duration": 2.389, "api": "vector_io", ...}
+
+``start`` and ``end`` are read from CLOCK_BOOTTIME, the clock behind /proc/uptime,
+so the entrypoint.sh phases (written to $STARTUP_EVENTS_FILE) and the Python
+ones share the same timeline. Once the HTTP server is started, a
+``startup_summary`` line lists the slowest phases; the same summary is served
+by the admin server on /startup.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from ansible_chatbot_stack.readiness import OK, READINESS
+
+logger = logging.getLogger(__name__)
+
+STARTUP_EVENTS_FILE_ENV = "STARTUP_EVENTS_FILE"
+STARTUP_SUMMARY_TOP_ENV = "STARTUP_SUMMARY_TOP"
+DEFAULT_SUMMARY_TOP = 10
+
+
+def monotonic() -> float:
+    """Seconds since boot, comparable with /proc/uptime."""
+    if hasattr(time, "CLOCK_BOOTTIME"):
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+    return time.monotonic()
+
+
+def process_start_time() -> float | None:
+    """Start time of this process on the monotonic() clock, from /proc/self/stat."""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces; fields are counted after its closing parenthesis.
+            fields = f.read().rsplit(")", 1)[1].split()
+        return int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class StartupTimings:
+    """Collects the startup phases of the entrypoint and of this process."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.phases: list[dict] = []
+        self.ready_at: float | None = None
+        self._lock = threading.Lock()
+
+    def record(self, phase: str, start: float, end: float, source: str = "python", **attributes):
+        event = {
+            "event": "startup_phase",
+            "source": source,
+            "phase": phase,
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "duration": round(end - start, 3),
+            **attributes,
+        }
+        with self._lock:
+            self.phases.append(event)
+        self._emit(event)
+
+    @contextlib.contextmanager
+    def phase(self, phase: str, **attributes):
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, start, monotonic(), **attributes)
+
+    def load_events_file(self, path: str):
+        """Import the phases entrypoint.sh already wrote (and printed) before Python started."""
+        try:
+            with open(path) as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event.get("event") == "startup_phase":
+                with self._lock:
+                    self.phases.append(event)
+
+    def mark_ready(self, top: int | None = None) -> dict:
+        """Record the end of the startup and emit the summary of the slowest phases."""
+        self.ready_at = monotonic()
+        summary = self.summary(top)
+        self._emit({"event": "startup_summary", **summary})
+        return summary
+
+    def summary(self, top: int | None = None) -> dict:
+        if top is None:
+            top = int(os.environ.get(STARTUP_SUMMARY_TOP_ENV, DEFAULT_SUMMARY_TOP))
+        with self._lock:
+            phases = list(self.phases)
+        first_start = min((p["start"] for p in phases), default=None)
+        total = None
+        if first_start is not None and self.ready_at is not None:
+            total = round(self.ready_at - first_start, 3)
+        return {
+            "ready": self.ready_at is not None,
+            "total": total,
+            # Phases nest (e.g. provider_init within llama_stack_init), so durations do not add up to the total.
+            "slowest": sorted(phases, key=lambda p: p["duration"], reverse=True)[:top],
+        }
+
+    def _emit(self, event: dict):
+        print(json.dumps(event), file=self.stream, flush=True)
+
+
+TIMINGS = StartupTimings()
+
+
+def _timed_async(phase: str, attributes=None):
+    """Wrap a coroutine function so that every call is recorded as ``phase``."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with TIMINGS.phase(phase, **(attributes(*args, **kwargs) if attributes else {})):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _provider_attributes(provider, *args, **kwargs) -> dict:
+    return {
+        "api": provider.spec.api.value,
+        "provider_id": provider.provider_id,
+        "provider_type": provider.spec.provider_type,
+    }
+
+
+def install_hooks():
+    """
+    Time the llama-stack initialization and mark the end of the startup.
+
+    Wraps, by module attribute so that the callers pick the wrappers up:
+      - Stack.initialize, as a whole
+      - resolver.instantiate_provider, once per provider of the run configuration
+      - stack.register_resources (models, vector stores, tool groups of the run configuration)
+      - uvicorn's Server.startup, after which the startup is complete
+    """
+    try:
+        from llama_stack.core import resolver, stack
+    except ImportError:
+        logger.warning("llama-stack not found, provider initialization is not timed")
+    else:
+        resolver.instantiate_provider = _timed_async("provider_init", _provider_attributes)(
+            resolver.instantiate_provider
+        )
+        stack.register_resources = _timed_async("register_resources")(stack.register_resources)
+        stack.Stack.initialize = _timed_async("llama_stack_init")(stack.Stack.initialize)
+
+    try:
+        from uvicorn.server import Server
+    except ImportError:
+        logger.warning("uvicorn not found, the end of the startup is not recorded")
+        return
+
+    startup = Server.startup
+
+    @functools.wraps(startup)
+    async def timed_startup(self, *args, **kwargs):
+        with TIMINGS.phase("http_server_startup"):
+            result = await startup(self, *args, **kwargs)
+        if TIMINGS.ready_at is None:
+            summary = TIMINGS.mark_ready()
+            READINESS.set("startup", OK, seconds=summary["total"])
+            slowest = ", ".join(f"{p['phase']} {p['duration']:.2f}s" for p in summary["slowest"][:5])
+            logger.info("Startup complete in %ss, slowest phases: %s", summary["total"], slowest)
+        return result
+
+    Server.startup = timed_startup
@@ -0,0 +1,267 @@
+"""Routing of the knowledge searches to the vector stores relevant to the query.
+
+Every file_search (knowledge_search) of the Responses API searches all the
+vector stores of its tool, the AAP store and each BYOK store, whatever the
+query: the CPU spent grows with the number of stores attached. With
+STORE_ROUTING=true, the chunk embeddings of each inline::faiss store are
+summarized when it is loaded (and reloaded, see faiss_index.reload) by
+STORE_ROUTING_CENTROIDS centroids, the spherical k-means of a sample of them.
+Before the stores of a file_search are searched, the query is embedded with
+the embedding model each store is registered with (not the one recorded in its
+chunks, "unknown" in those of older stores), which the query embedding cache
+then answers for the searches themselves (see embedding_cache), and compared
+with the centroids of each store: a store is searched when its closest
+centroid is within STORE_ROUTING_MARGIN of the closest centroid of all the
+stores.
+
+When no centroid comes closer than STORE_ROUTING_MIN_SIMILARITY, the routing
+is not confident, and every store is searched, as are the stores without
+centroids (not loaded in this process, or without chunk embeddings). The
+number of routed searches, the stores skipped and the low-confidence
+fallbacks are served as JSON by the admin server on GET /store_router.
+
+Environment:
+    STORE_ROUTING                 "true" to search only the stores relevant to each query (default: false)
+    STORE_ROUTING_CENTROIDS       centroids summarizing each store (default: 16)
+    STORE_ROUTING_MARGIN          cosine similarity below the best store's within which a store is searched
+                                  too (default: 0.1)
+    STORE_ROUTING_MIN_SIMILARITY  best cosine similarity under which every store is searched (default: 0.3)
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+from ansible_chatbot_stack import faiss_index
+from ansible_chatbot_stack.runtime import RUNTIME
+
+logger = logging.getLogger(__name__)
+
+ROUTING_ENV = "STORE_ROUTING"
+CENTROIDS_ENV = "STORE_ROUTING_CENTROIDS"
+MARGIN_ENV = "STORE_ROUTING_MARGIN"
+MIN_SIMILARITY_ENV = "STORE_ROUTING_MIN_SIMILARITY"
+DEFAULT_CENTROIDS = 16
+DEFAULT_MARGIN = 0.1
+DEFAULT_MIN_SIMILARITY = 0.3
+# Chunk embeddings the centroids of a store are computed from at most.
+MAX_SAMPLE = 20000
+KMEANS_ITERATIONS = 20
+
+
+@dataclass
+class StoreCentroids:
+    vectors: np.ndarray  # unit vectors, one per row
+    chunks: int
+
+
+def unit_rows(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def _chunk_field(chunk, name: str):
+    return chunk.get(name) if isinstance(chunk, dict) else getattr(chunk, name, None)
+
+
+def compute_centroids(chunk_by_index: dict, count: int) -> StoreCentroids | None:
+    """The centroids of the embeddings of the live chunks of a store, or None if they have no embedding."""
+    live = [chunk for chunk in chunk_by_index.values() if not faiss_index.is_tombstone(chunk)]
+    if not live:
+        return None
+    sample = live[:: max(1, len(live) // MAX_SAMPLE)][:MAX_SAMPLE]
+    embeddings = [_chunk_field(chunk, "embedding") for chunk in sample]
+    if not all(embeddings) or len({len(embedding) for embedding in embeddings}) != 1:
+        return None
+    vectors = unit_rows(np.asarray(embeddings, dtype=np.float32))
+    if len(vectors) > count:
+        import faiss
+
+        kmeans = faiss.Kmeans(vectors.shape[1], count, niter=KMEANS_ITERATIONS, seed=1234, spherical=True)
+        kmeans.train(vectors)
+        vectors = unit_rows(kmeans.centroids)
+    return StoreCentroids(vectors, len(live))
+
+
+class StoreRouter:
+    def __init__(
+        self,
+        centroid_count: int = DEFAULT_CENTROIDS,
+        margin: float = DEFAULT_MARGIN,
+        min_similarity: float = DEFAULT_MIN_SIMILARITY,
+    ):
+        self.centroid_count = max(1, centroid_count)
+        self.margin = margin
+        self.min_similarity = min_similarity
+        self.centroids: dict[str, StoreCentroids] = {}
+        # The embedding model each store is registered with, read from the registry on first use.
+        self.models: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.fallbacks = 0
+        self.searched: dict[str, int] = {}
+        self.skipped: dict[str, int] = {}
+
+    async def index_loaded(self, index):
+        """Summarize the chunks of a provider FaissIndex just loaded, in a thread."""
+        try:
+            centroids = await asyncio.to_thread(compute_centroids, index.chunk_by_index, self.centroid_count)
+        except Exception as e:
+            logger.warning("Vector store %s has no centroids, it is always searched: %s", index.bank_id, e)
+            centroids = None
+        with self._lock:
+            self.models.pop(index.bank_id, None)
+            if centroids is None:
+                self.centroids.pop(index.bank_id, None)
+            else:
+                self.centroids[index.bank_id] = centroids
+
+    def select(self, store_ids: list[str], embeddings: dict[str, np.ndarray]) -> list[str]:
+        """The stores to search for a query, given its unit embedding by model."""
+        with self._lock:
+            centroids = {store_id: self.centroids.get(store_id) for store_id in store_ids}
+            models = {store_id: self.models.get(store_id) for store_id in store_ids}
+        similarities = {
+            store_id: float((summary.vectors @ embeddings[models[store_id]]).max())
+            for store_id, summary in centroids.items()
+            if summary is not None and models[store_id] in embeddings
+        }
+        best = max(similarities.values(), default=None)
+        selected = store_ids
+        if best is not None and best >= self.min_similarity:
+            selected = [s for s in store_ids if s not in similarities or similarities[s] >= best - self.margin]
+        with self._lock:
+            self.routed += 1
+            if best is not None and best < self.min_similarity:
+                self.fallbacks += 1
+            for store_id in store_ids:
+                counts = self.searched if store_id in selected else self.skipped
+                counts[store_id] = counts.get(store_id, 0) + 1
+        return selected
+
+    async def route(self, store_ids: list[str], query: str, embed, registered_models) -> list[str]:
+        """The stores of ``store_ids`` to search for ``query``, embedded by ``await embed(model, query)`` with the
+        models of ``await registered_models()``, by store."""
+        with self._lock:
+            summarized = [s for s in store_ids if s in self.centroids]
+            unknown = [s for s in summarized if s not in self.models]
+        if len(store_ids) < 2 or not summarized:
+            return store_ids
+        if unknown:
+            registered = await registered_models()
+            with self._lock:
+                self.models.update((s, registered[s]) for s in unknown if registered.get(s))
+        with self._lock:
+            models = {self.models[s] for s in summarized if s in self.models}
+        if not models:
+            return store_ids
+        embeddings = {}
+        for model in models:
+            embedding = np.asarray(await embed(model, query), dtype=np.float32)
+            embeddings[model] = embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+        return self.select(store_ids, embeddings)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "centroids": self.centroid_count,
+                "margin": self.margin,
+                "min_similarity": self.min_similarity,
+                "routed": self.routed,
+                "fallbacks": self.fallbacks,
+                "stores": {
+                    store_id: {
+                        "chunks": summary.chunks if summary else None,
+                        "centroids": len(summary.vectors) if summary else 0,
+                        "searched": self.searched.get(store_id, 0),
+                        "skipped": self.skipped.get(store_id, 0),
+                    }
+                    for store_id in sorted({*self.centroids, *self.searched, *self.skipped})
+                    for summary in [self.centroids.get(store_id)]
+                },
+            }
+
+
+STORE_ROUTER: StoreRouter | None = None
+
+
+def from_env() -> StoreRouter | None:
+    if os.environ.get(ROUTING_ENV, "false").lower() != "true":
+        return None
+    return StoreRouter(
+        int(os.environ.get(CENTROIDS_ENV, DEFAULT_CENTROIDS)),
+        float(os.environ.get(MARGIN_ENV, DEFAULT_MARGIN)),
+        float(os.environ.get(MIN_SIMILARITY_ENV, DEFAULT_MIN_SIMILARITY)),
+    )
+
+
+def stats() -> dict:
+    return STORE_ROUTER.stats() if STORE_ROUTER else {"enabled": False}
+
+
+async def _registered_models() -> dict[str, str]:
+    vector_stores = await RUNTIME.api("vector_stores").list_vector_stores()
+    return {vector_store.identifier: vector_store.embedding_model for vector_store in vector_stores}
+
+
+async def _embed(model: str, query: str):
+    import llama_stack_api
+
+    request = llama_stack_api.OpenAIEmbeddingsRequestWithExtraBody(model=model, input=[query])
+    response = await RUNTIME.api("inference").openai_embeddings(request)
+    return response.data[0].embedding
+
+
+def install_hooks():
+    """Summarize the inline::faiss stores as they are loaded, and route the file searches with their summaries."""
+    global STORE_ROUTER
+    STORE_ROUTER = from_env()
+    if STORE_ROUTER is None:
+        return
+    try:
+        from llama_stack.providers.inline.agents.meta_reference.responses import tool_executor
+        from llama_stack.providers.inline.vector_io.faiss import faiss as provider
+    except ImportError:
+        logger.warning("llama-stack not found, knowledge searches are not routed")
+        return
+
+    initialize = provider.FaissIndex.initialize
+
+    @functools.wraps(initialize)
+    async def summarized_initialize(self):
+        await initialize(self)
+        await STORE_ROUTER.index_loaded(self)
+
+    reload_index = faiss_index.reload_index
+
+    @functools.wraps(reload_index)
+    async def summarized_reload_index(index, provider) -> bool:
+        reloaded = await reload_index(index, provider)
+        if reloaded:
+            await STORE_ROUTER.index_loaded(index)
+        return reloaded
+
+    search = tool_executor.ToolExecutor._execute_knowledge_search_via_vector_store
+
+    @functools.wraps(search)
+    async def routed_search(self, query: str, response_file_search_tool):
+        store_ids = list(response_file_search_tool.vector_store_ids)
+        if len(store_ids) > 1 and RUNTIME.api("inference") is not None:
+            try:
+                selected = await STORE_ROUTER.route(store_ids, query, _embed, _registered_models)
+            except Exception as e:
+                logger.warning("Knowledge search not routed, searching every store: %s", e)
+                selected = store_ids
+            if selected != store_ids:
+                response_file_search_tool = response_file_search_tool.model_copy(
+                    update={"vector_store_ids": selected}
+                )
+        return await search(self, query, response_file_search_tool)
+
+    provider.FaissIndex.initialize = summarized_initialize
+    faiss_index.reload_index = summarized_reload_index
+    tool_executor.ToolExecutor._execute_knowledge_search_via_vector_store = routed_search
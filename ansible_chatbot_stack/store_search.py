@@ -0,0 +1,303 @@
+"""Concurrent vector store searches, each bounded by a deadline.
+
+With byok_rag entries in lightspeed-stack.yaml, every knowledge_search
+searches the AAP store and each BYOK store. llama-stack starts the searches of
+one call concurrently, but waits for the slowest of them, and ranks the chunks
+of all the stores by their raw scores. install_hooks() wraps the searches of
+the vector_io router, query_chunks (the knowledge_search tool runtime) and
+openai_search_vector_store (the file_search tool of the Responses API), so
+that the search of each store:
+
+- has a deadline, when STORE_SEARCH_DEADLINE_MS or the per-store one of
+  STORE_SEARCH_DEADLINES_MS sets one. A store that misses it contributes no
+  chunks, and the call answers with the chunks of the others: a slow or huge
+  BYOK index does not stretch the turn. The misses are counted as timeouts.
+  The search itself is not cancelled, but finishes in the background: the
+  first search of a store may load its embedding model, which is then cached
+  for the next ones. While it runs, the store is not searched again, and its
+  searches count as timeouts: a slow store does not pile up searches that
+  hold the threads the other stores search and embed in. The warm-up searches
+  have no deadline (see warmup).
+- has its scores multiplied by the score_multiplier of its byok_rag entry
+  (the AAP store keeps a multiplier of 1), so that the chunks of all the
+  stores are ranked on one scale.
+- has its latency observed in a histogram of its own, that of the late
+  searches once they finish.
+
+The knowledge_search tool runtime sorts the chunks of all the stores in one
+step, but the file_search tool of the Responses API lists the results of each
+store in turn. install_hooks() also wraps the latter: the stores are searched
+as llama-stack does, their results are merged and sorted by their scaled
+scores, and run through the CONTEXT_FILTERS (see reranker and rag_context)
+before llama-stack formats the context from them, in that order.
+
+The query embedding is computed once for all the stores searched with the same
+model (see embedding_batcher and embedding_cache). The latency histograms,
+timeouts and multipliers are served as JSON by the admin server on
+GET /store_search.
+
+Environment:
+    STORE_SEARCH_DEADLINE_MS   milliseconds each store search may take, 0 for no deadline (default: 0)
+    STORE_SEARCH_DEADLINES_MS  per-store deadlines, e.g. "byok-docs-0001=500,aap-product-docs=1000"
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import copy
+import functools
+import logging
+import os
+import time
+import types
+
+import yaml
+
+from ansible_chatbot_stack.metrics import Histogram
+from ansible_chatbot_stack.warm_state import resolve_env_vars
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_ENV = "STORE_SEARCH_DEADLINE_MS"
+DEADLINES_ENV = "STORE_SEARCH_DEADLINES_MS"
+DEFAULT_DEADLINE_MS = 0.0
+MILLISECOND_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Async callables (query, results) -> results, by name, applied in order to the merged results of each file_search.
+CONTEXT_FILTERS: dict = {}
+
+_UNBOUNDED = contextvars.ContextVar("store_search_unbounded", default=False)
+
+
+@contextlib.contextmanager
+def unbounded():
+    """The store searches of the current task have no deadline, e.g. those of the warm-up."""
+    token = _UNBOUNDED.set(True)
+    try:
+        yield
+    finally:
+        _UNBOUNDED.reset(token)
+
+
+def parse_deadlines(value: str) -> dict[str, float]:
+    """Per-store deadlines in seconds, from ``<vector store ID>=<milliseconds>`` pairs separated by commas."""
+    deadlines = {}
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        store_id, sep, milliseconds = pair.rpartition("=")
+        if not sep or not store_id:
+            raise ValueError(f"Invalid store search deadline {pair!r}, expected <vector store ID>=<milliseconds>")
+        deadlines[store_id] = float(milliseconds) / 1000
+    return deadlines
+
+
+def score_multipliers(lightspeed_config: str) -> dict[str, float]:
+    """The score_multiplier of each byok_rag entry of lightspeed-stack.yaml, by vector store ID."""
+    with open(lightspeed_config) as f:
+        entries = resolve_env_vars(yaml.safe_load(f) or {}).get("byok_rag") or []
+    return {
+        entry["vector_db_id"]: float(entry.get("score_multiplier", 1.0))
+        for entry in entries
+        if entry.get("vector_db_id")
+    }
+
+
+def merge_results(pages: list[list]) -> list:
+    """The search results of several stores, best first by their (scaled) scores."""
+    return sorted((result for data in pages for result in data), key=lambda result: result.score, reverse=True)
+
+
+class _SearchedStores:
+    """Stands for the vector_io API of the tool executor, once its stores are searched: answers the search of the
+    first store with the merged results, in their order, and those of the others with none."""
+
+    def __init__(self, vector_io_api, first_store: str, results: list):
+        self._vector_io_api = vector_io_api
+        self._first_store = first_store
+        self._results = results
+
+    def __getattr__(self, name):
+        return getattr(self._vector_io_api, name)
+
+    async def openai_search_vector_store(self, vector_store_id: str, *args, **kwargs):
+        return types.SimpleNamespace(data=self._results if vector_store_id == self._first_store else [])
+
+
+class StoreSearch:
+    def __init__(
+        self,
+        deadline: float,
+        deadlines: dict[str, float] | None = None,
+        multipliers: dict[str, float] | None = None,
+    ):
+        self.deadline = deadline
+        self.deadlines = deadlines or {}
+        self.multipliers = multipliers or {}
+        self.latency_ms: dict[str, Histogram] = {}
+        self.timeouts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        # The search that missed its deadline and still runs, by store.
+        self.late: dict[str, asyncio.Task] = {}
+
+    def deadline_of(self, store_id: str) -> float | None:
+        """Seconds the search of a store may take, None for no deadline."""
+        return self.deadlines.get(store_id, self.deadline) or None
+
+    async def search(self, store_id: str, search):
+        """The result of ``search()``, a search of one store, or None if it missed the store's deadline, or if the
+        previous search that missed it still runs."""
+        started = time.monotonic()
+        deadline = None if _UNBOUNDED.get() else self.deadline_of(store_id)
+        self.latency_ms.setdefault(store_id, Histogram(MILLISECOND_BUCKETS))
+        if deadline is not None and store_id in self.late:
+            self.timeouts[store_id] = self.timeouts.get(store_id, 0) + 1
+            logger.warning("Vector store %s still runs a search past its deadline, answering without it", store_id)
+            return None
+        late = False
+        try:
+            if deadline is None:
+                return await search()
+            task = asyncio.ensure_future(search())
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), deadline)
+            except TimeoutError:
+                self.timeouts[store_id] = self.timeouts.get(store_id, 0) + 1
+                logger.warning("Search of vector store %s missed its deadline, answering without it", store_id)
+                self.late[store_id] = task
+                task.add_done_callback(functools.partial(self._late_search_done, store_id, started))
+                late = True
+                return None
+        except Exception:
+            self.errors[store_id] = self.errors.get(store_id, 0) + 1
+            raise
+        finally:
+            if not late:
+                self._observe(store_id, started)
+
+    def _observe(self, store_id: str, started: float):
+        self.latency_ms[store_id].observe((time.monotonic() - started) * 1000)
+
+    def _late_search_done(self, store_id: str, started: float, task: asyncio.Task):
+        if self.late.get(store_id) is task:
+            del self.late[store_id]
+        if task.cancelled():
+            return
+        self._observe(store_id, started)
+        if task.exception() is not None:
+            self.errors[store_id] = self.errors.get(store_id, 0) + 1
+            logger.warning("Search of vector store %s failed after its deadline: %s", store_id, task.exception())
+
+    def stats(self) -> dict:
+        return {
+            "deadline_ms": self.deadline * 1000 or None,
+            "late": len(self.late),
+            "stores": {
+                store_id: {
+                    "deadline_ms": self.deadlines.get(store_id, self.deadline) * 1000 or None,
+                    "score_multiplier": self.multipliers.get(store_id, 1.0),
+                    "timeouts": self.timeouts.get(store_id, 0),
+                    "errors": self.errors.get(store_id, 0),
+                    "latency_ms": histogram.snapshot(),
+                }
+                for store_id, histogram in sorted(self.latency_ms.items())
+            },
+        }
+
+
+STORE_SEARCH: StoreSearch | None = None
+
+
+def from_env(lightspeed_config: str | None = None) -> StoreSearch:
+    multipliers = {}
+    if lightspeed_config:
+        try:
+            multipliers = score_multipliers(lightspeed_config)
+        except (OSError, ValueError, TypeError, AttributeError, yaml.YAMLError) as e:
+            logger.warning("byok_rag score multipliers not read from %s: %s", lightspeed_config, e)
+    return StoreSearch(
+        float(os.environ.get(DEADLINE_ENV, DEFAULT_DEADLINE_MS)) / 1000,
+        parse_deadlines(os.environ.get(DEADLINES_ENV, "")),
+        multipliers,
+    )
+
+
+def stats() -> dict:
+    return STORE_SEARCH.stats() if STORE_SEARCH else {"enabled": False}
+
+
+def install_hooks(lightspeed_config: str | None = None):
+    """Bound the vector store searches of the vector_io router by their deadline, scale their scores, and merge
+    the results of the stores of each file search."""
+    global STORE_SEARCH
+    try:
+        from llama_stack.core.routers import vector_io
+        from llama_stack.providers.inline.agents.meta_reference.responses import tool_executor
+    except ImportError:
+        logger.warning("llama-stack not found, vector store searches are not bounded")
+        return
+    STORE_SEARCH = from_env(lightspeed_config)
+
+    query_chunks = vector_io.VectorIORouter.query_chunks
+
+    @functools.wraps(query_chunks)
+    async def bounded_query_chunks(self, vector_store_id: str, query, params=None):
+        response = await STORE_SEARCH.search(
+            vector_store_id, lambda: query_chunks(self, vector_store_id, query, params)
+        )
+        if response is None:
+            return vector_io.QueryChunksResponse(chunks=[], scores=[])
+        multiplier = STORE_SEARCH.multipliers.get(vector_store_id, 1.0)
+        if multiplier != 1.0:
+            response.scores = [score * multiplier for score in response.scores]
+        return response
+
+    openai_search_vector_store = vector_io.VectorIORouter.openai_search_vector_store
+
+    @functools.wraps(openai_search_vector_store)
+    async def bounded_openai_search_vector_store(self, vector_store_id: str, query, *args, **kwargs):
+        page = await STORE_SEARCH.search(
+            vector_store_id, lambda: openai_search_vector_store(self, vector_store_id, query, *args, **kwargs)
+        )
+        if page is None:
+            return vector_io.VectorStoreSearchResponsePage(
+                search_query=query if isinstance(query, list) else [query], data=[], has_more=False
+            )
+        multiplier = STORE_SEARCH.multipliers.get(vector_store_id, 1.0)
+        if multiplier != 1.0:
+            for result in page.data:
+                result.score *= multiplier
+        return page
+
+    knowledge_search = tool_executor.ToolExecutor._execute_knowledge_search_via_vector_store
+
+    @functools.wraps(knowledge_search)
+    async def merged_knowledge_search(self, query: str, response_file_search_tool):
+        store_ids = list(response_file_search_tool.vector_store_ids)
+        if not store_ids or (len(store_ids) < 2 and not CONTEXT_FILTERS):
+            return await knowledge_search(self, query, response_file_search_tool)
+
+        async def search_store(vector_store_id: str) -> list:
+            # As llama-stack's search of a single store.
+            try:
+                page = await self.vector_io_api.openai_search_vector_store(
+                    vector_store_id=vector_store_id,
+                    query=query,
+                    filters=response_file_search_tool.filters,
+                    max_num_results=response_file_search_tool.max_num_results,
+                    ranking_options=response_file_search_tool.ranking_options,
+                    rewrite_query=False,
+                )
+                return page.data
+            except Exception as e:
+                logger.warning("Failed to search vector store %s: %s", vector_store_id, e)
+                return []
+
+        results = merge_results(await asyncio.gather(*map(search_store, store_ids)))
+        for context_filter in list(CONTEXT_FILTERS.values()):
+            results = await context_filter(query, results)
+        executor = copy.copy(self)
+        executor.vector_io_api = _SearchedStores(self.vector_io_api, store_ids[0], results)
+        return await knowledge_search(executor, query, response_file_search_tool)
+
+    vector_io.VectorIORouter.query_chunks = bounded_query_chunks
+    vector_io.VectorIORouter.openai_search_vector_store = bounded_openai_search_vector_store
+    tool_executor.ToolExecutor._execute_knowledge_search_via_vector_store = merged_knowledge_search
@@ -0,0 +1,200 @@
+"""Warm restart: keep the llama-stack stores whose configuration did not change.
+
+By default entrypoint.sh deletes every store DB but the FAISS one on each start,
+which resets the registry, agent state, responses and conversations. With
+WARM_RESTART=true it runs this module instead:
+
+    python -m ansible_chatbot_stack.warm_state --lightspeed-config <lightspeed-stack.yaml> \\
+        --data-dir /.llama/data/distributions/ansible-chatbot --keep aap_faiss_store.db
+
+Every sqlite storage backend of the run configuration gets a fingerprint of
+what its content depends on: the llama-stack and provider package versions,
+the backend itself, the stores and provider settings using it and, for the
+registry backend, the providers and registered resources. A DB is kept when
+its fingerprint matches the one recorded by the previous start and it passes
+a sqlite quick check; otherwise it is deleted and llama-stack recreates it.
+Changing the inference model therefore resets the registry but keeps the
+conversations. Any other *.db file of the data directory is deleted, as before.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from importlib import metadata
+from pathlib import Path
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINTS_FILE = "warm_state.json"
+# Packages whose upgrades can change the schema or content of the stores.
+VERSIONED_PACKAGES = ("llama-stack", "llama-stack-api", "lightspeed-stack-providers")
+
+_ENV_VAR = re.compile(r"\$\{env\.([A-Za-z0-9_]+)(?::([=+])([^}]*))?\}")
+
+
+def resolve_env_vars(value):
+    """Substitute llama-stack's ${env.NAME}, ${env.NAME:=default} and ${env.NAME:+value} references."""
+    if isinstance(value, dict):
+        return {k: resolve_env_vars(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_env_vars(v) for v in value]
+    if not isinstance(value, str):
+        return value
+
+    def substitute(match):
+        name, operator, operand = match.groups()
+        current = os.environ.get(name, "")
+        if operator == "=":
+            return current or operand
+        if operator == "+":
+            return operand if current else ""
+        return current
+
+    return _ENV_VAR.sub(substitute, value)
+
+
+def package_versions() -> dict[str, str | None]:
+    versions = {}
+    for package in VERSIONED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def _references(node, backend: str, path: str = "") -> list:
+    """Every mapping of ``node`` that refers to ``backend``, with its location."""
+    found = []
+    if isinstance(node, dict):
+        if node.get("backend") == backend:
+            found.append([path, node])
+        for key, value in node.items():
+            found += _references(value, backend, f"{path}/{key}")
+    elif isinstance(node, list):
+        for index, value in enumerate(node):
+            found += _references(value, backend, f"{path}/{index}")
+    return found
+
+
+def backend_fingerprints(run_config: dict, versions: dict | None = None) -> dict[str, dict]:
+    """Fingerprint and DB path of every sqlite storage backend of a resolved run configuration."""
+    versions = package_versions() if versions is None else versions
+    storage = run_config.get("storage") or {}
+    registry_backend = ((storage.get("stores") or {}).get("metadata") or {}).get("backend")
+    providers = run_config.get("providers") or {}
+
+    fingerprints = {}
+    for name, backend in (storage.get("backends") or {}).items():
+        if not str(backend.get("type", "")).endswith("sqlite") or not backend.get("db_path"):
+            continue
+        content = {
+            "versions": versions,
+            "backend": backend,
+            "stores": _references(storage.get("stores"), name),
+            "providers": [
+                [api, provider.get("provider_id"), provider.get("provider_type"), _references(provider.get("config"), name)]
+                for api, entries in sorted(providers.items())
+                for provider in entries or []
+                if _references(provider.get("config"), name)
+            ],
+        }
+        if name == registry_backend:
+            # The registry holds every provider's resources: models, vector stores, tool groups, shields.
+            content["all_providers"] = [
+                [api, p.get("provider_id"), p.get("provider_type")]
+                for api, entries in sorted(providers.items())
+                for p in entries or []
+            ]
+            content["registered_resources"] = run_config.get("registered_resources")
+        digest = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+        fingerprints[name] = {"db_path": backend["db_path"], "fingerprint": digest}
+    return fingerprints
+
+
+def quick_check(db_path: Path) -> bool:
+    try:
+        with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as connection:
+            return connection.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    except sqlite3.Error:
+        return False
+
+
+def _remove(db_path: Path):
+    for path in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm"), Path(f"{db_path}-journal")):
+        path.unlink(missing_ok=True)
+
+
+def prepare(run_config: dict, data_dir: Path, keep: list[str]) -> dict[str, str]:
+    """
+    Delete the store DBs of ``data_dir`` that cannot be reused, and record the new fingerprints.
+
+    Returns what happened to each DB file: "kept", "reset" (fingerprint changed or
+    DB corrupted), "new" or "removed" (not a storage backend of the run configuration).
+    """
+    fingerprints_path = data_dir / FINGERPRINTS_FILE
+    try:
+        previous = json.loads(fingerprints_path.read_text())
+    except (OSError, json.JSONDecodeError):
+        previous = {}
+
+    current = {}
+    actions = {}
+    for name, backend in backend_fingerprints(run_config).items():
+        db_path = Path(backend["db_path"])
+        if db_path.name in keep or db_path.parent.resolve() != data_dir.resolve():
+            continue
+        current[db_path.name] = backend["fingerprint"]
+        if not db_path.exists():
+            actions[db_path.name] = "new"
+        elif previous.get(db_path.name) == backend["fingerprint"] and quick_check(db_path):
+            actions[db_path.name] = "kept"
+        else:
+            _remove(db_path)
+            actions[db_path.name] = "reset"
+
+    for db_path in sorted(data_dir.glob("*.db")):
+        if db_path.name not in keep and db_path.name not in current:
+            _remove(db_path)
+            actions[db_path.name] = "removed"
+
+    fingerprints_path.write_text(json.dumps(current, indent=2, sort_keys=True))
+    return actions
+
+
+def load_run_config(lightspeed_config: str | None, run_config: str | None) -> dict:
+    if run_config is None:
+        with open(lightspeed_config) as f:
+            run_config = yaml.safe_load(f)["llama_stack"]["library_client_config_path"]
+    with open(run_config) as f:
+        return resolve_env_vars(yaml.safe_load(f))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    config = parser.add_mutually_exclusive_group(required=True)
+    config.add_argument("--lightspeed-config", help="lightspeed-stack.yaml, whose library client run config is used")
+    config.add_argument("--run-config", help="llama-stack run config")
+    parser.add_argument("--data-dir", required=True, help="directory of the store DB files")
+    parser.add_argument("--keep", action="append", default=[], help="DB file name to always keep")
+    args = parser.parse_args(argv)
+
+    data_dir = Path(args.data_dir)
+    if not data_dir.is_dir():
+        print(f"Store DB directory not found: {data_dir}")
+        return 0
+    actions = prepare(load_run_config(args.lightspeed_config, args.run_config), data_dir, args.keep)
+    for db_file, action in actions.items():
+        print(f"Store DB {db_file}: {action}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Startup warm-up of the embedding model and the vector stores.
+
+The inline sentence-transformers provider loads its model on the first
+embedding request, and the first FAISS search initializes its own state too;
+without a warm-up, the first user query pays for both. Right after llama-stack
+is initialized, every warm-up query is searched in every registered vector
+store, which encodes it with the store's embedding model. The warm-up
+searches have no store search deadline (see store_search), so that the models
+are loaded before the service is ready, however long they take. With RERANK=true,
+the cross-encoder of the reranking is loaded then too (see reranker).
+
+The ``warmup`` readiness check blocks readiness while the warm-up runs. A failed
+or timed-out warm-up is logged and reported, but does not keep the service
+unready: it only means that the first queries are slower.
+
+Environment:
+    STARTUP_WARMUP           "false" to disable the warm-up (default: true)
+    STARTUP_WARMUP_QUERIES   queries to search, separated by "|"
+    STARTUP_WARMUP_TIMEOUT   seconds after which the warm-up is abandoned (default: 120)
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from ansible_chatbot_stack import reranker, store_search
+from ansible_chatbot_stack.readiness import FAILED, OK, PENDING, READINESS, SKIPPED
+from ansible_chatbot_stack.runtime import RUNTIME, Runtime
+from ansible_chatbot_stack.startup import TIMINGS
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENV = "STARTUP_WARMUP"
+WARMUP_QUERIES_ENV = "STARTUP_WARMUP_QUERIES"
+WARMUP_TIMEOUT_ENV = "STARTUP_WARMUP_TIMEOUT"
+DEFAULT_WARMUP_QUERIES = (
+    "What is Ansible Automation Platform?",
+    "What is Event-Driven Ansible?",
+    "How do I create a job template in automation controller?",
+)
+DEFAULT_WARMUP_TIMEOUT = 120.0
+
+
+def warmup_queries() -> list[str]:
+    queries = os.environ.get(WARMUP_QUERIES_ENV)
+    if not queries:
+        return list(DEFAULT_WARMUP_QUERIES)
+    return [q.strip() for q in queries.split("|") if q.strip()]
+
+
+async def search_vector_stores(runtime: Runtime, queries: list[str]) -> dict:
+    """Search every query in every registered vector store; returns what was searched."""
+    routing_table = runtime.api("vector_stores")
+    vector_io = runtime.api("vector_io")
+    if routing_table is None or vector_io is None:
+        return {}
+
+    searched = {}
+    for vector_store in await routing_table.list_vector_stores():
+        start = time.perf_counter()
+        for query in queries:
+            with store_search.unbounded():
+                await vector_io.query_chunks(vector_store.identifier, query, {"max_chunks": 1})
+        searched[vector_store.identifier] = {
+            "embedding_model": vector_store.embedding_model,
+            "queries": len(queries),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+    return searched
+
+
+async def load_reranker() -> dict | None:
+    """Load the cross-encoder of the reranking, when enabled; returns what was loaded."""
+    if reranker.RERANKER is None:
+        return None
+    start = time.perf_counter()
+    await reranker.RERANKER.warm_up()
+    return {"model": reranker.RERANKER.model, "seconds": round(time.perf_counter() - start, 3)}
+
+
+async def warm_up_models(runtime: Runtime, queries: list[str]) -> dict:
+    """Search the vector stores, then load the cross-encoder; returns the report of the warm-up."""
+    report = {"vector_stores": await search_vector_stores(runtime, queries)}
+    reranking = await load_reranker()
+    if reranking:
+        report["reranker"] = reranking
+    return report
+
+
+async def warm_up(runtime: Runtime):
+    if os.environ.get(WARMUP_ENV, "true").lower() != "true":
+        READINESS.set("warmup", SKIPPED, blocking=False)
+        return
+
+    READINESS.set("warmup", PENDING)
+    timeout = float(os.environ.get(WARMUP_TIMEOUT_ENV, DEFAULT_WARMUP_TIMEOUT))
+    try:
+        with TIMINGS.phase("warmup"):
+            report = await asyncio.wait_for(warm_up_models(runtime, warmup_queries()), timeout)
+    except Exception as e:
+        logger.warning("Startup warm-up failed, the first queries will be slower: %s", e)
+        READINESS.set("warmup", FAILED, blocking=False, error=f"{type(e).__name__}: {e}")
+        return
+
+    if report["vector_stores"]:
+        READINESS.set("warmup", OK, **report)
+    else:
+        READINESS.set("warmup", SKIPPED, blocking=False, reason="no vector stores registered")
+
+
+def install():
+    RUNTIME.after_initialize(warm_up)
@@ -13,6 +13,32 @@ BYOK_PROVIDER_VECTOR_DB_ID_FILE_PATH="${BYOK_VECTOR_DB_PATH}/provider_vector_db_
 
 PYTHON_CMD="$@"
 
+# Startup phase timings, as JSON lines on stdout and in STARTUP_EVENTS_FILE (read back by
+# ansible_chatbot_stack.launch). Timestamps are seconds since boot, the clock of /proc/uptime.
+export STARTUP_EVENTS_FILE="${STARTUP_EVENTS_FILE:-/tmp/ansible-chatbot-startup-events.jsonl}"
+: > "${STARTUP_EVENTS_FILE}" 2>/dev/null || STARTUP_EVENTS_FILE=/dev/null
+
+monotonic_now() {
+  local uptime _
+  read -r uptime _ < /proc/uptime
+  echo "${uptime}"
+}
+
+phase_start() {
+  PHASE_START=$(monotonic_now)
+}
+
+phase_end() {
+  local end event
+  end=$(monotonic_now)
+  event=$(awk -v phase="$1" -v start="${PHASE_START}" -v end="${end}" \
+    'BEGIN { printf "{\"event\": \"startup_phase\", \"source\": \"entrypoint\", \"phase\": \"%s\", \"start\": %.3f, \"end\": %.3f, \"duration\": %.3f}", phase, start, end, end - start }')
+  echo "${event}"
+  echo "${event}" >> "${STARTUP_EVENTS_FILE}"
+}
+
+phase_start
+
 echo "Checking preloaded embedding model..."
 if [[ -e /.llama/data/distributions/ansible-chatbot/embeddings_model ]]; then
   echo "/.llama/data/distributions/ansible-chatbot/embeddings_model already exists."
@@ -34,19 +60,32 @@ else
     fi
   fi
 fi
+phase_end embedding_model_link
 
 # cleanup vector db directory if exists
-if [ -d "$VECTOR_DB_PATH" ]; then
-    # Loop through all .db files in vector db directory
-    for db_file in "$VECTOR_DB_PATH"/*.db; do
-        # if the matched db_file exists and its filename is not FAISS_STORE_DB_FILE, remove it
-        if [ -e "$db_file" ] && [ "$(basename "$db_file")" != "$FAISS_STORE_DB_FILE" ]; then
-            rm "$db_file"
-        fi
-    done
+remove_store_dbs() {
+  if [ -d "$VECTOR_DB_PATH" ]; then
+      # Loop through all .db files in vector db directory
+      for db_file in "$VECTOR_DB_PATH"/*.db; do
+          # if the matched db_file exists and its filename is not FAISS_STORE_DB_FILE, remove it
+          if [ -e "$db_file" ] && [ "$(basename "$db_file")" != "$FAISS_STORE_DB_FILE" ]; then
+              rm "$db_file"
+          fi
+      done
+  fi
+}
+
+# with WARM_RESTART=true, the store DBs are checked against the run config just before start-up instead
+phase_start
+if [[ "${WARM_RESTART:-false}" == "true" ]]; then
+    echo "Warm restart enabled, store DB files are kept if the run config did not change."
+else
+    remove_store_dbs
 fi
+phase_end store_db_cleanup
 
 # log vector db files
+phase_start
 FAISS_STORE_DB_FILE_PATH="${VECTOR_DB_PATH}/${FAISS_STORE_DB_FILE}"
 PROVIDER_VECTOR_DB_ID_FILE_PATH="${VECTOR_DB_PATH}/${PROVIDER_VECTOR_DB_ID_FILE}"
 echo "Checking store DB files..."
@@ -74,8 +113,10 @@ if [[ -f "${PROVIDER_VECTOR_DB_ID_FILE_PATH}" ]]; then
 else
     echo "Provider vector DB ID file not found: ${PROVIDER_VECTOR_DB_ID_FILE_PATH}"
 fi
+phase_end store_db_check
 
 # log BYOK image if supplied
+phase_start
 if [[ -n "${BYOK_IMAGE:-}" ]]; then
     echo "BYOK_IMAGE is set: ${BYOK_IMAGE}"
 else
@@ -108,5 +149,77 @@ if [[ -f "${BYOK_PROVIDER_VECTOR_DB_ID_FILE_PATH}" ]]; then
 else
     echo "BYOK provider vector DB ID file not found: ${BYOK_PROVIDER_VECTOR_DB_ID_FILE_PATH}"
 fi
+phase_end byok_db_check
+
+# with HYBRID_SEARCH=true, the BM25 indexes of the chunks are built next to the FAISS indexes, unless up to date
+if [[ "${HYBRID_SEARCH:-false}" == "true" ]]; then
+    phase_start
+    echo "Building the BM25 indexes..."
+    for db_file in "${FAISS_STORE_DB_FILE_PATH}" "${BYOK_FAISS_STORE_DB_FILE_PATH}"; do
+        if [[ -f "${db_file}" ]]; then
+            ${PYTHON_CMD} -m ansible_chatbot_stack.faiss_index "${db_file}" --bm25 \
+                || echo "BM25 index build failed, the stores of ${db_file} are searched by vector only."
+        fi
+    done
+    phase_end bm25_index
+fi
+
+# with STORE_SNAPSHOTS=true, the AAP store DB is published as a versioned snapshot and served from
+# ${VECTOR_DB_PATH}/current, so that later snapshots are reloaded without a restart (see ansible_chatbot_stack.snapshots)
+if [[ "${STORE_SNAPSHOTS:-false}" == "true" && -f "${FAISS_STORE_DB_FILE_PATH}" ]]; then
+    phase_start
+    echo "Publishing the store DB as a snapshot..."
+    if ${PYTHON_CMD} -m ansible_chatbot_stack.snapshots publish "${VECTOR_DB_PATH}" "${FAISS_STORE_DB_FILE_PATH}"; then
+        export VECTOR_DB_DIR="${VECTOR_DB_PATH}/current"
+        FAISS_STORE_DB_FILE_PATH="${VECTOR_DB_DIR}/${FAISS_STORE_DB_FILE}"
+        echo "Serving the store DB from ${VECTOR_DB_DIR}"
+    else
+        echo "Store DB snapshot failed, serving ${FAISS_STORE_DB_FILE_PATH} instead."
+    fi
+    phase_end store_snapshot
+fi
+
+# with FAISS_INDEX_MMAP=true, the FAISS indexes are loaded memory-mapped from files exported next to their DBs
+if [[ "${FAISS_INDEX_MMAP:-false}" == "true" ]]; then
+    phase_start
+    echo "Exporting FAISS index files..."
+    for db_file in "${FAISS_STORE_DB_FILE_PATH}" "${BYOK_FAISS_STORE_DB_FILE_PATH}"; do
+        if [[ -f "${db_file}" ]]; then
+            ${PYTHON_CMD} -m ansible_chatbot_stack.faiss_index "${db_file}" --export \
+                || echo "FAISS index export failed, the indexes of ${db_file} are deserialized instead."
+        fi
+    done
+    phase_end faiss_index_export
+fi
+
+# with EMBEDDINGS_BACKEND=openvino, the embedding model runs from an export written next to it; the image has no
+# ONNX Runtime (sentence-transformers[onnx] requires transformers<4.58), so onnx runs the model with torch
+if [[ "${EMBEDDINGS_BACKEND:-torch}" == "onnx" ]]; then
+    echo "EMBEDDINGS_BACKEND=onnx is not available in this image, the model runs with torch. Use openvino instead."
+elif [[ "${EMBEDDINGS_BACKEND:-torch}" != "torch" ]]; then
+    phase_start
+    echo "Exporting the embedding model for the ${EMBEDDINGS_BACKEND} backend..."
+    # the int8 export is calibrated on the chunk texts of the stores
+    ${PYTHON_CMD} -m ansible_chatbot_stack.embedding_backend "${EMBEDDINGS_MODEL:-/.llama/data/embeddings_model}" \
+        --backend "${EMBEDDINGS_BACKEND}" ${EMBEDDINGS_QUANTIZATION:+--quantization "${EMBEDDINGS_QUANTIZATION}"} \
+        --calibration-db "${FAISS_STORE_DB_FILE_PATH}" --calibration-db "${BYOK_FAISS_STORE_DB_FILE_PATH}" \
+        || echo "Embedding model export failed, the model runs with torch instead."
+    phase_end embedding_backend_export
+fi
+
+LIGHTSPEED_STACK_CONFIG="/.llama/distributions/ansible-chatbot/config/lightspeed-stack.yaml"
+
+# keep the store DBs whose run config fingerprint still matches (run after the vector DB IDs are exported)
+if [[ "${WARM_RESTART:-false}" == "true" ]]; then
+    phase_start
+    echo "Checking store DB files for a warm restart..."
+    ${PYTHON_CMD} -m ansible_chatbot_stack.warm_state --lightspeed-config "${LIGHTSPEED_STACK_CONFIG}" \
+        --data-dir "${VECTOR_DB_PATH}" --keep "${FAISS_STORE_DB_FILE}"
+    if [[ $? != 0 ]]; then
+        echo "Warm restart check failed, removing the store DB files."
+        remove_store_dbs
+    fi
+    phase_end warm_state_check
+fi
 
-${PYTHON_CMD} /app-root/src/lightspeed_stack.py --config /.llama/distributions/ansible-chatbot/config/lightspeed-stack.yaml
+${PYTHON_CMD} -m ansible_chatbot_stack.launch /app-root/src/lightspeed_stack.py --config "${LIGHTSPEED_STACK_CONFIG}"
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Cold-start benchmark: from container start to the first answered /v1/query.
+
+Each run starts a fresh ansible-chatbot-stack container against the mock OpenAI
+API server (same setup as scripts/offline_benchmark.py), timestamps every line
+it logs, and records a timeline of the startup phases, relative to the moment
+the container runtime was invoked:
+
+  - entrypoint steps (embedding model link, store DB checks, BYOK checks)
+  - Python server process start and application startup complete
+  - HTTP ready (/v1/config answers 200)
+  - readiness ok (the admin server's /readiness answers 200)
+  - first /v1/query answered, which includes the lazy embedding model load
+    and the first FAISS search
+
+The JSON startup_phase lines logged by entrypoint.sh and ansible_chatbot_stack
+add the end of every instrumented phase (one per llama-stack provider) to the
+timeline, and their durations to the results.
+
+Several runs are summarized per phase (median, min, max) and written as JSON,
+one file per image tag, so startup regressions between releases and the lead
+time of a scale-up can be read from them. --baseline compares against a
+previous result file.
+
+Examples:
+    make bench-cold-start
+    uv run --group test python scripts/cold_start_benchmark.py --runs 5 \
+        --json bench_results/cold-start-0.0.1.json --baseline bench_results/cold-start-0.0.0.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+from offline_benchmark import ADMIN_PORT, CHATBOT_PORT, MOCK_OPENAI_PORT, PROJECT_ROOT, container_command, container_runtime
+from tests.mock_openai import add_profile_arguments, profile_from_args, start_mock_openai
+
+DEFAULT_QUERY = "What is AAP?"
+
+# First log line matching each pattern marks the phase; the order is the expected startup order.
+LOG_PHASES = [
+    ("entrypoint_started", re.compile(r"Checking preloaded embedding model")),
+    ("store_db_check_started", re.compile(r"Checking store DB files")),
+    ("byok_db_check_started", re.compile(r"Checking BYOK vector DB files")),
+    ("server_process_started", re.compile(r"Started server process")),
+    ("application_startup_complete", re.compile(r"Application startup complete")),
+    ("embedding_model_loading", re.compile(r"Loading sentence transformer")),
+]
+
+
+class ContainerLog:
+    """Reads the container output in the background, timestamping every line."""
+
+    def __init__(self, process: subprocess.Popen, start: float):
+        self.start = start
+        self.lines: list[tuple[float, str]] = []
+        self._thread = threading.Thread(target=self._read, args=(process,), daemon=True)
+        self._thread.start()
+
+    def _read(self, process: subprocess.Popen):
+        for raw_line in process.stdout:
+            self.lines.append((time.monotonic() - self.start, raw_line.decode("utf-8", errors="replace").rstrip()))
+
+    def join(self, timeout: float):
+        self._thread.join(timeout)
+
+    def phases(self) -> dict[str, float]:
+        found = {}
+        if self.lines:
+            found["first_output"] = self.lines[0][0]
+        for name, pattern in LOG_PHASES:
+            for offset, line in self.lines:
+                if pattern.search(line):
+                    found[name] = offset
+                    break
+        # Phase events are printed as soon as the phase ends.
+        for offset, event in self.phase_events():
+            found.setdefault(event["name"], offset)
+        return found
+
+    def durations(self) -> dict[str, float]:
+        return {event["name"]: event["duration"] for _, event in self.phase_events()}
+
+    def phase_events(self) -> list[tuple[float, dict]]:
+        """The startup_phase JSON lines, named after the phase and, for providers, the provider ID."""
+        events = []
+        for offset, line in self.lines:
+            if not line.startswith("{"):
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(event, dict) and event.get("event") == "startup_phase":
+                name = event["phase"] + (f":{event['provider_id']}" if event.get("provider_id") else "")
+                events.append((offset, {**event, "name": name}))
+        return events
+
+
+def wait_for_200(process: subprocess.Popen, url: str, start: float, timeout: float) -> float | None:
+    """Poll ``url`` until it answers 200; returns the offset from ``start`` at which it did."""
+    while time.monotonic() - start < timeout:
+        if process.poll() is not None:
+            return None
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                if response.status == 200:
+                    return time.monotonic() - start
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(0.25)
+    return None
+
+
+def first_query(base_url: str, query: str, model: str, timeout: float) -> tuple[int, float]:
+    """Send one /v1/query; returns its HTTP status and latency."""
+    body = json.dumps({"query": query, "model": model, "provider": "openai"}).encode()
+    request = urllib.request.Request(
+        f"{base_url}/v1/query", data=body, headers={"Content-Type": "application/json"}, method="POST"
+    )
+    start = time.monotonic()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        status = 0
+    return status, time.monotonic() - start
+
+
+def image_size(runtime: str, image: str) -> int | None:
+    result = subprocess.run(
+        [runtime, "image", "inspect", "--format", "{{.Size}}", image], capture_output=True, text=True
+    )
+    return int(result.stdout.strip()) if result.returncode == 0 and result.stdout.strip().isdigit() else None
+
+
+def cold_start(runtime: str, args, mock_url: str, run: int) -> dict:
+    """Start one container and return the timeline of its startup, in seconds from the run command."""
+    name = f"ansible-chatbot-cold-start-{os.getpid()}-{run}"
+    base_url = f"http://127.0.0.1:{CHATBOT_PORT}"
+    start = time.monotonic()
+    process = subprocess.Popen(
+        container_command(runtime, name, args.image, mock_url, args.model),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    log = ContainerLog(process, start)
+    timeline = {"container_run": 0.0}
+    first_query_latency = None
+    error = ""
+    try:
+        ready = wait_for_200(process, f"{base_url}/v1/config", start, args.startup_timeout)
+        if ready is not None:
+            timeline["http_ready"] = ready
+            ready = wait_for_200(process, f"http://127.0.0.1:{ADMIN_PORT}/readiness", start, args.startup_timeout)
+        if ready is None:
+            error = f"not ready after {args.startup_timeout:.0f}s (exit code {process.poll()})"
+        else:
+            timeline["readiness_ok"] = ready
+            status, latency = first_query(base_url, args.query, args.model, args.query_timeout)
+            if status == 200:
+                timeline["first_query_answered"] = time.monotonic() - start
+                first_query_latency = latency
+            else:
+                error = f"first /v1/query failed with HTTP {status}"
+    finally:
+        subprocess.run([runtime, "rm", "-f", name], capture_output=True, timeout=30)
+        process.wait(timeout=30)
+        log.join(timeout=5)
+
+    timeline.update(log.phases())
+    timeline = dict(sorted(timeline.items(), key=lambda item: item[1]))
+    result = {
+        "run": run,
+        "error": error,
+        "timeline": timeline,
+        "durations": log.durations(),
+        "first_query_latency": first_query_latency,
+    }
+    if error or args.keep_logs:
+        result["log"] = [f"{offset:8.3f} {line}" for offset, line in log.lines]
+    return result
+
+
+def _stats(samples: list[dict]) -> dict:
+    """Median, min and max of every key of ``samples``."""
+    stats = {}
+    for key in dict.fromkeys(k for sample in samples for k in sample):
+        values = [sample[key] for sample in samples if sample.get(key) is not None]
+        if values:
+            stats[key] = {"count": len(values), "median": statistics.median(values), "min": min(values), "max": max(values)}
+    return stats
+
+
+def summarize(runs: list[dict]) -> dict:
+    """Statistics of every timeline point, and of the first query latency, over the successful runs."""
+    return _stats([{**r["timeline"], "first_query_latency": r["first_query_latency"]} for r in runs if not r["error"]])
+
+
+def summarize_durations(runs: list[dict]) -> dict:
+    """Statistics of the duration of every instrumented phase, slowest first."""
+    stats = _stats([r["durations"] for r in runs if not r["error"]])
+    return dict(sorted(stats.items(), key=lambda item: item[1]["median"], reverse=True))
+
+
+def print_summary(summary: dict, baseline: dict | None = None):
+    header = f"{'phase':<32}{'count':>8}{'median':>10}{'min':>10}{'max':>10}"
+    if baseline:
+        header += f"{'baseline':>10}{'delta':>10}"
+    print(header)
+    print("-" * len(header))
+    for phase, stats in summary.items():
+        row = f"{phase:<32}{stats['count']:>8}{stats['median']:>10.3f}{stats['min']:>10.3f}{stats['max']:>10.3f}"
+        if baseline:
+            previous = baseline.get(phase, {}).get("median")
+            if previous is None:
+                row += f"{'-':>10}{'-':>10}"
+            else:
+                row += f"{previous:>10.3f}{stats['median'] - previous:>+10.3f}"
+        print(row)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--image",
+        default=f"ansible-chatbot-stack:{os.environ.get('ANSIBLE_CHATBOT_VERSION', 'latest')}",
+        help="chatbot image to benchmark (default: ansible-chatbot-stack:$ANSIBLE_CHATBOT_VERSION)",
+    )
+    parser.add_argument("--runs", type=int, default=3, help="number of container starts (default: 3)")
+    parser.add_argument("-q", "--query", default=DEFAULT_QUERY, help=f"first query to send (default: '{DEFAULT_QUERY}')")
+    parser.add_argument("--startup-timeout", type=float, default=float(os.environ.get("SERVER_STARTUP_TIMEOUT", 300)))
+    parser.add_argument("--query-timeout", type=float, default=120.0, help="timeout of the first query, in seconds")
+    parser.add_argument("--keep-logs", action="store_true", help="store the timestamped container logs of every run")
+    parser.add_argument(
+        "--label",
+        default=os.environ.get("ANSIBLE_CHATBOT_VERSION", ""),
+        help="label stored with the results, e.g. the image tag (default: $ANSIBLE_CHATBOT_VERSION)",
+    )
+    parser.add_argument("--json", dest="json_path", help="write the timelines and summary as JSON to this path")
+    parser.add_argument("--baseline", help="JSON result of a previous run to compare the medians against")
+    mock = parser.add_argument_group("mock LLM")
+    add_profile_arguments(mock)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for required in ("embeddings_model", "vector_db/aap_faiss_store.db", "llama-stack/providers.d"):
+        if not (PROJECT_ROOT / required).exists():
+            sys.exit(f"{required} not found - run 'make setup-test' first")
+
+    runtime = container_runtime()
+    mock = start_mock_openai(MOCK_OPENAI_PORT, profile_from_args(args))
+    started_at = datetime.now(timezone.utc).isoformat()
+    runs = []
+    try:
+        for run in range(args.runs):
+            result = cold_start(runtime, args, mock.url, run)
+            timeline = result["timeline"]
+            status = f"failed: {result['error']}" if result["error"] else (
+                f"ready {timeline['readiness_ok']:.1f}s, first answer {timeline['first_query_answered']:.1f}s"
+            )
+            print(f"[{run + 1}/{args.runs}] {status}")
+            runs.append(result)
+    finally:
+        mock.stop()
+
+    summary = summarize(runs)
+    durations = summarize_durations(runs)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print()
+    print_summary(summary, baseline.get("summary"))
+    if durations:
+        print("\nPhase durations:")
+        print_summary(durations, baseline.get("durations"))
+
+    if args.json_path:
+        metadata = {
+            "label": args.label,
+            "image": args.image,
+            "image_size": image_size(runtime, args.image),
+            "runtime": os.path.basename(runtime),
+            "runs": args.runs,
+            "mock_profile": vars(mock.profile),
+            "started_at": started_at,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump({"metadata": metadata, "summary": summary, "durations": durations, "runs": runs}, f, indent=2)
+        print(f"JSON results written to: {args.json_path}")
+
+    return 1 if all(r["error"] for r in runs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
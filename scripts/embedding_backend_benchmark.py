@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Latency and retrieval equivalence of embedding model backends against fp32 torch.
+
+The model (e.g. ./embeddings_model) is loaded with torch, the reference, then
+with each --backend (see ansible_chatbot_stack/embedding_backend.py):
+onnx:avx2, onnx:avx512_vnni, onnx:none (fp32 ONNX), openvino, openvino:int8, ... Every
+backend encodes the same queries, and is reported with:
+
+  - per-query latency (mean, p50, p90, p99), encoding one query at a time as
+    knowledge_search does, and the speed-up of the median over torch
+  - throughput in queries/s, encoding --batch-size queries at a time
+  - cosine similarity of its query embeddings to the torch ones (mean, min)
+  - with --store-db, retrieval equivalence: the share of the chunks the
+    torch embeddings retrieve among the top k that its embeddings retrieve
+    (recall@k), and how often both retrieve the same first chunk; the stored
+    chunk embeddings, computed with fp32 torch, are searched exactly, as the
+    flat index of the inline::faiss provider does
+
+The queries are the lines of --query-file, or else a seeded sample of the chunk
+texts of --store-db. A backend whose export is missing is exported first with
+--export, and skipped otherwise; the int8 OpenVINO export is calibrated on the
+chunk texts of --store-db.
+
+Examples:
+    make bench-embedding-backend
+    uv run --with 'sentence-transformers[onnx,openvino]' python scripts/embedding_backend_benchmark.py \
+        embeddings_model --backend onnx:avx2 --backend openvino --store-db vector_db/aap_faiss_store.db \
+        --export --json bench_results/embedding-backend.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from faiss_index_benchmark import recall_at_k
+from streaming_benchmark import describe
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from ansible_chatbot_stack.embedding_backend import (  # noqa: E402
+    Backend,
+    available,
+    calibration_texts,
+    export,
+    load_model,
+)
+from ansible_chatbot_stack.faiss_index import IndexSpec, build_index, load_stores, store_vectors  # noqa: E402
+
+DEFAULT_BACKENDS = ["onnx:avx2", "openvino", "openvino:int8"]
+# Characters of a chunk text kept as a query: about the length of a question with some context.
+QUERY_CHARS = 300
+
+
+def parse_backend(spec: str) -> Backend:
+    name, _, quantization = spec.partition(":")
+    try:
+        return Backend.parse(name, quantization or None)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def chunk_text(chunk: dict) -> str:
+    content = chunk.get("content")
+    if isinstance(content, list):
+        content = " ".join(item.get("text", "") for item in content if isinstance(item, dict))
+    return " ".join(str(content or "").split())[:QUERY_CHARS]
+
+
+def sample_chunk_queries(stores: dict, count: int, seed: int) -> list[str]:
+    texts = [
+        chunk_text(json.loads(chunk))
+        for record in stores.values()
+        for chunk in record.get("chunk_by_index", {}).values()
+    ]
+    texts = [text for text in texts if text]
+    return random.Random(seed).sample(texts, min(count, len(texts)))
+
+
+def encode_one_by_one(model, queries: list[str]) -> list[float]:
+    """Latency of encoding each query on its own, in milliseconds."""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode([query], show_progress_bar=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def encode_batches(model, queries: list[str], batch_size: int) -> tuple[np.ndarray, float]:
+    """Embeddings of all queries, and the queries encoded per second."""
+    start = time.perf_counter()
+    embeddings = [
+        model.encode(queries[i : i + batch_size], show_progress_bar=False) for i in range(0, len(queries), batch_size)
+    ]
+    elapsed = time.perf_counter() - start
+    return np.asarray(np.concatenate(embeddings), dtype=np.float32), len(queries) / elapsed
+
+
+def cosine_similarities(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return np.sum(reference * candidate, axis=1) / np.maximum(norms, 1e-12)
+
+
+def retrieval_equivalence(index, reference: np.ndarray, candidate: np.ndarray, k: int) -> dict:
+    """Recall@k and top-1 agreement of the chunks ``candidate`` retrieves, against those of ``reference``."""
+    k = min(k, index.ntotal)
+    _, reference_ids = index.search(reference, k)
+    _, candidate_ids = index.search(candidate, k)
+    return {
+        "recall": recall_at_k(candidate_ids, reference_ids),
+        "top1_agreement": float(np.mean(candidate_ids[:, 0] == reference_ids[:, 0])),
+    }
+
+
+def benchmark_backend(model, queries: list[str], batch_size: int, warmup: int = 3) -> tuple[dict, np.ndarray]:
+    encode_one_by_one(model, queries[:warmup])
+    latencies = encode_one_by_one(model, queries)
+    embeddings, throughput = encode_batches(model, queries, batch_size)
+    return {"latency_ms": describe(latencies), "throughput": throughput}, embeddings
+
+
+def compare(result: dict, embeddings: np.ndarray, reference: dict, reference_embeddings: np.ndarray, index, k: int):
+    result["speedup"] = reference["latency_ms"]["p50"] / result["latency_ms"]["p50"]
+    similarities = cosine_similarities(reference_embeddings, embeddings)
+    result["cosine"] = {"mean": float(similarities.mean()), "min": float(similarities.min())}
+    if index is not None:
+        result.update(retrieval_equivalence(index, reference_embeddings, embeddings, k))
+
+
+def print_results(results: list[dict], k: int):
+    header = (
+        f"{'backend':<22}{'p50 ms':>9}{'p99 ms':>9}{'speedup':>9}{'q/s':>9}"
+        f"{'cos mean':>10}{'cos min':>9}{f'recall@{k}':>10}{'top-1':>8}"
+    )
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        if "error" in r:
+            print(f"{r['backend']:<22}  skipped: {r['error']}")
+            continue
+        latency = r["latency_ms"]
+        retrieval = f"{r['recall']:>10.4f}{r['top1_agreement']:>8.3f}" if "recall" in r else f"{'n/a':>10}{'n/a':>8}"
+        print(
+            f"{r['backend']:<22}{latency['p50']:>9.2f}{latency['p99']:>9.2f}{r['speedup']:>8.2f}x{r['throughput']:>9.1f}"
+            f"{r['cosine']['mean']:>10.5f}{r['cosine']['min']:>9.5f}{retrieval}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="directory of the sentence-transformers model")
+    parser.add_argument(
+        "--backend",
+        dest="backends",
+        action="append",
+        type=parse_backend,
+        help=f"backend to compare with torch, name[:quantization], repeatable (default: {', '.join(DEFAULT_BACKENDS)})",
+    )
+    parser.add_argument("--store-db", type=Path, help="store DB whose chunks are retrieved, and sampled as queries")
+    parser.add_argument("--query-file", help="queries, one per line, instead of sampling chunk texts")
+    parser.add_argument("--queries", type=int, default=200, help="chunk texts sampled as queries (default: 200)")
+    parser.add_argument("-k", type=int, default=5, help="number of chunks retrieved per query (default: 5)")
+    parser.add_argument("--batch-size", type=int, default=32, help="queries per encode for throughput (default: 32)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the query sample (default: 0)")
+    parser.add_argument("--threads", type=int, help="torch and ONNX Runtime intra-op threads (default: all CPUs)")
+    parser.add_argument("--export", action="store_true", help="export the backends whose export is missing")
+    parser.add_argument("--label", default="", help="label stored with the JSON results")
+    parser.add_argument("--json", dest="json_path", help="write the results as JSON to this path")
+    args = parser.parse_args(argv)
+    if not args.query_file and not args.store_db:
+        parser.error("--query-file or --store-db is required")
+    args.backends = args.backends or [parse_backend(spec) for spec in DEFAULT_BACKENDS]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.threads:
+        # Read by ONNX Runtime and OpenVINO when their session is created, after this.
+        os.environ["OMP_NUM_THREADS"] = str(args.threads)
+        import torch
+
+        torch.set_num_threads(args.threads)
+
+    stores = load_stores(args.store_db) if args.store_db else {}
+    if args.query_file:
+        with open(args.query_file) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = sample_chunk_queries(stores, args.queries, args.seed)
+    if not queries:
+        sys.exit("No queries to encode")
+    index = None
+    if stores:
+        index = build_index(np.concatenate([store_vectors(record) for record in stores.values()]), IndexSpec("flat"))
+
+    reference, reference_embeddings = benchmark_backend(load_model(args.model, Backend()), queries, args.batch_size)
+    reference.update({"backend": "torch", "speedup": 1.0, "cosine": {"mean": 1.0, "min": 1.0}})
+    if index is not None:
+        reference.update({"recall": 1.0, "top1_agreement": 1.0})
+    results = [reference]
+    for backend in args.backends:
+        result = {"backend": str(backend)}
+        if not available(args.model, backend):
+            if not args.export:
+                results.append({**result, "error": f"{backend.model_file} not found, run with --export"})
+                continue
+            print(f"Exporting {backend.model_file}...")
+            try:
+                export(args.model, backend, calibration_texts([args.store_db]) if args.store_db else None)
+            except ValueError as e:
+                results.append({**result, "error": str(e)})
+                continue
+        measured, embeddings = benchmark_backend(load_model(args.model, backend), queries, args.batch_size)
+        result.update(measured)
+        compare(result, embeddings, reference, reference_embeddings, index, args.k)
+        results.append(result)
+    print_results(results, args.k)
+
+    if args.json_path:
+        metadata = {
+            "label": args.label,
+            "model": args.model,
+            "store_db": str(args.store_db) if args.store_db else None,
+            "queries": args.query_file or f"{len(queries)} sampled chunk texts, seed {args.seed}",
+            "k": args.k,
+            "batch_size": args.batch_size,
+            "threads": args.threads,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with open(args.json_path, "w") as f:
+            json.dump({"metadata": metadata, "results": results}, f, indent=2)
+        print(f"JSON results written to: {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Recall and latency of approximate FAISS indexes against the exact one.
+
+Every vector store of a store DB (aap_faiss_store.db, or a BYOK faiss_store.db)
+is indexed with each --index spec (see ansible_chatbot_stack/faiss_index.py),
+and searched one query at a time, as the inline::faiss provider does. Each
+spec is reported with:
+
+  - recall@k: the fraction of the exact top-k chunks it returns, averaged
+    over the queries; the exact top-k is what the chatbot retrieves today
+  - per-query search latency (mean, p50, p90, p99), and the speed-up of the
+    median over the flat index
+  - build time and serialized size, as stored in the kvstore, and how many
+    times smaller than the flat index it is
+
+Each --transform (e.g. int8, pca:256,int8, truncate:256) is applied to every
+index spec in turn, reporting the recall the smaller vectors keep.
+
+The queries are the lines of --query-file embedded with --model (the
+sentence-transformers model of the store, e.g. ./embeddings_model), or else a
+seeded sample of the stored chunk embeddings. The latter finds each query's
+own chunk first, so real questions give the more faithful recall.
+
+Examples:
+    make bench-faiss-index
+    uv run python scripts/faiss_index_benchmark.py vector_db/aap_faiss_store.db -k 5 \
+        --index ivf_flat:nprobe=8 --index ivf_flat:nprobe=32 --index hnsw:ef_search=64 --index ivf_pq \
+        --transform int8 --transform pca:256,int8 \
+        --query-file questions.txt --model embeddings_model --json bench_results/faiss-index.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from streaming_benchmark import describe
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from ansible_chatbot_stack.faiss_index import (  # noqa: E402
+    IndexSpec,
+    VectorTransform,
+    build_index,
+    load_stores,
+    serialize_index,
+    store_vectors,
+)
+
+DEFAULT_INDEXES = ["ivf_flat", "hnsw", "ivf_pq"]
+
+
+def sample_queries(vectors: np.ndarray, count: int, seed: int) -> np.ndarray:
+    rows = random.Random(seed).sample(range(len(vectors)), min(count, len(vectors)))
+    return vectors[rows]
+
+
+def embed_queries(query_file: str, model: str) -> np.ndarray:
+    from sentence_transformers import SentenceTransformer
+
+    with open(query_file) as f:
+        queries = [line.strip() for line in f if line.strip()]
+    return np.asarray(SentenceTransformer(model).encode(queries), dtype=np.float32)
+
+
+def search_one_by_one(index, queries: np.ndarray, k: int) -> tuple[np.ndarray, list[float]]:
+    """Top-k IDs of every query, and each search latency in milliseconds."""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for row, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids[row] = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return ids, latencies
+
+
+def recall_at_k(ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    k = exact_ids.shape[1]
+    found = [len(set(row[row >= 0]) & set(exact[exact >= 0])) for row, exact in zip(ids, exact_ids)]
+    return sum(found) / (k * len(exact_ids))
+
+
+def benchmark_store(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    specs: list[IndexSpec],
+    k: int,
+    transforms: list[VectorTransform] = (),
+) -> list[dict]:
+    k = min(k, len(vectors))
+    results = []
+    exact_ids = None
+    for spec in [IndexSpec("flat"), *specs]:
+        for transform in [None, *transforms]:
+            result = {"index": str(spec), "transform": str(transform) if transform else None}
+            try:
+                start = time.perf_counter()
+                index = build_index(vectors, spec, transform)
+                result["build_time"] = time.perf_counter() - start
+            except ValueError as e:
+                results.append({**result, "error": str(e)})
+                continue
+            dimension = (transform or VectorTransform()).output_dimension(vectors.shape[1])
+            result["params"] = spec.resolve(len(vectors), dimension)
+            result["size"] = len(serialize_index(index))
+            ids, latencies = search_one_by_one(index, queries, k)
+            if exact_ids is None:
+                exact_ids = ids
+            result["recall"] = recall_at_k(ids, exact_ids)
+            result["latency_ms"] = describe(latencies)
+            result["speedup"] = results[0]["latency_ms"]["p50"] / result["latency_ms"]["p50"] if results else 1.0
+            result["compression"] = results[0]["size"] / result["size"] if results else 1.0
+            results.append(result)
+    return results
+
+
+def print_results(store_id: str, chunks: int, k: int, results: list[dict]):
+    print(f"\nVector store {store_id}: {chunks} chunks")
+    header = (
+        f"{'index':<40}{'transform':<16}{f'recall@{k}':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'speedup':>9}"
+        f"{'build s':>9}{'MiB':>8}{'smaller':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        transform = r["transform"] or "-"
+        if "error" in r:
+            print(f"{r['index']:<40}{transform:<16}  skipped: {r['error']}")
+            continue
+        latency = r["latency_ms"]
+        print(
+            f"{r['index']:<40}{transform:<16}{r['recall']:>10.4f}{latency['p50']:>10.3f}{latency['p90']:>10.3f}"
+            f"{latency['p99']:>10.3f}{r['speedup']:>8.1f}x{r['build_time']:>9.2f}{r['size'] / 2**20:>8.1f}"
+            f"{r['compression']:>8.1f}x"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", type=Path, help="store DB of an inline::faiss provider")
+    parser.add_argument(
+        "--index",
+        dest="indexes",
+        action="append",
+        type=IndexSpec.parse,
+        help=f"index spec to compare with the flat index, repeatable (default: {', '.join(DEFAULT_INDEXES)})",
+    )
+    parser.add_argument(
+        "--transform",
+        dest="transforms",
+        action="append",
+        type=VectorTransform.parse,
+        default=[],
+        help="vector transform to apply to each index spec too, e.g. pca:256,int8, repeatable (default: none)",
+    )
+    parser.add_argument("--store", action="append", help="vector store ID to benchmark (default: all)")
+    parser.add_argument("-k", type=int, default=5, help="number of chunks retrieved per query (default: 5)")
+    parser.add_argument("--queries", type=int, default=1000, help="stored embeddings sampled as queries (default: 1000)")
+    parser.add_argument("--query-file", help="questions to embed as queries, one per line, instead of sampling")
+    parser.add_argument("--model", help="sentence-transformers model embedding --query-file")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the query sample (default: 0)")
+    parser.add_argument(
+        "--threads", type=int, default=1, help="FAISS threads per search, 0 for the FAISS default (default: 1)"
+    )
+    parser.add_argument("--label", default="", help="label stored with the JSON results")
+    parser.add_argument("--json", dest="json_path", help="write the results as JSON to this path")
+    args = parser.parse_args(argv)
+    if args.query_file and not args.model:
+        parser.error("--query-file requires --model")
+    args.indexes = args.indexes or [IndexSpec.parse(spec) for spec in DEFAULT_INDEXES]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.db.is_file():
+        sys.exit(f"Store DB not found: {args.db}")
+    import faiss
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+
+    stores = load_stores(args.db)
+    embedded_queries = embed_queries(args.query_file, args.model) if args.query_file else None
+    results = {}
+    for store_id in args.store or sorted(stores):
+        if store_id not in stores:
+            sys.exit(f"Vector store {store_id} not found in {args.db}")
+        vectors = store_vectors(stores[store_id])
+        queries = embedded_queries if embedded_queries is not None else sample_queries(vectors, args.queries, args.seed)
+        results[store_id] = benchmark_store(vectors, queries, args.indexes, args.k, args.transforms)
+        print_results(store_id, len(vectors), min(args.k, len(vectors)), results[store_id])
+
+    if args.json_path:
+        metadata = {
+            "label": args.label,
+            "db": str(args.db),
+            "k": args.k,
+            "queries": args.query_file or f"{args.queries} sampled chunk embeddings, seed {args.seed}",
+            "threads": args.threads,
+            "faiss_version": faiss.__version__,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with open(args.json_path, "w") as f:
+            json.dump({"metadata": metadata, "stores": results}, f, indent=2)
+        print(f"JSON results written to: {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import json
 from locust import task, constant, FastHttpUser
-import time
+
+from streaming_benchmark import parse_sse_line, token_from_event
 
 PROVIDER = "my_rhoai_dev"
 MODEL_ID = "granite-3.3-8b-instruct"
@@ -24,25 +25,17 @@ def get_response_chuncks_text_from_stream(response):
     if not stream:
         raise ValueError("response has no stream attribute")
 
-    chuncks_bytes = bytearray()
+    # parse the SSE events as the chunks arrive, instead of buffering the whole body
+    buffer = b""
     while True:
         try:
-            chunck = stream.next()
-            chuncks_bytes += chunck
-            # wait for data to be ready before reading next
-            time.sleep(5)
+            buffer += stream.next()
         except StopIteration:
             stream.release()
             break
-
-    chuncks_string = chuncks_bytes.decode("utf-8")
-    for http_chunk in chuncks_string.split("\n"):
-        if http_chunk:
-            if http_chunk.startswith("data: "):
-                chuck_data = json.loads(http_chunk.strip("data: "))
-                if chuck_data.get("event", "") == "token":
-                    token = chuck_data.get("data", {}).get("token", "")
-                    chuncks_text += token
+        while b"\n" in buffer:
+            http_chunk, buffer = buffer.split(b"\n", 1)
+            chuncks_text += token_from_event(parse_sse_line(http_chunk.decode("utf-8").strip()))
 
     return chuncks_text
 
@@ -69,6 +62,9 @@ class ChatTesting(FastHttpUser):
                 response.success()
 
 
+# For TTFT, inter-token latency and tokens/s percentiles use scripts/streaming_benchmark.py
+# (make bench-streaming) instead.
+
 # command line
 # uv run locust -f scripts/loading_test.py -t 120  --headless --users 10 --spawn-rate 10 -H http://localhost:8321
 
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Offline performance harness: the real chatbot container against a mock LLM.
+
+Starts the latency-configurable mock OpenAI API server (tests/mock_openai.py),
+runs the ansible-chatbot-stack image against it with the mock test suite's
+configuration (tests/test-*.yaml, test data from 'make setup-test'), and drives
+it with scripts/streaming_benchmark.py.
+
+Since the mock LLM timings are fixed and deterministic, what the benchmark
+measures on top of them is the stack's own overhead: agent loop, tool calls,
+RAG retrieval and serialization. No GPU, network access or live vLLM needed.
+
+Mock LLM options (--ttft, --token-delay, --response-tokens, --tool-call-rate,
+--error-rate, ...) are listed by --help; every other option is passed through
+to scripts/streaming_benchmark.py.
+
+Examples:
+    make bench
+    uv run python scripts/offline_benchmark.py --ttft 0.2 --token-delay 0.01 --tool-call-rate 1 \
+        --users 8 --requests 10 --json bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import streaming_benchmark
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from tests.mock_openai import add_profile_arguments, profile_from_args, start_mock_openai  # noqa: E402
+
+CHATBOT_PORT = 8322
+MOCK_OPENAI_PORT = 8323
+ADMIN_PORT = 8324
+DEFAULT_VECTOR_DB_ID = "aap-product-docs-2_6"
+
+
+def container_runtime() -> str:
+    runtime = os.environ.get("CONTAINER_RUNTIME")
+    runtime = shutil.which(runtime) if runtime else None
+    runtime = runtime or shutil.which("podman") or shutil.which("docker")
+    if not runtime:
+        sys.exit("Container runtime (podman/docker) not found")
+    return runtime
+
+
+def container_command(
+    runtime: str, name: str, image: str, mock_url: str, model: str, env: dict[str, str] | None = None
+) -> list[str]:
+    """Same mounts and environment as the chatbot_server fixture of tests/conftest.py, plus ``env``."""
+    vector_db_id_file = PROJECT_ROOT / "vector_db" / "provider_vector_db_id.ind"
+    vector_db_id = vector_db_id_file.read_text().strip() if vector_db_id_file.exists() else DEFAULT_VECTOR_DB_ID
+    cmd = [
+        runtime, "run", "--rm", "--name", name,
+        "--platform", "linux/amd64",
+        "--security-opt", "label=disable",
+        "--network", "host",
+    ]
+    if os.path.basename(runtime) == "podman":
+        cmd += ["--userns", "keep-id:uid=1001,gid=1001"]
+    mounts = {
+        "embeddings_model": "/.llama/data/embeddings_model",
+        "vector_db/aap_faiss_store.db": "/.llama/data/distributions/ansible-chatbot/aap_faiss_store.db",
+        "tests/test-lightspeed-stack.yaml": "/.llama/distributions/ansible-chatbot/config/lightspeed-stack.yaml",
+        "tests/test-ansible-chatbot-run.yaml": "/.llama/distributions/llama-stack/config/ansible-chatbot-run.yaml",
+        "ansible-chatbot-system-prompt.txt": "/.llama/distributions/ansible-chatbot/system-prompts/default.txt",
+        "llama-stack/providers.d": "/.llama/providers.d",
+    }
+    for source, target in mounts.items():
+        cmd += ["-v", f"{PROJECT_ROOT / source}:{target}:z"]
+    cmd += [
+        "--env", "OPENAI_API_KEY=fake-bench-key",
+        "--env", f"OPENAI_BASE_URL={mock_url}",
+        "--env", f"OPENAI_INFERENCE_MODEL={model}",
+        "--env", f"PROVIDER_VECTOR_DB_ID={vector_db_id}",
+        "--env", f"ANSIBLE_CHATBOT_ADMIN_PORT={ADMIN_PORT}",
+        "--env", "PYTHONUNBUFFERED=1",
+        "--env", f"LOG_LEVEL={os.environ.get('LOG_LEVEL', 'WARNING')}",
+    ]
+    for key, value in (env or {}).items():
+        cmd += ["--env", f"{key}={value}"]
+    cmd.append(image)
+    return cmd
+
+
+def wait_until_ready(process: subprocess.Popen, base_url: str, timeout: float) -> float:
+    """Poll /v1/config, then the admin server's /readiness, until both answer 200; returns the time it took."""
+    start = time.monotonic()
+    for url in (f"{base_url}/v1/config", f"http://127.0.0.1:{ADMIN_PORT}/readiness"):
+        while True:
+            if process.poll() is not None:
+                sys.exit(f"Chatbot container exited with code {process.returncode} before becoming ready")
+            if time.monotonic() - start > timeout:
+                sys.exit(f"Chatbot container not ready after {timeout:.0f}s ({url})")
+            try:
+                with urllib.request.urlopen(url, timeout=2) as response:
+                    if response.status == 200:
+                        break
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(1)
+    return time.monotonic() - start
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--image",
+        default=f"ansible-chatbot-stack:{os.environ.get('ANSIBLE_CHATBOT_VERSION', 'latest')}",
+        help="chatbot image to benchmark (default: ansible-chatbot-stack:$ANSIBLE_CHATBOT_VERSION)",
+    )
+    parser.add_argument("--startup-timeout", type=float, default=float(os.environ.get("SERVER_STARTUP_TIMEOUT", 300)))
+    parser.add_argument("--warmup-requests", type=int, default=1, help="untimed requests sent before the run")
+    mock = parser.add_argument_group("mock LLM")
+    add_profile_arguments(mock)
+    return parser.parse_known_args(argv)
+
+
+def main(argv=None):
+    args, bench_argv = parse_args(argv)
+    for required in ("embeddings_model", "vector_db/aap_faiss_store.db", "llama-stack/providers.d"):
+        if not (PROJECT_ROOT / required).exists():
+            sys.exit(f"{required} not found - run 'make setup-test' first")
+
+    base_url = f"http://127.0.0.1:{CHATBOT_PORT}"
+    # --seed is taken by the mock profile; the same seed drives the arrival times and scenario picks.
+    bench_args = streaming_benchmark.parse_args(
+        ["--host", base_url, "--model", args.model, "--provider", "openai", "--seed", str(args.seed), *bench_argv]
+    )
+
+    # The container shares the host network, so it reaches the mock on localhost.
+    mock = start_mock_openai(MOCK_OPENAI_PORT, profile_from_args(args))
+    print(f"[✓] Mock OpenAI API server on {mock.url}: {mock.profile}")
+
+    runtime = container_runtime()
+    name = f"ansible-chatbot-bench-{os.getpid()}"
+    process = subprocess.Popen(
+        container_command(runtime, name, args.image, mock.url, args.model),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        startup = wait_until_ready(process, base_url, args.startup_timeout)
+        print(f"[✓] Chatbot container {args.image} ready in {startup:.1f}s")
+
+        if args.warmup_requests:
+            warmup = streaming_benchmark.parse_args(
+                ["--host", base_url, "--model", args.model, "--provider", "openai",
+                 "--users", "1", "--requests", str(args.warmup_requests)]
+            )
+            asyncio.run(streaming_benchmark.run(warmup))
+        warmup_stats = mock.stats
+
+        steps, samples = streaming_benchmark.execute(bench_args)
+
+        mock_stats = {k: v - warmup_stats[k] for k, v in mock.stats.items()}
+        print(f"Mock LLM: {mock_stats}")
+        metadata = {
+            "label": bench_args.label,
+            "image": args.image,
+            "mock_profile": vars(mock.profile),
+            "mock_stats": mock_stats,
+            "startup_seconds": startup,
+            "workload": bench_args.workload,
+            "users": None if bench_args.arrival_rate else bench_args.users,
+            "arrival_rates": bench_args.arrival_rate,
+            "requests": None if bench_args.duration else bench_args.requests,
+            "duration": bench_args.duration,
+        }
+        if bench_args.json_path:
+            streaming_benchmark.write_json(bench_args.json_path, metadata, steps, samples)
+        else:
+            print(json.dumps(metadata, indent=2))
+        if bench_args.csv_path:
+            streaming_benchmark.write_csv(bench_args.csv_path, samples)
+    finally:
+        subprocess.run([runtime, "rm", "-f", name], capture_output=True, timeout=30)
+        process.wait(timeout=30)
+        mock.stop()
+
+    return 1 if all(not s.ok for s in samples) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
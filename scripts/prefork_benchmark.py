@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Throughput and memory of pre-forked workers against the single-worker service.
+
+Runs the chatbot container against the mock LLM, as scripts/offline_benchmark.py
+does, once per configuration: the single uvicorn worker of the default setup,
+then PREFORK_WORKERS=N for each --workers value (see
+ansible_chatbot_stack/prefork.py). Each configuration is warmed up, driven
+with the same closed-loop load of scripts/streaming_benchmark.py, and then
+measured inside the container, summed over all its processes:
+
+  - RSS: resident memory, which counts the pages shared copy-on-write once
+    per process
+  - PSS: proportional set size, which splits the shared pages between the
+    processes sharing them; the memory the pod really uses
+
+The report has requests/s, p50 total latency, RSS, PSS and PSS per worker, with
+the throughput and PSS ratios over the single worker. Every other option is
+passed through to scripts/streaming_benchmark.py.
+
+Examples:
+    make bench-prefork
+    uv run --group test python scripts/prefork_benchmark.py --workers 2,4 --users 16 --requests 10 \
+        --ttft 0.2 --token-delay 0.01 --json bench_results/prefork.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import streaming_benchmark
+from offline_benchmark import CHATBOT_PORT, MOCK_OPENAI_PORT, container_command, container_runtime, wait_until_ready
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from tests.mock_openai import add_profile_arguments, profile_from_args, start_mock_openai  # noqa: E402
+
+# Run in the container: RSS and PSS of every other process, from /proc/<pid>/smaps_rollup.
+MEMORY_SCRIPT = """
+import glob, json, os
+totals = {"processes": 0, "rss": 0, "pss": 0}
+for path in glob.glob("/proc/[0-9]*/smaps_rollup"):
+    if path == f"/proc/{os.getpid()}/smaps_rollup":
+        continue
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        continue
+    totals["processes"] += 1
+    for line in lines:
+        key, _, value = line.partition(":")
+        if key in ("Rss", "Pss"):
+            totals[key.lower()] += int(value.split()[0]) * 1024
+print(json.dumps(totals))
+"""
+
+
+def container_memory(runtime: str, name: str) -> dict:
+    result = subprocess.run(
+        [runtime, "exec", name, "python3", "-c", MEMORY_SCRIPT], capture_output=True, text=True, timeout=30
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip()}
+    return json.loads(result.stdout)
+
+
+def benchmark_workers(runtime: str, args, bench_argv: list[str], mock_url: str, workers: int) -> dict:
+    """Start the container with ``workers`` pre-forked workers (0: the single uvicorn worker) and load it."""
+    name = f"ansible-chatbot-prefork-bench-{os.getpid()}-{workers}"
+    base_url = f"http://127.0.0.1:{CHATBOT_PORT}"
+    env = {"PREFORK_WORKERS": str(workers)} if workers else {}
+    process = subprocess.Popen(
+        container_command(runtime, name, args.image, mock_url, args.model, env),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        startup = wait_until_ready(process, base_url, args.startup_timeout)
+        label = f"{workers} pre-forked workers" if workers else "single worker"
+        print(f"\n[✓] {label} ready in {startup:.1f}s")
+        common = ["--host", base_url, "--model", args.model, "--provider", "openai"]
+        # One request per worker at least, so that every one of them has loaded what it loads lazily.
+        warmup_users = max(1, workers)
+        warmup = streaming_benchmark.parse_args([*common, "--users", str(warmup_users), "--requests", "2"])
+        asyncio.run(streaming_benchmark.run(warmup))
+        idle = container_memory(runtime, name)
+
+        bench_args = streaming_benchmark.parse_args([*common, "--seed", str(args.seed), *bench_argv])
+        steps, samples = streaming_benchmark.execute(bench_args)
+        loaded = container_memory(runtime, name)
+    finally:
+        subprocess.run([runtime, "rm", "-f", name], capture_output=True, timeout=30)
+        process.wait(timeout=30)
+
+    summary = steps[0]["summary"]
+    return {
+        "workers": workers,
+        "startup_seconds": startup,
+        "requests": summary["requests"],
+        "errors": summary["errors"],
+        "throughput": summary["throughput"],
+        "total_latency_p50": summary["total_latency"]["p50"],
+        "memory_idle": idle,
+        "memory": loaded,
+    }
+
+
+def print_results(results: list[dict]):
+    baseline = results[0]
+    header = (
+        f"{'configuration':<24}{'req/s':>8}{'x':>7}{'p50 s':>8}{'errors':>8}"
+        f"{'RSS MiB':>10}{'PSS MiB':>10}{'x':>7}{'PSS/worker':>12}"
+    )
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        name = f"prefork {r['workers']}" if r["workers"] else "single worker"
+        memory = r["memory"]
+        if "error" in memory:
+            rss = pss = pss_ratio = per_worker = "n/a"
+        else:
+            rss = f"{memory['rss'] / 2**20:.0f}"
+            pss = f"{memory['pss'] / 2**20:.0f}"
+            base_pss = baseline["memory"].get("pss")
+            pss_ratio = f"{memory['pss'] / base_pss:.2f}" if base_pss else "n/a"
+            per_worker = f"{memory['pss'] / max(1, r['workers']) / 2**20:.0f}"
+        throughput = r["throughput"] or 0
+        ratio = throughput / baseline["throughput"] if baseline["throughput"] else 0
+        p50 = "n/a" if r["total_latency_p50"] is None else f"{r['total_latency_p50']:.2f}"
+        print(
+            f"{name:<24}{throughput:>8.2f}{ratio:>7.2f}{p50:>8}{r['errors']:>8}"
+            f"{rss:>10}{pss:>10}{pss_ratio:>7}{per_worker:>12}"
+        )
+
+
+def _counts(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--image",
+        default=f"ansible-chatbot-stack:{os.environ.get('ANSIBLE_CHATBOT_VERSION', 'latest')}",
+        help="chatbot image to benchmark (default: ansible-chatbot-stack:$ANSIBLE_CHATBOT_VERSION)",
+    )
+    parser.add_argument(
+        "--workers", type=_counts, default=[2, 4], help="comma separated PREFORK_WORKERS values (default: 2,4)"
+    )
+    parser.add_argument("--startup-timeout", type=float, default=float(os.environ.get("SERVER_STARTUP_TIMEOUT", 300)))
+    parser.add_argument("--label", default="", help="label stored with the JSON results")
+    parser.add_argument("--json", dest="json_path", help="write the results as JSON to this path")
+    mock = parser.add_argument_group("mock LLM")
+    add_profile_arguments(mock)
+    return parser.parse_known_args(argv)
+
+
+def main(argv=None):
+    args, bench_argv = parse_args(argv)
+    for required in ("embeddings_model", "vector_db/aap_faiss_store.db", "llama-stack/providers.d"):
+        if not (PROJECT_ROOT / required).exists():
+            sys.exit(f"{required} not found - run 'make setup-test' first")
+
+    mock = start_mock_openai(MOCK_OPENAI_PORT, profile_from_args(args))
+    print(f"[✓] Mock OpenAI API server on {mock.url}: {mock.profile}")
+    runtime = container_runtime()
+    started_at = datetime.now(timezone.utc).isoformat()
+    try:
+        results = [benchmark_workers(runtime, args, bench_argv, mock.url, workers) for workers in [0, *args.workers]]
+    finally:
+        mock.stop()
+
+    print_results(results)
+    if args.json_path:
+        metadata = {
+            "label": args.label,
+            "image": args.image,
+            "mock_profile": vars(mock.profile),
+            "benchmark_args": bench_argv,
+            "started_at": started_at,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump({"metadata": metadata, "results": results}, f, indent=2)
+        print(f"JSON results written to: {args.json_path}")
+    return 1 if any(r["errors"] == r["requests"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
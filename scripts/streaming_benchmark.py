@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+"""Latency benchmark and load generator for the chatbot's query endpoints.
+
+Every /v1/streaming_query response is parsed as the SSE events arrive, recording
+per request:
+  - time to first token (TTFT)
+  - the gaps between consecutive token events (inter-token latency)
+  - total latency, until the stream is closed
+  - tokens per second, over the decode phase (first to last token)
+/v1/query requests only have a total latency.
+
+Two load models are available:
+  - closed loop (default): --users concurrent users, each sending its next
+    request as soon as the previous one finished
+  - open loop (--arrival-rate): requests are started at the given rate
+    (Poisson arrivals by default), however many are still in flight, so
+    queueing shows up as growing latency instead of being absorbed by the
+    load generator. Several comma separated rates are run one after the
+    other, which gives the saturation point of a deployment.
+
+By default every request sends --query to /v1/streaming_query. A workload file
+(--workload, see scripts/workloads/mixed.yaml) mixes weighted scenarios instead:
+plain RAG queries, multi-turn conversations (follow-ups reuse the returned
+conversation_id), MCP tool queries with MCP-HEADERS, BYOK queries, and either
+endpoint.
+
+A summary with p50/p90/p99 for each metric is printed at the end, and the raw
+samples can be exported with --json / --csv so releases of the image can be
+compared against each other.
+
+Examples:
+    uv run python scripts/streaming_benchmark.py -H http://localhost:8321 --users 10 --requests 5
+    uv run python scripts/streaming_benchmark.py --users 4 --duration 120 \
+        --label "$ANSIBLE_CHATBOT_VERSION" --json bench.json --csv bench.csv
+    uv run python scripts/streaming_benchmark.py --workload scripts/workloads/mixed.yaml \
+        --arrival-rate 0.5,1,2,4 --duration 120 --json sweep.json
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import math
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+import aiohttp
+import yaml
+
+DEFAULT_HOST = "http://localhost:8321"
+DEFAULT_QUERY = "what is AAP ?"
+ENDPOINTS = {
+    "streaming_query": "/v1/streaming_query",
+    "query": "/v1/query",
+}
+STREAMING_QUERY_PATH = ENDPOINTS["streaming_query"]
+
+PERCENTILES = (50, 90, 99)
+
+CSV_FIELDS = [
+    "arrival_rate",
+    "scenario",
+    "endpoint",
+    "user",
+    "request",
+    "turn",
+    "started_at",
+    "status",
+    "error",
+    "ttft",
+    "mean_inter_token_latency",
+    "max_inter_token_latency",
+    "total_latency",
+    "tokens",
+    "tokens_per_second",
+]
+
+
+@dataclass
+class Scenario:
+    """One weighted entry of a workload file."""
+
+    name: str
+    weight: float = 1.0
+    endpoint: str = "streaming_query"
+    # A single-turn scenario sends one of `queries`, picked at random; a multi-turn
+    # one sends all of `turns` in order within the same conversation.
+    queries: list[str] = field(default_factory=list)
+    turns: list[str] = field(default_factory=list)
+    headers: dict[str, str] = field(default_factory=dict)
+    model: str | None = None
+    provider: str | None = None
+    expected_text: str | None = None
+
+    def __post_init__(self):
+        if self.endpoint not in ENDPOINTS:
+            raise ValueError(f"scenario '{self.name}': endpoint must be one of {list(ENDPOINTS)}")
+        if not self.queries and not self.turns:
+            raise ValueError(f"scenario '{self.name}': one of 'queries' or 'turns' is required")
+        if self.weight <= 0:
+            raise ValueError(f"scenario '{self.name}': weight must be positive")
+        # Header values may be mappings (e.g. MCP-HEADERS) and reference environment variables.
+        self.headers = {
+            name: os.path.expandvars(value if isinstance(value, str) else json.dumps(value))
+            for name, value in self.headers.items()
+        }
+
+    def pick_turns(self, rng: random.Random) -> list[str]:
+        return list(self.turns) if self.turns else [rng.choice(self.queries)]
+
+
+def load_workload(path: str) -> list[Scenario]:
+    with open(path) as f:
+        document = yaml.safe_load(f) or {}
+    scenarios = [Scenario(**entry) for entry in document.get("scenarios", [])]
+    if not scenarios:
+        raise ValueError(f"{path}: no scenarios defined")
+    return scenarios
+
+
+@dataclass
+class RequestSample:
+    """Timings recorded for a single request, in seconds."""
+
+    user: int
+    request: int
+    scenario: str = "default"
+    endpoint: str = "streaming_query"
+    turn: int = 0
+    arrival_rate: float | None = None
+    # Offset from the start of the run at which the request was sent.
+    started_at: float = 0.0
+    status: int = 0
+    error: str = ""
+    ttft: float | None = None
+    inter_token_latencies: list[float] = field(default_factory=list)
+    total_latency: float | None = None
+    tokens: int = 0
+    tokens_per_second: float | None = None
+    conversation_id: str | None = None
+    text: str = ""
+
+    @property
+    def ok(self) -> bool:
+        if self.error:
+            return False
+        return self.ttft is not None if self.endpoint == "streaming_query" else self.status == 200
+
+    def csv_row(self) -> dict:
+        gaps = self.inter_token_latencies
+        row = asdict(self)
+        row["mean_inter_token_latency"] = sum(gaps) / len(gaps) if gaps else None
+        row["max_inter_token_latency"] = max(gaps) if gaps else None
+        return {k: row[k] for k in CSV_FIELDS}
+
+
+def parse_sse_line(line: str) -> dict | None:
+    """Return the JSON payload of an SSE ``data:`` line, or None for anything else."""
+    if not line.startswith("data:"):
+        return None
+    payload = line[len("data:"):].strip()
+    if not payload or payload == "[DONE]":
+        return None
+    try:
+        return json.loads(payload)
+    except json.JSONDecodeError:
+        return None
+
+
+def token_from_event(event: dict | None) -> str:
+    """Return the token text carried by a lightspeed-stack ``token`` event, if any."""
+    if not event or event.get("event") != "token":
+        return ""
+    data = event.get("data") or {}
+    return data.get("token", "") or ""
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Linearly interpolated percentile, matching numpy's default method."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def describe(values: list[float]) -> dict:
+    """Count, mean, min/max and the reported percentiles of a list of samples."""
+    stats = {"count": len(values)}
+    if not values:
+        return stats
+    stats["mean"] = sum(values) / len(values)
+    stats["min"] = min(values)
+    stats["max"] = max(values)
+    for pct in PERCENTILES:
+        stats[f"p{pct}"] = percentile(values, pct)
+    return stats
+
+
+async def stream_query(
+    session: aiohttp.ClientSession, url: str, payload: dict, sample: RequestSample, headers: dict | None = None
+) -> RequestSample:
+    """Send one streaming query and fill in ``sample`` as the SSE events arrive."""
+    start = time.perf_counter()
+    first_token_at = None
+    last_token_at = None
+    tokens = []
+    try:
+        async with session.post(url, json=payload, headers=headers) as response:
+            sample.status = response.status
+            if response.status != 200:
+                sample.error = f"HTTP {response.status}: {(await response.text())[:200]}"
+                return sample
+
+            buffer = b""
+            # iter_any() hands over data as soon as it is read from the socket, so the
+            # timestamp taken here is the moment the token became visible to a client.
+            async for data in response.content.iter_any():
+                now = time.perf_counter()
+                buffer += data
+                while b"\n" in buffer:
+                    raw_line, buffer = buffer.split(b"\n", 1)
+                    event = parse_sse_line(raw_line.decode("utf-8", errors="replace").strip())
+                    if not event:
+                        continue
+                    if event.get("event") == "start":
+                        sample.conversation_id = (event.get("data") or {}).get("conversation_id")
+                    elif event.get("event") == "error":
+                        sample.error = json.dumps(event.get("data"))[:200]
+                    token = token_from_event(event)
+                    if not token:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = now
+                    else:
+                        sample.inter_token_latencies.append(now - last_token_at)
+                    last_token_at = now
+                    tokens.append(token)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        sample.error = f"{type(e).__name__}: {e}"
+    finally:
+        sample.total_latency = time.perf_counter() - start
+
+    sample.tokens = len(tokens)
+    sample.text = "".join(tokens)
+    if first_token_at is None:
+        sample.error = sample.error or "no token events received"
+        return sample
+
+    sample.ttft = first_token_at - start
+    decode_time = last_token_at - first_token_at
+    if decode_time > 0:
+        sample.tokens_per_second = (len(tokens) - 1) / decode_time
+    return sample
+
+
+async def query(
+    session: aiohttp.ClientSession, url: str, payload: dict, sample: RequestSample, headers: dict | None = None
+) -> RequestSample:
+    """Send one /v1/query request; only its total latency is recorded."""
+    start = time.perf_counter()
+    try:
+        async with session.post(url, json=payload, headers=headers) as response:
+            sample.status = response.status
+            body = await response.text()
+            if response.status != 200:
+                sample.error = f"HTTP {response.status}: {body[:200]}"
+                return sample
+            data = json.loads(body)
+            sample.text = data.get("response") or ""
+            sample.conversation_id = data.get("conversation_id")
+    except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+        sample.error = f"{type(e).__name__}: {e}"
+    finally:
+        sample.total_latency = time.perf_counter() - start
+    return sample
+
+
+class LoadGenerator:
+    """Sends scenarios to the chatbot and collects their samples."""
+
+    def __init__(self, session: aiohttp.ClientSession, args, scenarios: list[Scenario], arrival_rate: float | None):
+        self.session = session
+        self.args = args
+        self.scenarios = scenarios
+        self.arrival_rate = arrival_rate
+        self.rng = random.Random(args.seed)
+        self.samples: list[RequestSample] = []
+        self.start = time.perf_counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def pick_scenario(self) -> Scenario:
+        return self.rng.choices(self.scenarios, weights=[s.weight for s in self.scenarios])[0]
+
+    async def run_scenario(self, scenario: Scenario, user: int, request: int):
+        """Send every turn of a scenario, carrying the conversation_id over between turns."""
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            conversation_id = None
+            for turn, text in enumerate(scenario.pick_turns(self.rng)):
+                payload = {"query": text}
+                model = scenario.model or self.args.model
+                provider = scenario.provider or self.args.provider
+                if model:
+                    payload["model"] = model
+                if provider:
+                    payload["provider"] = provider
+                if conversation_id:
+                    payload["conversation_id"] = conversation_id
+
+                sample = RequestSample(
+                    user=user,
+                    request=request,
+                    scenario=scenario.name,
+                    endpoint=scenario.endpoint,
+                    turn=turn,
+                    arrival_rate=self.arrival_rate,
+                    started_at=time.perf_counter() - self.start,
+                )
+                send = stream_query if scenario.endpoint == "streaming_query" else query
+                url = self.args.host.rstrip("/") + ENDPOINTS[scenario.endpoint]
+                await send(self.session, url, payload, sample, headers=scenario.headers or None)
+
+                expected_text = scenario.expected_text or self.args.expected_text
+                if sample.ok and expected_text and expected_text not in sample.text:
+                    sample.error = f"expected '{expected_text}' not in response text"
+                self.samples.append(sample)
+                if not sample.ok:
+                    break
+                conversation_id = sample.conversation_id
+        finally:
+            self.in_flight -= 1
+
+    async def run_user(self, user: int, deadline: float | None):
+        """Closed-loop user: sends the next scenario as soon as the previous one finishes."""
+        request = 0
+        while request < self.args.requests or deadline is not None:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            await self.run_scenario(self.pick_scenario(), user, request)
+            request += 1
+            if self.args.think_time:
+                await asyncio.sleep(self.args.think_time)
+
+    async def run_closed_loop(self):
+        deadline = self.start + self.args.duration if self.args.duration else None
+        await asyncio.gather(*(self.run_user(user, deadline) for user in range(self.args.users)))
+
+    async def run_open_loop(self):
+        """
+        Start scenarios at the target arrival rate, regardless of how many are in flight.
+
+        Arrivals stop after --duration (or --requests in total); the requests still in
+        flight then get up to --timeout to finish.
+        """
+        duration = self.args.duration
+        total = None if duration else self.args.requests
+        tasks = []
+        next_arrival = self.start
+        request = 0
+        while (total is None or request < total) and (duration is None or next_arrival - self.start < duration):
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.run_scenario(self.pick_scenario(), user=0, request=request)))
+            request += 1
+            if self.args.arrival_process == "poisson":
+                next_arrival += self.rng.expovariate(self.arrival_rate)
+            else:
+                next_arrival += 1.0 / self.arrival_rate
+        await asyncio.gather(*tasks)
+
+
+def summarize(samples: list[RequestSample], wall_time: float | None = None) -> dict:
+    """Aggregate the samples into overall, per-scenario and per-user statistics."""
+    ok = [s for s in samples if s.ok]
+    summary = {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "throughput": len(ok) / wall_time if wall_time else None,
+        "ttft": describe([s.ttft for s in ok if s.ttft is not None]),
+        "inter_token_latency": describe([gap for s in ok for gap in s.inter_token_latencies]),
+        "total_latency": describe([s.total_latency for s in ok]),
+        "tokens_per_second": describe([s.tokens_per_second for s in ok if s.tokens_per_second is not None]),
+    }
+
+    per_scenario = {}
+    for scenario in sorted({s.scenario for s in samples}):
+        scenario_ok = [s for s in ok if s.scenario == scenario]
+        per_scenario[scenario] = {
+            "requests": len([s for s in samples if s.scenario == scenario]),
+            "errors": len([s for s in samples if s.scenario == scenario and not s.ok]),
+            "ttft": describe([s.ttft for s in scenario_ok if s.ttft is not None]),
+            "total_latency": describe([s.total_latency for s in scenario_ok]),
+        }
+    summary["per_scenario"] = per_scenario
+
+    per_user = {}
+    for user in sorted({s.user for s in samples}):
+        user_samples = [s for s in ok if s.user == user]
+        decode_tokens = sum(s.tokens - 1 for s in user_samples if s.tokens_per_second)
+        decode_time = sum((s.tokens - 1) / s.tokens_per_second for s in user_samples if s.tokens_per_second)
+        per_user[str(user)] = {
+            "requests": len([s for s in samples if s.user == user]),
+            "errors": len([s for s in samples if s.user == user and not s.ok]),
+            "ttft_p50": percentile([s.ttft for s in user_samples if s.ttft is not None], 50),
+            "tokens_per_second": decode_tokens / decode_time if decode_time else None,
+        }
+    summary["per_user"] = per_user
+    return summary
+
+
+def _format_stats_row(name: str, stats: dict) -> str:
+    cells = [f"{stats['count']:>10}"]
+    for key in ("mean", "p50", "p90", "p99", "max"):
+        value = stats.get(key)
+        cells.append(f"{value:>10.3f}" if value is not None else f"{'-':>10}")
+    return f"{name:<24}" + "".join(cells)
+
+
+def print_summary(summary: dict, wall_time: float, arrival_rate: float | None = None, max_in_flight: int | None = None):
+    load = f"arrival rate {arrival_rate}/s, " if arrival_rate else ""
+    throughput = f"{summary['throughput']:.2f}/s" if summary.get("throughput") is not None else "-"
+    print(
+        f"\n{load}requests: {summary['requests']}  errors: {summary['errors']}  "
+        f"throughput: {throughput}  wall time: {wall_time:.1f}s"
+        + (f"  max in flight: {max_in_flight}" if max_in_flight is not None else "")
+    )
+    header = f"{'metric':<24}" + "".join(f"{name:>10}" for name in ("count", "mean", "p50", "p90", "p99", "max"))
+    print(header)
+    print("-" * len(header))
+    for metric in ("ttft", "inter_token_latency", "total_latency", "tokens_per_second"):
+        print(_format_stats_row(metric, summary[metric]))
+
+    if len(summary["per_scenario"]) > 1:
+        print("\nPer scenario (total latency):")
+        for scenario, stats in summary["per_scenario"].items():
+            print(_format_stats_row(f"  {scenario}", stats["total_latency"]) + f"  errors: {stats['errors']}")
+
+    if len(summary["per_user"]) > 1:
+        print("\nPer user:")
+        for user, stats in summary["per_user"].items():
+            ttft = f"{stats['ttft_p50']:.3f}s" if stats["ttft_p50"] is not None else "-"
+            tps = f"{stats['tokens_per_second']:.1f}" if stats["tokens_per_second"] is not None else "-"
+            print(
+                f"  user {user}: {stats['requests']} requests, {stats['errors']} errors, "
+                f"ttft p50 {ttft}, {tps} tokens/s"
+            )
+
+
+def write_json(path: str, metadata: dict, steps: list[dict], samples: list[RequestSample]):
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "metadata": metadata,
+                # A single closed-loop run keeps its summary at the top level.
+                "summary": steps[0]["summary"] if len(steps) == 1 else None,
+                "steps": steps,
+                "requests": [{k: v for k, v in asdict(s).items() if k != "text"} for s in samples],
+            },
+            f,
+            indent=2,
+        )
+    print(f"JSON results written to: {path}")
+
+
+def write_csv(path: str, samples: list[RequestSample]):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for sample in samples:
+            writer.writerow(sample.csv_row())
+    print(f"CSV results written to: {path}")
+
+
+def _rates(value: str) -> list[float]:
+    rates = [float(rate) for rate in value.split(",") if rate.strip()]
+    if not rates or any(rate <= 0 for rate in rates):
+        raise argparse.ArgumentTypeError("arrival rates must be positive numbers")
+    return rates
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-H", "--host", default=DEFAULT_HOST, help=f"chatbot base URL (default: {DEFAULT_HOST})")
+    parser.add_argument("-u", "--users", type=int, default=1, help="closed loop: number of concurrent users (default: 1)")
+    parser.add_argument(
+        "-n", "--requests", type=int, default=5,
+        help="closed loop: requests per user; open loop: requests per arrival rate (default: 5)",
+    )
+    parser.add_argument("-t", "--duration", type=float, help="run for this many seconds (per arrival rate) instead of --requests")
+    parser.add_argument("--think-time", type=float, default=0.0, help="closed loop: pause between a user's requests, in seconds")
+    parser.add_argument(
+        "-r", "--arrival-rate", type=_rates,
+        help="open loop: requests started per second; comma separated rates are run one after the other",
+    )
+    parser.add_argument(
+        "--arrival-process", choices=("poisson", "constant"), default="poisson",
+        help="open loop: exponential (default) or fixed inter-arrival times",
+    )
+    parser.add_argument("-w", "--workload", help="YAML file of weighted scenarios, see scripts/workloads/mixed.yaml")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the arrival times and scenario picks (default: 0)")
+    parser.add_argument("-q", "--query", default=DEFAULT_QUERY, help=f"query to send without --workload (default: '{DEFAULT_QUERY}')")
+    parser.add_argument("--model", default=os.environ.get("ANSIBLE_CHATBOT_INFERENCE_MODEL"), help="model ID")
+    parser.add_argument("--provider", default=os.environ.get("ANSIBLE_CHATBOT_INFERENCE_PROVIDER"), help="provider ID")
+    parser.add_argument("--expected-text", help="count a response as failed unless it contains this text")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per request timeout, in seconds (default: 300)")
+    parser.add_argument(
+        "--label",
+        default=os.environ.get("ANSIBLE_CHATBOT_VERSION", ""),
+        help="label stored with the results, e.g. the image tag (default: $ANSIBLE_CHATBOT_VERSION)",
+    )
+    parser.add_argument("--json", dest="json_path", help="write the summary and raw samples as JSON to this path")
+    parser.add_argument("--csv", dest="csv_path", help="write one row per request as CSV to this path")
+    return parser.parse_args(argv)
+
+
+async def run(args, arrival_rate: float | None = None) -> tuple[list[RequestSample], float, int]:
+    """Run one closed-loop benchmark, or one open-loop step at ``arrival_rate``."""
+    scenarios = load_workload(args.workload) if args.workload else [Scenario(name="default", queries=[args.query])]
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        generator = LoadGenerator(session, args, scenarios, arrival_rate)
+        if arrival_rate:
+            await generator.run_open_loop()
+        else:
+            await generator.run_closed_loop()
+    wall_time = time.perf_counter() - generator.start
+    return generator.samples, wall_time, generator.max_in_flight
+
+
+def execute(args) -> tuple[list[dict], list[RequestSample]]:
+    """Run every step of the benchmark, printing a summary after each one."""
+    steps = []
+    samples = []
+    for rate in args.arrival_rate or [None]:
+        step_samples, wall_time, max_in_flight = asyncio.run(run(args, rate))
+        summary = summarize(step_samples, wall_time)
+        print_summary(summary, wall_time, rate, max_in_flight if rate else None)
+        steps.append(
+            {"arrival_rate": rate, "wall_time": wall_time, "max_in_flight": max_in_flight, "summary": summary}
+        )
+        samples += step_samples
+    return steps, samples
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started_at = datetime.now(timezone.utc).isoformat()
+    mode = f"open loop at {args.arrival_rate} req/s" if args.arrival_rate else f"{args.users} user(s)"
+    print(f"Benchmarking {args.host} with {mode}...")
+
+    steps, samples = execute(args)
+
+    metadata = {
+        "label": args.label,
+        "host": args.host,
+        "workload": args.workload,
+        "query": None if args.workload else args.query,
+        "model": args.model,
+        "provider": args.provider,
+        "mode": "open" if args.arrival_rate else "closed",
+        "users": None if args.arrival_rate else args.users,
+        "arrival_rates": args.arrival_rate,
+        "arrival_process": args.arrival_process if args.arrival_rate else None,
+        "requests": None if args.duration else args.requests,
+        "duration": args.duration,
+        "seed": args.seed,
+        "started_at": started_at,
+    }
+    if args.json_path:
+        write_json(args.json_path, metadata, steps, samples)
+    if args.csv_path:
+        write_csv(args.csv_path, samples)
+
+    return 1 if all(not s.ok for s in samples) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
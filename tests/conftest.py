@@ -12,10 +12,41 @@ import subprocess
 import time
 import requests
 import threading
-import json
 import shutil
+import types
 from pathlib import Path
-from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from tests.mock_openai import start_mock_openai
+
+# Port of the chatbot's admin server (ansible_chatbot_stack.admin), which serves /readiness.
+ADMIN_PORT = 8324
+
+
+@pytest.fixture
+def stub_modules(monkeypatch):
+    """
+    Replace modules by stand-ins for the duration of a test.
+
+    stub_modules({"llama_stack.core.stack": {"Stack": Stack}, ...}) puts a module with the given
+    attributes in sys.modules for each name, and an empty package for each of its parents, the
+    child set as attribute of its parent: both `import a.b.c` and `from a.b import c` find it.
+    The real packages, if installed, are hidden from the hooks under test; their real classes are
+    patched by test_llama_stack_hooks. Returns the stand-ins, by name.
+    """
+
+    def stub(modules: dict[str, dict]) -> dict[str, types.ModuleType]:
+        stubs = {}
+        for name, attributes in modules.items():
+            stubs.setdefault(name, types.ModuleType(name)).__dict__.update(attributes)
+            while "." in name:
+                parent, _, child = name.rpartition(".")
+                setattr(stubs.setdefault(parent, types.ModuleType(parent)), child, stubs[name])
+                name = parent
+        for name, module in stubs.items():
+            monkeypatch.setitem(sys.modules, name, module)
+        return stubs
+
+    return stub
 
 
 @pytest.fixture(scope="session")
@@ -33,138 +64,6 @@ def openai_config():
     }
 
 
-class MockOpenAIHandler(BaseHTTPRequestHandler):
-    """
-    Mock OpenAI API server for testing.
-    
-    Returns static responses that simulate OpenAI API behavior.
-    Supports both streaming and non-streaming responses.
-    """
-    
-    def log_message(self, format, *args):
-        """Suppress request logging."""
-        pass
-    
-    def do_POST(self):
-        """Handle POST requests to OpenAI API."""
-        if self.path == "/v1/chat/completions":
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            request_body = json.loads(post_data.decode('utf-8'))
-            
-            # Check if streaming is requested
-            is_streaming = request_body.get('stream', False)
-            
-            if is_streaming:
-                self._handle_streaming_response()
-            else:
-                self._handle_non_streaming_response()
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def do_GET(self):
-        """Handle GET requests to OpenAI API."""
-        if self.path == "/v1/models":
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            response = {
-              "object": "list",
-              "data": [
-                {
-                  "id": "gpt-4o-mini",
-                  "object": "model",
-                  "created": 1686935002,
-                  "owned_by": "openai"
-                },
-              ]
-            }
-            self.wfile.write(json.dumps(response).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
-
-    def _handle_streaming_response(self):
-        """Return a streaming SSE response."""
-        self.send_response(200)
-        self.send_header('Content-Type', 'text/event-stream')
-        self.end_headers()
-        
-        # Simulate streaming tokens
-        tokens = [
-            "AAP", " stands", " for", " Ansible", " Automation", " Platform", ".", 
-            " It", " is", " a", " comprehensive", " enterprise", " automation", " solution",
-            " by", " Red", " Hat", " for", " IT", " automation", " and", " orchestration", "."
-        ]
-        
-        for token in tokens:
-            chunk = {
-                "id": "chatcmpl-test-stream",
-                "object": "chat.completion.chunk",
-                "created": 1732800000,
-                "model": "gpt-4o-mini",
-                "choices": [{
-                    "index": 0,
-                    "delta": {"content": token},
-                    "finish_reason": None
-                }]
-            }
-            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
-        
-        # Send final chunk
-        final_chunk = {
-            "id": "chatcmpl-test-stream",
-            "object": "chat.completion.chunk",
-            "created": 1732800000,
-            "model": "gpt-4o-mini",
-            "choices": [{
-                "index": 0,
-                "delta": {},
-                "finish_reason": "stop"
-            }]
-        }
-        self.wfile.write(f"data: {json.dumps(final_chunk)}\n\n".encode())
-        self.wfile.write(b"data: [DONE]\n\n")
-    
-    def _handle_non_streaming_response(self):
-        """Return a non-streaming JSON response."""
-        response = {
-            "id": "chatcmpl-test-123",
-            "object": "chat.completion",
-            "created": 1732800000,
-            "model": "gpt-4o-mini",
-            "choices": [{
-                "index": 0,
-                "message": {
-                    "role": "assistant",
-                    "content": (
-                        "AAP stands for Ansible Automation Platform. It is a comprehensive "
-                        "enterprise solution developed by Red Hat that provides powerful "
-                        "automation capabilities for IT operations, cloud provisioning, "
-                        "configuration management, application deployment, and orchestration.\n\n"
-                        "Key components include Automation Controller, Automation Hub, "
-                        "Automation Execution Environments, Ansible Content Collections, "
-                        "and Event-Driven Ansible. AAP helps organizations automate complex "
-                        "workflows, improve operational efficiency, and ensure consistency "
-                        "across environments."
-                    )
-                },
-                "finish_reason": "stop"
-            }],
-            "usage": {
-                "prompt_tokens": 28,
-                "completion_tokens": 98,
-                "total_tokens": 126
-            }
-        }
-        
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(response).encode())
-
-
 @pytest.fixture(scope="session")
 def mock_openai_server():
     """
@@ -174,20 +73,13 @@ def mock_openai_server():
     that simulate OpenAI API behavior.
     """
     print("\n[Starting mock OpenAI API server on port 8323]")
-    server = HTTPServer(('127.0.0.1', 8323), MockOpenAIHandler)
-    
-    # Run server in background thread
-    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
-    server_thread.start()
-    
-    # Wait for server to be ready
-    time.sleep(1)
+    server = start_mock_openai(8323)
     
     yield server
     
     # Cleanup
     print("\n[Stopping mock OpenAI API server]")
-    server.shutdown()
+    server.stop()
 
 
 @pytest.fixture(scope="session")
@@ -200,6 +92,7 @@ def chatbot_server(mock_openai_server):
     - All chatbot dependencies (llama-stack, vector DB, agents, etc.)
     """
     base_url = "http://127.0.0.1:8322"
+    admin_url = f"http://127.0.0.1:{ADMIN_PORT}"
     
     print(f"\n[Checking for running chatbot server at {base_url}]")
     
@@ -333,6 +226,7 @@ def chatbot_server(mock_openai_server):
         "--env", f"OPENAI_BASE_URL={env['OPENAI_BASE_URL']}",
         "--env", f"OPENAI_INFERENCE_MODEL={env['OPENAI_INFERENCE_MODEL']}",
         "--env", f"PROVIDER_VECTOR_DB_ID={env['PROVIDER_VECTOR_DB_ID']}",
+        "--env", f"ANSIBLE_CHATBOT_ADMIN_PORT={ADMIN_PORT}",
         "--env", "PYTHONUNBUFFERED=1",
         "--env", f"LOG_LEVEL={env['LOG_LEVEL']}",
         full_image
@@ -387,6 +281,7 @@ def chatbot_server(mock_openai_server):
         # Wait for server to be ready
         max_wait = int(os.environ.get("SERVER_STARTUP_TIMEOUT", "300"))
         server_ready = False
+        last_readiness = None
         
         print("=" * 80)
         print(f"[⏳] Waiting for server (max {max_wait}s)...")
@@ -407,19 +302,27 @@ def chatbot_server(mock_openai_server):
                 sys.stderr.flush()
                 pytest.fail(f"Server process exited unexpectedly with code {exit_code}")
             
+            # /v1/config answers as soon as the HTTP server is up; the admin server's
+            # /readiness only once the vector stores and embedding model are loaded.
             try:
                 response = requests.get(f"{base_url}/v1/config", timeout=2)
                 if response.status_code == 200:
-                    print(f"[✓] Server ready ({i+1}s)")
-                    server_ready = True
-                    break
+                    readiness = requests.get(f"{admin_url}/readiness", timeout=2)
+                    if readiness.status_code == 200:
+                        print(f"[✓] Server ready ({i+1}s)")
+                        server_ready = True
+                        break
+                    last_readiness = readiness.text
             except requests.exceptions.RequestException:
-                if (i + 1) % 30 == 0:
-                    print(f"[⏳] Waiting... ({i+1}s)")
-                time.sleep(1)
+                pass
+            if (i + 1) % 30 == 0:
+                print(f"[⏳] Waiting... ({i+1}s)")
+            time.sleep(1)
                 
         if not server_ready:
             sys.stderr.write(f"\n[✗] SERVER TIMEOUT after {max_wait}s\n")
+            if last_readiness:
+                sys.stderr.write(f"\n[Last readiness report:]\n{last_readiness}\n")
             
             with output_lock:
                 recent_output = output_lines[-30:] if len(output_lines) > 30 else output_lines
@@ -0,0 +1,398 @@
+"""
+Latency-configurable mock OpenAI API server.
+
+Used by the mock test suite (tests/conftest.py) and as the inference backend of
+the offline performance harness (scripts/offline_benchmark.py, `make bench`), so
+performance runs exercise the chatbot's own overhead (agent loop, RAG,
+serialization) without a GPU, network access or a live vLLM.
+
+The behaviour is driven by a MockLLMProfile:
+  - ttft / token_delay: time before the first token and between tokens
+  - response_tokens (+ response_tokens_max / response_tokens_distribution):
+    number of content tokens per completion
+  - tool_call_rate: share of tool-enabled requests answered with a tool call
+  - error_rate / error_status: share of requests failed with an HTTP error
+
+The default profile has no delays and answers with the fixed "AAP stands for
+Ansible Automation Platform..." text, which is what the mock test suite expects.
+Profiles are deterministic for a given seed: the n-th request served always
+gets the same length, tool-call and error decisions.
+
+Run standalone:
+    uv run python -m tests.mock_openai --port 8323 --ttft 0.3 --token-delay 0.02 \
+        --response-tokens 50 --response-tokens-max 300 --tool-call-rate 1.0
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+import typing
+from dataclasses import dataclass, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+MOCK_MODEL_ID = "gpt-4o-mini"
+
+# Tokens of the canned answer; longer responses cycle through them.
+_TOKENS = [
+    "AAP", " stands", " for", " Ansible", " Automation", " Platform", ".",
+    " It", " is", " a", " comprehensive", " enterprise", " automation", " solution",
+    " by", " Red", " Hat", " for", " IT", " automation", " and", " orchestration", ".",
+]
+
+_NON_STREAMING_ANSWER = (
+    "AAP stands for Ansible Automation Platform. It is a comprehensive "
+    "enterprise solution developed by Red Hat that provides powerful "
+    "automation capabilities for IT operations, cloud provisioning, "
+    "configuration management, application deployment, and orchestration.\n\n"
+    "Key components include Automation Controller, Automation Hub, "
+    "Automation Execution Environments, Ansible Content Collections, "
+    "and Event-Driven Ansible. AAP helps organizations automate complex "
+    "workflows, improve operational efficiency, and ensure consistency "
+    "across environments."
+)
+
+_DISTRIBUTIONS = ("fixed", "uniform", "normal")
+
+
+@dataclass
+class MockLLMProfile:
+    """Latency and response shape of the mock LLM. Times are in seconds."""
+
+    model: str = MOCK_MODEL_ID
+    ttft: float = 0.0
+    token_delay: float = 0.0
+    # None keeps the canned answers (len(_TOKENS) streamed tokens).
+    response_tokens: int | None = None
+    response_tokens_max: int | None = None
+    response_tokens_distribution: str = "fixed"
+    tool_call_rate: float = 0.0
+    tool_name: str = "knowledge_search"
+    error_rate: float = 0.0
+    error_status: int = 500
+    seed: int = 0
+
+    def __post_init__(self):
+        if self.response_tokens_distribution not in _DISTRIBUTIONS:
+            raise ValueError(
+                f"response_tokens_distribution must be one of {_DISTRIBUTIONS}, "
+                f"got {self.response_tokens_distribution!r}"
+            )
+        for name in ("tool_call_rate", "error_rate"):
+            if not 0.0 <= getattr(self, name) <= 1.0:
+                raise ValueError(f"{name} must be between 0 and 1")
+
+    def response_length(self, rng: random.Random) -> int | None:
+        """Number of content tokens for one completion, drawn from the distribution."""
+        if self.response_tokens is None:
+            return None
+        low = self.response_tokens
+        high = max(self.response_tokens_max or low, low)
+        if self.response_tokens_distribution == "uniform":
+            return rng.randint(low, high)
+        if self.response_tokens_distribution == "normal":
+            mean = (low + high) / 2
+            return int(min(high, max(low, round(rng.gauss(mean, (high - low) / 6 or 1)))))
+        return low
+
+
+def _tokens(count: int | None) -> list[str]:
+    if count is None:
+        return list(_TOKENS)
+    return list(itertools.islice(itertools.cycle(_TOKENS), count))
+
+
+def _last_user_text(messages: list[dict]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return content or ""
+    return ""
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Mock OpenAI API server for testing.
+
+    Simulates OpenAI API behavior, for both streaming and non-streaming
+    responses, following the MockLLMProfile of the server.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """Suppress request logging."""
+        pass
+
+    @property
+    def profile(self) -> MockLLMProfile:
+        return self.server.profile
+
+    def do_POST(self):
+        """Handle POST requests to OpenAI API."""
+        content_length = int(self.headers.get("Content-Length", "0") or "0")
+        post_data = self.rfile.read(content_length) if content_length else b"{}"
+        if self.path != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": f"mock has no route {self.path}"}})
+            return
+
+        request_body = json.loads(post_data.decode("utf-8"))
+        rng = self.server.next_request_rng()
+
+        if rng.random() < self.profile.error_rate:
+            self.server.count("errors")
+            self._send_json(
+                self.profile.error_status,
+                {"error": {"message": "injected mock error", "type": "server_error", "code": self.profile.error_status}},
+            )
+            return
+
+        tool_call = self._tool_call_for(request_body, rng)
+        tokens = _tokens(self.profile.response_length(rng))
+        self.server.count("tool_calls" if tool_call else "completions")
+
+        if request_body.get("stream", False):
+            self._handle_streaming_response(tokens, tool_call)
+        else:
+            self._handle_non_streaming_response(tokens, tool_call)
+
+    def do_GET(self):
+        """Handle GET requests to OpenAI API."""
+        if self.path == "/v1/models":
+            self._send_json(200, {
+                "object": "list",
+                "data": [
+                    {
+                        "id": self.profile.model,
+                        "object": "model",
+                        "created": 1686935002,
+                        "owned_by": "openai"
+                    },
+                ]
+            })
+        else:
+            self._send_json(404, {"error": {"message": f"mock has no route {self.path}"}})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _tool_call_for(self, request_body, rng) -> dict | None:
+        """
+        Decide whether to answer with a tool call.
+
+        Only requests that offer the profile's tool are eligible, and never right
+        after a tool result, so every agent turn ends with a text answer.
+        """
+        messages = request_body.get("messages") or []
+        tools = request_body.get("tools") or []
+        tool_names = {(tool.get("function") or {}).get("name") for tool in tools}
+        if self.profile.tool_name not in tool_names:
+            return None
+        if messages and messages[-1].get("role") == "tool":
+            return None
+        if rng.random() >= self.profile.tool_call_rate:
+            return None
+        return {
+            "id": f"call_mock_{rng.getrandbits(32):08x}",
+            "type": "function",
+            "function": {
+                "name": self.profile.tool_name,
+                "arguments": json.dumps({"query": _last_user_text(messages)}),
+            },
+        }
+
+    def _write_chunk(self, payload):
+        data = payload if isinstance(payload, bytes) else f"data: {json.dumps(payload)}\n\n".encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _handle_streaming_response(self, tokens, tool_call):
+        """Return a streaming SSE response."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": "chatcmpl-test-stream",
+                "object": "chat.completion.chunk",
+                "created": 1732800000,
+                "model": self.profile.model,
+                "choices": [{
+                    "index": 0,
+                    "delta": delta,
+                    "finish_reason": finish_reason
+                }]
+            }
+
+        if self.profile.ttft:
+            time.sleep(self.profile.ttft)
+
+        if tool_call:
+            self._write_chunk(chunk({"role": "assistant", "tool_calls": [{"index": 0, **tool_call}]}))
+            finish_reason = "tool_calls"
+        else:
+            for i, token in enumerate(tokens):
+                if i and self.profile.token_delay:
+                    time.sleep(self.profile.token_delay)
+                self._write_chunk(chunk({"content": token}))
+            finish_reason = "stop"
+
+        # Send final chunk
+        self._write_chunk(chunk({}, finish_reason))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _handle_non_streaming_response(self, tokens, tool_call):
+        """Return a non-streaming JSON response."""
+        # A non-streaming completion costs the whole generation time up front.
+        delay = self.profile.ttft
+        if not tool_call:
+            delay += self.profile.token_delay * max(len(tokens) - 1, 0)
+        if delay:
+            time.sleep(delay)
+
+        if tool_call:
+            message = {"role": "assistant", "content": None, "tool_calls": [tool_call]}
+            finish_reason = "tool_calls"
+            completion_tokens = 1
+        else:
+            content = _NON_STREAMING_ANSWER if self.profile.response_tokens is None else "".join(tokens)
+            message = {"role": "assistant", "content": content}
+            finish_reason = "stop"
+            completion_tokens = 98 if self.profile.response_tokens is None else len(tokens)
+
+        self._send_json(200, {
+            "id": "chatcmpl-test-123",
+            "object": "chat.completion",
+            "created": 1732800000,
+            "model": self.profile.model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": finish_reason
+            }],
+            "usage": {
+                "prompt_tokens": 28,
+                "completion_tokens": completion_tokens,
+                "total_tokens": 28 + completion_tokens
+            }
+        })
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, server_address, profile: MockLLMProfile | None = None):
+        super().__init__(server_address, MockOpenAIHandler)
+        self.profile = profile or MockLLMProfile()
+        self.stats = {"requests": 0, "completions": 0, "tool_calls": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def next_request_rng(self) -> random.Random:
+        """A random generator seeded from the profile seed and the request number."""
+        with self._lock:
+            request_number = self.stats["requests"]
+            self.stats["requests"] += 1
+        return random.Random(self.profile.seed * 1_000_003 + request_number)
+
+    def count(self, outcome: str):
+        with self._lock:
+            self.stats[outcome] += 1
+
+
+class MockOpenAI:
+    """Lifecycle wrapper around MockOpenAIServer."""
+
+    def __init__(self, server: MockOpenAIServer, thread: threading.Thread):
+        self._server = server
+        self._thread = thread
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def profile(self) -> MockLLMProfile:
+        return self._server.profile
+
+    @property
+    def stats(self) -> dict:
+        with self._server._lock:
+            return dict(self._server.stats)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(timeout=5)
+
+
+def start_mock_openai(port: int = 0, profile: MockLLMProfile | None = None, host: str = "127.0.0.1") -> MockOpenAI:
+    """Start the mock OpenAI API server in a background thread (port 0 binds an ephemeral port)."""
+    try:
+        server = MockOpenAIServer((host, port), profile)
+    except OSError as exc:
+        raise RuntimeError(f"Failed to bind mock OpenAI server on port {port}: {exc}") from exc
+
+    thread = threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True)
+    thread.start()
+    return MockOpenAI(server, thread)
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    """Add one --option per MockLLMProfile field."""
+    defaults = MockLLMProfile()
+    hints = typing.get_type_hints(MockLLMProfile)
+    for f in fields(MockLLMProfile):
+        default = getattr(defaults, f.name)
+        # The type of the option: X of an "X | None" field.
+        kind = next(t for t in typing.get_args(hints[f.name]) or (hints[f.name],) if t is not type(None))
+        kwargs = {"default": default, "type": kind, "help": f"(default: {default})"}
+        if f.name == "response_tokens_distribution":
+            kwargs["choices"] = _DISTRIBUTIONS
+        parser.add_argument(f"--{f.name.replace('_', '-')}", dest=f.name, **kwargs)
+
+
+def profile_from_args(args: argparse.Namespace) -> MockLLMProfile:
+    return MockLLMProfile(**{f.name: getattr(args, f.name) for f in fields(MockLLMProfile)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency-configurable mock OpenAI API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8323)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    mock = start_mock_openai(args.port, profile_from_args(args), host=args.host)
+    print(f"Mock OpenAI API server listening on {mock.url} with {mock.profile}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Mock OpenAI API server stats: {mock.stats}", flush=True)
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Tests for the semantic answer cache (ansible_chatbot_stack/answer_cache.py), and its hook into
+a stand-in of llama-stack's Responses API orchestrator.
+"""
+
+import asyncio
+import types
+
+import pytest
+import requests
+
+from ansible_chatbot_stack import admin, answer_cache, faiss_index, runtime
+from ansible_chatbot_stack.answer_cache import AnswerCache, CachedAnswer, unit_vector
+
+ANSWER = "Event-Driven Ansible reacts to events.\nIt runs rulebooks."
+# Question embeddings: the first two are paraphrases, the third is another question.
+EMBEDDINGS = {
+    "What is EDA?": [1.0, 0.0, 0.1],
+    "what's EDA": [1.0, 0.0, 0.15],
+    "What is AAP?": [0.0, 1.0, 0.0],
+}
+
+
+def test_similarity_threshold_and_contexts():
+    cache = AnswerCache(min_similarity=0.95, ttl=0)
+    cache.put("context", CachedAnswer(unit_vector(EMBEDDINGS["What is EDA?"]), ANSWER))
+
+    assert cache.get("context", unit_vector(EMBEDDINGS["what's EDA"])).text == ANSWER
+    assert cache.get("context", unit_vector(EMBEDDINGS["What is AAP?"])) is None
+    assert cache.get("other context", unit_vector(EMBEDDINGS["What is EDA?"])) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 2, 0.3333)
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = AnswerCache(max_entries=2, ttl=60)
+    for question in EMBEDDINGS:
+        cache.put(question, CachedAnswer(unit_vector(EMBEDDINGS[question]), question))
+
+    assert cache.get("What is EDA?", unit_vector(EMBEDDINGS["What is EDA?"])) is None
+    assert cache.stats()["evictions"] == 1
+    assert cache.get("What is AAP?", unit_vector(EMBEDDINGS["What is AAP?"])) is not None
+    now[0] += 61
+    assert cache.get("What is AAP?", unit_vector(EMBEDDINGS["What is AAP?"])) is None
+    assert cache.clear() == 1
+
+
+def output(type_, **fields):
+    return {"type": type_, **fields}
+
+
+def message(text, part_type="output_text"):
+    return output("message", role="assistant", content=[{"type": part_type, "text": text}])
+
+
+@pytest.mark.parametrize(
+    "outputs, cacheable",
+    [
+        ([output("file_search_call", queries=["EDA"], status="completed"), message(ANSWER)], True),
+        ([output("mcp_list_tools", server_label="aap-controller"), message(ANSWER)], True),
+        ([output("mcp_call", name="job_templates_list"), message(ANSWER)], False),
+        ([message("I cannot help with that.", part_type="refusal")], False),
+        ([message("  ")], False),
+    ],
+)
+def test_cacheable_answers(outputs, cacheable):
+    response = types.SimpleNamespace(status="completed", output=outputs)
+    assert (answer_cache._cacheable_answer(response) is not None) is cacheable
+
+
+def model_type(type_):
+    """Stand-in of a llama-stack API model class, whose type field defaults to ``type_``."""
+    return lambda **fields: types.SimpleNamespace(**{"type": type_, **fields})
+
+
+class FakeOrchestrator:
+    """The attributes of StreamingResponseOrchestrator the cache uses; create_response "calls the LLM"."""
+
+    llm_calls = 0
+
+    def __init__(self, question, history=()):
+        messages = [types.SimpleNamespace(role="system", content="You are the Ansible assistant.")]
+        messages += [types.SimpleNamespace(role=role, content=text) for role, text in history]
+        messages.append(types.SimpleNamespace(role="user", content=[{"type": "text", "text": question}]))
+        self.ctx = types.SimpleNamespace(
+            model="granite-3.3-8b-instruct",
+            messages=messages,
+            response_tools=[{"type": "file_search", "vector_store_ids": ["aap-product-docs"]}],
+        )
+        self.guardrail_ids = []
+        self.response_id = "resp_1"
+        self.sequence_number = 0
+        self.final_messages = []
+        self.inference_api = FakeInference()
+
+    def _snapshot_response(self, status, outputs):
+        return types.SimpleNamespace(id=self.response_id, status=status, output=list(outputs))
+
+    async def create_response(self):
+        FakeOrchestrator.llm_calls += 1
+        yield types.SimpleNamespace(type="response.created")
+        yield types.SimpleNamespace(
+            type="response.completed",
+            response=types.SimpleNamespace(
+                status="completed",
+                output=[output("file_search_call", id="fs_1", queries=["EDA"], status="completed"), message(ANSWER)],
+            ),
+        )
+
+
+class FakeInference:
+    async def openai_embeddings(self, request):
+        return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=EMBEDDINGS[request.input[0]])])
+
+
+@pytest.fixture
+def hooked(monkeypatch, stub_modules):
+    streaming = {"StreamingResponseOrchestrator": FakeOrchestrator}
+    for name, type_ in {
+        "Created": "response.created",
+        "InProgress": "response.in_progress",
+        "OutputItemAdded": "response.output_item.added",
+        "ContentPartAdded": "response.content_part.added",
+        "OutputTextDelta": "response.output_text.delta",
+        "ContentPartDone": "response.content_part.done",
+        "OutputItemDone": "response.output_item.done",
+        "Completed": "response.completed",
+    }.items():
+        streaming[f"OpenAIResponseObjectStreamResponse{name}"] = model_type(type_)
+    for name, type_ in {
+        "OpenAIResponseMessage": "message",
+        "OpenAIResponseContentPartOutputText": "output_text",
+        "OpenAIResponseOutputMessageContentOutputText": "output_text",
+        "OpenAIResponseOutputMessageFileSearchToolCall": "file_search_call",
+        "OpenAIAssistantMessageParam": None,
+    }.items():
+        streaming[name] = model_type(type_)
+    stub_modules(
+        {
+            "llama_stack.providers.inline.agents.meta_reference.responses.streaming": streaming,
+            "llama_stack_api": {"OpenAIEmbeddingsRequestWithExtraBody": types.SimpleNamespace},
+        }
+    )
+    monkeypatch.setattr(FakeOrchestrator, "create_response", FakeOrchestrator.create_response)
+    monkeypatch.setattr(FakeOrchestrator, "llm_calls", 0)
+    monkeypatch.setenv("ANSWER_CACHE", "true")
+    rt = runtime.Runtime()
+    rt.impls = {
+        "vector_stores": types.SimpleNamespace(
+            list_vector_stores=lambda: asyncio.sleep(
+                0,
+                [types.SimpleNamespace(identifier="aap-product-docs", embedding_model="sentence-transformers/mpnet")],
+            )
+        )
+    }
+    monkeypatch.setattr(answer_cache, "RUNTIME", rt)
+    store = types.SimpleNamespace(bank_id="aap-product-docs", db_version=("aap_faiss_store.db", 1, 1), chunk_changes=0)
+    monkeypatch.setattr(faiss_index, "LOADED", [store])
+    answer_cache.install_hooks()
+    yield store
+    answer_cache.ANSWER_CACHE = None
+
+
+def run_turn(orchestrator):
+    async def collect():
+        return [event async for event in orchestrator.create_response()]
+
+    return asyncio.run(collect())
+
+
+def test_paraphrase_is_answered_from_the_cache(hooked):
+    run_turn(FakeOrchestrator("What is EDA?"))
+    paraphrase = FakeOrchestrator("what's EDA")
+    events = run_turn(paraphrase)
+
+    assert FakeOrchestrator.llm_calls == 1
+    types_ = [e.type for e in events]
+    assert types_[:2] == ["response.created", "response.in_progress"]
+    assert types_[-1] == "response.completed"
+    deltas = [e.delta for e in events if e.type == "response.output_text.delta"]
+    assert len(deltas) == len(ANSWER.split())
+    assert "".join(deltas) == ANSWER
+    sequence_numbers = [e.sequence_number for e in events if hasattr(e, "sequence_number")]
+    assert sequence_numbers == list(range(1, len(sequence_numbers) + 1))
+    completed = events[-1].response
+    assert [item.type for item in completed.output] == ["file_search_call", "message"]
+    assert completed.output[0].id != "fs_1"
+    assert paraphrase.final_messages[-1].content == ANSWER
+    assert answer_cache.stats()["hits"] == 1
+
+
+def test_new_rag_content_or_other_question_runs_the_turn(hooked):
+    run_turn(FakeOrchestrator("What is EDA?"))
+    hooked.chunk_changes += 1
+    run_turn(FakeOrchestrator("what's EDA"))
+    hooked.db_version = ("aap_faiss_store.db", 2, 1)
+    run_turn(FakeOrchestrator("what's EDA"))
+    run_turn(FakeOrchestrator("What is AAP?"))
+
+    assert FakeOrchestrator.llm_calls == 4
+    assert answer_cache.stats()["stored"] == 4
+    # Keyed on the content of the stores, without searching them.
+    run_turn(FakeOrchestrator("what's EDA"))
+    assert FakeOrchestrator.llm_calls == 4
+
+
+def test_follow_up_turns_are_not_cached(hooked):
+    history = [("user", "What is AAP?"), ("assistant", "A platform.")]
+    run_turn(FakeOrchestrator("What is EDA?", history))
+    run_turn(FakeOrchestrator("What is EDA?", history))
+
+    assert FakeOrchestrator.llm_calls == 2
+    assert answer_cache.stats()["skipped"] == 2
+
+
+def test_admin_clears_the_cache(monkeypatch):
+    cache = AnswerCache()
+    cache.put("context", CachedAnswer(unit_vector(EMBEDDINGS["What is EDA?"]), ANSWER))
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE", cache)
+
+    server = admin.start_admin_server(port=0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        monkeypatch.setenv("ANSIBLE_CHATBOT_ADMIN_TOKEN", "s3cret")
+        assert requests.post(f"{url}/answer_cache/clear", timeout=5).status_code == 403
+        assert requests.get(f"{url}/answer_cache", timeout=5).json()["entries"] == 1
+        monkeypatch.delenv("ANSIBLE_CHATBOT_ADMIN_TOKEN")
+        assert requests.post(f"{url}/answer_cache/clear", timeout=5).json() == {"cleared": 1}
+        assert requests.get(f"{url}/answer_cache", timeout=5).json()["entries"] == 0
+        assert requests.post(f"{url}/readiness", timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
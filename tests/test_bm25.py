@@ -0,0 +1,53 @@
+"""
+Tests for the BM25 inverted index of the chunks of a vector store (ansible_chatbot_stack/bm25.py).
+"""
+
+from ansible_chatbot_stack import bm25
+from ansible_chatbot_stack.bm25 import BM25Index
+
+TEXTS = [
+    "Use the ansible.builtin.copy module to copy files to remote hosts.",
+    "The template module renders Jinja2 templates; copy is simpler.",
+    "Automation controller job templates run playbooks.",
+    "",
+    "ERROR! couldn't resolve module/action 'ansible.builtin.cpy'",
+]
+
+
+def test_identifiers_are_kept_whole_and_split():
+    assert bm25.tokenize("Use ansible.builtin.copy, then the URL /api/v2/") == [
+        "use",
+        "ansible.builtin.copy",
+        "ansible",
+        "builtin",
+        "copy",
+        "then",
+        "url",
+        "api/v2",
+        "api",
+        "v2",
+    ]
+    assert bm25.chunk_text({"content": [{"type": "text", "text": "a b"}, {"type": "image"}]}) == "a b "
+
+
+def test_search_ranks_exact_identifiers_first():
+    index = BM25Index.build(TEXTS)
+
+    positions, scores = index.search("how to use ansible.builtin.copy", 3)
+
+    assert positions[0] == 0 and sorted(positions.tolist()) == [0, 1, 4]
+    assert scores.tolist() == sorted(scores.tolist(), reverse=True) and scores[-1] > 0
+    assert index.search("ansible.builtin.cpy", 5)[0].tolist()[0] == 4
+    assert index.search("unknown words", 5)[0].tolist() == []
+    assert len(index.search("module", 1)[0]) == 1
+
+
+def test_serialized_index_searches_the_same():
+    index = BM25Index.build(TEXTS)
+
+    loaded = BM25Index.deserialize(index.serialize())
+
+    assert len(loaded) == len(TEXTS) and loaded.vocabulary == index.vocabulary
+    for query in ("copy files", "job templates", "ansible.builtin.cpy"):
+        assert [a.tolist() for a in loaded.search(query, 5)] == [a.tolist() for a in index.search(query, 5)]
+    assert len(BM25Index.deserialize(BM25Index.build([""]).serialize())) == 1
@@ -0,0 +1,218 @@
+"""
+Tests for the dependency readiness checks (ansible_chatbot_stack/dependencies.py), against
+stand-ins of the llama-stack routing tables they query.
+"""
+
+import asyncio
+import sys
+import types
+
+import pytest
+
+from ansible_chatbot_stack import dependencies, runtime
+from ansible_chatbot_stack.readiness import FAILED, OK, PENDING, SKIPPED, Readiness
+
+EMBEDDING_MODEL_PATH = "/.llama/data/distributions/ansible-chatbot/embeddings_model"
+
+
+def model(identifier, provider_id, model_type="llm", provider_resource_id=None):
+    return types.SimpleNamespace(
+        identifier=identifier,
+        provider_id=provider_id,
+        provider_resource_id=provider_resource_id or identifier,
+        model_type=model_type,
+    )
+
+
+class FakeInferenceProvider:
+    def __init__(self, error=None):
+        self.error = error
+
+    async def list_provider_model_ids(self):
+        if self.error:
+            raise self.error
+        return ["granite-3.3-8b-instruct"]
+
+
+class FakeModels:
+    def __init__(self, models, providers):
+        self.models = models
+        self.impls_by_provider_id = providers
+
+    async def list_models(self):
+        return types.SimpleNamespace(data=self.models)
+
+
+class FakeFaiss:
+    def __init__(self, **chunks):
+        self.cache = {
+            store: types.SimpleNamespace(index=types.SimpleNamespace(chunk_by_index=dict.fromkeys(range(n))))
+            for store, n in chunks.items()
+        }
+
+
+class FakeVectorStores:
+    def __init__(self, stores, providers):
+        self.stores = [
+            types.SimpleNamespace(identifier=s, provider_id=p, provider_resource_id=s) for s, p in stores.items()
+        ]
+        self.impls_by_provider_id = providers
+
+    async def list_vector_stores(self):
+        return self.stores
+
+
+class FakeToolGroups:
+    def __init__(self, tools):
+        self.tools = tools
+
+    async def list_tool_groups(self):
+        return types.SimpleNamespace(
+            data=[
+                types.SimpleNamespace(identifier=group, mcp_endpoint=types.SimpleNamespace(uri=f"http://{group}"))
+                for group in self.tools
+            ]
+        )
+
+    async def list_tools(self, toolgroup_id=None):
+        tools = self.tools[toolgroup_id]
+        if isinstance(tools, Exception):
+            raise tools
+        return types.SimpleNamespace(data=tools)
+
+
+@pytest.fixture
+def state(monkeypatch):
+    """Fresh readiness checks, and a runtime with every dependency healthy."""
+    checks = Readiness()
+    monkeypatch.setattr(dependencies, "READINESS", checks)
+    monkeypatch.setattr(dependencies, "_loaded_embedding_models", lambda: {EMBEDDING_MODEL_PATH})
+    monkeypatch.delenv("READINESS_BLOCKING_CHECKS", raising=False)
+    rt = runtime.Runtime()
+    rt.impls = {
+        "models": FakeModels(
+            [
+                model("granite-3.3-8b-instruct", "rhoai_vllm"),
+                model("all-mpnet-base-v2", "inline_sentence-transformer", "embedding", EMBEDDING_MODEL_PATH),
+            ],
+            {"rhoai_vllm": FakeInferenceProvider()},
+        ),
+        "vector_stores": FakeVectorStores(
+            {"aap-product-docs": "aap_faiss", "byok": "byok_faiss"},
+            {"aap_faiss": FakeFaiss(**{"aap-product-docs": 12}), "byok_faiss": FakeFaiss(byok=3)},
+        ),
+        "tool_groups": FakeToolGroups({"mcp::aap-controller": ["job_templates_list"]}),
+    }
+    return rt, checks
+
+
+def test_all_dependencies_ok(state):
+    rt, checks = state
+
+    asyncio.run(dependencies.refresh(rt))
+
+    report = checks.report()
+    assert report["ready"] is True
+    assert {name: c["status"] for name, c in report["checks"].items()} == dict.fromkeys(dependencies.CHECKS, OK)
+    assert report["checks"]["inference"]["providers"]["rhoai_vllm"]["reachable"] is True
+    assert report["checks"]["embedding_model"]["models"] == {"all-mpnet-base-v2": True}
+    vector_stores = report["checks"]["vector_stores"]["vector_stores"]
+    assert vector_stores["aap-product-docs"]["chunks"] == 12
+    assert vector_stores["byok"] == {"provider_id": "byok_faiss", "loaded": True, "chunks": 3}
+    assert report["checks"]["mcp_servers"]["servers"]["mcp::aap-controller"]["tools"] == 1
+
+
+def test_external_dependencies_do_not_block_by_default(state):
+    rt, checks = state
+    rt.impls["models"].impls_by_provider_id["rhoai_vllm"] = FakeInferenceProvider(ConnectionError("refused"))
+    rt.impls["tool_groups"] = FakeToolGroups({"mcp::aap-controller": []})
+
+    asyncio.run(dependencies.refresh(rt))
+
+    report = checks.report()
+    assert report["checks"]["inference"]["status"] == FAILED
+    assert "refused" in report["checks"]["inference"]["providers"]["rhoai_vllm"]["error"]
+    assert report["checks"]["mcp_servers"]["status"] == FAILED
+    assert report["ready"] is True
+
+
+def test_blocking_checks_are_configurable(state, monkeypatch):
+    rt, checks = state
+    monkeypatch.setenv("READINESS_BLOCKING_CHECKS", "inference,vector_stores")
+    rt.impls["models"].impls_by_provider_id["rhoai_vllm"] = FakeInferenceProvider(ConnectionError("refused"))
+
+    asyncio.run(dependencies.refresh(rt))
+
+    assert checks.report()["checks"]["embedding_model"]["blocking"] is False
+    assert not checks.ready()
+
+
+def test_vector_store_not_loaded(state):
+    rt, checks = state
+    del rt.impls["vector_stores"].impls_by_provider_id["byok_faiss"].cache["byok"]
+
+    asyncio.run(dependencies.refresh(rt))
+
+    check = checks.report()["checks"]["vector_stores"]
+    assert check["status"] == FAILED
+    assert check["vector_stores"]["byok"]["loaded"] is False
+    assert not checks.ready()
+
+
+def test_embedding_model_waits_for_the_warm_up(state, monkeypatch):
+    rt, checks = state
+    monkeypatch.setattr(dependencies, "_loaded_embedding_models", set)
+
+    checks.set("warmup", PENDING)
+    asyncio.run(dependencies.refresh(rt))
+    assert checks.report()["checks"]["embedding_model"]["status"] == PENDING
+
+    checks.set("warmup", FAILED, blocking=False)
+    asyncio.run(dependencies.refresh(rt))
+    assert checks.report()["checks"]["embedding_model"]["status"] == FAILED
+
+    checks.set("warmup", SKIPPED, blocking=False)
+    asyncio.run(dependencies.refresh(rt))
+    assert checks.report()["checks"]["embedding_model"]["status"] == SKIPPED
+
+
+def test_check_timeout(state, monkeypatch):
+    rt, checks = state
+    monkeypatch.setenv("READINESS_CHECK_TIMEOUT", "0.1")
+
+    class SlowProvider:
+        async def list_provider_model_ids(self):
+            await asyncio.sleep(1)
+
+    rt.impls["models"].impls_by_provider_id["rhoai_vllm"] = SlowProvider()
+
+    asyncio.run(dependencies.refresh(rt))
+
+    check = checks.report()["checks"]["inference"]
+    assert check["status"] == FAILED
+    assert check["error"].startswith("TimeoutError")
+
+
+def test_checks_start_after_the_server_startup(state, monkeypatch, stub_modules):
+    _, checks = state
+
+    class Server:
+        async def startup(self):
+            return "started"
+
+    stub_modules({"uvicorn.server": {"Server": Server}})
+    monkeypatch.setitem(sys.modules, "llama_stack", None)
+    rt = runtime.Runtime()
+    monkeypatch.setattr(runtime, "RUNTIME", rt)
+    monkeypatch.setattr(dependencies, "RUNTIME", rt)
+
+    dependencies.install()
+    runtime.install_hooks()
+    assert checks.report()["checks"]["vector_stores"]["status"] == PENDING
+    assert not checks.ready()
+
+    assert asyncio.run(Server().startup()) == "started"
+
+    # Not started by lightspeed-stack's llama-stack client: nothing to check.
+    assert checks.report()["checks"]["vector_stores"]["status"] == SKIPPED
+    assert checks.ready()
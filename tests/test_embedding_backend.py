@@ -0,0 +1,164 @@
+"""
+Tests for the embedding model backends (ansible_chatbot_stack/embedding_backend.py), with a stand-in
+of sentence-transformers, and for the helpers of scripts/embedding_backend_benchmark.py.
+"""
+
+import json
+import sqlite3
+import sys
+import types
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from ansible_chatbot_stack import embedding_backend
+from ansible_chatbot_stack.embedding_backend import Backend
+
+faiss = pytest.importorskip("faiss")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+import embedding_backend_benchmark  # noqa: E402
+
+
+def test_parse_backends():
+    assert Backend.parse(None) == Backend("torch")
+    assert Backend.parse("ONNX") == Backend("onnx", "avx2")
+    assert Backend.parse("onnx", "none").model_file == "onnx/model.onnx"
+    assert Backend.parse("onnx", "avx512_vnni").model_file == "onnx/model_qint8_avx512_vnni.onnx"
+    assert Backend.parse("openvino", "").model_file == "openvino/openvino_model.xml"
+    assert Backend.parse("openvino", "int8").model_file == "openvino/openvino_model_qint8_quantized.xml"
+    for name, quantization in (("tensorrt", None), ("onnx", "int4"), ("openvino", "avx2")):
+        with pytest.raises(ValueError):
+            Backend.parse(name, quantization)
+
+
+def test_backend_of_provider_config():
+    # llama-stack's config object keeps the keys it has no field for in model_extra.
+    config = types.SimpleNamespace(model_extra={"backend": "onnx", "quantization": "arm64"})
+
+    assert Backend.from_config({"backend": "openvino", "quantization": ""}) == Backend("openvino")
+    assert embedding_backend.backend_of(types.SimpleNamespace(config=config)) == Backend("onnx", "arm64")
+    assert embedding_backend.backend_of(types.SimpleNamespace(config={"backend": "gpu"})) == Backend("torch")
+
+
+@pytest.fixture
+def sentence_transformers(monkeypatch):
+    """A stand-in of sentence-transformers that records the arguments models are loaded with."""
+    module = types.ModuleType("sentence_transformers")
+    module.loaded = []
+    module.SentenceTransformer = lambda path, **kwargs: module.loaded.append(kwargs) or kwargs
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    return module
+
+
+def test_missing_export_is_loaded_with_torch(tmp_path, sentence_transformers):
+    onnx = Backend("onnx", "avx2")
+
+    embedding_backend.load_model(str(tmp_path), onnx)
+    (tmp_path / "onnx").mkdir()
+    (tmp_path / "onnx" / "model_qint8_avx2.onnx").write_bytes(b"onnx")
+    embedding_backend.load_model(str(tmp_path), onnx)
+
+    assert sentence_transformers.loaded == [
+        {"trust_remote_code": True},
+        {"trust_remote_code": True, "backend": "onnx", "model_kwargs": {"file_name": "onnx/model_qint8_avx2.onnx"}},
+    ]
+
+
+def test_main_keeps_an_existing_export(tmp_path, capsys):
+    (tmp_path / "openvino").mkdir()
+    (tmp_path / "openvino" / "openvino_model.xml").write_text("<net/>")
+
+    assert embedding_backend.main([str(tmp_path), "--backend", "openvino"]) == 0
+    assert "already exists" in capsys.readouterr().out
+    assert embedding_backend.main([str(tmp_path / "missing")]) == 1
+    assert embedding_backend.main([str(tmp_path), "--backend", "openvino", "--quantization", "avx2"]) == 1
+    # The int8 export is calibrated on chunk texts: none without a store DB.
+    int8 = [str(tmp_path), "--backend", "openvino", "--quantization", "int8", "--calibration-db", "missing.db"]
+    assert embedding_backend.main(int8) == 1
+    assert "No chunk texts" in capsys.readouterr().out
+
+
+def write_store_db(db_path: Path, store_id: str, contents: list[str]):
+    chunks = {str(i): json.dumps({"content": content, "chunk_id": f"c{i}"}) for i, content in enumerate(contents)}
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE IF NOT EXISTS kvstore (key TEXT PRIMARY KEY, value TEXT, expiration TIMESTAMP)")
+        db.execute(
+            "INSERT INTO kvstore VALUES (?, ?, NULL)",
+            (f"faiss_index:v3::{store_id}", json.dumps({"chunk_by_index": chunks, "faiss_index": ""})),
+        )
+
+
+def test_calibration_texts_sample_the_chunks_of_the_stores(tmp_path):
+    write_store_db(tmp_path / "aap.db", "aap", ["Event-Driven   Ansible", "", *(f"chunk {i}" for i in range(10))])
+    write_store_db(tmp_path / "byok.db", "byok", ["Private   automation hub"])
+    dbs = [tmp_path / "aap.db", tmp_path / "byok.db"]
+
+    texts = embedding_backend.calibration_texts(dbs, samples=100)
+    assert sorted(texts) == sorted(
+        ["Event-Driven Ansible", "Private automation hub", *(f"chunk {i}" for i in range(10))]
+    )
+    assert embedding_backend.calibration_texts(dbs, samples=5) == embedding_backend.calibration_texts(dbs, samples=5)
+    assert len(embedding_backend.calibration_texts(dbs, samples=5)) == 5
+
+
+def test_int8_openvino_export_is_calibrated_on_the_texts(tmp_path, stub_modules):
+    calibrated = []
+
+    class OVQuantizer:
+        @classmethod
+        def from_pretrained(cls, model):
+            return cls()
+
+        def quantize(self, dataset, save_directory, ov_config):
+            calibrated.extend(dataset.samples)
+            quantized = Path(save_directory) / "openvino_model.xml"
+            quantized.write_text("<net/>")
+            quantized.with_suffix(".bin").write_bytes(b"int8")
+
+    class Model(list):
+        max_seq_length = 16
+
+        def tokenizer(self, text, **kwargs):
+            return {"input_ids": [len(text)], "token_type_ids": [0]}
+
+    model = Model([types.SimpleNamespace(auto_model=types.SimpleNamespace(input_names=["input_ids"]))])
+    stub_modules(
+        {
+            "sentence_transformers": {"SentenceTransformer": lambda path, **kwargs: model},
+            "nncf": {"Dataset": lambda samples: types.SimpleNamespace(samples=samples)},
+            "optimum.intel.openvino": {"OVConfig": dict, "OVQuantizationConfig": dict, "OVQuantizer": OVQuantizer},
+        }
+    )
+
+    with pytest.raises(ValueError):
+        embedding_backend.export(str(tmp_path), Backend("openvino", "int8"))
+    target = embedding_backend.export(str(tmp_path), Backend("openvino", "int8"), ["Ansible", "AAP"])
+    assert target == tmp_path / "openvino" / "openvino_model_qint8_quantized.xml"
+    assert target.with_suffix(".bin").read_bytes() == b"int8"
+    assert calibrated == [{"input_ids": [7]}, {"input_ids": [3]}]
+
+
+def test_benchmark_retrieval_equivalence():
+    rng = np.random.default_rng(0)
+    chunks = rng.standard_normal((500, 16)).astype(np.float32)
+    reference = rng.standard_normal((50, 16)).astype(np.float32)
+    index = faiss.IndexFlatL2(16)
+    index.add(chunks)
+
+    quantized = reference + rng.normal(0, 0.01, reference.shape).astype(np.float32)
+    unrelated = rng.standard_normal((50, 16)).astype(np.float32)
+
+    close = embedding_backend_benchmark.retrieval_equivalence(index, reference, quantized, k=5)
+    far = embedding_backend_benchmark.retrieval_equivalence(index, reference, unrelated, k=5)
+    assert close["recall"] > 0.9 and close["top1_agreement"] > 0.9
+    assert far["recall"] < 0.2
+    assert embedding_backend_benchmark.cosine_similarities(reference, quantized).min() > 0.99
+
+
+def test_benchmark_samples_chunk_texts():
+    chunk = {"content": [{"type": "text", "text": "Event-Driven   Ansible"}], "chunk_id": "c1"}
+    stores = {"aap": {"chunk_by_index": {"0": json.dumps(chunk), "1": json.dumps({"content": ""})}}}
+
+    assert embedding_backend_benchmark.sample_chunk_queries(stores, 10, seed=0) == ["Event-Driven Ansible"]
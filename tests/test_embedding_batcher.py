@@ -0,0 +1,156 @@
+"""
+Tests for the micro-batching of query embeddings (ansible_chatbot_stack/embedding_batcher.py), and
+its hook into a stand-in of llama-stack's sentence-transformers embedding mixin.
+"""
+
+import asyncio
+import types
+
+import numpy as np
+import pytest
+
+from ansible_chatbot_stack import embedding_batcher
+from ansible_chatbot_stack.embedding_batcher import EmbeddingBatcher
+from ansible_chatbot_stack.metrics import Histogram
+
+MODEL = "/.llama/data/embeddings_model"
+
+
+class FakeModel:
+    """A SentenceTransformer whose embedding of a text is its length, and which records its batches."""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def encode(self, texts, show_progress_bar=True):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("out of memory")
+        return np.array([[float(len(text))] for text in texts], dtype=np.float32)
+
+
+def test_histogram():
+    histogram = Histogram([1, 5, 10])
+    for value in (0.5, 1, 3, 12):
+        histogram.observe(value)
+
+    assert histogram.snapshot() == {
+        "count": 4,
+        "sum": 16.5,
+        "mean": 4.125,
+        "buckets": {"<=1": 2, "<=5": 1, "<=10": 0, "+Inf": 1},
+    }
+
+
+def test_concurrent_queries_are_encoded_in_batches():
+    batcher = EmbeddingBatcher(max_batch_size=4, max_wait=0.05)
+    model = FakeModel()
+    texts = [f"query {'x' * i}" for i in range(10)]
+
+    async def run():
+        return await asyncio.gather(*(batcher.embed(MODEL, model, text) for text in texts))
+
+    embeddings = asyncio.run(run())
+
+    assert [len(batch) for batch in model.batches] == [4, 4, 2]
+    assert [float(e[0]) for e in embeddings] == [float(len(text)) for text in texts]
+    stats = batcher.stats()
+    assert (stats["batches"], stats["queries"]) == (3, 10)
+    assert stats["batch_size"]["buckets"]["<=4"] == 2
+
+
+def test_lone_query_waits_at_most_the_max_wait():
+    batcher = EmbeddingBatcher(max_batch_size=32, max_wait=0.01)
+    model = FakeModel()
+
+    async def run():
+        first = await batcher.embed(MODEL, model, "What is AAP?")
+        second = await batcher.embed(MODEL, model, "What is EDA?")
+        return first, second
+
+    asyncio.run(run())
+
+    assert model.batches == [["What is AAP?"], ["What is EDA?"]]
+    assert batcher.stats()["queue_wait_ms"]["buckets"]["+Inf"] == 0
+
+
+def test_encoding_errors_reach_every_caller_of_the_batch():
+    batcher = EmbeddingBatcher(max_batch_size=8, max_wait=0.01)
+    model = FakeModel(fail=True)
+
+    async def run():
+        return await asyncio.gather(*(batcher.embed(MODEL, model, t) for t in "ab"), return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(model.batches) == 1 and batcher.stats()["errors"] == 1
+
+
+@pytest.fixture
+def mixin(monkeypatch, stub_modules):
+    """A stand-in of llama-stack's embedding mixin, which encodes requests with a FakeModel."""
+
+    class SentenceTransformerEmbeddingMixin:
+        def __init__(self):
+            self.model = FakeModel()
+            self.unbatched = []
+
+        async def openai_embeddings(self, params):
+            self.unbatched.append(params.input)
+            return types.SimpleNamespace(data=[])
+
+        async def _load_sentence_transformer_model(self, model):
+            return self.model
+
+    stub_modules(
+        {
+            "llama_stack.providers.utils.inference.embedding_mixin": {
+                "SentenceTransformerEmbeddingMixin": SentenceTransformerEmbeddingMixin,
+                "OpenAIEmbeddingsResponse": types.SimpleNamespace,
+                "OpenAIEmbeddingData": types.SimpleNamespace,
+                "OpenAIEmbeddingUsage": types.SimpleNamespace,
+            }
+        }
+    )
+    for name in ("EMBEDDING_BATCH", "EMBEDDING_BATCH_MAX_SIZE"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("EMBEDDING_BATCH_MAX_WAIT_MS", "20")
+    monkeypatch.setattr(embedding_batcher, "EMBEDDING_BATCHER", None)
+    return SentenceTransformerEmbeddingMixin
+
+
+def request(text, **params):
+    return types.SimpleNamespace(
+        **{"model": MODEL, "input": text, "encoding_format": "float", "dimensions": None, **params}
+    )
+
+
+def test_hook_batches_single_text_requests(mixin):
+    embedding_batcher.install_hooks()
+    aap, byok = mixin(), mixin()
+    byok.model = aap.model  # both providers serve the same model from llama-stack's model cache
+
+    async def run():
+        return await asyncio.gather(
+            aap.openai_embeddings(request("What is AAP?")),
+            byok.openai_embeddings(request(["What is EDA?"])),
+            aap.openai_embeddings(request(["chunk 1", "chunk 2"])),
+        )
+
+    first, second, _ = asyncio.run(run())
+
+    assert aap.model.batches == [["What is AAP?", "What is EDA?"]]
+    assert aap.unbatched == [["chunk 1", "chunk 2"]]
+    assert (first.data[0].embedding, second.data[0].embedding) == ([12.0], [12.0])
+
+
+def test_hook_disabled(mixin, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_BATCH", "false")
+    openai_embeddings = mixin.openai_embeddings
+
+    embedding_batcher.install_hooks()
+
+    assert mixin.openai_embeddings is openai_embeddings
+    assert embedding_batcher.stats() == {"enabled": False}
@@ -0,0 +1,200 @@
+"""
+Tests for the query embedding cache (ansible_chatbot_stack/embedding_cache.py), and its hook
+into a stand-in of llama-stack's sentence-transformers embedding mixin.
+"""
+
+import asyncio
+import threading
+import types
+
+import pytest
+
+from ansible_chatbot_stack import embedding_cache
+from ansible_chatbot_stack.embedding_cache import DiskTier, EmbeddingCache, model_fingerprint, normalize
+
+MODEL = "/.llama/data/embeddings_model"
+
+
+def test_normalize():
+    assert normalize("  What is\tAAP?\n") == "what is aap?"
+    assert normalize("Ｗhat is AAP?") == "what is aap?"
+
+
+def test_lru_eviction_and_stats():
+    cache = EmbeddingCache(max_entries=2, ttl=0)
+    cache.put(MODEL, "What is AAP?", [0.1, 0.2])
+    cache.put(MODEL, "What is EDA?", [0.3, 0.4])
+    assert cache.get(MODEL, "what is aap?") is not None  # "What is EDA?" is now the least recently used
+    cache.put(MODEL, "How do I create a job template?", [0.5, 0.6])
+
+    assert cache.get(MODEL, "What is EDA?") is None
+    assert list(cache.get(MODEL, "What is AAP?")) == pytest.approx([0.1, 0.2])
+    assert cache.get("another-model", "What is AAP?") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 2, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now[0])
+    cache = EmbeddingCache(max_entries=10, ttl=60)
+    cache.put(MODEL, "What is AAP?", [0.1])
+
+    now[0] += 30
+    assert cache.get(MODEL, "What is AAP?") is not None
+    now[0] += 31
+    assert cache.get(MODEL, "What is AAP?") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "embedding_cache.db")
+    cache = EmbeddingCache(disk=DiskTier(path, max_entries=100, ttl=0))
+    cache.put(MODEL, "What is AAP?", [0.1, 0.2])
+    cache.disk.close()
+
+    restarted = EmbeddingCache(disk=DiskTier(path, max_entries=100, ttl=0))
+    assert list(restarted.get(MODEL, "What is AAP?")) == pytest.approx([0.1, 0.2])
+    assert restarted.get(MODEL, "What is AAP?") is not None
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["hits"], stats["disk"]["entries"]) == (1, 1, 1)
+
+
+def test_disk_tier_prune(tmp_path):
+    disk = DiskTier(str(tmp_path / "embedding_cache.db"), max_entries=3, ttl=0)
+    cache = EmbeddingCache(disk=disk)
+    for i in range(5):
+        cache.put(MODEL, f"query {i}", [float(i)])
+    disk.flush()
+    disk.prune()
+    assert len(disk) == 3
+    assert cache.get(MODEL, "query 4") is not None and EmbeddingCache(disk=disk).get(MODEL, "query 0") is None
+
+
+def test_disk_tier_runs_off_the_event_loop(tmp_path, monkeypatch):
+    disk = DiskTier(str(tmp_path / "embedding_cache.db"), max_entries=100, ttl=0)
+    assert disk._db.execute("SELECT name FROM sqlite_master WHERE name = 'embeddings_created_at'").fetchone()
+    threads = []
+    for name in ("get", "put"):
+        method = getattr(DiskTier, name)
+
+        def recorded(self, *args, method=method):
+            threads.append(threading.current_thread())
+            return method(self, *args)
+
+        monkeypatch.setattr(DiskTier, name, recorded)
+
+    async def run():
+        EmbeddingCache(disk=disk).put(MODEL, "What is AAP?", [0.1])
+        return await EmbeddingCache(disk=disk).get_async(MODEL, "What is AAP?")
+
+    assert list(asyncio.run(run())) == pytest.approx([0.1])
+    assert len(threads) == 2 and threading.main_thread() not in threads
+
+
+def test_model_fingerprint_changes_with_the_model_files(tmp_path):
+    model = tmp_path / "embeddings_model"
+    model.mkdir()
+    (model / "config.json").write_text('{"hidden_size": 768}')
+    before = model_fingerprint(str(model))
+    assert model_fingerprint(str(model), "openvino:int8") != before
+    (model / "config.json").write_text('{"hidden_size": 384}')
+
+    assert model_fingerprint(str(model)) != before
+
+
+@pytest.fixture
+def mixin(monkeypatch, stub_modules):
+    """A stand-in of llama-stack's embedding mixin, which counts the texts it encodes."""
+
+    class Response(types.SimpleNamespace):
+        pass
+
+    class SentenceTransformerEmbeddingMixin:
+        def __init__(self):
+            self.encoded = []
+
+        async def openai_embeddings(self, params):
+            inputs = [params.input] if isinstance(params.input, str) else params.input
+            self.encoded.extend(inputs)
+            return Response(
+                data=[types.SimpleNamespace(embedding=[float(len(text))], index=i) for i, text in enumerate(inputs)],
+                model=params.model,
+            )
+
+    stub_modules(
+        {
+            "llama_stack.providers.utils.inference.embedding_mixin": {
+                "SentenceTransformerEmbeddingMixin": SentenceTransformerEmbeddingMixin,
+                "OpenAIEmbeddingsResponse": Response,
+                "OpenAIEmbeddingData": types.SimpleNamespace,
+                "OpenAIEmbeddingUsage": types.SimpleNamespace,
+            }
+        }
+    )
+    monkeypatch.delenv("EMBEDDING_CACHE", raising=False)
+    monkeypatch.delenv("EMBEDDING_CACHE_DISK_PATH", raising=False)
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE", None)
+    return SentenceTransformerEmbeddingMixin
+
+
+def request(text, **params):
+    return types.SimpleNamespace(
+        **{"model": MODEL, "input": text, "encoding_format": "float", "dimensions": None, **params}
+    )
+
+
+def test_hook_caches_single_text_requests(mixin):
+    embedding_cache.install_hooks()
+    provider = mixin()
+
+    async def run():
+        first = await provider.openai_embeddings(request(["What is AAP?"]))
+        second = await provider.openai_embeddings(request("what is  AAP?"))
+        await provider.openai_embeddings(request(["chunk 1", "chunk 2"]))
+        await provider.openai_embeddings(request("What is AAP?", encoding_format="base64"))
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert second.data[0].embedding == first.data[0].embedding == [12.0]
+    assert provider.encoded == ["What is AAP?", "chunk 1", "chunk 2", "What is AAP?"]
+    assert embedding_cache.stats()["hits"] == 1
+
+
+def test_hook_fingerprints_the_model_off_the_event_loop_with_its_backend(mixin, tmp_path, monkeypatch):
+    (tmp_path / "openvino").mkdir()
+    (tmp_path / "openvino" / "openvino_model.xml").write_text("<net/>")
+    fingerprinted = []
+
+    def fingerprint(model, backend="torch"):
+        fingerprinted.append((backend, threading.current_thread()))
+        return backend
+
+    monkeypatch.setattr(embedding_cache, "model_fingerprint", fingerprint)
+    embedding_cache.install_hooks()
+    torch, openvino, int8 = mixin(), mixin(), mixin()
+    openvino.config = {"backend": "openvino"}
+    int8.config = {"backend": "openvino", "quantization": "int8"}
+
+    async def run():
+        for provider in (torch, openvino, int8, openvino):
+            await provider.openai_embeddings(request("What is AAP?", model=str(tmp_path)))
+
+    asyncio.run(run())
+
+    # The int8 export is missing: that provider runs with torch, and shares its embeddings.
+    assert [backend for backend, _ in fingerprinted] == ["torch", "openvino", "torch"]
+    assert threading.main_thread() not in [thread for _, thread in fingerprinted]
+    assert (torch.encoded, openvino.encoded, int8.encoded) == (["What is AAP?"], ["What is AAP?"], [])
+
+
+def test_hook_disabled(mixin, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE", "false")
+    openai_embeddings = mixin.openai_embeddings
+
+    embedding_cache.install_hooks()
+
+    assert mixin.openai_embeddings is openai_embeddings
+    assert embedding_cache.stats() == {"enabled": False}
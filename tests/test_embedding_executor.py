@@ -0,0 +1,149 @@
+"""
+Tests for the embedding process pool (ansible_chatbot_stack/embedding_executor.py), with a stand-in
+of sentence-transformers importable by the pool processes, and of llama-stack's embedding mixin.
+"""
+
+import asyncio
+import os
+import textwrap
+import types
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from ansible_chatbot_stack import embedding_executor
+from ansible_chatbot_stack.embedding_backend import Backend
+from ansible_chatbot_stack.embedding_executor import EmbeddingExecutor, PooledModel
+
+MODEL = "/.llama/data/embeddings_model"
+
+FAKE_SENTENCE_TRANSFORMERS = '''
+import os
+
+import numpy as np
+
+
+class SentenceTransformer:
+    """Embeds a text as its length and the PID of the process encoding it."""
+
+    def __init__(self, model, trust_remote_code=False):
+        if model == "missing":
+            raise OSError(f"{model} not found")
+
+    def encode(self, texts, show_progress_bar=True):
+        if "die" in texts:
+            os._exit(1)
+        return np.array([[len(text), os.getpid()] for text in texts], dtype=np.float32)
+'''
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    """An executor whose pool processes import the stand-in sentence_transformers (spawn passes on sys.path)."""
+    (tmp_path / "sentence_transformers.py").write_text(textwrap.dedent(FAKE_SENTENCE_TRANSFORMERS))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    executor = EmbeddingExecutor(processes=1)
+    yield executor
+    executor.shutdown()
+
+
+def shared_memory_blocks():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+def test_embeddings_come_back_through_the_shared_memory_ring(executor):
+    model = PooledModel(executor, MODEL)
+    shared_memory = shared_memory_blocks()
+
+    embeddings = model.encode(["What is AAP?", "EDA"])
+    single = model.encode("What is AAP?")
+    for _ in range(20):
+        model.encode(["a", "b", "c"])
+
+    assert embeddings.dtype == np.float32 and embeddings.shape == (2, 2)
+    assert embeddings[:, 0].tolist() == [12.0, 3.0]
+    assert embeddings[0, 1] != os.getpid()
+    assert single.tolist() == embeddings[0].tolist()
+    assert len(shared_memory_blocks() - shared_memory) == 1
+    executor.shutdown()
+    assert shared_memory_blocks() == shared_memory
+
+
+def test_embeddings_overwritten_in_the_ring_are_encoded_again(tmp_path, monkeypatch):
+    (tmp_path / "sentence_transformers.py").write_text(textwrap.dedent(FAKE_SENTENCE_TRANSFORMERS))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    # Room for 2 embeddings of 2 floats.
+    executor = EmbeddingExecutor(processes=1, shared_memory=16)
+    try:
+        first = executor.submit_encode(MODEL, Backend(), ["What is AAP?"])
+        second = executor.submit_encode(MODEL, Backend(), ["a", "b"])
+        larger = executor.submit_encode(MODEL, Backend(), ["a", "b", "c"])
+
+        assert executor.read(second)[:, 0].tolist() == [1.0, 1.0]
+        assert executor.read(first)[:, 0].tolist() == [12.0]
+        assert executor.read(larger)[:, 0].tolist() == [1.0, 1.0, 1.0]
+        assert executor.stats()["overwritten"] == 1
+    finally:
+        executor.shutdown()
+
+
+def test_dead_pool_process_is_replaced(executor):
+    model = PooledModel(executor, MODEL)
+    first_pid = model.encode(["a"])[0, 1]
+
+    with pytest.raises(BrokenProcessPool):
+        model.encode(["die"])
+
+    assert model.encode(["a"])[0, 1] != first_pid
+    assert (executor.stats()["errors"], executor.stats()["restarts"]) == (1, 1)
+
+
+@pytest.fixture
+def mixin(monkeypatch, executor, stub_modules):
+    """A stand-in of llama-stack's embedding mixin, which encodes with the model from its cache, in a thread."""
+
+    class SentenceTransformerEmbeddingMixin:
+        async def openai_embeddings(self, params):
+            model = await self._load_sentence_transformer_model(params.model)
+            return await asyncio.to_thread(model.encode, [params.input], show_progress_bar=False)
+
+        async def _load_sentence_transformer_model(self, model):
+            raise AssertionError("the model is loaded in the server process")
+
+    name = "llama_stack.providers.utils.inference.embedding_mixin"
+    module = stub_modules(
+        {
+            name: {
+                "SentenceTransformerEmbeddingMixin": SentenceTransformerEmbeddingMixin,
+                "EMBEDDING_MODELS": {},
+                "EMBEDDING_MODELS_LOCK": asyncio.Lock(),
+            }
+        }
+    )[name]
+    monkeypatch.setenv("EMBEDDING_EXECUTOR", "process")
+    monkeypatch.setattr(embedding_executor, "from_env", lambda: executor)
+    monkeypatch.setattr(embedding_executor, "EMBEDDING_EXECUTOR", None)
+    embedding_executor.install_hooks()
+    return module
+
+
+def test_hook_loads_the_model_in_the_pool(mixin):
+    provider = mixin.SentenceTransformerEmbeddingMixin()
+
+    embeddings = asyncio.run(provider.openai_embeddings(types.SimpleNamespace(model=MODEL, input="What is AAP?")))
+
+    assert embeddings[0, 0] == 12.0
+    assert isinstance(mixin.EMBEDDING_MODELS[MODEL], PooledModel)
+    with pytest.raises(OSError, match="missing not found"):
+        asyncio.run(provider.openai_embeddings(types.SimpleNamespace(model="missing", input="What is AAP?")))
+    assert "missing" not in mixin.EMBEDDING_MODELS
+
+
+def test_thread_executor_by_default(monkeypatch):
+    monkeypatch.delenv("EMBEDDING_EXECUTOR", raising=False)
+    monkeypatch.setattr(embedding_executor, "EMBEDDING_EXECUTOR", None)
+
+    embedding_executor.install_hooks()
+
+    assert embedding_executor.stats() == {"enabled": False}
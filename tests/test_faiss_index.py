@@ -0,0 +1,546 @@
+"""
+Tests for the approximate FAISS index builder and the memory-mapped index files
+(ansible_chatbot_stack/faiss_index.py), on a store DB in the kvstore format of llama-stack's
+inline::faiss provider.
+"""
+
+import asyncio
+import json
+import sqlite3
+import sys
+import types
+import weakref
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from ansible_chatbot_stack import faiss_index, store_search
+from ansible_chatbot_stack.faiss_index import IndexSpec, VectorTransform
+
+faiss = pytest.importorskip("faiss")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+import faiss_index_benchmark  # noqa: E402
+
+STORE_ID = "aap-product-docs"
+DIMENSION = 32
+
+
+def write_store_db(db_path, vectors, store_id=STORE_ID, embeddings=True):
+    """A store DB as llama-stack's FaissIndex._save_index writes it, with a flat index."""
+    chunks = {
+        i: json.dumps({"content": f"chunk {i}", "chunk_id": f"c{i}", "embedding": v.tolist() if embeddings else []})
+        for i, v in enumerate(vectors)
+    }
+    flat = faiss_index.build_index(vectors, IndexSpec("flat"))
+    record = {"chunk_by_index": chunks, "faiss_index": faiss_index.serialize_index(flat)}
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE IF NOT EXISTS kvstore (key TEXT PRIMARY KEY, value TEXT, expiration TIMESTAMP)")
+        db.execute("INSERT INTO kvstore VALUES (?, ?, NULL)", (f"vector_stores:v3::{store_id}", "{}"))
+        db.execute("INSERT INTO kvstore VALUES (?, ?, NULL)", (f"faiss_index:v3::{store_id}", json.dumps(record)))
+    db.close()
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).standard_normal((1000, DIMENSION)).astype(np.float32)
+
+
+def test_parse_index_specs():
+    assert IndexSpec.parse("hnsw:m=16,ef_search=32") == IndexSpec("hnsw", {"m": 16, "ef_search": 32})
+    assert str(IndexSpec.parse("ivf_flat:nprobe=8")) == "ivf_flat:nprobe=8"
+    assert IndexSpec.parse("ivf_pq").resolve(10000, 768) == {"nlist": 400, "nprobe": 16, "pq_m": 96, "pq_nbits": 8}
+    for spec in ("ivf", "hnsw:nprobe=8", "hnsw:m=many"):
+        with pytest.raises(ValueError):
+            IndexSpec.parse(spec)
+
+
+@pytest.mark.parametrize(
+    "spec, index_type", [("ivf_flat", "IndexIVFFlat"), ("hnsw:m=16", "IndexHNSWFlat"), ("ivf_pq:pq_m=8", "IndexIVFPQ")]
+)
+def test_rewrite_keeps_chunks_in_index_order(tmp_path, vectors, spec, index_type):
+    db_path = tmp_path / "aap_faiss_store.db"
+    write_store_db(db_path, vectors)
+
+    results = faiss_index.rewrite(db_path, IndexSpec.parse(spec))
+
+    assert results[STORE_ID]["chunks"] == len(vectors)
+    record = faiss_index.load_stores(db_path)[STORE_ID]
+    index = faiss_index.deserialize_index(record["faiss_index"])
+    assert type(index).__name__ == index_type
+    assert index.ntotal == len(vectors)
+    _, ids = index.search(vectors[:20], 1)
+    assert (ids[:, 0] == np.arange(20)).mean() >= 0.9
+    assert record["index_spec"].startswith(spec.split(":")[0])
+
+
+def test_search_parameters_are_stored_with_the_index(tmp_path, vectors):
+    db_path = tmp_path / "aap_faiss_store.db"
+    write_store_db(db_path, vectors)
+
+    faiss_index.rewrite(db_path, IndexSpec.parse("ivf_flat:nlist=50,nprobe=7"))
+
+    index = faiss_index.deserialize_index(faiss_index.load_stores(db_path)[STORE_ID]["faiss_index"])
+    assert (index.nlist, index.nprobe) == (50, 7)
+
+
+def test_vectors_read_back_from_a_flat_index(tmp_path, vectors):
+    db_path = tmp_path / "faiss_store.db"
+    write_store_db(db_path, vectors[:10], embeddings=False)
+
+    assert np.allclose(faiss_index.store_vectors(faiss_index.load_stores(db_path)[STORE_ID]), vectors[:10])
+
+
+def test_main_backs_up_and_rejects_small_stores(tmp_path, vectors, capsys):
+    db_path = tmp_path / "faiss_store.db"
+    write_store_db(db_path, vectors[:100])
+
+    assert faiss_index.main([str(db_path), "--index", "ivf_pq"]) == 1
+    assert "needs at least 256 chunks" in capsys.readouterr().out
+    assert (tmp_path / "faiss_store.db.bak").is_file()
+    assert faiss_index.main([str(db_path), "--index", "hnsw", "--store", "unknown", "--no-backup"]) == 1
+
+
+def test_parse_vector_transforms():
+    assert VectorTransform.parse("pca:16,int8") == VectorTransform("pca", 16, "int8")
+    assert VectorTransform.parse("int8") == VectorTransform(quantization="int8")
+    assert str(VectorTransform.parse("int8, truncate:8")) == "truncate:8,int8"
+    assert VectorTransform.parse("pca:16").output_dimension(768) == 16
+    for transform in ("", "pca", "pca:0", "pca:16,truncate:8", "fp16", "int8:4"):
+        with pytest.raises(ValueError):
+            VectorTransform.parse(transform)
+    with pytest.raises(ValueError, match="does not reduce"):
+        VectorTransform.parse("pca:32").output_dimension(DIMENSION)
+
+
+@pytest.mark.parametrize("spec", ["flat", "hnsw:m=16", "ivf_flat:nlist=20,nprobe=20"])
+@pytest.mark.parametrize("transform", ["int8", "pca:16,int8", "truncate:16"])
+def test_transformed_index_projects_full_embeddings(tmp_path, vectors, spec, transform):
+    db_path = tmp_path / "aap_faiss_store.db"
+    write_store_db(db_path, vectors)
+
+    results = faiss_index.rewrite(db_path, IndexSpec.parse(spec), transform=VectorTransform.parse(transform))
+
+    assert results[STORE_ID]["vector_transform"] == transform
+    if not spec.startswith("hnsw"):  # whose graph outweighs vectors of this dimension
+        assert results[STORE_ID]["size"] < results[STORE_ID]["previous_size"]
+    record = faiss_index.load_stores(db_path)[STORE_ID]
+    assert record["vector_transform"] == transform
+    index = faiss_index.deserialize_index(record["faiss_index"])
+    # The provider checks and searches with embeddings of the model's dimension.
+    assert (index.d, index.ntotal) == (DIMENSION, len(vectors))
+    _, ids = index.search(vectors[:20], 1)
+    assert (ids[:, 0] == np.arange(20)).mean() >= 0.9
+    index.add(vectors[:1])
+    assert index.ntotal == len(vectors) + 1
+
+
+def test_transform_is_dropped_by_a_plain_rewrite(tmp_path, vectors):
+    db_path = tmp_path / "aap_faiss_store.db"
+    write_store_db(db_path, vectors)
+    faiss_index.rewrite(db_path, IndexSpec("flat"), transform=VectorTransform.parse("pca:8,int8"))
+    assert faiss_index.main([str(db_path), "--index", "ivf_pq", "--transform", "int8", "--no-backup"]) == 1
+
+    faiss_index.rewrite(db_path, IndexSpec("flat"))
+
+    record = faiss_index.load_stores(db_path)[STORE_ID]
+    assert "vector_transform" not in record
+    assert type(faiss_index.deserialize_index(record["faiss_index"])).__name__ == "IndexFlatL2"
+
+
+def test_benchmark_reports_recall_against_the_flat_index(vectors):
+    queries = faiss_index_benchmark.sample_queries(vectors, 50, seed=0)
+    results = faiss_index_benchmark.benchmark_store(
+        vectors, queries, [IndexSpec.parse("hnsw"), IndexSpec.parse("ivf_flat:nlist=100,nprobe=1")], k=5
+    )
+
+    flat, hnsw, ivf = results
+    assert flat["recall"] == 1.0 and flat["speedup"] == 1.0
+    assert hnsw["recall"] >= 0.9
+    assert 0 < ivf["recall"] < hnsw["recall"]
+    assert hnsw["latency_ms"]["count"] == 50
+
+
+def test_benchmark_reports_the_size_of_transformed_indexes(vectors):
+    queries = faiss_index_benchmark.sample_queries(vectors, 50, seed=0)
+    results = faiss_index_benchmark.benchmark_store(
+        vectors, queries, [IndexSpec.parse("ivf_pq:pq_m=8")], k=5, transforms=[VectorTransform.parse("pca:8,int8")]
+    )
+
+    flat, flat_reduced, ivf_pq, ivf_pq_reduced = results
+    assert flat["transform"] is None and flat["compression"] == 1.0
+    assert flat_reduced["transform"] == "pca:8,int8"
+    assert flat_reduced["compression"] > 4 and flat_reduced["params"] == {}
+    assert 0 < flat_reduced["recall"] < 1
+    assert "error" not in ivf_pq and "already quantizes" in ivf_pq_reduced["error"]
+
+
+class KVStore:
+    """The parts of llama-stack's SqliteKVStoreImpl the provider FaissIndex uses."""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+
+    async def get(self, key):
+        with closing(sqlite3.connect(self.db_path)) as db:
+            row = db.execute("SELECT value FROM kvstore WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    async def delete(self, key):
+        with closing(sqlite3.connect(self.db_path)) as db, db:
+            db.execute("DELETE FROM kvstore WHERE key = ?", (key,))
+
+
+@pytest.fixture
+def provider(monkeypatch, stub_modules):
+    """A stand-in of llama-stack's inline::faiss provider module, whose FaissIndex deserializes its index."""
+
+    class FaissIndex:
+        def __init__(self, kvstore, bank_id):
+            self.kvstore = kvstore
+            self.bank_id = bank_id
+            self.index = None
+
+        async def initialize(self):
+            record = json.loads(await self.kvstore.get(f"faiss_index:v3::{self.bank_id}"))
+            self.chunk_by_index = {int(k): json.loads(v) for k, v in record["chunk_by_index"].items()}
+            self.index = faiss_index.deserialize_index(record["faiss_index"])
+
+        async def add_chunks(self, embeddings):
+            self.index.add(embeddings)
+
+        async def query_vector(self, embedding, k, score_threshold):
+            distances, indices = self.index.search(embedding.reshape(1, -1), k)
+            hits = [(self.chunk_by_index[int(i)], 1.0 / float(d)) for d, i in zip(distances[0], indices[0]) if i >= 0]
+            return module.QueryChunksResponse(chunks=[c for c, _ in hits], scores=[s for _, s in hits])
+
+        async def delete_chunks(self, chunk_ids):
+            pass
+
+        async def query_keyword(self, query_string, k, score_threshold):
+            raise NotImplementedError("Keyword search is not supported in FAISS")
+
+        async def query_hybrid(self, embedding, query_string, k, score_threshold, reranker_type, reranker_params=None):
+            raise NotImplementedError("Hybrid search is not supported in FAISS")
+
+    class WeightedInMemoryAggregator:
+        @staticmethod
+        def combine_search_results(vector_scores, keyword_scores, reranker_type="rrf", reranker_params=None):
+            impact_factor = (reranker_params or {}).get("impact_factor", 60.0)
+            fused = {}
+            for scores in (vector_scores, keyword_scores):
+                for rank, i in enumerate(sorted(scores, key=scores.get, reverse=True), 1):
+                    fused[i] = fused.get(i, 0.0) + 1.0 / (impact_factor + rank)
+            return fused
+
+    class VectorStoreWithIndex:
+        """Embeds a query as its vector in ``embeddings``, and dispatches it by mode as llama-stack does."""
+
+        def __init__(self, index, embeddings):
+            self.index = index
+            self.embeddings = embeddings
+
+        async def query_chunks(self, query, params=None):
+            params = params or {}
+            k = params.get("max_chunks", 3)
+            if params.get("mode") == "keyword":
+                return await self.index.query_keyword(query, k, 0.0)
+            if params.get("mode") == "hybrid":
+                embedding = self.embeddings[query]
+                return await self.index.query_hybrid(embedding, query, k, 0.0, "rrf", {"impact_factor": 60.0})
+            return await self.index.query_vector(self.embeddings[query], k, 0.0)
+
+    name = "llama_stack.providers.inline.vector_io.faiss.faiss"
+    module = stub_modules(
+        {
+            name: {
+                "FaissIndex": FaissIndex,
+                "faiss": faiss,
+                "QueryChunksResponse": types.SimpleNamespace,
+                "load_embedded_chunk_with_backward_compat": lambda data: types.SimpleNamespace(**data),
+                "VectorStoreWithIndex": VectorStoreWithIndex,
+            },
+            "llama_stack.providers.utils.vector_io": {"WeightedInMemoryAggregator": WeightedInMemoryAggregator},
+            "llama_stack.providers.utils.memory.vector_store": {"VectorStoreWithIndex": VectorStoreWithIndex},
+        }
+    )[name]
+    monkeypatch.setenv("FAISS_INDEX_MMAP", "true")
+    monkeypatch.setattr(faiss_index, "PRELOADED", {})
+    monkeypatch.setattr(faiss_index, "LOADED", weakref.WeakSet())
+    faiss_index.install_hooks()
+    return module
+
+
+def load(provider, db_path):
+    index = provider.FaissIndex(KVStore(db_path), STORE_ID)
+    asyncio.run(index.initialize())
+    return index
+
+
+def test_exported_index_is_memory_mapped_read_only(tmp_path, vectors, provider):
+    db_path = tmp_path / "aap_faiss_store.db"
+    write_store_db(db_path, vectors)
+
+    assert faiss_index.main([str(db_path), "--export"]) == 0
+    index = load(provider, db_path)
+
+    exported = list(tmp_path.glob("aap_faiss_store.aap-product-docs.*.faiss"))
+    assert index.shared_index_source == str(exported[0])
+    assert index.chunk_ids == [f"c{i}" for i in range(len(vectors))]
+    _, ids = index.index.search(vectors[:5], 1)
+    assert ids[:, 0].tolist() == list(range(5))
+    with pytest.raises(ValueError, match="is read-only"):
+        asyncio.run(index.add_chunks(vectors[:1]))
+
+
+@pytest.mark.parametrize("spec", ["ivf_flat", "hnsw:m=16"])
+def test_chunks_are_only_deleted_from_flat_indexes(tmp_path, vectors, provider, monkeypatch, spec):
+    monkeypatch.setenv("FAISS_INDEX_MMAP", "false")
+    db_path = tmp_path / "aap_faiss_store.db"
+    write_store_db(db_path, vectors)
+    asyncio.run(load(provider, db_path).delete_chunks(["c0"]))
+
+    faiss_index.rewrite(db_path, IndexSpec.parse(spec))
+
+    with pytest.raises(ValueError, match="cannot be deleted"):
+        asyncio.run(load(provider, db_path).delete_chunks(["c0"]))
+
+
+def test_changed_index_is_deserialized_and_exported_again(tmp_path, vectors, provider):
+    db_path = tmp_path / "aap_faiss_store.db"
+    write_store_db(db_path, vectors)
+    first = faiss_index.export(db_path)[STORE_ID]
+
+    faiss_index.rewrite(db_path, IndexSpec.parse("hnsw"))
+    index = load(provider, db_path)
+
+    assert getattr(index, "shared_index_source", None) is None
+    assert type(index.index).__name__ == "IndexHNSWFlat"
+    second = faiss_index.export(db_path)[STORE_ID]
+    assert second != first and not first.exists()
+    assert load(provider, db_path).shared_index_source == str(second)
+
+
+def test_missing_index_file_is_deserialized(tmp_path, vectors, provider):
+    db_path = tmp_path / "faiss_store.db"
+    write_store_db(db_path, vectors[:10])
+    faiss_index.export(db_path)[STORE_ID].unlink()
+
+    index = load(provider, db_path)
+
+    assert getattr(index, "shared_index_source", None) is None
+    assert index.index.ntotal == 10
+
+
+def test_preloaded_index_is_adopted(tmp_path, vectors, provider, monkeypatch):
+    monkeypatch.setenv("FAISS_INDEX_MMAP", "false")
+    db_path = tmp_path / "aap_faiss_store.db"
+    write_store_db(db_path, vectors)
+
+    assert faiss_index.preload(db_path) == [STORE_ID]
+    first, second = load(provider, db_path), load(provider, db_path)
+
+    assert first.index is second.index is faiss_index.PRELOADED[(str(db_path), STORE_ID)].index
+    assert first.shared_index_source == str(db_path)
+    faiss_index.rewrite(db_path, IndexSpec.parse("hnsw"))
+    assert getattr(load(provider, db_path), "shared_index_source", None) is None
+
+
+def tombstone_chunks(db_path, indices):
+    record = faiss_index.load_stores(db_path)[STORE_ID]
+    for i in indices:
+        chunk = json.loads(record["chunk_by_index"][str(i)])
+        chunk["metadata"] = {"document_id": f"doc{i}"}
+        record["chunk_by_index"][str(i)] = json.dumps(faiss_index.tombstone(chunk))
+    with closing(sqlite3.connect(db_path)) as db, db:
+        db.execute("UPDATE kvstore SET value = ? WHERE key = ?", (json.dumps(record), f"faiss_index:v3::{STORE_ID}"))
+
+
+@pytest.mark.parametrize("spec", ["flat", "hnsw"])
+def test_tombstones_are_skipped_by_searches(tmp_path, vectors, provider, spec):
+    db_path = tmp_path / "faiss_store.db"
+    write_store_db(db_path, vectors)
+    if spec != "flat":
+        faiss_index.rewrite(db_path, IndexSpec.parse(spec))
+    tombstone_chunks(db_path, range(5))
+    index = load(provider, db_path)
+
+    response = asyncio.run(index.query_vector(vectors[2], 10, 0.0))
+
+    assert len(response.chunks) == 10 == len(response.scores)
+    assert not any(faiss_index.is_tombstone(chunk) for chunk in response.chunks)
+    assert response.scores == sorted(response.scores, reverse=True)
+    live = asyncio.run(index.query_vector(vectors[7], 1, 0.0))
+    assert live.chunks[0]["chunk_id"] == "c7"
+
+
+@pytest.mark.parametrize("spec", ["flat", "hnsw"])
+def test_compaction_drops_tombstones_and_renumbers_chunks(tmp_path, vectors, capsys, spec):
+    db_path = tmp_path / "faiss_store.db"
+    write_store_db(db_path, vectors)
+    if spec != "flat":
+        faiss_index.rewrite(db_path, IndexSpec.parse(spec))
+    tombstone_chunks(db_path, [0, 10, 999])
+
+    assert faiss_index.main([str(db_path), "--compact"]) == 0
+
+    assert "3 tombstoned chunks dropped" in capsys.readouterr().out
+    record = faiss_index.load_stores(db_path)[STORE_ID]
+    index = faiss_index.deserialize_index(record["faiss_index"])
+    assert index.ntotal == len(record["chunk_by_index"]) == 997
+    assert json.loads(record["chunk_by_index"]["9"])["chunk_id"] == "c11"
+    _, ids = index.search(vectors[[11, 998]], 1)
+    assert ids[:, 0].tolist() == [9, 996]
+    assert faiss_index.compact(db_path) == {STORE_ID: 0}
+
+
+def relabel_chunks(db_path, label):
+    record = faiss_index.load_stores(db_path)[STORE_ID]
+    for i, chunk in record["chunk_by_index"].items():
+        record["chunk_by_index"][i] = json.dumps({**json.loads(chunk), "content": f"{label} chunk {i}"})
+    with closing(sqlite3.connect(db_path)) as db, db:
+        db.execute("UPDATE kvstore SET value = ? WHERE key = ?", (json.dumps(record), f"faiss_index:v3::{STORE_ID}"))
+
+
+def test_reload_swaps_the_index_once_searches_in_flight_started(tmp_path, vectors, provider):
+    for version, part in (("v1", vectors[:500]), ("v2", vectors[:500][::-1])):
+        (tmp_path / version).mkdir()
+        write_store_db(tmp_path / version / "faiss_store.db", part)
+        relabel_chunks(tmp_path / version / "faiss_store.db", version)
+    (tmp_path / "current").symlink_to("v1")
+    index = load(provider, tmp_path / "current" / "faiss_store.db")
+    assert asyncio.run(faiss_index.reload()) == {STORE_ID: "unchanged"}
+    (tmp_path / "next").symlink_to("v2")
+    (tmp_path / "next").replace(tmp_path / "current")
+
+    async def search_while_reloading():
+        search = asyncio.create_task(index.query_vector(vectors[3], 1, 0.0))
+        # The search starts, on the index and chunks of v1, and waits for its thread.
+        await asyncio.sleep(0)
+        return await faiss_index.reload(), await search
+
+    reloaded, in_flight = asyncio.run(search_while_reloading())
+
+    assert reloaded == {STORE_ID: "reloaded"}
+    assert in_flight.chunks[0]["content"] == "v1 chunk 3"
+    after = asyncio.run(index.query_vector(vectors[3], 1, 0.0))
+    assert after.chunks[0].content == "v2 chunk 496"
+    assert index.db_version[0] == str(tmp_path / "v2" / "faiss_store.db")
+
+
+def test_failed_reload_keeps_the_loaded_index(tmp_path, vectors, provider):
+    db_path = tmp_path / "faiss_store.db"
+    write_store_db(db_path, vectors[:10])
+    index = load(provider, db_path)
+    with closing(sqlite3.connect(db_path)) as db, db:
+        db.execute("DELETE FROM kvstore")
+
+    result = asyncio.run(faiss_index.reload())
+
+    assert result[STORE_ID].startswith("failed: ValueError: Vector store aap-product-docs not found")
+    assert index.index.ntotal == 10
+
+
+def set_contents(db_path, contents):
+    record = faiss_index.load_stores(db_path)[STORE_ID]
+    for i, content in contents.items():
+        chunk = json.loads(record["chunk_by_index"][str(i)])
+        record["chunk_by_index"][str(i)] = json.dumps({**chunk, "content": content})
+    with closing(sqlite3.connect(db_path)) as db, db:
+        db.execute("UPDATE kvstore SET value = ? WHERE key = ?", (json.dumps(record), f"faiss_index:v3::{STORE_ID}"))
+
+
+def test_bm25_index_is_built_once_and_kept_up_to_date(tmp_path, vectors, capsys):
+    db_path = tmp_path / "faiss_store.db"
+    write_store_db(db_path, vectors[:100])
+    set_contents(db_path, {7: "Copy files with ansible.builtin.copy"})
+
+    assert faiss_index.main([str(db_path), "--bm25"]) == 0
+    assert faiss_index.main([str(db_path), "--bm25"]) == 0
+
+    out = capsys.readouterr().out
+    assert "BM25 index built" in out and "BM25 index up to date" in out
+    tombstone_chunks(db_path, [0, 1])
+    assert faiss_index.main([str(db_path), "--compact", "--no-backup"]) == 0
+    with closing(sqlite3.connect(db_path)) as db:
+        stored = json.loads(db.execute("SELECT value FROM kvstore WHERE key LIKE 'bm25_index:%'").fetchone()[0])
+    assert stored["chunks"] == 98
+    chunks = {int(i): json.loads(c) for i, c in faiss_index.load_stores(db_path)[STORE_ID]["chunk_by_index"].items()}
+    positions, _ = faiss_index._bm25_index(json.dumps(stored), STORE_ID, chunks).search("copy", 5)
+    assert positions.tolist() == [5]
+    # As many chunks, but not the same ones at the same positions.
+    chunks[0], chunks[1] = chunks[1], chunks[0]
+    assert faiss_index._bm25_index(json.dumps(stored), STORE_ID, chunks) is None
+
+
+def test_hybrid_search_fuses_keyword_and_vector_rankings(tmp_path, vectors, provider, monkeypatch):
+    db_path = tmp_path / "faiss_store.db"
+    write_store_db(db_path, vectors[:100])
+    set_contents(db_path, {7: "Copy files with ansible.builtin.copy", 8: "Render with ansible.builtin.template"})
+    faiss_index.build_bm25(db_path)
+    embeddings = {"how do I use ansible.builtin.copy": vectors[3]}
+    query = next(iter(embeddings))
+
+    vector_only = provider.VectorStoreWithIndex(load(provider, db_path), embeddings)
+    assert vector_only.index.bm25 is None
+    assert "c7" not in [c["chunk_id"] for c in asyncio.run(vector_only.query_chunks(query)).chunks]
+
+    monkeypatch.setenv("HYBRID_SEARCH", "true")
+    store = provider.VectorStoreWithIndex(load(provider, db_path), embeddings)
+    response = asyncio.run(store.query_chunks(query, {"max_chunks": 3}))
+
+    assert [c["chunk_id"] for c in response.chunks][:2] in (["c3", "c7"], ["c7", "c3"])
+    assert response.scores == sorted(response.scores, reverse=True)
+    keyword = asyncio.run(store.query_chunks(query, {"mode": "keyword"}))
+    assert [c["chunk_id"] for c in keyword.chunks] == ["c7", "c8"]
+    assert keyword.scores[0] > keyword.scores[1]
+
+
+def test_runtime_changes_drop_the_bm25_index(tmp_path, vectors, provider, monkeypatch):
+    monkeypatch.setenv("FAISS_INDEX_MMAP", "false")
+    monkeypatch.setenv("HYBRID_SEARCH", "true")
+    db_path = tmp_path / "faiss_store.db"
+    write_store_db(db_path, vectors[:100])
+    faiss_index.build_bm25(db_path)
+    index = load(provider, db_path)
+    assert index.bm25 is not None
+
+    # One chunk deleted and one inserted: as many chunks as the BM25 index, at other positions.
+    asyncio.run(index.delete_chunks(["c0"]))
+    asyncio.run(index.add_chunks(vectors[:1]))
+
+    assert index.bm25 is None
+    assert asyncio.run(index.kvstore.get(f"bm25_index:v1::{STORE_ID}")) is None
+    assert faiss_index.store_version(STORE_ID)[::3] == [str(db_path.resolve()), 2]
+    assert load(provider, db_path).bm25 is None
+
+
+def test_hybrid_results_rank_with_those_of_vector_only_stores(tmp_path, vectors, provider, monkeypatch):
+    monkeypatch.setenv("HYBRID_SEARCH", "true")
+    for name in ("hybrid", "vector"):
+        (tmp_path / name).mkdir()
+        write_store_db(tmp_path / name / "faiss_store.db", vectors[:100])
+        set_contents(tmp_path / name / "faiss_store.db", {7: "Copy files with ansible.builtin.copy"})
+    faiss_index.build_bm25(tmp_path / "hybrid" / "faiss_store.db")
+    embeddings = {"how do I use ansible.builtin.copy": vectors[3] + 0.1}
+    query = next(iter(embeddings))
+    stores = {
+        name: provider.VectorStoreWithIndex(load(provider, tmp_path / name / "faiss_store.db"), embeddings)
+        for name in ("hybrid", "vector")
+    }
+    responses = {name: asyncio.run(store.query_chunks(query, {"max_chunks": 3})) for name, store in stores.items()}
+
+    assert "c7" in [c["chunk_id"] for c in responses["hybrid"].chunks]
+    assert "c7" not in [c["chunk_id"] for c in responses["vector"].chunks]
+    # Scored on the scale of the vector-only store, best first: the best chunks of both stores rank first.
+    assert responses["hybrid"].scores[0] == responses["vector"].scores[0]
+    assert responses["hybrid"].scores == sorted(responses["hybrid"].scores, reverse=True)
+    merged = store_search.merge_results(
+        [
+            [types.SimpleNamespace(store=name, score=score) for score in response.scores]
+            for name, response in responses.items()
+        ]
+    )
+    assert {result.store for result in merged[:2]} == {"hybrid", "vector"}
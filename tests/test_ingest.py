@@ -0,0 +1,235 @@
+"""
+Tests for the BYOK ingestion command (ansible_chatbot_stack/ingest.py), with a stand-in of
+sentence-transformers importable by the embedding pool processes.
+"""
+
+import json
+import sqlite3
+import textwrap
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+
+import pytest
+
+from ansible_chatbot_stack import faiss_index, ingest
+from ansible_chatbot_stack.embedding_executor import EmbeddingExecutor
+
+pytest.importorskip("faiss")
+
+STORE_ID = "byok-docs-0001"
+
+FAKE_SENTENCE_TRANSFORMERS = '''
+import os
+import zlib
+
+import numpy as np
+
+
+class SentenceTransformer:
+    """Embeds a text as its normalized bag of hashed words; dies on CRASH while the crash file exists."""
+
+    def __init__(self, model, trust_remote_code=False):
+        pass
+
+    def encode(self, texts, show_progress_bar=True):
+        crash_file = os.environ.get("FAKE_CRASH_FILE")
+        if crash_file and os.path.exists(crash_file) and any("CRASH" in text for text in texts):
+            os.remove(crash_file)
+            os._exit(1)
+        vectors = np.zeros((len(texts), 16), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                vectors[row, zlib.crc32(word.encode()) % 16] += 1
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+'''
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    """The stand-in model, importable by the spawned pool processes (spawn passes on sys.path)."""
+    modules = tmp_path / "modules"
+    modules.mkdir()
+    (modules / "sentence_transformers.py").write_text(textwrap.dedent(FAKE_SENTENCE_TRANSFORMERS))
+    monkeypatch.syspath_prepend(str(modules))
+    return "embeddings_model"
+
+
+@pytest.fixture
+def documents(tmp_path):
+    root = tmp_path / "docs"
+    (root / "guides").mkdir(parents=True)
+    for i in range(10):
+        paragraphs = [f"# Guide {i}"] + [f"Paragraph {p} of guide {i} about playbook {i * p}." for p in range(30)]
+        (root / "guides" / f"guide{i:02}.md").write_text("\n\n".join(paragraphs))
+    (root / "empty.txt").write_text("")
+    (root / "image.png").write_bytes(b"\x89PNG")
+    return root
+
+
+def run(documents, output, model, *args):
+    return ingest.main(
+        [str(documents), str(output), "--vector-store-id", STORE_ID, "--model", model, "--chunk-words", "40", *args]
+    )
+
+
+def test_chunks_are_paragraph_aligned_and_overlap():
+    text = "\n\n".join(" ".join(f"p{p}w{w}" for w in range(6)) for p in range(5)) + "\n\n" + "long " * 25
+
+    chunks = ingest.chunk_text(text, chunk_words=10, overlap_words=2)
+
+    assert all(len(chunk.split()) <= 10 for chunk in chunks)
+    assert chunks[0] == "p0w0 p0w1 p0w2 p0w3 p0w4 p0w5"
+    assert chunks[1].startswith("p0w4 p0w5\n\np1w0")
+    assert chunks[-1].split()[-1] == "long"
+    assert ingest.chunk_text("", 10, 2) == []
+
+
+def test_title_is_the_first_heading(tmp_path):
+    assert ingest.document_title("Intro\n\n## Install the collection ##\n\n# Other", tmp_path / "a.md") == (
+        "Install the collection"
+    )
+    assert ingest.document_title("= Automation hub\n\ntext", tmp_path / "a.adoc") == "Automation hub"
+    assert ingest.document_title("no heading", tmp_path / "notes.txt") == "notes"
+
+
+def test_ingestion_writes_a_store_the_provider_loads(tmp_path, documents, model, capsys):
+    output = tmp_path / "byok_vector_db"
+
+    assert run(documents, output, model, "--batch-size", "7") == 0
+
+    out = capsys.readouterr().out
+    assert (output / "provider_vector_db_id.ind").read_text() == STORE_ID
+    db_path = output / "faiss_store.db"
+    record = faiss_index.load_stores(db_path)[STORE_ID]
+    chunks = [json.loads(record["chunk_by_index"][str(i)]) for i in range(len(record["chunk_by_index"]))]
+    assert {chunk["metadata"]["document_id"] for chunk in chunks} == {f"guides/guide{i:02}.md" for i in range(10)}
+    assert chunks[0]["metadata"]["title"] == "Guide 0"
+    assert chunks[0]["chunk_id"] == "guides/guide00.md#0" and chunks[0]["embedding_dimension"] == 16
+    assert len({chunk["chunk_id"] for chunk in chunks}) == len(chunks)
+    index = faiss_index.deserialize_index(record["faiss_index"])
+    vectors = faiss_index.store_vectors(record)
+    assert index.ntotal == len(chunks)
+    _, ids = index.search(vectors[:5], 1)
+    assert ids[:, 0].tolist() == list(range(5))
+    assert faiss_index.build_bm25(db_path) == {STORE_ID: "up to date"}
+    with closing(sqlite3.connect(db_path)) as db:
+        row = db.execute("SELECT value FROM kvstore WHERE key = ?", (f"vector_stores:v3::{STORE_ID}",)).fetchone()
+        assert db.execute("SELECT COUNT(*) FROM ingest_chunks").fetchone()[0] == 0
+        assert db.execute("SELECT COUNT(*) FROM ingest_documents").fetchone()[0] == 11
+    vector_store = json.loads(row[0])
+    assert vector_store["identifier"] == STORE_ID and vector_store["provider_id"] == "byok-docs"
+    assert vector_store["embedding_dimension"] == 16
+    assert '"documents": 11' in out and "documents_per_second" in out
+
+    assert run(documents, output, model) == 1
+    assert "already ingested" in capsys.readouterr().out
+    assert run(documents, output, model, "--force", "--index", "hnsw", "--transform", "int8") == 0
+    assert faiss_index.load_stores(db_path)[STORE_ID]["vector_transform"] == "int8"
+
+
+def test_interrupted_ingestion_resumes(tmp_path, documents, model, monkeypatch, capsys):
+    (documents / "guides" / "guide07.md").write_text("# Guide 7\n\nCRASH while embedding this one.")
+    crash_file = tmp_path / "crash"
+    crash_file.touch()
+    monkeypatch.setenv("FAKE_CRASH_FILE", str(crash_file))
+    output = tmp_path / "byok_vector_db"
+    settings = {
+        "vector_store_id": STORE_ID,
+        "provider_id": ingest.DEFAULT_PROVIDER_ID,
+        "embedding_model": ingest.DEFAULT_EMBEDDING_MODEL,
+        "chunk_words": 40,
+        "overlap_words": ingest.DEFAULT_OVERLAP_WORDS,
+    }
+    output.mkdir()
+    db = ingest.open_store(output / "faiss_store.db", settings)
+    ingestion = ingest.Ingestion(db, EmbeddingExecutor(processes=1), model, batch_size=4, commit_documents=1)
+    with pytest.raises(BrokenProcessPool):
+        ingestion.run(documents, ingest.document_paths(documents, ingest.DEFAULT_SUFFIXES), 40, 20)
+    ingestion.close()
+    staged = ingestion.documents
+    db.close()
+    assert 0 < staged < 11
+
+    assert run(documents, output, model, "--overlap-words", "5") == 1
+    assert "other settings" in capsys.readouterr().out
+    assert run(documents, output, model) == 0
+
+    staged_stats = json.loads(capsys.readouterr().out.split("Staged: ")[1].splitlines()[0])
+    assert staged_stats["skipped"] == staged and staged_stats["ingested"] == 11 - staged
+    record = faiss_index.load_stores(output / "faiss_store.db")[STORE_ID]
+    document_ids = [json.loads(chunk)["metadata"]["document_id"] for chunk in record["chunk_by_index"].values()]
+    assert "guides/guide07.md" in document_ids
+    assert len(document_ids) == faiss_index.deserialize_index(record["faiss_index"]).ntotal
+
+
+def test_existing_store_is_not_overwritten(tmp_path, documents, model, capsys):
+    output = tmp_path / "byok_vector_db"
+    output.mkdir()
+    with sqlite3.connect(output / "faiss_store.db") as db:
+        db.execute("CREATE TABLE kvstore (key TEXT PRIMARY KEY, value TEXT, expiration TIMESTAMP)")
+    db.close()
+
+    assert run(documents, output, model) == 1
+    assert "--force" in capsys.readouterr().out
+    assert not (output / "provider_vector_db_id.ind").exists()
+
+
+def stored_chunks(db_path):
+    record = faiss_index.load_stores(db_path)[STORE_ID]
+    return record, [json.loads(record["chunk_by_index"][str(i)]) for i in range(len(record["chunk_by_index"]))]
+
+
+def test_update_embeds_only_the_changed_documents(tmp_path, documents, model, capsys):
+    output = tmp_path / "byok_vector_db"
+    db_path = output / "faiss_store.db"
+    assert run(documents, output, model) == 0
+    _, before = stored_chunks(db_path)
+    (documents / "guides" / "guide03.md").write_text("# Guide 3\n\nRewritten from scratch.")
+    (documents / "guides" / "guide05.md").unlink()
+    (documents / "guides" / "guide10.md").write_text("# Guide 10\n\nA new guide.")
+    capsys.readouterr()
+
+    assert run(documents, output, model, "--update", "--compact-ratio", "1") == 0
+
+    out = capsys.readouterr().out
+    staged = json.loads(out.split("Staged: ")[1].splitlines()[0])
+    assert staged["ingested"] == 2 and staged["skipped"] == 9 and staged["deleted"] == 1
+    record, after = stored_chunks(db_path)
+    removed = [c for c in before if c["metadata"]["document_id"] in ("guides/guide03.md", "guides/guide05.md")]
+    assert [c for c in after if faiss_index.is_tombstone(c)] == [faiss_index.tombstone(c) for c in removed]
+    assert after[: len(before)] == [faiss_index.tombstone(c) if c in removed else c for c in before]
+    assert [c["content"] for c in after[len(before) :]] == [
+        "# Guide 3\n\nRewritten from scratch.",
+        "# Guide 10\n\nA new guide.",
+    ]
+    index = faiss_index.deserialize_index(record["faiss_index"])
+    assert index.ntotal == len(after)
+    _, ids = index.search(faiss_index.store_vectors(record)[-1:], 1)
+    assert ids[0, 0] == len(after) - 1
+
+    assert run(documents, output, model, "--update", "--compact-ratio", "0") == 0
+    assert '"added_chunks": 0' in capsys.readouterr().out
+    record, compacted = stored_chunks(db_path)
+    assert compacted == [c for c in after if not faiss_index.is_tombstone(c)]
+    assert faiss_index.deserialize_index(record["faiss_index"]).ntotal == len(compacted)
+    assert faiss_index.build_bm25(db_path) == {STORE_ID: "up to date"}
+
+
+def test_update_adopts_a_store_built_elsewhere(tmp_path, documents, model, capsys):
+    output = tmp_path / "vector_db"
+    assert run(documents, output, model, "--db-name", "aap_faiss_store.db") == 0
+    db_path = output / "aap_faiss_store.db"
+    with closing(sqlite3.connect(db_path)) as db, db:
+        db.executescript("DROP TABLE ingest_state; DROP TABLE ingest_documents; DROP TABLE ingest_chunks")
+    _, before = stored_chunks(db_path)
+    capsys.readouterr()
+
+    assert run(documents, output, model, "--db-name", "aap_faiss_store.db") == 1
+    assert "--update" in capsys.readouterr().out
+    assert run(documents, output, model, "--db-name", "aap_faiss_store.db", "--update") == 0
+
+    _, after = stored_chunks(db_path)
+    assert not any(faiss_index.is_tombstone(c) for c in after)
+    assert [c["chunk_id"] for c in after] == [c["chunk_id"] for c in before]
+    assert run(documents, output, model, "--db-name", "aap_faiss_store.db", "--update") == 0
+    assert '"added_chunks": 0, "tombstoned_chunks": 0' in capsys.readouterr().out
@@ -0,0 +1,165 @@
+"""
+Tests that the hooks of ansible_chatbot_stack wrap the real llama-stack and uvicorn classes.
+
+The other tests exercise each hook against stand-ins of the classes it wraps (see the stub_modules
+fixture of conftest.py). These install every hook on the installed llama-stack instead, and check
+that each wrapper replaced the attribute it was written for, so that a llama-stack upgrade that
+renames or moves one fails here rather than silently disabling the hook. They are skipped where
+llama-stack, or a module it needs such as torch, is not installed.
+"""
+
+import importlib
+import inspect
+import operator
+
+import pytest
+
+from ansible_chatbot_stack import (
+    answer_cache,
+    embedding_backend,
+    embedding_batcher,
+    embedding_cache,
+    embedding_executor,
+    faiss_index,
+    runtime,
+    startup,
+    store_router,
+    store_search,
+)
+
+EMBEDDING_MIXIN = "llama_stack.providers.utils.inference.embedding_mixin"
+FAISS = "llama_stack.providers.inline.vector_io.faiss.faiss"
+TOOL_EXECUTOR = "llama_stack.providers.inline.agents.meta_reference.responses.tool_executor"
+
+# install_hooks, the environment enabling it, its module state, and the attributes it wraps: (module, attribute path).
+HOOKS = {
+    "runtime": (
+        runtime.install_hooks,
+        {},
+        [],
+        [
+            ("llama_stack.core.stack", "Stack.initialize"),
+            ("uvicorn.server", "Server.startup"),
+        ],
+    ),
+    "startup": (
+        startup.install_hooks,
+        {},
+        [],
+        [
+            ("llama_stack.core.resolver", "instantiate_provider"),
+            ("llama_stack.core.stack", "register_resources"),
+            ("llama_stack.core.stack", "Stack.initialize"),
+            ("uvicorn.server", "Server.startup"),
+        ],
+    ),
+    "answer_cache": (
+        answer_cache.install_hooks,
+        {"ANSWER_CACHE": "true"},
+        ["ANSWER_CACHE"],
+        [
+            (
+                "llama_stack.providers.inline.agents.meta_reference.responses.streaming",
+                "StreamingResponseOrchestrator.create_response",
+            ),
+        ],
+    ),
+    "embedding_backend": (
+        embedding_backend.install_hooks,
+        {},
+        [],
+        [
+            (EMBEDDING_MIXIN, "SentenceTransformerEmbeddingMixin._load_sentence_transformer_model"),
+        ],
+    ),
+    "embedding_batcher": (
+        embedding_batcher.install_hooks,
+        {"EMBEDDING_BATCH": "true"},
+        ["EMBEDDING_BATCHER"],
+        [
+            (EMBEDDING_MIXIN, "SentenceTransformerEmbeddingMixin.openai_embeddings"),
+        ],
+    ),
+    "embedding_cache": (
+        embedding_cache.install_hooks,
+        {"EMBEDDING_CACHE": "true"},
+        ["EMBEDDING_CACHE"],
+        [
+            (EMBEDDING_MIXIN, "SentenceTransformerEmbeddingMixin.openai_embeddings"),
+        ],
+    ),
+    "embedding_executor": (
+        embedding_executor.install_hooks,
+        {"EMBEDDING_EXECUTOR": "process"},
+        ["EMBEDDING_EXECUTOR"],
+        [
+            (EMBEDDING_MIXIN, "SentenceTransformerEmbeddingMixin._load_sentence_transformer_model"),
+        ],
+    ),
+    "faiss_index": (
+        faiss_index.install_hooks,
+        {},
+        [],
+        [
+            (FAISS, "FaissIndex.initialize"),
+            (FAISS, "FaissIndex.query_vector"),
+            (FAISS, "FaissIndex.add_chunks"),
+            (FAISS, "FaissIndex.delete_chunks"),
+            (FAISS, "FaissIndex.query_keyword"),
+            (FAISS, "FaissIndex.query_hybrid"),
+            ("llama_stack.providers.utils.memory.vector_store", "VectorStoreWithIndex.query_chunks"),
+        ],
+    ),
+    "store_search": (
+        store_search.install_hooks,
+        {},
+        ["STORE_SEARCH"],
+        [
+            ("llama_stack.core.routers.vector_io", "VectorIORouter.query_chunks"),
+            ("llama_stack.core.routers.vector_io", "VectorIORouter.openai_search_vector_store"),
+            (TOOL_EXECUTOR, "ToolExecutor._execute_knowledge_search_via_vector_store"),
+        ],
+    ),
+    "store_router": (
+        store_router.install_hooks,
+        {"STORE_ROUTING": "true"},
+        ["STORE_ROUTER"],
+        [
+            (FAISS, "FaissIndex.initialize"),
+            (TOOL_EXECUTOR, "ToolExecutor._execute_knowledge_search_via_vector_store"),
+        ],
+    ),
+}
+
+
+@pytest.mark.parametrize("hook", HOOKS)
+def test_hook_wraps_the_real_classes(hook, monkeypatch):
+    install_hooks, environment, state, targets = HOOKS[hook]
+    originals = {}
+    for module_name, path in targets:
+        module = pytest.importorskip(module_name)
+        *owner_path, attribute = path.split(".")
+        owner = operator.attrgetter(".".join(owner_path))(module) if owner_path else module
+        originals[module_name, path] = inspect.unwrap(getattr(owner, attribute))
+        # Restored after the test, so that every hook wraps the real attribute.
+        monkeypatch.setattr(owner, attribute, getattr(owner, attribute))
+    hook_module = importlib.import_module(f"ansible_chatbot_stack.{hook}")
+    for name in state:
+        monkeypatch.setattr(hook_module, name, None)
+    monkeypatch.setattr(faiss_index, "reload_index", faiss_index.reload_index)
+    if hook == "embedding_backend":
+        config = importlib.import_module("llama_stack.providers.inline.inference.sentence_transformers.config")
+        monkeypatch.setattr(
+            config.SentenceTransformersInferenceConfig,
+            "model_config",
+            {**config.SentenceTransformersInferenceConfig.model_config},
+        )
+    for name, value in environment.items():
+        monkeypatch.setenv(name, value)
+
+    install_hooks()
+
+    for (module_name, path), original in originals.items():
+        wrapper = operator.attrgetter(path)(importlib.import_module(module_name))
+        assert wrapper is not original, f"{hook} did not wrap {module_name}.{path}"
+        assert inspect.unwrap(wrapper) is original
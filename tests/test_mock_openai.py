@@ -0,0 +1,135 @@
+"""
+Tests for the latency-configurable mock OpenAI API server (tests/mock_openai.py).
+
+These run without the chatbot container: they only check that the mock honours
+its MockLLMProfile, since the offline benchmark (make bench) relies on it.
+"""
+
+import argparse
+import json
+import time
+
+import pytest
+import requests
+
+from tests.mock_openai import MockLLMProfile, add_profile_arguments, profile_from_args, start_mock_openai
+
+
+KNOWLEDGE_SEARCH_TOOL = {
+    "type": "function",
+    "function": {"name": "knowledge_search", "parameters": {"type": "object", "properties": {}}},
+}
+
+
+@pytest.fixture
+def mock_openai(request):
+    """Start a mock on an ephemeral port with the profile given by indirect parametrization."""
+    mock = start_mock_openai(0, getattr(request, "param", None))
+    yield mock
+    mock.stop()
+
+
+def _stream(mock, body):
+    response = requests.post(
+        f"{mock.url}/chat/completions", json={**body, "stream": True}, stream=True, timeout=10
+    )
+    chunks = []
+    for line in response.iter_lines(chunk_size=None):
+        if line.startswith(b"data: ") and line != b"data: [DONE]":
+            chunks.append((time.perf_counter(), json.loads(line[6:])))
+    return response, chunks
+
+
+def _completion(mock, body):
+    return requests.post(f"{mock.url}/chat/completions", json=body, timeout=10)
+
+
+def test_default_profile_returns_canned_answer(mock_openai):
+    response = _completion(mock_openai, {"messages": [{"role": "user", "content": "What is AAP?"}]})
+
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"].startswith("AAP stands for Ansible Automation Platform")
+
+    _, chunks = _stream(mock_openai, {"messages": [{"role": "user", "content": "What is AAP?"}]})
+    text = "".join(c["choices"][0]["delta"].get("content", "") for _, c in chunks)
+    assert text.startswith("AAP stands for Ansible Automation Platform")
+
+
+@pytest.mark.parametrize(
+    "mock_openai", [MockLLMProfile(ttft=0.2, token_delay=0.02, response_tokens=10)], indirect=True
+)
+def test_streaming_delays_and_length(mock_openai):
+    start = time.perf_counter()
+    _, chunks = _stream(mock_openai, {"messages": [{"role": "user", "content": "What is AAP?"}]})
+
+    content = [(t, c) for t, c in chunks if c["choices"][0]["delta"].get("content")]
+    assert len(content) == 10
+    assert content[0][0] - start >= 0.2
+    assert content[-1][0] - content[0][0] >= 9 * 0.02
+
+
+@pytest.mark.parametrize(
+    "mock_openai",
+    [MockLLMProfile(response_tokens=5, response_tokens_max=50, response_tokens_distribution="uniform", seed=7)],
+    indirect=True,
+)
+def test_response_length_distribution_is_deterministic(mock_openai):
+    body = {"messages": [{"role": "user", "content": "What is AAP?"}]}
+    lengths = [_completion(mock_openai, body).json()["usage"]["completion_tokens"] for _ in range(10)]
+
+    replay = start_mock_openai(0, mock_openai.profile)
+    try:
+        assert [_completion(replay, body).json()["usage"]["completion_tokens"] for _ in range(10)] == lengths
+    finally:
+        replay.stop()
+    assert all(5 <= n <= 50 for n in lengths)
+    assert len(set(lengths)) > 1
+
+
+@pytest.mark.parametrize("mock_openai", [MockLLMProfile(tool_call_rate=1.0)], indirect=True)
+def test_tool_call_then_answer(mock_openai):
+    messages = [{"role": "user", "content": "What is EDA?"}]
+    response = _completion(mock_openai, {"messages": messages, "tools": [KNOWLEDGE_SEARCH_TOOL]})
+
+    choice = response.json()["choices"][0]
+    assert choice["finish_reason"] == "tool_calls"
+    tool_call = choice["message"]["tool_calls"][0]
+    assert tool_call["function"]["name"] == "knowledge_search"
+    assert json.loads(tool_call["function"]["arguments"]) == {"query": "What is EDA?"}
+
+    messages += [choice["message"], {"role": "tool", "tool_call_id": tool_call["id"], "content": "EDA docs"}]
+    response = _completion(mock_openai, {"messages": messages, "tools": [KNOWLEDGE_SEARCH_TOOL]})
+    assert response.json()["choices"][0]["finish_reason"] == "stop"
+
+    _, chunks = _stream(mock_openai, {"messages": messages[:1], "tools": [KNOWLEDGE_SEARCH_TOOL]})
+    assert chunks[0][1]["choices"][0]["delta"]["tool_calls"][0]["function"]["name"] == "knowledge_search"
+    assert chunks[-1][1]["choices"][0]["finish_reason"] == "tool_calls"
+    assert mock_openai.stats["tool_calls"] == 2
+
+
+@pytest.mark.parametrize("mock_openai", [MockLLMProfile(error_rate=1.0, error_status=429)], indirect=True)
+def test_error_injection(mock_openai):
+    response = _completion(mock_openai, {"messages": [{"role": "user", "content": "What is AAP?"}]})
+
+    assert response.status_code == 429
+    assert mock_openai.stats["errors"] == 1
+
+
+def test_invalid_profile():
+    with pytest.raises(ValueError):
+        MockLLMProfile(error_rate=2.0)
+    with pytest.raises(ValueError):
+        MockLLMProfile(response_tokens_distribution="zipf")
+
+
+def test_profile_arguments():
+    parser = argparse.ArgumentParser()
+    add_profile_arguments(parser)
+
+    profile = profile_from_args(
+        parser.parse_args(["--ttft", "0.25", "--response-tokens", "40", "--model", "mock", "--error-status", "503"])
+    )
+    assert profile == MockLLMProfile(model="mock", ttft=0.25, response_tokens=40, error_status=503)
+    assert profile_from_args(parser.parse_args([])) == MockLLMProfile()
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--response-tokens-distribution", "zipf"])
@@ -0,0 +1,83 @@
+"""
+Tests for the pre-fork server (ansible_chatbot_stack/prefork.py): configuration, and the
+supervision of forked workers.
+"""
+
+import signal
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from ansible_chatbot_stack import prefork
+from ansible_chatbot_stack.embedding_backend import Backend
+from ansible_chatbot_stack.warm_state import load_run_config
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_workers(monkeypatch):
+    monkeypatch.setattr(prefork, "cpu_count", lambda: 8)
+    monkeypatch.delenv("PREFORK_WORKERS", raising=False)
+    assert prefork.workers() == 0
+    monkeypatch.setenv("PREFORK_WORKERS", "auto")
+    assert prefork.workers() == 8
+    monkeypatch.setenv("PREFORK_WORKERS", "3")
+    assert (prefork.workers(), prefork.torch_threads(3)) == (3, 2)
+
+
+def test_lightspeed_config():
+    assert prefork.lightspeed_config(["lightspeed_stack.py", "--config", "ls.yaml"]) == "ls.yaml"
+    assert prefork.lightspeed_config(["lightspeed_stack.py", "-c", "ls.yaml"]) == "ls.yaml"
+    assert prefork.lightspeed_config(["lightspeed_stack.py", "--config=ls.yaml"]) == "ls.yaml"
+    assert prefork.lightspeed_config(["lightspeed_stack.py"]) is None
+
+
+def test_state_to_preload_from_the_run_config(monkeypatch):
+    for name in ("EMBEDDINGS_MODEL", "EMBEDDINGS_BACKEND", "EMBEDDINGS_QUANTIZATION"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("VECTOR_DB_DIR", "/data")
+    run_config = load_run_config(None, str(PROJECT_ROOT / "ansible-chatbot-run.yaml"))
+
+    assert prefork.embedding_models(run_config) == {"/.llama/data/embeddings_model": Backend("torch")}
+    monkeypatch.setenv("EMBEDDINGS_BACKEND", "onnx")
+    run_config = load_run_config(None, str(PROJECT_ROOT / "ansible-chatbot-run.yaml"))
+    assert prefork.embedding_models(run_config) == {"/.llama/data/embeddings_model": Backend("onnx", "avx2")}
+    assert prefork.faiss_store_dbs(run_config) == [Path("/data/aap_faiss_store.db")]
+
+
+class ScriptedSupervisor(prefork.Supervisor):
+    """Workers that log their start: worker 0 crashes, then fails to start; worker 1 serves until stopped."""
+
+    def __init__(self, log: Path):
+        super().__init__(config=None, sock=None, worker_count=2)
+        self.log = log
+
+    def _serve(self, number):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        with open(self.log, "a") as f:
+            f.write(f"{number}\n")
+        if number == 0:
+            starts = self.log.read_text().split().count("0")
+            sys.exit(1 if starts == 1 else prefork.STARTUP_FAILURE)
+        time.sleep(30)
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def test_supervisor_restarts_workers_and_stops_on_startup_failure(tmp_path, monkeypatch, restore_signals):
+    monkeypatch.setattr(prefork, "RESTART_DELAY", 0)
+    log = tmp_path / "starts.log"
+    start = time.monotonic()
+
+    assert ScriptedSupervisor(log).run() == prefork.STARTUP_FAILURE
+
+    assert sorted(log.read_text().split()) == ["0", "0", "1"]
+    assert time.monotonic() - start < 10
@@ -0,0 +1,108 @@
+"""
+Tests for the adaptive knowledge_search context (ansible_chatbot_stack/rag_context.py), with stand-ins of
+llama-stack's tool executor and vector_io router.
+"""
+
+import asyncio
+import logging
+import types
+
+import pytest
+
+from ansible_chatbot_stack import rag_context, store_search
+
+
+def result(file_id, score, words=10):
+    text = " ".join(["word"] * words)
+    return types.SimpleNamespace(file_id=file_id, score=score, content=[types.SimpleNamespace(text=text)])
+
+
+def test_low_value_results_are_dropped():
+    context = rag_context.RagContext(min_chunks=1, min_score=0.2, score_gap=0.3, token_budget=100)
+    ids = lambda results: [r.file_id for r in results]  # noqa: E731
+
+    kept, saved = context.select([result("b", 0.8), result("a", 0.9), result("c", 0.5), result("d", 0.45)])
+    assert ids(kept) == ["a", "b"] and saved == 2 * rag_context.estimate_tokens(result("c", 0).content[0].text)
+    assert ids(context.select([result("a", 0.9), result("b", 0.19)])[0]) == ["a"]
+    assert ids(context.select([result("a", 0.1)])[0]) == ["a"]
+    assert ids(context.select([result("a", 0.9, 200), result("b", 0.9, 200)])[0]) == ["a"]
+    assert ids(rag_context.RagContext(2, 0, 0.3, 0).select([result("a", 0.9), result("b", 0.1)])[0]) == ["a", "b"]
+    assert context.stats()["searches"] == 4 and context.stats()["dropped"] == 4
+
+
+@pytest.fixture
+def tool_executor(monkeypatch, stub_modules):
+    """A stand-in of llama-stack's tool executor, listing the results of each store in the order of its tools."""
+
+    class VectorIO:
+        pages = {
+            "aap": [result("aap-1", 0.9), result("aap-2", 0.4)],
+            "byok": [result("byok-1", 0.85), result("byok-2", 0.8)],
+        }
+
+        async def openai_search_vector_store(self, vector_store_id, query, **kwargs):
+            if vector_store_id not in self.pages:
+                raise ValueError(f"No vector store {vector_store_id}")
+            return types.SimpleNamespace(data=self.pages[vector_store_id])
+
+    class ToolExecutor:
+        vector_io_api = VectorIO()
+
+        async def _execute_knowledge_search_via_vector_store(self, query, response_file_search_tool):
+            results = []
+            for vector_store_id in response_file_search_tool.vector_store_ids:
+                page = await self.vector_io_api.openai_search_vector_store(vector_store_id=vector_store_id, query=query)
+                results.extend(page.data)
+            return [r.file_id for r in results]
+
+    class VectorIORouter:
+        async def query_chunks(self, vector_store_id, query, params=None):
+            raise NotImplementedError
+
+        openai_search_vector_store = query_chunks
+
+    stub_modules(
+        {
+            "llama_stack.providers.inline.agents.meta_reference.responses.tool_executor": {
+                "ToolExecutor": ToolExecutor
+            },
+            "llama_stack.core.routers.vector_io": {"VectorIORouter": VectorIORouter},
+        }
+    )
+    monkeypatch.setattr(rag_context, "RAG_CONTEXT", None)
+    monkeypatch.setattr(store_search, "STORE_SEARCH", None)
+    monkeypatch.setattr(store_search, "CONTEXT_FILTERS", {})
+    monkeypatch.setenv("RAG_ADAPTIVE", "true")
+    store_search.install_hooks()
+    rag_context.install_hooks()
+    return ToolExecutor()
+
+
+def test_file_search_context_keeps_the_best_results_of_all_stores(tool_executor, caplog):
+    tool = types.SimpleNamespace(
+        vector_store_ids=["aap", "byok", "missing"], filters=None, max_num_results=10, ranking_options=None
+    )
+
+    with caplog.at_level(logging.INFO, logger=rag_context.__name__):
+        found = asyncio.run(tool_executor._execute_knowledge_search_via_vector_store("q", tool))
+
+    assert found == ["aap-1", "byok-1", "byok-2"]
+    assert "3 of 4 chunks kept, ~13 tokens saved" in caplog.text
+    assert rag_context.stats()["tokens_saved"] == 13
+
+
+def test_file_search_context_is_reranked_before_it_is_trimmed(tool_executor, monkeypatch):
+    class CrossEncoder:
+        def predict(self, pairs, batch_size, show_progress_bar):
+            return [0.1, 0.9, 0.8, 0.05]
+
+    ranker = rag_context.reranker.Reranker("model", top_k=3, load_model=lambda model: CrossEncoder())
+    monkeypatch.setattr(rag_context.reranker, "RERANKER", ranker)
+    tool = types.SimpleNamespace(
+        vector_store_ids=["aap", "byok"], filters=None, max_num_results=10, ranking_options=None
+    )
+
+    found = asyncio.run(tool_executor._execute_knowledge_search_via_vector_store("q", tool))
+
+    # Ranked by retrieval aap-1, byok-1, byok-2, aap-2; aap-1 falls more than the score gap under byok-2.
+    assert found == ["byok-1", "byok-2"]
@@ -0,0 +1,65 @@
+"""
+Tests for the cross-encoder reranking of the knowledge_search results (ansible_chatbot_stack/reranker.py), with a
+stand-in of the cross-encoder.
+"""
+
+import asyncio
+import threading
+import types
+
+from ansible_chatbot_stack import rag_context, reranker
+
+
+def result(file_id, score, text):
+    return types.SimpleNamespace(file_id=file_id, score=score, content=[types.SimpleNamespace(text=text)])
+
+
+class CrossEncoder:
+    """Scores a text by the share of its words found in the query."""
+
+    def __init__(self, release=None):
+        self.release = release
+        self.batches = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.batches.append(len(pairs))
+        if self.release:
+            self.release.wait(5)
+        return [len(set(text.split()) & set(query.split())) / len(text.split()) for query, text in pairs]
+
+
+def results():
+    return [
+        result("a", 0.9, "automation controller overview"),
+        result("b", 0.8, "create a job template"),
+        result("c", 0.7, "job template"),
+        result("d", 0.1, "event driven ansible"),
+    ]
+
+
+def test_candidates_are_reranked_by_the_cross_encoder_in_batches():
+    cross_encoder = CrossEncoder()
+    ranker = reranker.Reranker("model", candidates=3, top_k=2, batch_size=2, load_model=lambda model: cross_encoder)
+
+    reranked = asyncio.run(ranker.rerank("create a job template", results(), rag_context.result_text))
+
+    assert [(r.file_id, r.score) for r in reranked] == [("b", 1.0), ("c", 1.0)]
+    assert cross_encoder.batches == [2, 1]
+    assert ranker.stats()["reranked"] == 1 and ranker.stats()["loaded"]
+
+
+def test_retrieval_order_is_kept_when_the_budget_runs_out():
+    release = threading.Event()
+    cross_encoder = CrossEncoder(release)
+    ranker = reranker.Reranker("model", top_k=2, batch_size=1, budget=0.05, load_model=lambda model: cross_encoder)
+
+    try:
+        reranked = asyncio.run(ranker.rerank("create a job template", results(), rag_context.result_text))
+    finally:
+        release.set()
+    ranker.executor().submit(lambda: None).result()
+
+    assert [(r.file_id, r.score) for r in reranked] == [("a", 0.9), ("b", 0.8)]
+    # The batches after the deadline are not scored.
+    assert cross_encoder.batches == [1]
+    assert ranker.stats()["fallbacks"] == 1 and ranker.stats()["latency_ms"]["count"] == 1
@@ -0,0 +1,107 @@
+"""
+Tests for the versioned store DB snapshots and their reload (ansible_chatbot_stack/snapshots.py).
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+from ansible_chatbot_stack import answer_cache, faiss_index, snapshots
+from ansible_chatbot_stack.faiss_index import IndexSpec
+
+pytest.importorskip("faiss")
+
+
+def write_store_db(db_path, store_ids, count=10):
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    vectors = np.random.default_rng(count).standard_normal((count, 8)).astype(np.float32)
+    record = {
+        "chunk_by_index": {str(i): json.dumps({"content": f"chunk {i}", "chunk_id": f"c{i}"}) for i in range(count)},
+        "faiss_index": faiss_index.serialize_index(faiss_index.build_index(vectors, IndexSpec("flat"))),
+    }
+    with sqlite3.connect(db_path) as db:
+        db.execute("CREATE TABLE kvstore (key TEXT PRIMARY KEY, value TEXT, expiration TIMESTAMP)")
+        for store_id in store_ids:
+            db.execute("INSERT INTO kvstore VALUES (?, ?, NULL)", (f"faiss_index:v3::{store_id}", json.dumps(record)))
+    db.close()
+    return db_path
+
+
+def test_publish_switches_the_current_link_and_prunes(tmp_path, capsys):
+    store_dir = tmp_path / "ansible-chatbot"
+    first = write_store_db(tmp_path / "first" / "aap_faiss_store.db", ["aap"])
+    (first.parent / "provider_vector_db_id.ind").write_text("aap")
+
+    assert snapshots.publish(store_dir, first, "v1") == ("v1", True)
+    assert snapshots.publish(store_dir, first) == ("v1", False)
+
+    current = store_dir / "current" / "aap_faiss_store.db"
+    assert current.resolve() == store_dir / "snapshots" / "v1" / "aap_faiss_store.db"
+    assert (store_dir / "current" / "provider_vector_db_id.ind").read_text() == "aap"
+    for version, count in (("v2", 20), ("v3", 30)):
+        write_store_db(tmp_path / version / "aap_faiss_store.db", ["aap"], count)
+        args = ["publish", str(store_dir), str(tmp_path / version), "--version", version, "--keep", "2"]
+        assert snapshots.main(args) == 0
+    assert snapshots.main(["publish", str(store_dir), str(tmp_path / "v3")]) == 0
+    assert "is current and identical" in capsys.readouterr().out
+    assert snapshots.versions(store_dir) == ["v2", "v3"]
+    assert len(faiss_index.load_stores(current)["aap"]["chunk_by_index"]) == 30
+
+    assert snapshots.main(["activate", str(store_dir), "v2"]) == 0
+    assert len(faiss_index.load_stores(current)["aap"]["chunk_by_index"]) == 20
+    assert snapshots.main(["list", str(store_dir)]) == 0
+    assert "* v2" in capsys.readouterr().out
+    assert snapshots.main(["activate", str(store_dir), "v1"]) == 1
+
+
+def test_snapshot_must_keep_the_served_vector_stores(tmp_path, capsys):
+    store_dir = tmp_path / "ansible-chatbot"
+    snapshots.publish(store_dir, write_store_db(tmp_path / "v1" / "faiss_store.db", ["aap", "byok"]), "v1")
+
+    other = write_store_db(tmp_path / "v2" / "faiss_store.db", ["aap"])
+    assert snapshots.main(["publish", str(store_dir), str(other), "--version", "v2"]) == 1
+
+    assert "no vector store byok" in capsys.readouterr().out
+    assert snapshots.versions(store_dir) == ["v1"]
+    assert not list((store_dir / "snapshots").glob(".*"))
+
+
+def test_reload_empties_the_answer_cache_when_a_store_changed(monkeypatch):
+    outcomes = iter([{"aap": "unchanged"}, {"aap": "reloaded"}])
+
+    async def reload():
+        return next(outcomes)
+
+    monkeypatch.setattr(faiss_index, "reload", reload)
+    monkeypatch.setattr(answer_cache, "clear", lambda: {"cleared": 2})
+
+    assert "answer_cache" not in asyncio.run(snapshots.reload())
+    assert asyncio.run(snapshots.reload())["answer_cache"] == {"cleared": 2}
+    assert snapshots.LAST_RELOAD["stores"] == {"aap": "reloaded"}
+
+
+def test_reload_request_runs_in_the_service_event_loop(monkeypatch):
+    async def reload():
+        return {"aap": "reloaded" if threading.current_thread().name == "service" else "wrong thread"}
+
+    monkeypatch.setattr(faiss_index, "reload", reload)
+    monkeypatch.setattr(answer_cache, "clear", lambda: {"cleared": 0})
+    monkeypatch.setattr(snapshots, "LOOP", None)
+    assert snapshots.request_reload()[0] == 503
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="service", daemon=True)
+    thread.start()
+    monkeypatch.setattr(snapshots, "LOOP", loop)
+    try:
+        status, body = snapshots.request_reload()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    assert status == 200 and body["stores"] == {"aap": "reloaded"}
@@ -0,0 +1,185 @@
+"""
+Tests for the startup phase timings (ansible_chatbot_stack/startup.py) and the admin server.
+
+These run without the chatbot container; the hooks into llama-stack and uvicorn are
+exercised by the container tests.
+"""
+
+import asyncio
+import io
+import json
+import sys
+import types
+
+import pytest
+import requests
+
+from ansible_chatbot_stack import admin, launch, startup
+from ansible_chatbot_stack.admin import start_admin_server
+from ansible_chatbot_stack.startup import StartupTimings, monotonic, process_start_time
+
+
+def _events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_phases_are_emitted_as_json_lines():
+    stream = io.StringIO()
+    timings = StartupTimings(stream)
+
+    with timings.phase("provider_init", api="vector_io", provider_id="aap_faiss"):
+        pass
+    timings.record("register_resources", 10.0, 12.5)
+
+    events = _events(stream)
+    assert [e["phase"] for e in events] == ["provider_init", "register_resources"]
+    assert events[0]["event"] == "startup_phase"
+    assert events[0]["source"] == "python"
+    assert events[0]["provider_id"] == "aap_faiss"
+    assert events[1]["duration"] == 2.5
+
+
+def test_summary_includes_entrypoint_phases(tmp_path):
+    events_file = tmp_path / "startup-events.jsonl"
+    start = monotonic() - 5
+    events_file.write_text(
+        json.dumps({"event": "startup_phase", "source": "entrypoint", "phase": "store_db_check",
+                    "start": start, "end": start + 0.2, "duration": 0.2})
+        + "\nnot json\n"
+    )
+    stream = io.StringIO()
+    timings = StartupTimings(stream)
+    timings.load_events_file(str(events_file))
+    timings.record("llama_stack_init", start + 1, start + 4)
+
+    assert timings.summary()["ready"] is False
+    summary = timings.mark_ready(top=1)
+
+    assert summary["ready"] is True
+    assert summary["total"] >= 5
+    assert [p["phase"] for p in summary["slowest"]] == ["llama_stack_init"]
+    assert _events(stream)[-1]["event"] == "startup_summary"
+
+
+def test_process_start_time_is_on_the_same_clock():
+    started = process_start_time()
+    if started is None:
+        pytest.skip("/proc/self/stat not available")
+    assert 0 < started <= monotonic()
+
+
+def test_admin_server_serves_startup_summary(monkeypatch):
+    timings = StartupTimings(io.StringIO())
+    timings.record("python_launch", 1.0, 3.0)
+    monkeypatch.setattr("ansible_chatbot_stack.admin.TIMINGS", timings)
+
+    server = start_admin_server(port=0, host="127.0.0.1")
+    try:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        response = requests.get(f"{base_url}/startup", timeout=5)
+        assert response.status_code == 200
+        assert response.json()["slowest"][0]["phase"] == "python_launch"
+        assert requests.get(f"{base_url}/unknown", timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_admin_server_post_routes_need_a_local_client_or_the_token(monkeypatch):
+    reloads = []
+    monkeypatch.setitem(admin.POST_ROUTES, "/stores/reload", lambda: reloads.append(1) or (200, {"reloaded": []}))
+    monkeypatch.delenv("ANSIBLE_CHATBOT_ADMIN_TOKEN", raising=False)
+    remote = types.SimpleNamespace(client_address=("10.0.0.7", 40000), headers={})
+    assert not admin.AdminHandler.authorized(remote)
+
+    server = start_admin_server(port=0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/stores/reload"
+        assert requests.post(url, timeout=5).status_code == 200
+        monkeypatch.setenv("ANSIBLE_CHATBOT_ADMIN_TOKEN", "s3cret")
+        assert requests.post(url, timeout=5).status_code == 403
+        assert requests.post(url, headers={"Authorization": "Bearer nope"}, timeout=5).status_code == 403
+        assert requests.post(url, headers={"Authorization": "Bearer s3cret"}, timeout=5).status_code == 200
+        assert len(reloads) == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_admin_server_answers_500_when_a_route_fails(monkeypatch):
+    monkeypatch.setitem(admin.ROUTES, "/startup", lambda: 1 / 0)
+
+    server = start_admin_server(port=0, host="127.0.0.1")
+    try:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        response = requests.get(f"{base_url}/startup", timeout=5)
+        assert response.status_code == 500
+        assert response.json() == {"detail": "ZeroDivisionError: division by zero"}
+        assert requests.get(f"{base_url}/readiness", timeout=5).status_code in (200, 503)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_admin_server_disabled_without_port(monkeypatch):
+    monkeypatch.delenv("ANSIBLE_CHATBOT_ADMIN_PORT", raising=False)
+    assert start_admin_server() is None
+
+
+def test_launch_runs_script_as_main(tmp_path, monkeypatch, capsys):
+    script = tmp_path / "fake_lightspeed_stack.py"
+    script.write_text("import sys\nif __name__ == '__main__':\n    print('ARGS', sys.argv[1:], sys.path[0])\n")
+    monkeypatch.setattr(sys, "argv", list(sys.argv))
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    monkeypatch.setattr(launch, "install_hooks", lambda: None)
+    monkeypatch.setattr(launch, "TIMINGS", StartupTimings(io.StringIO()))
+    monkeypatch.delenv("STARTUP_EVENTS_FILE", raising=False)
+
+    launch.main([str(script), "--config", "lightspeed-stack.yaml"])
+
+    assert f"ARGS ['--config', 'lightspeed-stack.yaml'] {tmp_path}" in capsys.readouterr().out
+
+
+def test_hooks_time_providers_and_mark_ready(monkeypatch, stub_modules):
+    """install_hooks() against stand-ins of the llama-stack and uvicorn functions it wraps."""
+    async def instantiate_provider(provider, *args):
+        return f"impl-{provider.provider_id}"
+
+    async def register_resources(run_config, impls):
+        pass
+
+    class Stack:
+        async def initialize(self):
+            provider = types.SimpleNamespace(
+                provider_id="aap_faiss",
+                spec=types.SimpleNamespace(api=types.SimpleNamespace(value="vector_io"), provider_type="inline::faiss"),
+            )
+            assert await resolver.instantiate_provider(provider) == "impl-aap_faiss"
+            await stack.register_resources(None, {})
+
+    class Server:
+        async def startup(self, sockets=None):
+            pass
+
+    modules = stub_modules(
+        {
+            "llama_stack.core.resolver": {"instantiate_provider": instantiate_provider},
+            "llama_stack.core.stack": {"register_resources": register_resources, "Stack": Stack},
+            "uvicorn.server": {"Server": Server},
+        }
+    )
+    resolver, stack = modules["llama_stack.core.resolver"], modules["llama_stack.core.stack"]
+    stream = io.StringIO()
+    monkeypatch.setattr(startup, "TIMINGS", StartupTimings(stream))
+
+    startup.install_hooks()
+    asyncio.run(Stack().initialize())
+    asyncio.run(Server().startup())
+
+    events = _events(stream)
+    assert [e.get("phase") for e in events] == [
+        "provider_init", "register_resources", "llama_stack_init", "http_server_startup", None
+    ]
+    assert events[0]["provider_type"] == "inline::faiss"
+    assert events[-1]["event"] == "startup_summary"
+    assert events[-1]["ready"] is True
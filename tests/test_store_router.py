@@ -0,0 +1,145 @@
+"""
+Tests for the routing of the knowledge searches to the relevant vector stores
+(ansible_chatbot_stack/store_router.py), with stand-ins of llama-stack's tool executor and inline::faiss provider.
+"""
+
+import asyncio
+import types
+
+import numpy as np
+import pytest
+
+from ansible_chatbot_stack import faiss_index, store_router
+from ansible_chatbot_stack.runtime import RUNTIME
+
+pytest.importorskip("faiss")
+
+MODEL = "sentence-transformers/embeddings_model"
+DIMENSION = 16
+
+
+def topic(axis, count, seed=0):
+    """Unit embeddings around one axis of the embedding space."""
+    vectors = np.random.default_rng(seed).normal(scale=0.1, size=(count, DIMENSION)).astype(np.float32)
+    vectors[:, axis] += 1
+    return store_router.unit_rows(vectors)
+
+
+def chunks(vectors, tombstones=()):
+    return {
+        i: {
+            "content": f"chunk {i}",
+            "chunk_id": f"c{i}",
+            "embedding": vector.tolist(),
+            # Recorded by older llama-stack versions in place of the model of the store.
+            "embedding_model": "unknown",
+            "metadata": {faiss_index.TOMBSTONE_KEY: True} if i in tombstones else {},
+        }
+        for i, vector in enumerate(vectors)
+    }
+
+
+def router(**stores):
+    routing = store_router.StoreRouter(centroid_count=4, margin=0.1, min_similarity=0.5)
+    for store_id, vectors in stores.items():
+        routing.centroids[store_id] = store_router.compute_centroids(chunks(vectors), routing.centroid_count)
+        routing.models[store_id] = MODEL
+    return routing
+
+
+def test_centroids_summarize_the_live_chunks():
+    summary = store_router.compute_centroids(chunks(np.vstack([topic(0, 50), topic(1, 50)]), tombstones={0, 1}), 4)
+
+    assert summary.chunks == 98
+    assert summary.vectors.shape == (4, DIMENSION)
+    assert np.allclose(np.linalg.norm(summary.vectors, axis=1), 1, atol=1e-5)
+    assert sorted({int(np.argmax(vector)) for vector in summary.vectors}) == [0, 1]
+    assert store_router.compute_centroids(chunks(topic(0, 3)), 4).vectors.shape == (3, DIMENSION)
+    assert store_router.compute_centroids({0: {"content": "no embedding", "embedding": []}}, 4) is None
+
+
+def test_queries_are_routed_to_the_closest_stores():
+    routing = router(aap=topic(0, 100), byok_network=topic(1, 100), byok_cloud=topic(2, 100, seed=1))
+
+    def route(query):
+        return routing.select(["aap", "byok_network", "byok_cloud", "not_loaded"], {MODEL: query})
+
+    assert route(topic(1, 1, seed=2)[0]) == ["byok_network", "not_loaded"]
+    assert route(store_router.unit_rows(np.eye(DIMENSION)[[0, 2]].sum(axis=0, keepdims=True))[0]) == [
+        "aap",
+        "byok_cloud",
+        "not_loaded",
+    ]
+    # Far from every store: not confident, every store is searched.
+    assert route(np.eye(DIMENSION, dtype=np.float32)[9]) == ["aap", "byok_network", "byok_cloud", "not_loaded"]
+    stats = routing.stats()
+    assert stats["routed"] == 3 and stats["fallbacks"] == 1
+    assert stats["stores"]["byok_cloud"] == {"chunks": 100, "centroids": 4, "searched": 2, "skipped": 1}
+
+
+@pytest.fixture
+def llama_stack(monkeypatch, stub_modules):
+    """Stand-ins of the tool executor, of the inline::faiss FaissIndex, and of the inference and vector_stores APIs."""
+
+    class ToolExecutor:
+        async def _execute_knowledge_search_via_vector_store(self, query, response_file_search_tool):
+            return response_file_search_tool.vector_store_ids
+
+    class FaissIndex:
+        def __init__(self, bank_id, vectors):
+            self.bank_id = bank_id
+            self.vectors = vectors
+
+        async def initialize(self):
+            self.chunk_by_index = chunks(self.vectors)
+
+    class FileSearchTool(types.SimpleNamespace):
+        def model_copy(self, update):
+            return FileSearchTool(**{**vars(self), **update})
+
+    class Inference:
+        async def openai_embeddings(self, request):
+            assert request.model == MODEL
+            embedding = topic(int(request.input[0].split()[-1]), 1, seed=3)[0]
+            return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=embedding.tolist())])
+
+    class VectorStores:
+        listed = 0
+
+        async def list_vector_stores(self):
+            self.listed += 1
+            return [types.SimpleNamespace(identifier=store_id, embedding_model=MODEL) for store_id in ("aap", "byok")]
+
+    stub_modules(
+        {
+            "llama_stack_api": {"OpenAIEmbeddingsRequestWithExtraBody": types.SimpleNamespace},
+            "llama_stack.providers.inline.agents.meta_reference.responses.tool_executor": {
+                "ToolExecutor": ToolExecutor
+            },
+            "llama_stack.providers.inline.vector_io.faiss.faiss": {"FaissIndex": FaissIndex},
+        }
+    )
+    vector_stores = VectorStores()
+    monkeypatch.setattr(RUNTIME, "impls", {"inference": Inference(), "vector_stores": vector_stores})
+    monkeypatch.setattr(faiss_index, "reload_index", faiss_index.reload_index)
+    monkeypatch.setattr(store_router, "STORE_ROUTER", None)
+    monkeypatch.setenv("STORE_ROUTING", "true")
+    monkeypatch.setenv("STORE_ROUTING_MIN_SIMILARITY", "0.5")
+    store_router.install_hooks()
+    return types.SimpleNamespace(
+        ToolExecutor=ToolExecutor, FaissIndex=FaissIndex, FileSearchTool=FileSearchTool, vector_stores=vector_stores
+    )
+
+
+def test_file_search_skips_the_stores_far_from_the_query(llama_stack):
+    async def serve():
+        for store_id, axis in (("aap", 0), ("byok", 1)):
+            await llama_stack.FaissIndex(store_id, topic(axis, 40)).initialize()
+        executor = llama_stack.ToolExecutor()
+        tool = llama_stack.FileSearchTool(type="file_search", vector_store_ids=["aap", "byok"])
+        return [await executor._execute_knowledge_search_via_vector_store(q, tool) for q in ("about 1", "about 7")]
+
+    assert asyncio.run(serve()) == [["byok"], ["aap", "byok"]]
+    assert store_router.stats()["stores"]["aap"]["skipped"] == 1
+    # The chunks record no model: the queries are embedded with the registered one, listed once.
+    assert llama_stack.vector_stores.listed == 1
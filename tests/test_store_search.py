@@ -0,0 +1,199 @@
+"""
+Tests for the deadlines, score multipliers and merged results of the vector store searches
+(ansible_chatbot_stack/store_search.py), with stand-ins of llama-stack's vector_io router and tool executor.
+"""
+
+import asyncio
+import types
+
+import pytest
+
+from ansible_chatbot_stack import store_search
+
+LIGHTSPEED_CONFIG = """
+name: test
+byok_rag:
+  - rag_id: byok-docs
+    rag_type: inline::faiss
+    vector_db_id: ${env.BYOK_PROVIDER_VECTOR_DB_ID:=}
+    db_path: /tmp/faiss_store.db
+    score_multiplier: 1.2
+  - rag_id: unset
+    vector_db_id: ""
+"""
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch, stub_modules):
+    """A stand-in of the vector_io router: each store answers after its delay in the ``delays`` of the router."""
+
+    class VectorIORouter:
+        delays = {}
+
+        async def query_chunks(self, vector_store_id, query, params=None):
+            await asyncio.sleep(self.delays.get(vector_store_id, 0))
+            return module.QueryChunksResponse(chunks=[f"{vector_store_id}:{query}"], scores=[0.5])
+
+        async def openai_search_vector_store(self, vector_store_id, query, filters=None, max_num_results=10, **kwargs):
+            await asyncio.sleep(self.delays.get(vector_store_id, 0))
+            data = [types.SimpleNamespace(file_id=f"{vector_store_id}-{score}", score=score) for score in (0.5, 0.4)]
+            return module.VectorStoreSearchResponsePage(search_query=[query], data=data, has_more=False)
+
+    class ToolExecutor:
+        """Lists the results of each store in the order of its tools, as llama-stack formats the context."""
+
+        vector_io_api = VectorIORouter()
+
+        async def _execute_knowledge_search_via_vector_store(self, query, response_file_search_tool):
+            results = []
+            for vector_store_id in response_file_search_tool.vector_store_ids:
+                page = await self.vector_io_api.openai_search_vector_store(vector_store_id=vector_store_id, query=query)
+                results.extend(page.data)
+            return [(r.file_id, r.score) for r in results]
+
+    name = "llama_stack.core.routers.vector_io"
+    module = stub_modules(
+        {
+            name: {
+                "VectorIORouter": VectorIORouter,
+                "QueryChunksResponse": types.SimpleNamespace,
+                "VectorStoreSearchResponsePage": types.SimpleNamespace,
+            },
+            "llama_stack.providers.inline.agents.meta_reference.responses.tool_executor": {
+                "ToolExecutor": ToolExecutor
+            },
+        }
+    )[name]
+    monkeypatch.setattr(store_search, "STORE_SEARCH", None)
+    monkeypatch.setattr(store_search, "CONTEXT_FILTERS", {})
+    monkeypatch.setenv("BYOK_PROVIDER_VECTOR_DB_ID", "byok-docs-0001")
+    monkeypatch.setenv("STORE_SEARCH_DEADLINE_MS", "1000")
+    monkeypatch.setenv("STORE_SEARCH_DEADLINES_MS", "byok-docs-0001=50")
+    config = tmp_path / "lightspeed-stack.yaml"
+    config.write_text(LIGHTSPEED_CONFIG)
+    store_search.install_hooks(str(config))
+    VectorIORouter.tool_executor = ToolExecutor()
+    return VectorIORouter()
+
+
+def test_deadlines_are_parsed_per_store():
+    assert store_search.parse_deadlines(" a=500, b-c=1.5 ,") == {"a": 0.5, "b-c": 0.0015}
+    with pytest.raises(ValueError, match="expected"):
+        store_search.parse_deadlines("500")
+
+
+def test_stores_are_searched_concurrently_and_byok_scores_scaled(router):
+    async def knowledge_search():
+        stores = ["aap-product-docs", "byok-docs-0001"]
+        return await asyncio.gather(*(router.query_chunks(store, "q") for store in stores))
+
+    aap, byok = asyncio.run(knowledge_search())
+
+    assert aap.scores == [0.5] and byok.scores == [pytest.approx(0.6)]
+    assert byok.chunks == ["byok-docs-0001:q"]
+    stats = store_search.stats()["stores"]
+    assert stats["byok-docs-0001"]["score_multiplier"] == 1.2 and stats["byok-docs-0001"]["deadline_ms"] == 50
+    assert stats["aap-product-docs"]["latency_ms"]["count"] == 1
+
+
+def test_slow_store_misses_its_deadline_without_delaying_the_others(router):
+    router.delays = {"byok-docs-0001": 5.0, "aap-product-docs": 0.01}
+
+    async def file_search():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        stores = ["aap-product-docs", "byok-docs-0001"]
+        pages = await asyncio.gather(*(router.openai_search_vector_store(store, "q") for store in stores))
+        return pages, loop.time() - started
+
+    (aap, byok), elapsed = asyncio.run(file_search())
+
+    assert elapsed < 1
+    assert [result.file_id for result in aap.data] == ["aap-product-docs-0.5", "aap-product-docs-0.4"]
+    assert byok.data == []
+    stats = store_search.stats()["stores"]
+    assert stats["byok-docs-0001"]["timeouts"] == 1 and stats["aap-product-docs"]["timeouts"] == 0
+    # The late search is cancelled with the event loop, before it finishes: its latency is not known.
+    assert stats["byok-docs-0001"]["latency_ms"]["count"] == 0
+
+
+def test_search_missing_its_deadline_finishes_in_the_background(router):
+    models = {}
+
+    async def query_chunks(self, vector_store_id, query, params=None):
+        # The first search loads the embedding model, as llama-stack does, in a task cancelled by a timeout.
+        if vector_store_id not in models:
+            await asyncio.sleep(0.2)
+            models[vector_store_id] = "model"
+        return types.SimpleNamespace(chunks=[query], scores=[0.5])
+
+    type(router).query_chunks = query_chunks
+    store_search.install_hooks()
+
+    async def knowledge_searches():
+        first = await router.query_chunks("byok-docs-0001", "q")
+        await asyncio.sleep(0.3)
+        return first, await router.query_chunks("byok-docs-0001", "q")
+
+    first, second = asyncio.run(knowledge_searches())
+
+    assert first.chunks == [] and second.chunks == ["q"]
+    assert models == {"byok-docs-0001": "model"}
+    assert store_search.stats()["late"] == 0 and store_search.stats()["stores"]["byok-docs-0001"]["timeouts"] == 1
+
+
+def test_store_is_not_searched_again_while_its_late_search_runs(router):
+    router.delays = {"byok-docs-0001": 0.2}
+    searches = []
+    query_chunks = type(router).query_chunks.__wrapped__
+
+    async def counted_query_chunks(self, vector_store_id, query, params=None):
+        searches.append(vector_store_id)
+        return await query_chunks(self, vector_store_id, query, params)
+
+    type(router).query_chunks = counted_query_chunks
+    store_search.install_hooks()
+
+    async def knowledge_searches():
+        first = await router.query_chunks("byok-docs-0001", "q")
+        second = await router.query_chunks("byok-docs-0001", "q")
+        await asyncio.sleep(0.3)
+        return first, second, await router.query_chunks("byok-docs-0001", "q")
+
+    first, second, third = asyncio.run(knowledge_searches())
+
+    assert first.chunks == second.chunks == third.chunks == []
+    assert searches == ["byok-docs-0001", "byok-docs-0001"]
+    stats = store_search.stats()["stores"]["byok-docs-0001"]
+    assert stats["timeouts"] == 3
+    # The late search that finished is observed with its own latency, not the deadline.
+    assert stats["latency_ms"]["count"] == 1 and stats["latency_ms"]["sum"] >= 200
+
+
+def test_warmup_searches_have_no_deadline(router):
+    router.delays = {"byok-docs-0001": 0.1}
+
+    async def warmup_search():
+        with store_search.unbounded():
+            return await router.query_chunks("byok-docs-0001", "q")
+
+    assert asyncio.run(warmup_search()).chunks == ["byok-docs-0001:q"]
+    assert store_search.stats()["stores"]["byok-docs-0001"]["timeouts"] == 0
+
+
+def test_file_search_results_of_all_stores_are_merged_by_scaled_score(router):
+    tool = types.SimpleNamespace(
+        vector_store_ids=["aap-product-docs", "byok-docs-0001"],
+        filters=None,
+        max_num_results=10,
+        ranking_options=None,
+    )
+
+    found = asyncio.run(router.tool_executor._execute_knowledge_search_via_vector_store("q", tool))
+
+    assert found == [
+        ("byok-docs-0001-0.5", pytest.approx(0.6)),
+        ("aap-product-docs-0.5", 0.5),
+        ("byok-docs-0001-0.4", pytest.approx(0.48)),
+        ("aap-product-docs-0.4", 0.4),
+    ]
@@ -0,0 +1,153 @@
+"""
+Tests for the warm restart store checks (ansible_chatbot_stack/warm_state.py).
+"""
+
+import copy
+import sqlite3
+
+import pytest
+import yaml
+
+from ansible_chatbot_stack import warm_state
+
+RUN_CONFIG = """
+providers:
+  inference:
+  - provider_id: openai
+    provider_type: remote::openai
+    config:
+      api_key: ${env.OPENAI_API_KEY:=}
+  vector_io:
+  - provider_id: aap_faiss
+    provider_type: inline::faiss
+    config:
+      persistence:
+        namespace: vector_io::faiss
+        backend: kv_rag
+  agents:
+  - provider_id: lightspeed_inline_agent
+    provider_type: inline::lightspeed_inline_agent
+    config:
+      persistence:
+        agent_state:
+          namespace: agents_state
+          backend: kv_default
+        responses:
+          table_name: agent_responses
+          backend: sql_default
+storage:
+  backends:
+    kv_rag:
+      type: kv_sqlite
+      db_path: ${env.VECTOR_DB_DIR}/aap_faiss_store.db
+    kv_default:
+      type: kv_sqlite
+      db_path: ${env.VECTOR_DB_DIR}/kv_store.db
+    sql_default:
+      type: sql_sqlite
+      db_path: ${env.VECTOR_DB_DIR}/sql_store.db
+  stores:
+    metadata:
+      namespace: registry
+      backend: kv_default
+    conversations:
+      table_name: openai_conversations
+      backend: sql_default
+registered_resources:
+  models:
+  - model_id: openai/${env.INFERENCE_MODEL:=gpt-4o-mini}
+    provider_id: openai
+"""
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("VECTOR_DB_DIR", str(tmp_path))
+    monkeypatch.delenv("INFERENCE_MODEL", raising=False)
+    monkeypatch.setattr(warm_state, "package_versions", lambda: {"llama-stack": "0.4.3"})
+    return tmp_path
+
+
+def _run_config():
+    return warm_state.resolve_env_vars(yaml.safe_load(RUN_CONFIG))
+
+
+def _create_db(path):
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE t (x)")
+        connection.execute("INSERT INTO t VALUES (1)")
+
+
+def _start(data_dir, run_config=None):
+    """Simulate a container start: check the stores, then let llama-stack (re)create the missing DBs."""
+    actions = warm_state.prepare(run_config or _run_config(), data_dir, keep=["aap_faiss_store.db"])
+    for name in ("aap_faiss_store.db", "kv_store.db", "sql_store.db"):
+        if not (data_dir / name).exists():
+            _create_db(data_dir / name)
+    return actions
+
+
+def test_resolve_env_vars(monkeypatch):
+    monkeypatch.setenv("SET", "value")
+    monkeypatch.delenv("UNSET", raising=False)
+
+    assert warm_state.resolve_env_vars(
+        {"a": "${env.SET}", "b": ["${env.UNSET:=default}", "${env.SET:=default}"], "c": "x-${env.SET:+on}-${env.UNSET:+on}", "d": 1}
+    ) == {"a": "value", "b": ["default", "value"], "c": "x-on-", "d": 1}
+
+
+def test_unchanged_config_keeps_stores(data_dir):
+    assert _start(data_dir) == {"kv_store.db": "new", "sql_store.db": "new"}
+    (data_dir / "legacy_agents_store.db").write_text("")
+
+    assert _start(data_dir) == {"kv_store.db": "kept", "sql_store.db": "kept", "legacy_agents_store.db": "removed"}
+    assert not (data_dir / "legacy_agents_store.db").exists()
+    assert (data_dir / "aap_faiss_store.db").exists()
+
+
+def test_only_changed_stores_are_reset(data_dir, monkeypatch):
+    _start(data_dir)
+
+    # A different model only changes the registry.
+    monkeypatch.setenv("INFERENCE_MODEL", "gpt-4o")
+    assert _start(data_dir) == {"kv_store.db": "reset", "sql_store.db": "kept"}
+
+    # A different responses table only changes the SQL store.
+    run_config = _run_config()
+    run_config["providers"]["agents"][0]["config"]["persistence"]["responses"]["table_name"] = "responses_v2"
+    assert _start(data_dir, run_config) == {"kv_store.db": "kept", "sql_store.db": "reset"}
+
+
+def test_version_upgrade_resets_stores(data_dir, monkeypatch):
+    _start(data_dir)
+
+    monkeypatch.setattr(warm_state, "package_versions", lambda: {"llama-stack": "0.5.0"})
+    assert _start(data_dir) == {"kv_store.db": "reset", "sql_store.db": "reset"}
+
+
+def test_corrupted_store_is_reset(data_dir):
+    _start(data_dir)
+    (data_dir / "sql_store.db").write_bytes(b"not a sqlite database" * 100)
+
+    assert _start(data_dir) == {"kv_store.db": "kept", "sql_store.db": "reset"}
+
+
+def test_fingerprints_ignore_other_backends():
+    run_config = _run_config()
+    fingerprints = warm_state.backend_fingerprints(run_config, versions={})
+    changed = copy.deepcopy(run_config)
+    changed["providers"]["vector_io"][0]["config"]["persistence"]["namespace"] = "vector_io::faiss_v2"
+
+    changed_fingerprints = warm_state.backend_fingerprints(changed, versions={})
+    assert changed_fingerprints["kv_rag"] != fingerprints["kv_rag"]
+    assert changed_fingerprints["sql_default"] == fingerprints["sql_default"]
+
+
+def test_main_reads_run_config_from_lightspeed_config(data_dir, capsys):
+    run_config_path = data_dir / "run.yaml"
+    run_config_path.write_text(RUN_CONFIG)
+    lightspeed_config = data_dir / "lightspeed-stack.yaml"
+    lightspeed_config.write_text(yaml.safe_dump({"llama_stack": {"library_client_config_path": str(run_config_path)}}))
+
+    assert warm_state.main(["--lightspeed-config", str(lightspeed_config), "--data-dir", str(data_dir)]) == 0
+    assert "Store DB kv_store.db: new" in capsys.readouterr().out
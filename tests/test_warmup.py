@@ -0,0 +1,158 @@
+"""
+Tests for the startup warm-up (ansible_chatbot_stack/warmup.py), the runtime hooks it
+relies on and the readiness checks it reports to.
+"""
+
+import asyncio
+import types
+
+import pytest
+import requests
+
+from ansible_chatbot_stack import admin, reranker, runtime, warmup
+from ansible_chatbot_stack.readiness import FAILED, OK, PENDING, SKIPPED, Readiness
+
+
+class FakeVectorStores:
+    def __init__(self, *ids):
+        self.vector_stores = [
+            types.SimpleNamespace(identifier=i, embedding_model="sentence-transformers/all-mpnet-base-v2") for i in ids
+        ]
+
+    async def list_vector_stores(self):
+        return self.vector_stores
+
+
+class FakeVectorIO:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.queries = []
+
+    async def query_chunks(self, vector_store_id, query, params=None):
+        await asyncio.sleep(self.delay)
+        self.queries.append((vector_store_id, query, params))
+
+
+@pytest.fixture
+def state(monkeypatch):
+    """Fresh readiness checks, and a runtime with the fake vector store APIs."""
+    checks = Readiness()
+    monkeypatch.setattr(warmup, "READINESS", checks)
+    monkeypatch.setattr(reranker, "RERANKER", None)
+    rt = runtime.Runtime()
+    rt.impls = {"vector_stores": FakeVectorStores("aap-product-docs", "byok"), "vector_io": FakeVectorIO()}
+    return rt, checks
+
+
+def test_readiness_blocking_and_non_blocking_checks():
+    checks = Readiness()
+    assert checks.ready()
+
+    checks.set("startup", PENDING)
+    checks.set("warmup", FAILED, blocking=False)
+    assert not checks.ready()
+
+    checks.set("startup", OK)
+    report = checks.report()
+    assert report["ready"] is True
+    assert report["checks"]["warmup"]["status"] == FAILED
+
+
+def test_warm_up_searches_every_store(state, monkeypatch):
+    rt, checks = state
+    monkeypatch.setenv("STARTUP_WARMUP_QUERIES", "What is AAP? | What is EDA?")
+
+    asyncio.run(warmup.warm_up(rt))
+
+    assert [(store, query) for store, query, _ in rt.api("vector_io").queries] == [
+        ("aap-product-docs", "What is AAP?"),
+        ("aap-product-docs", "What is EDA?"),
+        ("byok", "What is AAP?"),
+        ("byok", "What is EDA?"),
+    ]
+    check = checks.report()["checks"]["warmup"]
+    assert check["status"] == OK
+    assert check["vector_stores"]["byok"]["queries"] == 2
+
+
+def test_warm_up_loads_the_reranking_cross_encoder(state, monkeypatch):
+    rt, checks = state
+    loaded = []
+    cross_encoder = types.SimpleNamespace(predict=lambda pairs, **kwargs: [0.5] * len(pairs))
+    rr = reranker.Reranker("/.llama/data/rerank_model", load_model=lambda model: loaded.append(model) or cross_encoder)
+    monkeypatch.setattr(reranker, "RERANKER", rr)
+
+    asyncio.run(warmup.warm_up(rt))
+
+    assert loaded == ["/.llama/data/rerank_model"]
+    assert rr.stats()["loaded"]
+    assert checks.report()["checks"]["warmup"]["reranker"]["model"] == "/.llama/data/rerank_model"
+
+
+def test_warm_up_timeout_does_not_block_readiness(state, monkeypatch):
+    rt, checks = state
+    rt.impls["vector_io"] = FakeVectorIO(delay=1.0)
+    monkeypatch.setenv("STARTUP_WARMUP_TIMEOUT", "0.1")
+
+    asyncio.run(warmup.warm_up(rt))
+
+    assert checks.report()["checks"]["warmup"]["status"] == FAILED
+    assert checks.ready()
+
+
+def test_warm_up_disabled(state, monkeypatch):
+    rt, checks = state
+    monkeypatch.setenv("STARTUP_WARMUP", "false")
+
+    asyncio.run(warmup.warm_up(rt))
+
+    assert checks.report()["checks"]["warmup"]["status"] == SKIPPED
+    assert rt.api("vector_io").queries == []
+
+
+def test_runtime_hook_runs_callbacks_after_initialize(monkeypatch, stub_modules):
+    class Api:
+        def __init__(self, value):
+            self.value = value
+
+    class Stack:
+        def __init__(self):
+            self.run_config = {"image_name": "ansible-chatbot"}
+            self.impls = None
+
+        async def initialize(self):
+            self.impls = {Api("vector_io"): "vector-io-impl"}
+
+    stub_modules({"llama_stack.core.stack": {"Stack": Stack}})
+    rt = runtime.Runtime()
+    monkeypatch.setattr(runtime, "RUNTIME", rt)
+    seen = []
+
+    async def callback(initialized):
+        seen.append(initialized.api("vector_io"))
+
+    rt.after_initialize(callback)
+    runtime.install_hooks()
+    asyncio.run(Stack().initialize())
+
+    assert seen == ["vector-io-impl"]
+    assert rt.run_config == {"image_name": "ansible-chatbot"}
+
+
+def test_admin_readiness_endpoint(monkeypatch):
+    checks = Readiness()
+    monkeypatch.setattr(admin, "READINESS", checks)
+    checks.set("warmup", PENDING)
+
+    server = admin.start_admin_server(port=0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/readiness"
+        response = requests.get(url, timeout=5)
+        assert response.status_code == 503
+        assert response.json()["checks"]["warmup"]["status"] == PENDING
+
+        checks.set("warmup", OK)
+        assert requests.get(url, timeout=5).status_code == 200
+    finally:
+        server.shutdown()
+        server.server_close()